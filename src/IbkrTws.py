@@ -5,6 +5,7 @@ from ibapi.wrapper import EWrapper
 from ibapi.contract import Contract
 import xml.etree.ElementTree as ET  # Import für XML-Verarbeitung
 
+import itertools
 import threading
 import time
 import pandas as pd
@@ -18,41 +19,23 @@ global gCurrentTicker
 gCurrentTicker   = "" 
 app              = None
 ASK, OPEN, CLOSE, VOLA = 2, 14, 9, 23
+openLock = threading.Lock() # threads of the load test and the prefetcher open the connection at the same time
 
-#----------------------------------------------------------------------------------------------------------------------  
-#--------------------------------------------------------------------------------------------------------------------------------
-class Database:
-  mInfo = {}
-  @staticmethod
-  def storeInfo(id, news, type="news"):
-    if type == "account":
-      data = news
-      key, value = data.split(":")
-      Database.mInfo[key] = value
-    else:  
-      Database.mInfo[id] = news
-
-  @staticmethod
-  def getInfo():
-    return Database.mInfo
-  
-  @staticmethod
-  def clear():
-    Database.mInfo = {}
-  
-  @staticmethod
-  def print():
-    #print("-" * 80)
-    for key, value in Database.mInfo.items():    
-      #print("-" * 80)
-      value = value.replace(",",";")
-      print(F"{key}:{value}")  
+#-----------------------------------------------------------------------------  
+#-----------------------------------------------------------------------------  
+class HistoricalRequest:
+  """Result slot of one reqHistoricalData, see IbApi.get."""
+  def __init__(self, ticker):
+    self.ticker = ticker
+    self.bars = []
+    self.error = None
+    self.done = threading.Event()
 #-----------------------------------------------------------------------------  
 #-----------------------------------------------------------------------------  
 class IbApi(EWrapper, EClient):
   app =  None
   ibSync = None
-  REQ_ID, REQ_ID_NEWS, REQ_ID_INFO, REQ_ID_FUNDAMENTAL = 1, 2, 3, 4
+  REQ_ID, REQ_ID_INFO, REQ_ID_FUNDAMENTAL = 1, 3, 4
   def __init__(self):
     EClient.__init__(self, self)
     self.clearData() 
@@ -61,6 +44,16 @@ class IbApi(EWrapper, EClient):
     self.cnt = 0
     self.portofolio = False
     self.data_received_event = threading.Event()
+    self.fundamentalRequests = {}                    # reqId -> (ticker, queue), see requestFundamentalData
+    self.scannerSubscriptions = {}                   # reqId -> listener, e.g. scanner.ScannerSubscription
+    self.newsSubscriptions = {}                      # reqId -> (ticker, listener), e.g. newsStore.NewsStore
+    self.historicalRequests = {}                     # reqId -> HistoricalRequest, see get
+    self.requestIds = itertools.count(1000)          # reqIds of the historical, fundamental, scanner and news requests
+    self.fundamentalLock = threading.Lock()
+    self.portfolioListener = None                    # e.g. portfolio.PositionTable, gets the account updates instead of self.info
+    self.scannerXml = None                           # answer of reqScannerParameters, not in self.info: see getScannerParameter
+    self.scannerXmlReceived = threading.Event()
+    self.scannerXmlLock = threading.Lock()
   #----------------------------------------------------  
   @staticmethod
   def run_loop(app):
@@ -80,12 +73,23 @@ class IbApi(EWrapper, EClient):
     #super().error(reqId, errorCode, errorString, advancedOrderRejectJson)
     if reqId != -1:
       global gCurrentTicker
+      request = self.historicalRequests.get(reqId)
+      ticker = request.ticker if request is not None else gCurrentTicker
       if advancedOrderRejectJson:
         print(f"Error:{errorCode}, Id:{reqId}, Msg:{errorString}, AdvancedOrderRejectJson:{advancedOrderRejectJson}")
       else:
-        print(f"Error:{errorCode}, Id:{reqId}, ticker:{gCurrentTicker}, Msg:{errorString}")
+        print(f"Error:{errorCode}, Id:{reqId}, ticker:{ticker}, Msg:{errorString}")
       if errorCode == 200:  
         self.data_received_event.set()
+      warning = 2100 <= errorCode < 2200 # 21xx are warnings, e.g. 2174 about the time zone
+      if request is not None and not warning:
+        request.error = f"{errorCode}: {errorString}"
+        request.done.set()
+      if not warning:
+        self.finishFundamentalRequest(reqId, None) # e.g. 430: no fundamental data for the security
+      listener = self.scannerSubscriptions.get(reqId)
+      if listener is not None:
+        listener.scannerError(errorCode, errorString)
     else:
       #print("Error:", errorCode, "Id:", reqId, "Msg:", errorString, "AdvancedOrderRejectJson:", advancedOrderRejectJson)
       pass
@@ -95,21 +99,22 @@ class IbApi(EWrapper, EClient):
       print('The current ask price is: ', price)
   #----------------------------------------------------  
   def historicalData(self, reqId, bar):
-    if reqId == IbApi.REQ_ID:
-      a = [bar.date, bar.open, bar.close, bar.low, bar.high]
-      self.data.append(a)
-      #print(f'Time,Open,Close,Low,High: {a}')
+    request = self.historicalRequests.get(reqId)
+    if request is not None:
+      request.bars.append([bar.date, bar.open, bar.close, bar.low, bar.high])
   #----------------------------------------------------  
   def historicalDataEnd(self, reqId: int, start: str, end: str):
-    if reqId == IbApi.REQ_ID:
+    request = self.historicalRequests.get(reqId)
+    if request is not None:
       super().historicalDataEnd(reqId, start, end)
-      self.data_received_event.set()
+      request.done.set()
   #----------------------------------------------------  
   def tickNews(self, reqId: int, timeStamp: int, providerCode: str, articleId: str, headline: str, extraData: str):
-    if reqId == IbApi.REQ_ID_NEWS:
-      #self.news.append(f"reqId:f{reqId}; TimeStamp:{timeStamp}; ProviderCode:{providerCode}; ArticleId:{articleId}; Headline:{headline}; ExtraData:{extraData}")
-      self.info.append(f"ProviderCode:{providerCode};  Headline:{headline}; {extraData}\n")
-      self.data_received_event.set()
+    # a subscription gets headlines until it is cancelled, no event: waiting for "the" answer ended after the first headline
+    subscription = self.newsSubscriptions.get(reqId)
+    if subscription is not None:
+      ticker, listener = subscription
+      listener.tickNews(ticker, timeStamp, providerCode, articleId, headline, extraData)
   #----------------------------------------------------  
   def accountSummary(self, reqId, account, tag, value, currency):
     if reqId == IbApi.REQ_ID_INFO:
@@ -124,6 +129,9 @@ class IbApi(EWrapper, EClient):
       self.data_received_event.set()
   #----------------------------------------------------  
   def updateAccountValue(self, key: str, val: str, currency: str,accountName: str):
+    if self.portfolioListener is not None:
+      self.portfolioListener.updateAccountValue(key, val, currency, accountName)
+      return
     if len(self.info) == 0:
       x = f"Key,Value,Currency" #, AccountName:{accountName}"
       self.info.append(x)
@@ -131,6 +139,9 @@ class IbApi(EWrapper, EClient):
     self.info.append(x)
   #----------------------------------------------------  
   def updatePortfolio(self, contract: Contract, position,marketPrice: float, marketValue: float, averageCost: float, unrealizedPNL: float, realizedPNL: float, accountName: str):  
+    if self.portfolioListener is not None:
+      self.portfolioListener.updatePortfolio(contract, position, marketPrice, marketValue, averageCost, unrealizedPNL, realizedPNL, accountName)
+      return
     if not self.portofolio:
       self.portofolio = True
       x = "Symbol,SecType,Exchange,Position,MarketPrice,MarketValue,AverageCost,UnrealizedPNL,RealizedPNL"
@@ -140,17 +151,29 @@ class IbApi(EWrapper, EClient):
   #----------------------------------------------------  
   def accountDownloadEnd(self, accountName: str):
     self.portofolio = False
+    if self.portfolioListener is not None:
+      self.portfolioListener.accountDownloadEnd(accountName)
     self.data_received_event.set()
   #----------------------------------------------------  
   def scannerParameters(self, xml: str):
-    open('log/scanner.xml', 'w').write(xml)
-    self.data_received_event.set()
+    # cached and parsed by scanner.py, no more log/scanner.xml on every call
+    self.scannerXml = xml
+    self.scannerXmlReceived.set()
   #----------------------------------------------------  
   def scannerData(self, reqId: int, rank: int, contractDetails, distance: str, benchmark: str, projection: str, legsStr: str):
+    listener = self.scannerSubscriptions.get(reqId)
+    if listener is not None:
+      listener.scannerData(rank, contractDetails, distance, benchmark, projection, legsStr)
+      return
     x = f"ScannerData. ReqId: {reqId}, Contract: {contractDetails.contract}, Rank: {rank}, Distance: {distance}, Benchmark: {benchmark}, Projection: {projection}, Legs: {legsStr}"
     self.info.append(x)
     self.data_received_event.set()
   #----------------------------------------------------  
+  def scannerDataEnd(self, reqId: int):
+    listener = self.scannerSubscriptions.get(reqId)
+    if listener is not None:
+      listener.scannerDataEnd()
+  #----------------------------------------------------  
   def newsProviders(self, newsProviders):
     x = f"NewsProviders: {newsProviders}"
     self.info.append(x)
@@ -164,6 +187,8 @@ class IbApi(EWrapper, EClient):
         print("FundamentalData Returned. ReqId: {}, XML Data: {}".format(
               reqId, data))
   def fundamentalData(self, reqId: int, data: str):
+    if self.finishFundamentalRequest(reqId, data):
+      return
     if reqId == IbApi.REQ_ID_FUNDAMENTAL:
       #print(f"FundamentalData Returned. ReqId: {reqId}, XML Data: {data}")
       self.info.append(data)  # Speichere die empfangenen Daten
@@ -178,6 +203,7 @@ class IbApi(EWrapper, EClient):
       threading.Thread(target=IbApi.run_loop, args=(self,), daemon=True).start()
       time.sleep(1) # time for connection to server
       if not self.isConnected():
+        self.opened = False # the next open() tries again instead of waiting for answers that never come
         raise globalsSa.CustomError("Ibkr connection failed.")
   #----------------------------------------------------  
   def close(self):
@@ -209,6 +235,8 @@ class IbApi(EWrapper, EClient):
     return ret
   #----------------------------------------------------  
   def get(self, ticker, interval, period='3 Y'):
+    """Historical bars of ticker. Every call has its own reqId and result slot, so several threads can wait at the
+    same time (a hedged request, the prefetcher and the load test do)."""
     global gCurrentTicker
     gCurrentTicker = ticker
     #Create contract object
@@ -224,13 +252,19 @@ class IbApi(EWrapper, EClient):
     contract.symbol   = ticker
     contract.currency = 'USD'
     #Request Market Data
-    self.reqHistoricalData(IbApi.REQ_ID, contract, '', period, interval, 'TRADES', 1, 2, False, [])
-    #self.reqHistoricalData(IbApi.REQ_ID, contract, '3 Y', interval, 'TRADES', 1, 2, False, [])
-    self.data_received_event.wait()
-    self.data_received_event.clear()
-    d = pd.DataFrame(self.data, columns=['DateTime', 'Open', 'Close', 'Low', 'High'])
-    self.clearData()
-    if d.empty:                                   raise globalsSa.CustomError("No Data")
+    reqId = next(self.requestIds)
+    request = HistoricalRequest(ticker)
+    self.historicalRequests[reqId] = request
+    try:
+      self.reqHistoricalData(reqId, contract, '', period, interval, 'TRADES', 1, 2, False, [])
+      #self.reqHistoricalData(IbApi.REQ_ID, contract, '3 Y', interval, 'TRADES', 1, 2, False, [])
+      if not request.done.wait(timeout=60):
+        self.cancelHistoricalData(reqId)
+        raise globalsSa.CustomError(f"Timeout waiting for historical data of {ticker}")
+    finally:
+      self.historicalRequests.pop(reqId, None)
+    d = pd.DataFrame(request.bars, columns=['DateTime', 'Open', 'Close', 'Low', 'High'])
+    if d.empty:                                   raise globalsSa.CustomError(f"No Data ({request.error})" if request.error else "No Data")
     d['DateTime'] = pd.to_datetime(d['DateTime']) 
     d = d.set_index(['DateTime'])
     return d
@@ -245,9 +279,30 @@ class IbApi(EWrapper, EClient):
       return self.waitAndReturnInfo()
     return ""
   #----------------------------------------------------  
+  def subscribePortfolio(self, listener, acctCode):
+    """Account updates go to listener until unsubscribePortfolio, returns when the first download is complete."""
+    self.portfolioListener = listener
+    self.data_received_event.clear()
+    self.reqAccountUpdates(True, acctCode)
+    if not self.data_received_event.wait(timeout=10):
+      print("Timeout waiting for the account download.")
+    self.data_received_event.clear()
+  #----------------------------------------------------  
+  def unsubscribePortfolio(self, acctCode):
+    self.reqAccountUpdates(False, acctCode)
+    self.portfolioListener = None
+  #----------------------------------------------------  
   def getScannerParameter(self):
-    self.reqScannerParameters()
-    return self.waitAndReturnInfo()
+    """The scanner parameters xml, None on a timeout. Own slot and event: leftovers in self.info or a historical
+    request waiting on data_received_event at the same time can't swap the answers."""
+    with self.scannerXmlLock:
+      self.scannerXml = None
+      self.scannerXmlReceived.clear()
+      self.reqScannerParameters()
+      if not self.scannerXmlReceived.wait(timeout=10):
+        print("Timeout waiting for the scanner parameters.")
+        return None
+      return self.scannerXml
   #----------------------------------------------------
   def getSubscriptionData(self,scannerSubscription,filterTagvalues):
     self.reqScannerSubscription(7002, scannerSubscription, [], filterTagvalues)
@@ -255,15 +310,38 @@ class IbApi(EWrapper, EClient):
   #----------------------------------------------------
   def stopSubscriptionData(self):
     self.cancelScannerSubscription(7003)
+  #----------------------------------------------------
+  def startScanner(self, scannerSubscription, filterTagvalues, listener):
+    """Keeps the subscription open, the rows of every snapshot go to listener.scannerData until listener.scannerDataEnd()."""
+    reqId = next(self.requestIds)
+    self.scannerSubscriptions[reqId] = listener
+    self.reqScannerSubscription(reqId, scannerSubscription, [], filterTagvalues)
+    return reqId
+  #----------------------------------------------------
+  def stopScanner(self, reqId):
+    if self.scannerSubscriptions.pop(reqId, None) is not None:
+      self.cancelScannerSubscription(reqId)
   #----------------------------------------------------  
-  def getNews(self, ticker=None, interval=None):
+  def subscribeNews(self, ticker, listener):
+    """Headlines of ticker ('' for the broad tape, news of all stocks) go to listener.tickNews until unsubscribeNews."""
     contract = Contract()
-    contract.symbol   = f"BRFG:BRFG_ALL" #BroadTape All News
-    contract.secType  = "NEWS"
-    contract.exchange = "BRFG"
-    #Request Market Data
-    self.reqMktData(IbApi.REQ_ID_NEWS, contract, "mdoff,292", False, False, [])
-    return self.waitAndReturnInfo()
+    if ticker:
+      contract.symbol   = ticker
+      contract.secType  = "STK"
+      contract.exchange = "SMART"
+      contract.currency = "USD"
+    else:
+      contract.symbol   = f"BRFG:BRFG_ALL" #BroadTape All News
+      contract.secType  = "NEWS"
+      contract.exchange = "BRFG"
+    reqId = next(self.requestIds)
+    self.newsSubscriptions[reqId] = (ticker, listener)
+    self.reqMktData(reqId, contract, "mdoff,292", False, False, [])
+    return reqId
+  #----------------------------------------------------
+  def unsubscribeNews(self, reqId):
+    if self.newsSubscriptions.pop(reqId, None) is not None:
+      self.cancelMktData(reqId)
   #----------------------------------------------------  
   def getNewsProviders(self):
     self.reqNewsProviders()
@@ -279,6 +357,35 @@ class IbApi(EWrapper, EClient):
     self.reqFundamentalData(IbApi.REQ_ID_FUNDAMENTAL, contract, "RESC", [])
     return self.waitAndReturnInfo()
   #----------------------------------------------------  
+  def requestFundamentalData(self, ticker, results, reportType="RESC"):
+    """Non blocking, (ticker, xml) is put into the queue results when the answer arrives, (ticker, None) on an error.
+    Every request has its own reqId, so several can be outstanding (fundamentals.py paces them)."""
+    contract = Contract()
+    contract.symbol   = ticker
+    contract.secType  = "STK"
+    contract.exchange = "SMART"
+    contract.currency = "USD"
+    with self.fundamentalLock:
+      reqId = next(self.requestIds)
+      self.fundamentalRequests[reqId] = (ticker, results)
+    self.reqFundamentalData(reqId, contract, reportType, [])
+    return reqId
+  #----------------------------------------------------  
+  def cancelFundamentalRequest(self, reqId):
+    with self.fundamentalLock:
+      pending = self.fundamentalRequests.pop(reqId, None)
+    if pending is not None:
+      self.cancelFundamentalData(reqId)
+  #----------------------------------------------------  
+  def finishFundamentalRequest(self, reqId, data):
+    with self.fundamentalLock:
+      pending = self.fundamentalRequests.pop(reqId, None)
+    if pending is None:
+      return False
+    ticker, results = pending
+    results.put((ticker, data))
+    return True
+  #----------------------------------------------------  
   def getFairValue(self, ticker=None):
     contract = Contract()
     contract.symbol   = ticker
@@ -291,8 +398,12 @@ class IbApi(EWrapper, EClient):
 #-----------------------------------------------------------------------------  
 #-----------------------------------------------------------------------------  
 def open():
-  IbApi.app = IbApi()
-  IbApi.app.open()
+  with openLock:
+    if isOpen():
+      return
+    app = IbApi()
+    app.open()
+    IbApi.app = app # published when connected, isOpen() of the other threads is True only from here
 #-----------------------------------------------------------------------------  
 def isOpen():
   return not IbApi.app is None and IbApi.app.isOpen()
@@ -307,7 +418,10 @@ class Interval:
   #----------------------------------------------------
   @staticmethod
   def getIbkr():
-    interval = Interval.interval
+    return Interval.toIbkr(Interval.interval)
+  #----------------------------------------------------
+  @staticmethod
+  def toIbkr(interval):
     if interval == '1d':    interval = '1 day'
     elif interval == '1wk': interval = '1 week'
     return interval
@@ -328,9 +442,10 @@ class Interval:
   def setPeriod(value):
     Interval.period = value
 #-----------------------------------------------------------------------------  
-def get(ticker):
+def get(ticker, interval=None, period=None):
+  """interval ('1d', '1wk') and period ('3 Y') of this request, the Interval settings if not given."""
   if isOpen():
-    df = IbApi.app.get(ticker, Interval.getIbkr(), Interval.getPeriod())
+    df = IbApi.app.get(ticker, Interval.toIbkr(interval or Interval.get()), period or Interval.getPeriod())
     return df
   else: 
     raise globalsSa.CustomError("IbApi not opend")
@@ -347,15 +462,54 @@ def stopAccountUpdate():
   if IbApi.app is None or not IbApi.app.isOpen():  raise globalsSa.CustomError("Ibkr not opened")
   return IbApi.app.getAccountUpdates(False, config.account)
 #-----------------------------------------------------------------------------  
-def getNews(ticker):
+def getScannerParameters():
   if IbApi.app is None or not IbApi.app.isOpen():  raise globalsSa.CustomError("Ibkr not opened")
-  return IbApi.app.getNews(ticker)
+  return IbApi.app.getScannerParameter()
+#-----------------------------------------------------------------------------  
+def startScanner(scannerSubscription, filterTagvalues, listener):
+  if IbApi.app is None or not IbApi.app.isOpen():  raise globalsSa.CustomError("Ibkr not opened")
+  return IbApi.app.startScanner(scannerSubscription, filterTagvalues, listener)
+#-----------------------------------------------------------------------------  
+def stopScanner(reqId):
+  if IbApi.app is None or not IbApi.app.isOpen():  return
+  IbApi.app.stopScanner(reqId)
+#-----------------------------------------------------------------------------  
+def subscribePortfolio(listener):
+  if IbApi.app is None or not IbApi.app.isOpen():  raise globalsSa.CustomError("Ibkr not opened")
+  IbApi.app.subscribePortfolio(listener, config.account)
+#-----------------------------------------------------------------------------  
+def unsubscribePortfolio():
+  if IbApi.app is None or not IbApi.app.isOpen():  return
+  IbApi.app.unsubscribePortfolio(config.account)
+#-----------------------------------------------------------------------------  
+def subscribeNews(ticker, listener):
+  if IbApi.app is None or not IbApi.app.isOpen():  raise globalsSa.CustomError("Ibkr not opened")
+  return IbApi.app.subscribeNews(ticker, listener)
+#-----------------------------------------------------------------------------  
+def unsubscribeNews(reqId):
+  if IbApi.app is None or not IbApi.app.isOpen():  return
+  IbApi.app.unsubscribeNews(reqId)
+#-----------------------------------------------------------------------------  
+def getNews(ticker, seconds=5.0):
+  """The headlines of ticker which arrive within seconds (the TWS sends the latest ones first), newest first."""
+  import newsStore
+  store = newsStore.NewsStore()
+  reqId = subscribeNews(ticker, store)
+  time.sleep(seconds)
+  unsubscribeNews(reqId)
+  return store.latest(ticker, len(store))
 #-----------------------------------------------------------------------------  
 def getFundamentalData(ticker):
   if IbApi.app is None or not IbApi.app.isOpen():  raise globalsSa.CustomError("Ibkr not opened")
   return IbApi.app.getFundamentalData(ticker)
 #----------------------------------------------------------------------------- 
 def calculateFairValue(xmlData):
+  # streaming parser and the vectorized calculation of the watchlist, see fundamentals.py
+  import fundamentals
+  return fundamentals.fairValueOfXml(xmlData)
+#----------------------------------------------------------------------------- 
+def calculateFairValueTree(xmlData):
+  """The former calculateFairValue, whole document as a tree. Reference of fundamentals.py (python fundamentals.py --compare)."""
   root = ET.fromstring(xmlData)
   weightedMedianSum = 0
   weightedMeanSum = 0
@@ -424,23 +578,18 @@ def evaluateAndExecute(opt):
   if opt.ibkr:
     open()
   if opt.news:
+    import newsStore
     for ticker in opt.tickers:
       print(f"{ticker}")
-      for cnt, item in enumerate(getNews(ticker)):   
-        Database.storeInfo(cnt, item)
-      Database.print()
-      Database.clear()
+      for headline in getNews(ticker):
+        print(newsStore.formatHeadline(headline))
   if opt.account:
-    for cnt, item in enumerate(getAccountInfo()):   
-      Database.storeInfo(cnt, item, "account")
-    Database.print()
-    Database.clear()
+    for item in getAccountInfo() or []:
+      print(item)
   if opt.portofolio:
-    for cnt, item in enumerate(getAccountUpdate()):   
-      Database.storeInfo(cnt, item)
+    for item in getAccountUpdate() or []:
+      print(item)
     stopAccountUpdate()
-    Database.print()
-    Database.clear()
     # todo ib.IbApi.app.getNewsProviders()
 #-----------------------------------------------------------------------------  
 #-----------------------------------------------------------------------------  
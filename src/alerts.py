@@ -0,0 +1,519 @@
+"""Alerts on indicator events of the watchlist, evaluated incrementally when the cache of a ticker gets new bars.
+
+The rules are declared in the file alertRules, one per line, over the columns of indicators.Calculator:
+
+  Rsi crossesBelow 30
+  MacdHist crossesAbove 0
+  Close crossesAbove BbUpper
+  Sma50 above Sma200
+
+crossesAbove/crossesBelow fire on the bar where the left side crosses the right side (a number or a column),
+above/below on every bar where it holds. Each alert fires once per ticker, rule and bar.
+
+Per ticker only the state of the indicators used by the rules is kept (the ema's, the last closes of a window, ...),
+so a new bar costs a few scalar updates instead of recomputing the frame. The last bar of a file may still change
+(the current day is refetched), it is evaluated on a copy of the state, the bars before it are committed.
+A scan only stats the cache files and reads the ones that changed. Fired alerts go to data/alerts.log.
+"""
+import collections
+import datetime
+import math
+import os
+import re
+import threading
+import tkinter as tk
+from tkinter import ttk
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import atomicIo
+import globalsSa
+import loader
+import corporateActions
+#--------------------------------------------------------------------------------------------------------------------------------
+OPERATORS = ('crossesAbove', 'crossesBelow', 'above', 'below')
+PRICE_COLUMNS = ('Open', 'High', 'Low', 'Close', 'Volume')
+DEFAULT_RULES = [
+  'Rsi crossesBelow 30',
+  'Rsi crossesAbove 70',
+  'MacdHist crossesAbove 0',
+  'MacdHist crossesBelow 0',
+  'Close crossesAbove BbUpper',
+  'Close crossesBelow BbLower',
+]
+TAIL_BARS = 64       # bars read on an incremental update, more new bars than that mean a rebuild
+FULL_HISTORY = 10**9 # nBars for loader.loadRecentBars to read a whole file
+MAX_ALERTS = 500     # alerts kept for the GUI
+#--------------------------------------------------------------------------------------------------------------------------------
+def rulesPath(filename: str = "alertRules") -> str:
+  return os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+#--------------------------------------------------------------------------------------------------------------------------------
+def alertLogPath(dataDirName: str = "data") -> str:
+  return os.path.join(os.path.dirname(os.path.abspath(__file__)), dataDirName, "alerts.log")
+#--------------------------------------------------------------------------------------------------------------------------------
+def isNumber(text: str) -> bool:
+  try:
+    float(text)
+    return True
+  except ValueError:
+    return False
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class Rule:
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, text: str):
+    parts = text.split()
+    if len(parts) != 3 or parts[1] not in OPERATORS:
+      raise globalsSa.CustomError(f"Invalid alert rule '{text}', expected '<column> {'|'.join(OPERATORS)} <column or number>'")
+    self.text = ' '.join(parts)
+    self.left, self.operator = parts[0], parts[1]
+    self.right = float(parts[2]) if isNumber(parts[2]) else parts[2]
+  #------------------------------------------------------------------------------------------------------------------------------
+  def columns(self) -> List[str]:
+    return [self.left] + ([self.right] if isinstance(self.right, str) else [])
+  #------------------------------------------------------------------------------------------------------------------------------
+  def difference(self, values: Dict[str, float]) -> float:
+    right = values.get(self.right, math.nan) if isinstance(self.right, str) else self.right
+    return values.get(self.left, math.nan) - right
+  #------------------------------------------------------------------------------------------------------------------------------
+  def check(self, previous: Optional[Dict[str, float]], current: Dict[str, float]) -> bool:
+    now = self.difference(current)
+    if self.operator == 'above':
+      return now > 0
+    if self.operator == 'below':
+      return now < 0
+    if previous is None:
+      return False
+    before = self.difference(previous)
+    if self.operator == 'crossesAbove':
+      return before <= 0 < now
+    return before >= 0 > now # crossesBelow, comparisons with NaN are False
+#--------------------------------------------------------------------------------------------------------------------------------
+def loadRules(filename: str = "alertRules") -> List[Rule]:
+  path = rulesPath(filename)
+  if not os.path.exists(path):
+    header = "# <column> crossesAbove|crossesBelow|above|below <column or number>\n"
+    atomicIo.writeText(path, header + ''.join(f"{text}\n" for text in DEFAULT_RULES))
+  rules = []
+  with open(path, 'r') as f:
+    for line in f:
+      line = line.strip()
+      if line and not line.startswith('#'):
+        try:
+          rules.append(Rule(line))
+        except globalsSa.CustomError as e:
+          print(e)
+  return rules
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+# incremental versions of the indicators.Calculator columns: warmup() with pandas on the history, update() per bar
+#--------------------------------------------------------------------------------------------------------------------------------
+class IndicatorState:
+  #------------------------------------------------------------------------------------------------------------------------------
+  def clone(self) -> 'IndicatorState':
+    """Copy for the evaluation of the last bar, cheaper than copy.deepcopy."""
+    other = object.__new__(type(self))
+    state = other.__dict__
+    state.update(self.__dict__)
+    for name, value in state.items():
+      if isinstance(value, collections.deque):
+        state[name] = value.copy()
+      elif isinstance(value, list):
+        state[name] = [item.copy() for item in value]
+    return other
+#--------------------------------------------------------------------------------------------------------------------------------
+class PriceState(IndicatorState):
+  columns = PRICE_COLUMNS
+  #------------------------------------------------------------------------------------------------------------------------------
+  def warmup(self, df: pd.DataFrame) -> Dict[str, float]:
+    return {column: float(df[column].iloc[-1]) for column in self.columns if column in df.columns}
+  #------------------------------------------------------------------------------------------------------------------------------
+  def update(self, bar: Dict[str, float]) -> Dict[str, float]:
+    return {column: bar[column] for column in self.columns if column in bar}
+#--------------------------------------------------------------------------------------------------------------------------------
+class RsiState(IndicatorState):
+  columns = ('Rsi',)
+  alphaUp, alphaDown = 1 / 11, 1 / 8 # ewm(com=10) and ewm(com=7) as in Calculator.addRsi
+  #------------------------------------------------------------------------------------------------------------------------------
+  def warmup(self, df: pd.DataFrame) -> Dict[str, float]:
+    delta = df['Close'].diff()
+    self.emaUp = float(delta.clip(lower=0).ewm(com=10, adjust=False).mean().iloc[-1])
+    self.emaDown = float((-1 * delta.clip(upper=0)).ewm(com=7, adjust=False).mean().iloc[-1])
+    self.lastClose = float(df['Close'].iloc[-1])
+    return self.values()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def update(self, bar: Dict[str, float]) -> Dict[str, float]:
+    delta = bar['Close'] - self.lastClose
+    up, down = max(delta, 0.0), max(-delta, 0.0)
+    self.emaUp = up if math.isnan(self.emaUp) else self.emaUp + self.alphaUp * (up - self.emaUp)
+    self.emaDown = down if math.isnan(self.emaDown) else self.emaDown + self.alphaDown * (down - self.emaDown)
+    self.lastClose = bar['Close']
+    return self.values()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def values(self) -> Dict[str, float]:
+    if math.isnan(self.emaUp) or math.isnan(self.emaDown) or (self.emaUp == 0 and self.emaDown == 0):
+      return {'Rsi': 50.0}
+    if self.emaDown == 0:
+      return {'Rsi': 100.0}
+    return {'Rsi': 100 - 100 / (1 + self.emaUp / self.emaDown)}
+#--------------------------------------------------------------------------------------------------------------------------------
+class MacdState(IndicatorState):
+  columns = ('Macd', 'MacdSignal', 'MacdHist')
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, slow: int = 29, fast: int = 12, smooth: int = 6):
+    self.alphas = (2 / (fast + 1), 2 / (slow + 1), 2 / (smooth + 1))
+    self.spans = (fast, slow, smooth)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def warmup(self, df: pd.DataFrame) -> Dict[str, float]:
+    fast, slow, smooth = self.spans
+    emaFast = df['Close'].ewm(span=fast, adjust=False).mean()
+    emaSlow = df['Close'].ewm(span=slow, adjust=False).mean()
+    signal = (emaFast - emaSlow).ewm(span=smooth, adjust=False).mean()
+    self.emaFast, self.emaSlow, self.signal = float(emaFast.iloc[-1]), float(emaSlow.iloc[-1]), float(signal.iloc[-1])
+    return self.values()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def update(self, bar: Dict[str, float]) -> Dict[str, float]:
+    alphaFast, alphaSlow, alphaSignal = self.alphas
+    self.emaFast += alphaFast * (bar['Close'] - self.emaFast)
+    self.emaSlow += alphaSlow * (bar['Close'] - self.emaSlow)
+    self.signal += alphaSignal * (self.emaFast - self.emaSlow - self.signal)
+    return self.values()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def values(self) -> Dict[str, float]:
+    macd = self.emaFast - self.emaSlow
+    return {'Macd': macd, 'MacdSignal': self.signal, 'MacdHist': macd - self.signal}
+#--------------------------------------------------------------------------------------------------------------------------------
+class BollingerState(IndicatorState):
+  columns = ('BbMiddle', 'BbUpper', 'BbLower', 'BbSize')
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, window: int = 20, numStdDev: int = 2):
+    self.window, self.numStdDev = window, numStdDev
+  #------------------------------------------------------------------------------------------------------------------------------
+  def warmup(self, df: pd.DataFrame) -> Dict[str, float]:
+    self.closes = collections.deque(df['Close'].iloc[-self.window:].astype(float), maxlen=self.window)
+    self.count = len(df)
+    return self.values()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def update(self, bar: Dict[str, float]) -> Dict[str, float]:
+    self.closes.append(bar['Close'])
+    self.count += 1
+    return self.values()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def values(self) -> Dict[str, float]:
+    if self.count < self.window:
+      return dict.fromkeys(self.columns, math.nan)
+    closes = self.closes # plain floats, numpy costs more than the 20 values
+    middle = sum(closes) / len(closes)
+    stdDev = math.sqrt(sum((close - middle) ** 2 for close in closes) / (len(closes) - 1))
+    return {'BbMiddle': middle, 'BbUpper': middle + stdDev * self.numStdDev, 'BbLower': middle - stdDev * self.numStdDev,
+            'BbSize': 2 * stdDev * self.numStdDev}
+#--------------------------------------------------------------------------------------------------------------------------------
+class MovingAverageState(IndicatorState):
+  """Sma{n}, Ema{n} (pandas ewm with adjust=True) and Cma{n} of one window."""
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, window: int):
+    self.window = window
+    self.columns = (f'Sma{window}', f'Ema{window}', f'Cma{window}')
+    self.decay = 1 - 2 / (window + 1)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def warmup(self, df: pd.DataFrame) -> Dict[str, float]:
+    closes = df['Close'].to_numpy(dtype='float64')
+    self.last = collections.deque(closes[-self.window:], maxlen=self.window)
+    self.windowSum = float(sum(self.last))
+    self.count, self.total = len(closes), float(closes.sum())
+    weights = self.decay ** np.arange(len(closes) - 1, -1, -1)
+    self.emaNumerator, self.emaDenominator = float(weights @ closes), float(weights.sum())
+    return self.values()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def update(self, bar: Dict[str, float]) -> Dict[str, float]:
+    close = bar['Close']
+    if len(self.last) == self.window:
+      self.windowSum -= self.last[0]
+    self.last.append(close)
+    self.windowSum += close
+    self.count += 1
+    self.total += close
+    self.emaNumerator = self.emaNumerator * self.decay + close
+    self.emaDenominator = self.emaDenominator * self.decay + 1
+    return self.values()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def values(self) -> Dict[str, float]:
+    if self.count < self.window:
+      return dict.fromkeys(self.columns, math.nan)
+    sma, ema, cma = self.columns
+    return {sma: self.windowSum / len(self.last), ema: self.emaNumerator / self.emaDenominator, cma: self.total / self.count}
+#--------------------------------------------------------------------------------------------------------------------------------
+class StochasticState(IndicatorState):
+  columns = ('stochK', 'stochD', 'stochKSlow', 'stochDSlow')
+  windows = ((16, 3), (44, 5)) # as in Calculator.addStochastic
+  #------------------------------------------------------------------------------------------------------------------------------
+  def warmup(self, df: pd.DataFrame) -> Dict[str, float]:
+    self.count = len(df)
+    self.highs = collections.deque(df['High'].iloc[-44:].astype(float), maxlen=44)
+    self.lows = collections.deque(df['Low'].iloc[-44:].astype(float), maxlen=44)
+    self.kValues = []
+    for kWindow, dWindow in self.windows:
+      lowMin = df['Low'].rolling(window=kWindow, min_periods=1).min().iloc[-dWindow:]
+      highMax = df['High'].rolling(window=kWindow, min_periods=1).max().iloc[-dWindow:]
+      k = (100 * ((df['Close'].iloc[-dWindow:] - lowMin) / (highMax - lowMin).replace(0, 1e-9))).fillna(50)
+      self.kValues.append(collections.deque(k.astype(float), maxlen=dWindow))
+    self.lastClose = float(df['Close'].iloc[-1])
+    return self.values()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def update(self, bar: Dict[str, float]) -> Dict[str, float]:
+    self.count += 1
+    self.highs.append(bar['High'])
+    self.lows.append(bar['Low'])
+    self.lastClose = bar['Close']
+    for (kWindow, dWindow), kValues in zip(self.windows, self.kValues):
+      lows, highs = list(self.lows)[-kWindow:], list(self.highs)[-kWindow:]
+      lowMin, highMax = min(lows), max(highs)
+      denominator = (highMax - lowMin) or 1e-9
+      k = 100 * (bar['Close'] - lowMin) / denominator
+      kValues.append(50.0 if math.isnan(k) else k)
+    return self.values()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def values(self) -> Dict[str, float]:
+    result = {}
+    for (kWindow, dWindow), kValues, (kName, dName) in zip(self.windows, self.kValues, (self.columns[:2], self.columns[2:])):
+      if kWindow > self.count:
+        result[kName] = result[dName] = 50.0
+      else:
+        result[kName], result[dName] = kValues[-1], sum(kValues) / len(kValues)
+    return result
+#--------------------------------------------------------------------------------------------------------------------------------
+def indicatorFor(column: str):
+  """The incremental state computing a Calculator column."""
+  for stateClass in (PriceState, RsiState, MacdState, BollingerState, StochasticState):
+    if column in stateClass.columns:
+      return stateClass()
+  match = re.fullmatch(r'(Sma|Ema|Cma)(\d+)', column)
+  if match:
+    return MovingAverageState(int(match.group(2)))
+  raise globalsSa.CustomError(f"Alert rules: unknown column '{column}'")
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class Alert(NamedTuple):
+  ticker: str
+  barTime: pd.Timestamp
+  rule: str
+  values: Dict[str, float]
+  firedAt: datetime.datetime
+  #------------------------------------------------------------------------------------------------------------------------------
+  def describe(self) -> str:
+    return ', '.join(f"{column}={value:.2f}" for column, value in self.values.items())
+#--------------------------------------------------------------------------------------------------------------------------------
+class TickerState:
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, indicatorStates: list):
+    self.indicators = indicatorStates
+    self.committedTime: Optional[pd.Timestamp] = None # last bar that can not change anymore
+    self.committedClose = math.nan
+    self.committedValues: Dict[str, float] = {}
+    self.fileStamp: Tuple[float, float] = (0.0, 0.0)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def warmup(self, df: pd.DataFrame) -> Dict[str, float]:
+    values = {}
+    for indicator in self.indicators:
+      values.update(indicator.warmup(df))
+    return values
+  #------------------------------------------------------------------------------------------------------------------------------
+  def update(self, bar: Dict[str, float], indicatorStates: Optional[list] = None) -> Dict[str, float]:
+    values = {}
+    for indicator in self.indicators if indicatorStates is None else indicatorStates:
+      values.update(indicator.update(bar))
+    return values
+#--------------------------------------------------------------------------------------------------------------------------------
+class AlertEngine:
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, rules: List[Rule], interval: str = '1d', dataDirName: str = "data"):
+    self.interval = interval
+    self.dataDirName = dataDirName
+    self.lock = threading.Lock()
+    self.logPath = alertLogPath(dataDirName)
+    self.fired = self.loadFiredKeys() # (ticker, bar, rule) already reported, also by earlier runs
+    self.setRules(rules)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def setRules(self, rules: List[Rule]):
+    validRules = []
+    for rule in rules:
+      try:
+        for column in rule.columns():
+          indicatorFor(column)
+        validRules.append(rule)
+      except globalsSa.CustomError as e:
+        print(e)
+    with self.lock:
+      self.rules = validRules
+      self.columns = list(dict.fromkeys(column for rule in validRules for column in rule.columns()))
+      self.states: Dict[str, TickerState] = {}
+  #------------------------------------------------------------------------------------------------------------------------------
+  def newTickerState(self) -> TickerState:
+    indicatorStates, seen = [], set()
+    for column in self.columns:
+      indicator = indicatorFor(column)
+      key = (type(indicator), getattr(indicator, 'window', None))
+      if key not in seen:
+        seen.add(key)
+        indicatorStates.append(indicator)
+    return TickerState(indicatorStates)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def fileStamp(self, ticker: str) -> Optional[Tuple[float, float]]:
+    path = loader.constructParquetFilePath(ticker, self.interval, self.dataDirName)
+    try:
+      dataMtime = os.stat(path).st_mtime
+    except OSError:
+      return None
+    try:
+      actionsMtime = os.stat(corporateActions.actionsPath(path)).st_mtime
+    except OSError:
+      actionsMtime = 0.0
+    return dataMtime, actionsMtime
+  #------------------------------------------------------------------------------------------------------------------------------
+  def scan(self, tickers: List[str]) -> List[Alert]:
+    """Evaluates the rules for the tickers whose cache file changed since the last scan."""
+    alerts = []
+    with self.lock:
+      for ticker in tickers:
+        stamp = self.fileStamp(ticker)
+        state = self.states.get(ticker)
+        if stamp is None or (state is not None and state.fileStamp == stamp):
+          continue
+        try:
+          alerts.extend(self.process(ticker, stamp))
+        except Exception as e:
+          print(f"Alert evaluation of {ticker} failed: {e}")
+          self.states.pop(ticker, None)
+    if alerts:
+      self.writeLog(alerts)
+    return alerts
+  #------------------------------------------------------------------------------------------------------------------------------
+  def loadBars(self, ticker: str, nBars: int) -> Optional[pd.DataFrame]:
+    return loader.loadRecentBars([ticker], self.interval, nBars, self.dataDirName).get(ticker)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def process(self, ticker: str, stamp: Tuple[float, float]) -> List[Alert]:
+    state = self.states.get(ticker)
+    df = self.loadBars(ticker, TAIL_BARS) if state is not None else None
+    if df is None or state.committedTime not in df.index or not math.isclose(df.at[state.committedTime, 'Close'], state.committedClose, rel_tol=1e-9):
+      # first time, too many new bars or the history was adjusted: rebuild from the whole file
+      df = self.loadBars(ticker, FULL_HISTORY)
+      if df is None or len(df) < 2:
+        return []
+      state = self.newTickerState()
+      state.committedValues = state.warmup(df.iloc[:-1])
+      state.committedTime, state.committedClose = df.index[-2], float(df['Close'].iloc[-2])
+      self.states[ticker] = state
+    state.fileStamp = stamp
+    first = df.index.searchsorted(state.committedTime, side='right')
+    newTimes = df.index[first:]
+    columns = [column for column in PRICE_COLUMNS if column in df.columns]
+    bars = [dict(zip(columns, row)) for row in df[columns].to_numpy(dtype='float64')[first:]]
+    alerts = []
+    for barTime, bar in zip(newTimes[:-1], bars[:-1]):
+      values = state.update(bar)
+      alerts.extend(self.evaluate(ticker, barTime, state.committedValues, values))
+      state.committedTime, state.committedClose, state.committedValues = barTime, bar['Close'], values
+    if bars: # the last bar may still change, evaluate it on a copy
+      values = state.update(bars[-1], [indicator.clone() for indicator in state.indicators])
+      alerts.extend(self.evaluate(ticker, newTimes[-1], state.committedValues, values))
+    return alerts
+  #------------------------------------------------------------------------------------------------------------------------------
+  def processLiveBar(self, ticker: str, barTime: pd.Timestamp, bar: Dict[str, float], final: bool,
+                     history: Optional[pd.DataFrame] = None) -> List[Alert]:
+    """Evaluates the rules for a bar of a live feed, a bar that is not final on a copy of the state. The state of a new
+    ticker is warmed up from history (bars before barTime) or the cache file. The alerts are not logged, the feed decides."""
+    with self.lock:
+      if not self.rules:
+        return []
+      state = self.states.get(ticker)
+      if state is None:
+        df = history if history is not None else self.loadBars(ticker, FULL_HISTORY)
+        df = df[df.index < barTime] if df is not None else None
+        if df is None or len(df) < 2:
+          return []
+        state = self.newTickerState()
+        state.committedValues = state.warmup(df)
+        state.committedTime, state.committedClose = df.index[-1], float(df['Close'].iloc[-1])
+        self.states[ticker] = state
+      if barTime <= state.committedTime:
+        return []
+      if not final:
+        return self.evaluate(ticker, barTime, state.committedValues, state.update(bar, [indicator.clone() for indicator in state.indicators]))
+      values = state.update(bar)
+      alerts = self.evaluate(ticker, barTime, state.committedValues, values)
+      state.committedTime, state.committedClose, state.committedValues = barTime, bar['Close'], values
+      return alerts
+  #------------------------------------------------------------------------------------------------------------------------------
+  def evaluate(self, ticker: str, barTime: pd.Timestamp, previous: Dict[str, float], current: Dict[str, float]) -> List[Alert]:
+    alerts = []
+    barKey = str(barTime)
+    for rule in self.rules:
+      key = (ticker, barKey, rule.text)
+      if key not in self.fired and rule.check(previous, current):
+        self.fired.add(key)
+        alerts.append(Alert(ticker, barTime, rule.text, {column: current.get(column, math.nan) for column in rule.columns()},
+                            datetime.datetime.now()))
+    return alerts
+  #------------------------------------------------------------------------------------------------------------------------------
+  def writeLog(self, alerts: List[Alert]):
+    try:
+      os.makedirs(os.path.dirname(self.logPath), exist_ok=True)
+      with open(self.logPath, 'a') as f:
+        for alert in alerts:
+          f.write(f"{alert.firedAt.isoformat(timespec='seconds')}\t{alert.ticker}\t{alert.barTime}\t{alert.rule}\t{alert.describe()}\n")
+    except Exception as e:
+      print(f"Error writing alert log {self.logPath}: {e}")
+  #------------------------------------------------------------------------------------------------------------------------------
+  def loadFiredKeys(self, maxLines: int = 5000) -> set:
+    fired = set()
+    if not os.path.exists(self.logPath):
+      return fired
+    try:
+      with open(self.logPath, 'r') as f:
+        for line in collections.deque(f, maxlen=maxLines):
+          parts = line.rstrip('\n').split('\t')
+          if len(parts) >= 4:
+            fired.add((parts[1], parts[2], parts[3]))
+    except Exception as e:
+      print(f"Error reading alert log {self.logPath}: {e}")
+    return fired
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class AlertPanel:
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, root: tk.Tk, alerts: List[Alert], onOpen: Callable[[str], None], onReloadRules: Callable[[], None]):
+    self.onOpen = onOpen
+    self.window = tk.Toplevel(root)
+    self.window.title("Alerts")
+    self.window.geometry("750x400")
+    controls = ttk.Frame(self.window, padding=3)
+    controls.pack(side=tk.TOP, fill=tk.X)
+    ttk.Label(controls, text=f"Rules: {rulesPath()}   Log: {alertLogPath()}").pack(side=tk.LEFT)
+    ttk.Button(controls, text="Reload Rules", command=onReloadRules).pack(side=tk.RIGHT)
+    self.tree = ttk.Treeview(self.window, columns=('time', 'ticker', 'bar', 'rule', 'values'), show='headings')
+    for column, text, width in (('time', 'Time', 70), ('ticker', 'Ticker', 80), ('bar', 'Bar', 90), ('rule', 'Rule', 200), ('values', 'Values', 250)):
+      self.tree.heading(column, text=text)
+      self.tree.column(column, width=width, anchor='w')
+    self.tree.pack(fill=tk.BOTH, expand=True)
+    self.tree.bind("<Double-1>", self.handleDoubleClick)
+    self.addAlerts(alerts)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def exists(self) -> bool:
+    try:
+      return bool(self.window.winfo_exists())
+    except tk.TclError:
+      return False
+  #------------------------------------------------------------------------------------------------------------------------------
+  def addAlerts(self, alerts: List[Alert]):
+    for alert in alerts:
+      self.tree.insert('', 0, values=(alert.firedAt.strftime('%H:%M:%S'), alert.ticker, str(alert.barTime)[:16], alert.rule, alert.describe()))
+    children = self.tree.get_children()
+    if len(children) > MAX_ALERTS:
+      self.tree.delete(*children[MAX_ALERTS:])
+  #------------------------------------------------------------------------------------------------------------------------------
+  def handleDoubleClick(self, event):
+    selection = self.tree.selection()
+    if selection:
+      self.onOpen(self.tree.set(selection[0], 'ticker'))
@@ -0,0 +1,144 @@
+"""Crash and multi-process safe file writes: a temporary file in the same directory, fsync, os.replace.
+
+A reader opens either the old or the new file, never a partly written one, so reads need no lock and never wait.
+Writers which read, merge and write a file (loader, intradayStore) serialize on an advisory lock per file:
+
+  data/AAPL_1d.parquet             written with writeParquet()
+  data/.locks/AAPL_1d.parquet.lock lock file of fileLock('data/AAPL_1d.parquet'), fcntl.flock (POSIX) or msvcrt.locking (windows)
+
+The locks are advisory: only writers which take them are serialized. A lock is re-entrant within a process, so
+saveData() can be called while fetchAndProcessIntervalData() holds the lock of the same file.
+Kept free of pandas & co. so stockList can use it before the heavy imports are done.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, IO, Optional
+
+if sys.platform == 'win32':
+  import msvcrt
+else:
+  import fcntl
+#--------------------------------------------------------------------------------------------------------------------------------
+LOCK_DIR = ".locks"
+REPLACE_RETRIES = 20       # windows refuses to replace a file another process has open, retry for about a second
+REPLACE_RETRY_DELAY = 0.05
+#--------------------------------------------------------------------------------------------------------------------------------
+def fsyncDirectory(directory: str):
+  """Makes the rename itself durable, not possible (and not needed) on windows."""
+  if sys.platform == 'win32':
+    return
+  fd = os.open(directory, os.O_RDONLY)
+  try:
+    os.fsync(fd)
+  finally:
+    os.close(fd)
+#--------------------------------------------------------------------------------------------------------------------------------
+def replaceFile(path: str, write: Callable[[IO[bytes]], None], durable: bool = True):
+  """Calls write(file) with a temporary binary file next to path and renames it to path when write returns.
+  durable: fsync the file and the directory, caches which can be rebuilt (hot tier) skip it.
+  """
+  directory = os.path.dirname(os.path.abspath(path))
+  os.makedirs(directory, exist_ok=True)
+  fd, tmpPath = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      write(f)
+      if durable:
+        f.flush()
+        os.fsync(f.fileno())
+    for attempt in range(REPLACE_RETRIES):
+      try:
+        os.replace(tmpPath, path)
+        break
+      except PermissionError:
+        if sys.platform != 'win32' or attempt == REPLACE_RETRIES - 1:
+          raise
+        time.sleep(REPLACE_RETRY_DELAY)
+    if durable:
+      fsyncDirectory(directory)
+  except BaseException:
+    try:
+      os.remove(tmpPath)
+    except OSError:
+      pass
+    raise
+#--------------------------------------------------------------------------------------------------------------------------------
+def writeParquet(df, path: str, durable: bool = True):
+  replaceFile(path, lambda f: df.to_parquet(f, engine='pyarrow', index=True), durable)
+#--------------------------------------------------------------------------------------------------------------------------------
+def writeText(path: str, text: str, durable: bool = True):
+  """Same content as open(path, 'w').write(text), '\\n' becomes os.linesep."""
+  replaceFile(path, lambda f: f.write(text.replace('\n', os.linesep).encode('utf-8')), durable)
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class FileLock:
+  """Exclusive advisory lock of one file across processes, re-entrant for the thread holding it."""
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, lockPath: str):
+    self.lockPath = lockPath
+    self.threadLock = threading.RLock() # flock does not serialize the threads of one process
+    self.depth = 0
+    self.file: Optional[IO[bytes]] = None
+  #------------------------------------------------------------------------------------------------------------------------------
+  def acquire(self):
+    self.threadLock.acquire()
+    if self.depth == 0:
+      try:
+        os.makedirs(os.path.dirname(self.lockPath), exist_ok=True)
+        self.file = open(self.lockPath, 'a+b')
+        if sys.platform == 'win32':
+          while True:
+            try:
+              self.file.seek(0)
+              msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1) # gives up after 10 s with OSError
+              break
+            except OSError:
+              pass
+        else:
+          fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+      except BaseException:
+        if self.file is not None:
+          self.file.close()
+          self.file = None
+        self.threadLock.release()
+        raise
+    self.depth += 1
+  #------------------------------------------------------------------------------------------------------------------------------
+  def release(self):
+    self.depth -= 1
+    if self.depth == 0:
+      try:
+        if sys.platform == 'win32':
+          self.file.seek(0)
+          msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+          fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+      finally:
+        self.file.close()
+        self.file = None
+    self.threadLock.release()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __enter__(self) -> 'FileLock':
+    self.acquire()
+    return self
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __exit__(self, *exc):
+    self.release()
+#--------------------------------------------------------------------------------------------------------------------------------
+locks: Dict[str, FileLock] = {}
+locksLock = threading.Lock()
+#--------------------------------------------------------------------------------------------------------------------------------
+def lockPath(path: str) -> str:
+  directory, name = os.path.split(os.path.abspath(path))
+  return os.path.join(directory, LOCK_DIR, name + ".lock")
+#--------------------------------------------------------------------------------------------------------------------------------
+def fileLock(path: str) -> FileLock:
+  """The lock of a file (or a directory such as data/intraday/AAPL), one instance per process and path."""
+  key = lockPath(path)
+  with locksLock:
+    if key not in locks:
+      locks[key] = FileLock(key)
+    return locks[key]
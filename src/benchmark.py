@@ -0,0 +1,264 @@
+"""Offline benchmark suite for the loader, the indicators and the charting.
+
+Usage:
+  python benchmark.py                                  # run and write log/benchmark.json
+  python benchmark.py --sizes 500 2500 --repeat 3
+  python benchmark.py --output new.json --compare log/benchmark.json
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import List, Dict, Any, Optional, Callable
+
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # no display needed, must be set before pyplot gets imported
+import matplotlib.pyplot as plt
+
+import hotCache
+import loader
+import indicators
+from syntheticData import generateOhlcv
+#--------------------------------------------------------------------------------------------------------------------------------
+DEFAULT_SIZES = [500, 2500, 10000]
+#--------------------------------------------------------------------------------------------------------------------------------
+def timeIt(function: Callable[[], Any], repeat: int, setup: Optional[Callable[[], Any]] = None) -> Dict[str, float]:
+  """setup runs before each repeat and is not timed."""
+  times = []
+  for _ in range(repeat):
+    if setup is not None:
+      setup()
+    start = time.perf_counter()
+    function()
+    times.append(time.perf_counter() - start)
+  return {'min': min(times), 'median': statistics.median(times), 'repeat': repeat}
+#--------------------------------------------------------------------------------------------------------------------------------
+def benchmarkIndicators(df: pd.DataFrame, repeat: int) -> Dict[str, Dict[str, float]]:
+  results = {}
+  calc = indicators.Calculator()
+  results['indicators.calculate'] = timeIt(lambda: calc.setDataframe(df).calculate(), repeat)
+  methods = ['addMovingAverages', 'addBollingerBands', 'addMacd', 'addRsi', 'addStochastic', 'addVolatility', 'addFusedIndicators']
+  for name in methods:
+    def run():
+      getattr(calc.setDataframe(df), name)()
+    results[f'indicators.{name}'] = timeIt(run, repeat)
+  # the kernel alone, without the column inserts into the frame
+  high, low, close, volume = (df[col].to_numpy(dtype='float64') for col in ['High', 'Low', 'Close', 'Volume'])
+  results['indicators.fusedIndicators'] = timeIt(lambda: indicators.fusedIndicators(high, low, close, volume), repeat)
+  results['indicators.pandasFusedReference'] = timeIt(lambda: pandasFusedReference(df), repeat)
+  return results
+#--------------------------------------------------------------------------------------------------------------------------------
+def benchmarkIndicatorCache(df: pd.DataFrame, repeat: int, workDir: str) -> Dict[str, Dict[str, float]]:
+  """indicatorCache.calculate without a file, with an unchanged file and with one new bar."""
+  import indicatorCache
+  path = indicatorCache.cachePath('SYN', '1d', workDir)
+  def cold():
+    if os.path.exists(path):
+      os.remove(path)
+    indicatorCache.calculate(df, 'SYN', '1d', workDir)
+  def appendBar():
+    # a frame with another first bar replaces the file (the learned warmups stay), then the file has all but the last two bars
+    indicatorCache.calculate(df.iloc[1:], 'SYN', '1d', workDir)
+    indicatorCache.calculate(df.iloc[:-2], 'SYN', '1d', workDir)
+    start = time.perf_counter()
+    indicatorCache.calculate(df.iloc[:-1], 'SYN', '1d', workDir)
+    return time.perf_counter() - start
+  results = {'indicatorCache.cold': timeIt(cold, repeat)}
+  results['indicatorCache.hit'] = timeIt(lambda: indicatorCache.calculate(df, 'SYN', '1d', workDir), repeat)
+  appendBar() # the first append finds the warmup of each group
+  times = [appendBar() for _ in range(repeat)]
+  results['indicatorCache.appendBar'] = {'min': min(times), 'median': statistics.median(times), 'repeat': repeat}
+  return results
+#--------------------------------------------------------------------------------------------------------------------------------
+def pandasFusedReference(df: pd.DataFrame, volaWindow: int = 20, atrWindow: int = 14, vwapWindow: int = 20) -> pd.DataFrame:
+  """The columns of Calculator.addFusedIndicators one by one with pandas, the baseline for speed and values."""
+  high, low, close, volume = df['High'], df['Low'], df['Close'], df['Volume']
+  prevClose = close.shift().fillna(close.iloc[0])
+  result = pd.DataFrame(index=df.index)
+  result[f'Vola{volaWindow}'] = np.log(close / close.shift()).rolling(volaWindow).std() * 252 ** .5 * 100
+  trueRange = pd.concat([high - low, (high - prevClose).abs(), (low - prevClose).abs()], axis=1).max(axis=1)
+  result['Atr'] = trueRange.ewm(alpha=1 / atrWindow, adjust=False).mean()
+  up, down = high.diff().fillna(0), -low.diff().fillna(0)
+  plusDm = up.where((up > down) & (up > 0), 0.0)
+  minusDm = down.where((down > up) & (down > 0), 0.0)
+  result['PlusDi'] = 100 * plusDm.ewm(alpha=1 / atrWindow, adjust=False).mean() / result['Atr']
+  result['MinusDi'] = 100 * minusDm.ewm(alpha=1 / atrWindow, adjust=False).mean() / result['Atr']
+  dx = 100 * (result['PlusDi'] - result['MinusDi']).abs() / (result['PlusDi'] + result['MinusDi'])
+  result['Adx'] = dx.fillna(0).ewm(alpha=1 / atrWindow, adjust=False).mean()
+  result['Obv'] = (np.sign(close.diff()).fillna(0) * volume).cumsum()
+  typical = (high + low + close) / 3
+  result['Vwap'] = (typical * volume).rolling(vwapWindow).sum() / volume.rolling(vwapWindow).sum()
+  return result
+#--------------------------------------------------------------------------------------------------------------------------------
+def benchmarkLoader(df: pd.DataFrame, repeat: int, workDir: str) -> Dict[str, Dict[str, float]]:
+  results = {}
+  path = os.path.join(workDir, f"SYN{len(df)}_1d.parquet")
+  results['loader.saveData'] = timeIt(lambda: loader.saveData(df, path), repeat)
+  def clearHotCache():
+    try:
+      os.remove(hotCache.hotPath(path))
+    except FileNotFoundError:
+      pass
+  # saveData also writes the hot copy: without clearing it every load would be a hot cache hit, not a parquet read
+  results['loader.loadLocalData'] = timeIt(lambda: loader.loadLocalData(path, 'SYN', '1d'), repeat, clearHotCache)
+  results['loader.loadLocalData.hotCache'] = timeIt(lambda: loader.loadLocalData(path, 'SYN', '1d'), repeat)
+  def roundTrip():
+    loader.saveData(df, path)
+    loader.loadLocalData(path, 'SYN', '1d')
+  results['loader.roundTrip'] = timeIt(roundTrip, repeat)
+  # local file misses the last 5% of the bars, the provider delivers them with some overlap
+  split = int(len(df) * 0.95)
+  localData, newData = df.iloc[:split], df.iloc[split - 5:]
+  startDate, endDate = df.index[0].date(), df.index[-1].date()
+  def fetchAndMerge():
+    loader.determineFetchParameters(localData, startDate, endDate, '1d', 'SYN')
+    loader.mergeData(localData, newData)
+  results['loader.determineFetchParameters+merge'] = timeIt(fetchAndMerge, repeat)
+  return results
+#--------------------------------------------------------------------------------------------------------------------------------
+def benchmarkCharting(df: pd.DataFrame, repeat: int) -> Dict[str, Dict[str, float]]:
+  import stockAnalyzer
+  stockAnalyzer.importHeavyModules()
+  chartUtils = stockAnalyzer.ChartingUtils()
+  calculated = indicators.Calculator().setDataframe(df).calculate().get()
+  def createFigure():
+    fig = chartUtils.createStockChartFigure(calculated, 'SYN', 'Daily')
+    plt.close(fig)
+  def createAndRender():
+    fig = chartUtils.createStockChartFigure(calculated, 'SYN', 'Daily')
+    fig.canvas.draw()
+    plt.close(fig)
+  return {
+    'charting.createStockChartFigure': timeIt(createFigure, repeat),
+    'charting.createStockChartFigure+draw': timeIt(createAndRender, repeat),
+  }
+#--------------------------------------------------------------------------------------------------------------------------------
+def benchmarkGrid(repeat: int, cells: int = 64, nBars: int = 60) -> Dict[str, Dict[str, float]]:
+  from matplotlib.figure import Figure
+  from matplotlib.backends.backend_agg import FigureCanvasAgg
+  import gridView
+  frames = [(f"SYN{i:02d}", generateOhlcv(nBars, seed=i)) for i in range(cells)]
+  figure = Figure(figsize=(14, 9), dpi=100)
+  canvas = FigureCanvasAgg(figure)
+  grid = gridView.GridFigure(figure, cells)
+  def render(mode: str):
+    grid.setData(frames, mode)
+    canvas.draw()
+  return {
+    f'charting.grid{cells}.candles+draw': timeIt(lambda: render('candles'), repeat),
+    f'charting.grid{cells}.line+draw': timeIt(lambda: render('line'), repeat),
+  }
+#--------------------------------------------------------------------------------------------------------------------------------
+def benchmarkAlerts(repeat: int, workDir: str, tickers: int = 200, nBars: int = 2500) -> Dict[str, Dict[str, float]]:
+  """One alert scan in which the cache file of every ticker changed (the default rules, per-ticker time = value / tickers)."""
+  import alerts
+  for i in range(tickers):
+    loader.saveData(generateOhlcv(nBars, seed=i), loader.constructParquetFilePath(f"ALERT{i:04d}", '1d', workDir))
+  symbols = [f"ALERT{i:04d}" for i in range(tickers)]
+  engine = alerts.AlertEngine([alerts.Rule(text) for text in alerts.DEFAULT_RULES], dataDirName=workDir)
+  def changedScan():
+    for state in engine.states.values():
+      state.fileStamp = (0.0, 0.0)
+    engine.scan(symbols)
+  return {
+    f'alerts.scan{tickers}.warmup': timeIt(lambda: alerts.AlertEngine(engine.rules, dataDirName=workDir).scan(symbols), 1),
+    f'alerts.scan{tickers}.changed': timeIt(changedScan, repeat),
+    f'alerts.scan{tickers}.unchanged': timeIt(lambda: engine.scan(symbols), repeat),
+  }
+#--------------------------------------------------------------------------------------------------------------------------------
+def runBenchmarks(sizes: List[int], repeat: int, chartMaxBars: int) -> Dict[str, Any]:
+  results: Dict[str, Dict[str, float]] = {}
+  workDir = tempfile.mkdtemp(prefix='stockAnalyzerBench')
+  try:
+    for size in sizes:
+      df = generateOhlcv(size, seed=size)
+      print(f"Benchmarking {size} bars ...")
+      sizeResults = benchmarkIndicators(df, repeat)
+      with contextlib.redirect_stdout(io.StringIO()): # loader reports every file access
+        sizeResults.update(benchmarkLoader(df, repeat, workDir))
+        sizeResults.update(benchmarkIndicatorCache(df, repeat, workDir))
+      if size <= chartMaxBars:
+        sizeResults.update(benchmarkCharting(df, repeat))
+      for name, value in sizeResults.items():
+        results[f"{name}[{size}]"] = value
+    for name, value in benchmarkGrid(repeat).items():
+      results[name] = value
+    with contextlib.redirect_stdout(io.StringIO()):
+      results.update(benchmarkAlerts(repeat, workDir))
+  finally:
+    shutil.rmtree(workDir, ignore_errors=True)
+  return {
+    'meta': {
+      'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+      'python': platform.python_version(),
+      'platform': platform.platform(),
+      'pandas': pd.__version__,
+      'numpy': np.__version__,
+      'matplotlib': matplotlib.__version__,
+      'sizes': sizes,
+      'repeat': repeat,
+    },
+    'results': results,
+  }
+#--------------------------------------------------------------------------------------------------------------------------------
+def compareResults(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+  """Prints current vs. baseline (median times) and returns the names that got slower than threshold."""
+  regressions = []
+  baseResults = baseline.get('results', {})
+  print(f"{'benchmark':<58}{'baseline':>12}{'current':>12}{'ratio':>8}")
+  for name, value in current['results'].items():
+    base = baseResults.get(name)
+    if base is None:
+      print(f"{name:<58}{'-':>12}{value['median']*1000:>10.2f}ms{'new':>8}")
+      continue
+    ratio = value['median'] / base['median'] if base['median'] > 0 else float('inf')
+    flag = ''
+    if ratio > threshold:
+      flag = ' <-- slower'
+      regressions.append(name)
+    print(f"{name:<58}{base['median']*1000:>10.2f}ms{value['median']*1000:>10.2f}ms{ratio:>8.2f}{flag}")
+  return regressions
+#--------------------------------------------------------------------------------------------------------------------------------
+def printResults(current: Dict[str, Any]):
+  for name, value in current['results'].items():
+    print(f"{name:<58}min {value['min']*1000:>10.2f}ms  median {value['median']*1000:>10.2f}ms")
+#--------------------------------------------------------------------------------------------------------------------------------
+def main(argv: Optional[List[str]] = None) -> int:
+  scriptDir = os.path.dirname(os.path.abspath(__file__))
+  parser = argparse.ArgumentParser(description="Offline benchmarks for stockAnalyzer.")
+  parser.add_argument("--sizes", type=int, nargs='+', default=DEFAULT_SIZES, help="Number of bars per synthetic series.")
+  parser.add_argument("--repeat", type=int, default=5, help="Repetitions per benchmark.")
+  parser.add_argument("--chart-max-bars", type=int, default=2500, help="Skip charting for bigger series.")
+  parser.add_argument("--output", default=os.path.join(scriptDir, 'log', 'benchmark.json'), help="Result file (json).")
+  parser.add_argument("--compare", default=None, help="Baseline file to compare with.")
+  parser.add_argument("--threshold", type=float, default=1.25, help="Ratio current/baseline counted as regression.")
+  opt = parser.parse_args(argv)
+
+  current = runBenchmarks(opt.sizes, opt.repeat, opt.chart_max_bars)
+  os.makedirs(os.path.dirname(os.path.abspath(opt.output)), exist_ok=True)
+  with open(opt.output, 'w') as f:
+    json.dump(current, f, indent=2)
+  print(f"Results written to {opt.output}")
+  if opt.compare:
+    with open(opt.compare) as f:
+      baseline = json.load(f)
+    regressions = compareResults(current, baseline, opt.threshold)
+    if regressions:
+      print(f"{len(regressions)} benchmark(s) slower than {opt.threshold:.2f}x baseline.")
+      return 1
+  else:
+    printResults(current)
+  return 0
+#----------------------------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,189 @@
+"""Compact representation of the processed frames and a process-wide memory manager with a byte budget.
+
+compact() keeps the prices (Open, High, Low, Close) as float64 and stores
+  indicator columns    as float32 (half the bytes, see the parity report for the error)
+  Volume               as int32 if it fits, otherwise unchanged
+  constant columns     (Vola) as scalars in df.attrs['constants'], expand() turns them into columns again
+It is opt-in with globalsSa.COMPACT_FRAMES.
+
+The MemoryManager holds frames (or tuples/dicts of frames) under keys, counts their bytes and evicts the least
+recently used ones above the budget (globalsSa.FRAME_MEMORY_MB). getManager() is the one instance of the process.
+
+  python compactFrame.py                # parity report float32 vs. float64 and the memory of a processed frame
+  python compactFrame.py --sizes 500 5000
+"""
+import argparse
+import collections
+import sys
+import threading
+from typing import Any, Dict, Hashable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import globalsSa
+#--------------------------------------------------------------------------------------------------------------------------------
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close']
+INT32_MAX = np.iinfo(np.int32).max
+OSCILLATOR_CENTERS = {'Macd': 0.0, 'MacdHist': 0.0, 'Rsi': 50.0, 'stochK': 50.0, 'stochD': 50.0, 'stochKSlow': 50.0, 'stochDSlow': 50.0}
+#--------------------------------------------------------------------------------------------------------------------------------
+def isCompact(df: pd.DataFrame) -> bool:
+  return 'constants' in df.attrs
+#--------------------------------------------------------------------------------------------------------------------------------
+def compact(df: pd.DataFrame) -> pd.DataFrame:
+  """float32 indicators, int32 volume and constant columns as scalars, the prices stay float64."""
+  if df is None or df.empty or isCompact(df):
+    return df
+  columns: Dict[str, np.ndarray] = {}
+  constants: Dict[str, float] = {}
+  for col in df.columns:
+    values = df[col].to_numpy()
+    if col in PRICE_COLUMNS or values.dtype.kind not in 'fiu':
+      columns[col] = values
+    elif col == 'Volume':
+      fits = values.dtype.kind in 'iu' or (np.isfinite(values).all() and (values == np.round(values)).all())
+      columns[col] = values.astype(np.int32) if fits and (len(values) == 0 or (values.min() >= 0 and values.max() <= INT32_MAX)) else values
+    elif len(values) > 1 and values[0] == values[0] and (values == values[0]).all():
+      constants[col] = float(values[0]) # the same value in every row (and no NaN)
+    else:
+      columns[col] = values.astype(np.float32)
+  result = pd.DataFrame(columns, index=df.index)
+  result.attrs = dict(df.attrs, constants=constants)
+  return result
+#--------------------------------------------------------------------------------------------------------------------------------
+def expand(df: pd.DataFrame) -> pd.DataFrame:
+  """The constant columns of a compact frame as columns again (float64), other frames are returned as they are."""
+  if df is None or not isCompact(df) or not df.attrs['constants']:
+    return df
+  constants = df.attrs['constants']
+  result = pd.concat([df, pd.DataFrame({col: np.full(len(df), value) for col, value in constants.items()}, index=df.index)], axis=1)
+  result.attrs = {key: value for key, value in df.attrs.items() if key != 'constants'}
+  return result
+#--------------------------------------------------------------------------------------------------------------------------------
+def frameBytes(value: Any) -> int:
+  """Bytes of a frame, or of the frames in a tuple, list or dict."""
+  if isinstance(value, pd.DataFrame):
+    return int(value.memory_usage(index=True, deep=True).sum())
+  if isinstance(value, dict):
+    return sum(frameBytes(v) for v in value.values())
+  if isinstance(value, (tuple, list)):
+    return sum(frameBytes(v) for v in value)
+  return 0
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class MemoryManager:
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, budgetBytes: int):
+    self.budgetBytes = budgetBytes
+    self.entries: 'collections.OrderedDict[Hashable, List[Any]]' = collections.OrderedDict() # key -> [value, bytes]
+    self.totalBytes = 0
+    self.lock = threading.Lock()
+    self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'evictedBytes': 0}
+  #------------------------------------------------------------------------------------------------------------------------------
+  def put(self, key: Hashable, value: Any, nbytes: Optional[int] = None):
+    """Stores value (the bytes are counted from its frames if not given) and evicts above the budget."""
+    nbytes = frameBytes(value) if nbytes is None else nbytes
+    with self.lock:
+      if key in self.entries:
+        self.totalBytes -= self.entries.pop(key)[1]
+      self.entries[key] = [value, nbytes]
+      self.totalBytes += nbytes
+      self.evict(keep=key)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def get(self, key: Hashable, default: Any = None) -> Any:
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is None:
+        self.stats['misses'] += 1
+        return default
+      self.entries.move_to_end(key)
+      self.stats['hits'] += 1
+      return entry[0]
+  #------------------------------------------------------------------------------------------------------------------------------
+  def resize(self, key: Hashable, nbytes: Optional[int] = None):
+    """Counts the bytes of an entry again, e.g. after frames were added to it."""
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is None:
+        return
+      newBytes = frameBytes(entry[0]) if nbytes is None else nbytes
+      self.totalBytes += newBytes - entry[1]
+      entry[1] = newBytes
+      self.evict(keep=key)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def discard(self, key: Hashable):
+    with self.lock:
+      entry = self.entries.pop(key, None)
+      if entry is not None:
+        self.totalBytes -= entry[1]
+  #------------------------------------------------------------------------------------------------------------------------------
+  def evict(self, keep: Hashable = None):
+    """Removes the least recently used entries above the budget, the lock is held by the caller."""
+    for key in list(self.entries):
+      if self.totalBytes <= self.budgetBytes:
+        break
+      if key == keep:
+        continue # the entry just stored stays even if it alone is above the budget
+      nbytes = self.entries.pop(key)[1]
+      self.totalBytes -= nbytes
+      self.stats['evictions'] += 1
+      self.stats['evictedBytes'] += nbytes
+  #------------------------------------------------------------------------------------------------------------------------------
+  def usage(self) -> Dict[str, Any]:
+    with self.lock:
+      return dict(self.stats, entries=len(self.entries), bytes=self.totalBytes, budgetBytes=self.budgetBytes)
+#--------------------------------------------------------------------------------------------------------------------------------
+manager: Optional[MemoryManager] = None
+managerLock = threading.Lock()
+#--------------------------------------------------------------------------------------------------------------------------------
+def getManager() -> MemoryManager:
+  global manager
+  with managerLock:
+    if manager is None:
+      manager = MemoryManager(int(globalsSa.FRAME_MEMORY_MB * 2**20))
+    return manager
+#--------------------------------------------------------------------------------------------------------------------------------
+# parity report
+#--------------------------------------------------------------------------------------------------------------------------------
+def parityReport(df: pd.DataFrame) -> pd.DataFrame:
+  """Error of the compact frame against the float64 frame per column.
+  maxRelError is relative to the largest absolute value of the column. signFlips counts the bars of the
+  oscillators whose side of OSCILLATOR_CENTERS differs (MacdHist: MACD above or below its signal).
+  """
+  compactDf = compact(df)
+  rows = []
+  for col in df.columns:
+    if col not in compactDf.columns or compactDf[col].dtype != np.float32:
+      continue
+    exact = df[col].to_numpy(dtype='float64')
+    approx = compactDf[col].to_numpy(dtype='float64')
+    scale = np.nanmax(np.abs(exact)) if np.isfinite(exact).any() else 0.0
+    error = np.abs(approx - exact)
+    flips = 0
+    if col in OSCILLATOR_CENTERS:
+      valid = np.isfinite(exact) & np.isfinite(approx)
+      center = OSCILLATOR_CENTERS[col]
+      flips = int(np.sum(np.sign(exact[valid] - center) != np.sign(approx[valid] - center)))
+    rows.append({'column': col, 'maxAbsError': np.nanmax(error) if len(error) else 0.0,
+                 'maxRelError': np.nanmax(error) / scale if scale > 0 else 0.0, 'signFlips': flips})
+  return pd.DataFrame(rows).set_index('column')
+#--------------------------------------------------------------------------------------------------------------------------------
+def main(argv: Optional[List[str]] = None) -> int:
+  parser = argparse.ArgumentParser(description="Parity report of the compact (float32) frames against float64.")
+  parser.add_argument("--sizes", type=int, nargs='+', default=[500, 2500, 10000], help="Bars of the synthetic frames.")
+  opt = parser.parse_args(argv)
+  import indicators
+  from syntheticData import generateOhlcv
+  pd.set_option('display.width', 160)
+  for size in opt.sizes:
+    df = indicators.Calculator().setDataframe(generateOhlcv(size, seed=size)).calculate().get()
+    compactDf = compact(df)
+    print(f"\n{size} bars: {frameBytes(df) / 1024:.0f} KiB -> {frameBytes(compactDf) / 1024:.0f} KiB, "
+          f"constants {compactDf.attrs['constants']}")
+    report = parityReport(df)
+    print(report.sort_values('maxRelError', ascending=False).head(12).to_string(float_format=lambda v: f"{v:.2e}"))
+    print(f"worst relative error {report['maxRelError'].max():.2e}, bars with a flipped sign/side: {report['signFlips'].sum()}")
+  return 0
+#----------------------------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+  sys.exit(main())
@@ -1 +1,2 @@
 port = 7496
+account = ""         # account code for the account updates, empty: the only account of the login
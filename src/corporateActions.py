@@ -0,0 +1,115 @@
+"""Corporate actions (splits, dividends) next to the raw price cache.
+
+The parquet files keep the bars as traded (unadjusted). The actions of a file are kept in
+{ticker}_{interval}_actions.parquet with the columns Dividends (as paid per share at that time) and
+Stock Splits (ratio, e.g. 4.0 for 4:1). Adjusted prices are computed when reading:
+
+  adjusted = raw * dividendFactor / splitFactor,  adjusted volume = raw volume * splitFactor
+
+where the factors of a bar are the products over all actions after the day of that bar.
+A missing actions file means the parquet file was written before, with already adjusted prices.
+"""
+import os
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+import atomicIo
+#--------------------------------------------------------------------------------------------------------------------------------
+ACTION_COLUMNS = ['Dividends', 'Stock Splits']
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close']
+#--------------------------------------------------------------------------------------------------------------------------------
+def emptyActions() -> pd.DataFrame:
+  return pd.DataFrame({c: pd.Series(dtype='float64') for c in ACTION_COLUMNS}, index=pd.DatetimeIndex([], name='Date'))
+#--------------------------------------------------------------------------------------------------------------------------------
+def actionsPath(parquetFilePath: str) -> str:
+  return parquetFilePath.replace('.parquet', '_actions.parquet')
+#--------------------------------------------------------------------------------------------------------------------------------
+def loadActions(parquetFilePath: str) -> Optional[pd.DataFrame]:
+  path = actionsPath(parquetFilePath)
+  if not os.path.exists(path):
+    return None
+  try:
+    return pd.read_parquet(path)
+  except Exception as e:
+    print(f"Error reading actions file {path}: {e}.")
+    return None
+#--------------------------------------------------------------------------------------------------------------------------------
+def saveActions(actions: pd.DataFrame, parquetFilePath: str):
+  try:
+    atomicIo.writeParquet(actions, actionsPath(parquetFilePath))
+  except Exception as e:
+    print(f"Error saving actions {actionsPath(parquetFilePath)}: {e}")
+#--------------------------------------------------------------------------------------------------------------------------------
+def extractActions(df: pd.DataFrame) -> Optional[pd.DataFrame]:
+  """The rows of a fetched frame with a dividend or a split, None if the provider does not report actions."""
+  if df is None or not all(c in df.columns for c in ACTION_COLUMNS):
+    return None
+  actions = df[ACTION_COLUMNS].fillna(0.0).astype('float64')
+  splits = actions['Stock Splits']
+  actions = actions[(actions['Dividends'] != 0) | ((splits != 0) & (splits != 1))]
+  actions.index.name = 'Date'
+  return actions
+#--------------------------------------------------------------------------------------------------------------------------------
+def mergeActions(actions: Optional[pd.DataFrame], newActions: Optional[pd.DataFrame]) -> pd.DataFrame:
+  merged = pd.concat([f for f in [emptyActions(), actions, newActions] if f is not None])
+  merged = merged[~merged.index.duplicated(keep='last')]
+  return merged.sort_index()
+#--------------------------------------------------------------------------------------------------------------------------------
+def splitRatios(actions: pd.DataFrame) -> np.ndarray:
+  splits = actions['Stock Splits'].to_numpy(dtype='float64')
+  return np.where((splits == 0) | np.isnan(splits), 1.0, splits)
+#--------------------------------------------------------------------------------------------------------------------------------
+def cumulativeAfter(index: pd.DatetimeIndex, actionIndex: pd.DatetimeIndex, factors: np.ndarray) -> np.ndarray:
+  """For every bar the product of the factors of all actions after the day of the bar."""
+  # an action applies to the bars before the first bar on or after its day
+  positions = np.searchsorted(index.normalize().asi8, actionIndex.normalize().asi8, side='left')
+  perBar = np.ones(len(index) + 1)
+  np.multiply.at(perBar, positions, factors) # actions after the last bar land in the extra slot
+  # reverse cumulative product, shifted by one: bar i gets the product of perBar[i+1:]
+  return np.cumprod(perBar[::-1])[::-1][1:]
+#--------------------------------------------------------------------------------------------------------------------------------
+def unadjust(df: pd.DataFrame, actions: pd.DataFrame) -> pd.DataFrame:
+  """Split adjusted bars (as delivered by the providers) -> raw bars."""
+  df = df.drop(columns=[c for c in ACTION_COLUMNS + ['Adj Close', 'Capital Gains'] if c in df.columns])
+  if df.empty or actions.empty:
+    return df
+  splitFactor = cumulativeAfter(df.index, actions.index, splitRatios(actions))
+  if np.all(splitFactor == 1.0):
+    return df
+  for col in PRICE_COLUMNS:
+    if col in df.columns:
+      df[col] = df[col].to_numpy(dtype='float64') * splitFactor
+  if 'Volume' in df.columns:
+    df['Volume'] = df['Volume'].to_numpy(dtype='float64') / splitFactor
+  return df
+#--------------------------------------------------------------------------------------------------------------------------------
+def unadjustDividends(newActions: pd.DataFrame, actions: pd.DataFrame) -> pd.DataFrame:
+  """The providers report dividends for today's number of shares, this converts them to the shares at the ex-date."""
+  if newActions.empty or actions.empty:
+    return newActions
+  newActions = newActions.copy()
+  newActions['Dividends'] = newActions['Dividends'].to_numpy() * cumulativeAfter(newActions.index, actions.index, splitRatios(actions))
+  return newActions
+#--------------------------------------------------------------------------------------------------------------------------------
+def adjust(raw: pd.DataFrame, actions: pd.DataFrame) -> pd.DataFrame:
+  """Adjusted view of raw bars, the same frame is returned if no action applies to it."""
+  if raw.empty or actions is None or actions.empty or actions.index[-1].normalize() <= raw.index[0].normalize():
+    return raw
+  close = raw['Close'].to_numpy(dtype='float64')
+  # dividend factor 1 - D / close of the bar before the ex-date
+  positions = np.searchsorted(raw.index.normalize().asi8, actions.index.normalize().asi8, side='left')
+  previousClose = np.where(positions > 0, close[np.maximum(positions - 1, 0)], np.nan)
+  dividends = actions['Dividends'].to_numpy(dtype='float64')
+  with np.errstate(divide='ignore', invalid='ignore'):
+    dividendFactors = np.where((dividends > 0) & (previousClose > 0), 1.0 - dividends / previousClose, 1.0)
+  splitFactor = cumulativeAfter(raw.index, actions.index, splitRatios(actions))
+  priceFactor = cumulativeAfter(raw.index, actions.index, dividendFactors) / splitFactor
+  adjusted = raw.copy(deep=False)
+  for col in PRICE_COLUMNS:
+    if col in adjusted.columns:
+      adjusted[col] = adjusted[col].to_numpy(dtype='float64') * priceFactor
+  if 'Volume' in adjusted.columns:
+    adjusted['Volume'] = adjusted['Volume'].to_numpy(dtype='float64') * splitFactor
+  return adjusted
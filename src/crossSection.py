@@ -0,0 +1,230 @@
+"""Cross-sectional analytics of the watchlist: rolling correlation/covariance and relative strength vs. a benchmark.
+
+The daily closes are aligned to the calendar of the benchmark (crypto trading on weekends is sampled on its
+trading days, a ticker without a bar on a day keeps its last close). RollingCrossSection keeps the last
+window log returns plus their sums and cross-products; a new bar updates them in O(N^2) instead of
+recomputing the N x N matrices from the whole window. The state is kept in data/analytics, so the next
+run only feeds the bars that arrived since.
+"""
+import os
+import threading
+import tkinter as tk
+from tkinter import ttk
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+import atomicIo
+#--------------------------------------------------------------------------------------------------------------------------------
+DEFAULT_BENCHMARK = '^GSPC'
+RECOMPUTE_EVERY = 500 # full recomputation of the sums against rounding drift
+#--------------------------------------------------------------------------------------------------------------------------------
+def analyticsDir(dataDirName: str = "data") -> str:
+  path = os.path.join(os.path.dirname(os.path.abspath(__file__)), dataDirName, "analytics")
+  os.makedirs(path, exist_ok=True)
+  return path
+#--------------------------------------------------------------------------------------------------------------------------------
+def alignedCloses(frames: Dict[str, pd.DataFrame], benchmark: str) -> pd.DataFrame:
+  """Closes of all frames on the trading days of the benchmark, the benchmark is the first column."""
+  calendar = pd.DatetimeIndex(frames[benchmark].index.normalize().unique()).sort_values()
+  columns = {}
+  for ticker in [benchmark] + [t for t in frames if t != benchmark]:
+    close = frames[ticker]['Close']
+    close = close.groupby(close.index.normalize()).last() # one value per day
+    columns[ticker] = close.reindex(calendar.union(close.index)).ffill().reindex(calendar)
+  return pd.DataFrame(columns, index=calendar)
+#--------------------------------------------------------------------------------------------------------------------------------
+def alignedReturns(frames: Dict[str, pd.DataFrame], benchmark: str = DEFAULT_BENCHMARK) -> pd.DataFrame:
+  closes = alignedCloses(frames, benchmark)
+  return np.log(closes).diff().iloc[1:]
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class RollingCrossSection:
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, tickers: List[str], window: int = 60):
+    """tickers[0] is the benchmark."""
+    self.tickers = list(tickers)
+    self.window = window
+    n = len(self.tickers)
+    self.buffer = np.zeros((window, n)) # ring buffer of the last window return vectors
+    self.position = 0
+    self.count = 0
+    self.updates = 0
+    self.sums = np.zeros(n)
+    self.crossProducts = np.zeros((n, n))
+    self.lastDate: Optional[pd.Timestamp] = None
+  #------------------------------------------------------------------------------------------------------------------------------
+  def update(self, returns: np.ndarray, date: Optional[pd.Timestamp] = None):
+    """Adds the returns of one bar (NaN = no return, counts as 0) and drops the oldest one of the window."""
+    returns = np.nan_to_num(np.asarray(returns, dtype='float64'))
+    if self.count == self.window:
+      old = self.buffer[self.position]
+      self.sums -= old
+      self.crossProducts -= np.outer(old, old)
+    else:
+      self.count += 1
+    self.sums += returns
+    self.crossProducts += np.outer(returns, returns)
+    self.buffer[self.position] = returns
+    self.position = (self.position + 1) % self.window
+    self.lastDate = date
+    self.updates += 1
+    if self.updates % RECOMPUTE_EVERY == 0:
+      self.recompute()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def recompute(self):
+    window = self.buffer[:self.count]
+    self.sums = window.sum(axis=0)
+    self.crossProducts = window.T @ window
+  #------------------------------------------------------------------------------------------------------------------------------
+  def feed(self, returns: pd.DataFrame) -> int:
+    """Feeds the rows after lastDate, returns their number."""
+    returns = returns[self.tickers]
+    if self.lastDate is not None:
+      returns = returns[returns.index > self.lastDate]
+    for date, row in zip(returns.index, returns.to_numpy()):
+      self.update(row, date)
+    return len(returns)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def covariance(self) -> pd.DataFrame:
+    n = self.count
+    cov = (self.crossProducts - np.outer(self.sums, self.sums) / n) / (n - 1) if n > 1 else np.full_like(self.crossProducts, np.nan)
+    return pd.DataFrame(cov, index=self.tickers, columns=self.tickers)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def correlation(self) -> pd.DataFrame:
+    cov = self.covariance().to_numpy()
+    std = np.sqrt(np.clip(np.diag(cov), 0, None))
+    with np.errstate(divide='ignore', invalid='ignore'):
+      corr = np.clip(cov / np.outer(std, std), -1.0, 1.0)
+    return pd.DataFrame(corr, index=self.tickers, columns=self.tickers)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def relativeStrength(self) -> pd.DataFrame:
+    """Performance over the window relative to the benchmark, best first."""
+    relative = np.exp(self.sums - self.sums[0]) - 1
+    beta = self.covariance().iloc[:, 0] / self.covariance().iloc[0, 0] if self.count > 1 else np.nan
+    df = pd.DataFrame({
+      'return': np.exp(self.sums) - 1,
+      'relativeStrength': relative,
+      'beta': beta,
+    }, index=self.tickers).drop(index=self.tickers[0]).sort_values('relativeStrength', ascending=False)
+    df['rank'] = np.arange(1, len(df) + 1)
+    return df
+  #------------------------------------------------------------------------------------------------------------------------------
+  def save(self, path: str):
+    atomicIo.replaceFile(path, lambda f: np.savez(
+      f, tickers=np.array(self.tickers), window=self.window, buffer=self.buffer, position=self.position, count=self.count,
+      sums=self.sums, crossProducts=self.crossProducts, lastDate=np.datetime64(self.lastDate) if self.lastDate is not None else np.datetime64('NaT')))
+  #------------------------------------------------------------------------------------------------------------------------------
+  @staticmethod
+  def load(path: str, tickers: List[str], window: int) -> Optional['RollingCrossSection']:
+    """The saved state if it was built for the same tickers and window."""
+    if not os.path.exists(path):
+      return None
+    try:
+      data = np.load(path)
+      if list(data['tickers']) != list(tickers) or int(data['window']) != window:
+        return None
+      state = RollingCrossSection(tickers, window)
+      state.buffer, state.position, state.count = data['buffer'], int(data['position']), int(data['count'])
+      state.sums, state.crossProducts = data['sums'], data['crossProducts']
+      lastDate = data['lastDate'][()]
+      state.lastDate = None if np.isnat(lastDate) else pd.Timestamp(lastDate)
+      return state
+    except Exception as e:
+      print(f"Error reading cross section state {path}: {e}")
+      return None
+#--------------------------------------------------------------------------------------------------------------------------------
+def updateCrossSection(frames: Dict[str, pd.DataFrame], benchmark: str = DEFAULT_BENCHMARK, window: int = 60,
+                       dataDirName: str = "data") -> RollingCrossSection:
+  """Loads the saved state, feeds the new bars, saves it and exports correlation and rankings to parquet."""
+  returns = alignedReturns(frames, benchmark)
+  tickers = list(returns.columns)
+  statePath = os.path.join(analyticsDir(dataDirName), f"crossSection_{window}.npz")
+  state = RollingCrossSection.load(statePath, tickers, window)
+  if state is None or (state.lastDate is not None and state.lastDate not in returns.index):
+    state = RollingCrossSection(tickers, window) # other tickers, or history changed: start over
+  newBars = state.feed(returns)
+  print(f"Cross section: {newBars} new bars for {len(tickers)} tickers.")
+  state.save(statePath)
+  exportResults(state, dataDirName)
+  return state
+#--------------------------------------------------------------------------------------------------------------------------------
+def exportResults(state: RollingCrossSection, dataDirName: str = "data"):
+  directory = analyticsDir(dataDirName)
+  atomicIo.writeParquet(state.correlation(), os.path.join(directory, f"correlation_{state.window}.parquet"))
+  atomicIo.writeParquet(state.covariance(), os.path.join(directory, f"covariance_{state.window}.parquet"))
+  atomicIo.writeParquet(state.relativeStrength(), os.path.join(directory, f"relativeStrength_{state.window}.parquet"))
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class CrossSectionView:
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, root: tk.Tk, computeState: Callable[[int], RollingCrossSection], onOpen: Callable[[str], None], window: int = 60):
+    self.computeState = computeState
+    self.onOpen = onOpen
+    self.window = tk.Toplevel(root)
+    self.window.title("Correlation & Relative Strength")
+    self.window.geometry("1300x800")
+    self.windowVar = tk.IntVar(value=window)
+    self.setupUserInterface()
+    self.refresh()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def setupUserInterface(self):
+    controls = ttk.Frame(self.window, padding=3)
+    controls.pack(side=tk.TOP, fill=tk.X)
+    ttk.Label(controls, text="Window (bars):").pack(side=tk.LEFT)
+    windowBox = ttk.Combobox(controls, textvariable=self.windowVar, values=[20, 60, 120, 250], state="readonly", width=5)
+    windowBox.pack(side=tk.LEFT, padx=(2, 8))
+    windowBox.bind("<<ComboboxSelected>>", lambda event: self.refresh())
+    ttk.Button(controls, text="Refresh", command=self.refresh).pack(side=tk.LEFT)
+    self.statusLabel = ttk.Label(controls, text="")
+    self.statusLabel.pack(side=tk.RIGHT)
+    pane = ttk.PanedWindow(self.window, orient=tk.HORIZONTAL)
+    pane.pack(fill=tk.BOTH, expand=True)
+    self.figure = Figure(figsize=(9, 8), dpi=100)
+    self.canvas = FigureCanvasTkAgg(self.figure, master=pane)
+    pane.add(self.canvas.get_tk_widget(), weight=3)
+    self.rankingTree = ttk.Treeview(pane, columns=('rank', 'ticker', 'rs', 'ret', 'beta'), show='headings')
+    for column, text, width in (('rank', '#', 40), ('ticker', 'Ticker', 90), ('rs', 'RS %', 70), ('ret', 'Return %', 70), ('beta', 'Beta', 60)):
+      self.rankingTree.heading(column, text=text)
+      self.rankingTree.column(column, width=width, anchor='e' if column != 'ticker' else 'w')
+    self.rankingTree.bind("<Double-1>", self.handleDoubleClick)
+    pane.add(self.rankingTree, weight=1)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def refresh(self):
+    self.statusLabel.config(text="Calculating ...")
+    window = self.windowVar.get()
+    def compute():
+      try:
+        state = self.computeState(window)
+        self.window.after(0, self.show, state)
+      except Exception as e:
+        print(f"Error in cross section: {e}")
+        self.window.after(0, lambda: self.statusLabel.config(text=f"Error: {e}"))
+    threading.Thread(target=compute, name='crossSection', daemon=True).start()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def show(self, state: RollingCrossSection):
+    if not self.window.winfo_exists():
+      return
+    corr = state.correlation()
+    self.figure.clear()
+    ax = self.figure.add_subplot(111)
+    image = ax.imshow(corr.to_numpy(), cmap='RdYlGn', vmin=-1, vmax=1)
+    ax.set_xticks(range(len(corr)), corr.columns, rotation=90, fontsize=7)
+    ax.set_yticks(range(len(corr)), corr.index, fontsize=7)
+    ax.set_title(f"Correlation of log returns, last {state.count} bars until {state.lastDate.date() if state.lastDate is not None else '-'}")
+    self.figure.colorbar(image, ax=ax, fraction=0.04)
+    self.figure.tight_layout()
+    self.canvas.draw()
+    self.rankingTree.delete(*self.rankingTree.get_children())
+    for ticker, row in state.relativeStrength().iterrows():
+      self.rankingTree.insert('', tk.END, iid=ticker, values=(int(row['rank']), ticker, f"{row['relativeStrength'] * 100:+.1f}",
+                                                             f"{row['return'] * 100:+.1f}", f"{row['beta']:.2f}"))
+    self.statusLabel.config(text=f"{len(corr) - 1} tickers vs. {state.tickers[0]}, exported to data/analytics")
+  #------------------------------------------------------------------------------------------------------------------------------
+  def handleDoubleClick(self, event):
+    selection = self.rankingTree.selection()
+    if selection:
+      self.onOpen(selection[0])
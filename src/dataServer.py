@@ -0,0 +1,322 @@
+"""Headless HTTP server for the cached bars and indicators, so other tools share one warm cache instead of downloading again.
+
+  python dataServer.py --port 8765
+  GET /candles/AAPL?interval=1d&start=2024-01-01&end=2024-06-30&columns=Close,Rsi,Macd&format=arrow
+  GET /tickers
+  GET /stats
+
+/candles parameters:
+  interval    1d (default), 1wk or an intraday interval (1h, 15m, 5m, 1m) from the intraday store
+  start, end  ISO dates, default: the last year
+  columns     comma separated columns. Indicator columns (Rsi, Macd, BbUpper, ...) make the server calculate them
+  indicators  1: all indicator columns of indicators.Calculator
+  format      json (default, pandas orient 'split') or arrow (Arrow IPC stream), also chosen by the Accept header
+
+Responses carry an ETag, a request with If-None-Match gets 304 while the data did not change.
+The bars of a ticker are kept in memory for --ttl seconds, within the budget of --memory-mb (compactFrame.MemoryManager). After that the next request goes through
+loader.fetchAndProcessIntervalData, which downloads only when the exchange traded since the last update.
+Concurrent requests for the same ticker wait for one fetch.
+"""
+import argparse
+import concurrent.futures
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+
+import globalsSa
+import loader
+import indicatorCache
+import compactFrame
+import corporateActions
+from intradayStore import INTRADAY_INTERVALS
+#--------------------------------------------------------------------------------------------------------------------------------
+DEFAULT_PORT = 8765
+DEFAULT_TTL = 60.0          # seconds a cached frame is served without asking the loader
+INDICATOR_WARMUP_DAYS = 300 # history before start for the indicators, as calculateDateRanges of the app
+ARROW_MIME = 'application/vnd.apache.arrow.stream'
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+TICKER_PATTERN = re.compile(r'[A-Za-z0-9^][A-Za-z0-9.^=\-]{0,19}') # part of file names under data/, no leading dot for '..'
+#--------------------------------------------------------------------------------------------------------------------------------
+class RequestError(globalsSa.CustomError):
+  def __init__(self, status: int, message: str):
+    super().__init__(message)
+    self.status = status
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class SingleFlight:
+  """Concurrent calls with the same key share one execution of the function."""
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.calls: Dict[Any, concurrent.futures.Future] = {}
+  #------------------------------------------------------------------------------------------------------------------------------
+  def do(self, key: Any, function: Callable[[], Any]) -> Tuple[Any, bool]:
+    """Result of function and whether it was shared with a call already running."""
+    with self.lock:
+      future = self.calls.get(key)
+      leader = future is None
+      if leader:
+        future = self.calls[key] = concurrent.futures.Future()
+    if not leader:
+      return future.result(), True
+    try:
+      future.set_result(function())
+    except BaseException as e:
+      future.set_exception(e)
+    finally:
+      with self.lock:
+        del self.calls[key]
+    return future.result(), False
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class CacheEntry:
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, bars: pd.DataFrame, coveredStart: datetime.date):
+    self.bars = bars
+    self.coveredStart = coveredStart
+    self.loadedAt = time.monotonic()
+    self.version = format(int(pd.util.hash_pandas_object(bars, index=True).sum()) & (2**64 - 1), 'x') if not bars.empty else 'empty'
+    self.withIndicators: Optional[pd.DataFrame] = None
+    self.lock = threading.Lock()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def indicatorFrame(self, ticker: str, interval: str, dataDirName: str) -> pd.DataFrame:
+    with self.lock:
+      if self.withIndicators is None:
+        df = indicatorCache.calculate(self.bars, ticker, interval, dataDirName)
+        self.withIndicators = compactFrame.compact(df) if globalsSa.COMPACT_FRAMES else df
+      return self.withIndicators
+  #------------------------------------------------------------------------------------------------------------------------------
+  def nbytes(self) -> int:
+    return compactFrame.frameBytes([self.bars, self.withIndicators] if self.withIndicators is not None else self.bars)
+#--------------------------------------------------------------------------------------------------------------------------------
+class CandleService:
+  """The in-process cache in front of the loader, shared by all request threads. The entries are kept by the
+  memory manager of the process (compactFrame.getManager()), which evicts them above globalsSa.FRAME_MEMORY_MB.
+  """
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, dataDirName: str = "data", ttl: float = DEFAULT_TTL, useIbkr: bool = False, offline: bool = False):
+    self.dataDirName = dataDirName
+    self.ttl = ttl
+    self.useIbkr = useIbkr
+    self.offline = offline
+    self.memory = compactFrame.getManager()
+    self.lock = threading.Lock()
+    self.singleFlight = SingleFlight()
+    self.stats = {'requests': 0, 'cacheHits': 0, 'loads': 0, 'sharedLoads': 0, 'notModified': 0, 'errors': 0}
+  #------------------------------------------------------------------------------------------------------------------------------
+  def count(self, key: str):
+    with self.lock:
+      self.stats[key] += 1
+  #------------------------------------------------------------------------------------------------------------------------------
+  def memoryKey(self, ticker: str, interval: str) -> Tuple[str, str, str, str]:
+    return ('dataServer', self.dataDirName, ticker, interval)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def entry(self, ticker: str, interval: str, start: datetime.date) -> CacheEntry:
+    key = (ticker, interval)
+    entry = self.memory.get(self.memoryKey(ticker, interval))
+    if entry is not None and entry.coveredStart <= start and time.monotonic() - entry.loadedAt < self.ttl:
+      self.count('cacheHits')
+      return entry
+    coveredStart = min(start, entry.coveredStart) if entry is not None else start
+    entry, shared = self.singleFlight.do(key, lambda: self.load(ticker, interval, coveredStart))
+    self.count('sharedLoads' if shared else 'loads')
+    if entry.coveredStart > start: # a shared load started before this request needed more history
+      entry = self.load(ticker, interval, start)
+    return entry
+  #------------------------------------------------------------------------------------------------------------------------------
+  def load(self, ticker: str, interval: str, start: datetime.date) -> CacheEntry:
+    today = datetime.date.today()
+    fetchStart = start - datetime.timedelta(days=INDICATOR_WARMUP_DAYS)
+    if interval in INTRADAY_INTERVALS:
+      if self.offline:
+        bars = loader.getIntradayStore(self.dataDirName).aggregate(ticker, interval, fetchStart, today)
+      else:
+        bars = loader.fetchIntradayData(ticker, interval, (today - fetchStart).days, self.dataDirName)
+    elif self.offline:
+      bars = self.loadLocal(ticker, interval)
+    else:
+      bars = loader.fetchAndProcessIntervalData(ticker, fetchStart, today, interval, self.useIbkr, self.dataDirName)
+    if bars is None:
+      bars = pd.DataFrame(columns=PRICE_COLUMNS, index=pd.DatetimeIndex([], name='Date'))
+    entry = CacheEntry(bars, start)
+    self.memory.put(self.memoryKey(ticker, interval), entry, entry.nbytes())
+    return entry
+  #------------------------------------------------------------------------------------------------------------------------------
+  def loadLocal(self, ticker: str, interval: str) -> Optional[pd.DataFrame]:
+    path = loader.constructParquetFilePath(ticker, interval, self.dataDirName)
+    raw = loader.loadLocalData(path, ticker, interval)
+    return corporateActions.adjust(raw, corporateActions.loadActions(path)) if raw is not None else None
+  #------------------------------------------------------------------------------------------------------------------------------
+  def candles(self, ticker: str, interval: str, start: datetime.date, end: datetime.date,
+              columns: Optional[List[str]], allIndicators: bool) -> Tuple[pd.DataFrame, str]:
+    """Projected bars of [start, end] and the version of the data they come from."""
+    entry = self.entry(ticker, interval, start)
+    needsIndicators = allIndicators or (columns is not None and any(c not in entry.bars.columns for c in columns))
+    if needsIndicators:
+      df = entry.indicatorFrame(ticker, interval, self.dataDirName)
+      self.memory.resize(self.memoryKey(ticker, interval), entry.nbytes())
+      if compactFrame.isCompact(df) and (columns is None or any(c in df.attrs['constants'] for c in columns)):
+        df = compactFrame.expand(df)
+    else:
+      df = entry.bars
+    if columns is not None:
+      unknown = [c for c in columns if c not in df.columns]
+      if unknown:
+        raise RequestError(400, f"Unknown columns {unknown}, available: {list(df.columns)}")
+      df = df[columns]
+    return df.loc[str(start):str(end)], entry.version
+  #------------------------------------------------------------------------------------------------------------------------------
+  def tickers(self) -> List[str]:
+    dataDir = os.path.dirname(loader.constructParquetFilePath('X', '1d', self.dataDirName))
+    return sorted(name[:-len('_1d.parquet')] for name in os.listdir(dataDir) if name.endswith('_1d.parquet'))
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+def parseDate(value: Optional[str], default: datetime.date) -> datetime.date:
+  if not value:
+    return default
+  try:
+    return datetime.date.fromisoformat(value)
+  except ValueError:
+    raise RequestError(400, f"Invalid date '{value}', expected YYYY-MM-DD")
+#--------------------------------------------------------------------------------------------------------------------------------
+def toJson(df: pd.DataFrame, ticker: str, interval: str) -> bytes:
+  body = json.loads(df.to_json(orient='split', date_format='iso'))
+  body.update(ticker=ticker, interval=interval)
+  return json.dumps(body, separators=(',', ':')).encode('utf-8')
+#--------------------------------------------------------------------------------------------------------------------------------
+def toArrow(df: pd.DataFrame) -> bytes:
+  table = pa.Table.from_pandas(df.apply(pd.to_numeric, errors='coerce'), preserve_index=True) # pd.NA columns become float NaN
+  sink = pa.BufferOutputStream()
+  with pa.ipc.new_stream(sink, table.schema) as writer:
+    writer.write_table(table)
+  return sink.getvalue().to_pybytes()
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class CandleRequestHandler(BaseHTTPRequestHandler):
+  service: CandleService = None # set by createServer
+  protocol_version = 'HTTP/1.1'   # keep-alive for notebooks polling many tickers
+  #------------------------------------------------------------------------------------------------------------------------------
+  def do_GET(self):
+    self.service.count('requests')
+    url = urllib.parse.urlsplit(self.path)
+    query = {key: values[-1] for key, values in urllib.parse.parse_qs(url.query).items()}
+    try:
+      parts = [urllib.parse.unquote(p) for p in url.path.strip('/').split('/')]
+      if len(parts) == 2 and parts[0] == 'candles':
+        self.handleCandles(parts[1], query)
+      elif parts == ['tickers']:
+        self.sendBody(200, json.dumps(self.service.tickers()).encode('utf-8'), 'application/json')
+      elif parts == ['stats']:
+        with self.service.lock:
+          stats = dict(self.service.stats, memory=self.service.memory.usage(), http=loader.httpCacheStats())
+        self.sendBody(200, json.dumps(stats).encode('utf-8'), 'application/json')
+      else:
+        raise RequestError(404, f"Unknown path {url.path}, use /candles/<ticker>, /tickers or /stats")
+    except RequestError as e:
+      self.service.count('errors')
+      self.sendBody(e.status, json.dumps({'error': str(e)}).encode('utf-8'), 'application/json')
+    except Exception as e:
+      self.service.count('errors')
+      print(f"Error handling {self.path}: {e}")
+      self.sendBody(500, json.dumps({'error': str(e)}).encode('utf-8'), 'application/json')
+  #------------------------------------------------------------------------------------------------------------------------------
+  def handleCandles(self, ticker: str, query: Dict[str, str]):
+    if not TICKER_PATTERN.fullmatch(ticker):
+      raise RequestError(400, f"Invalid ticker '{ticker}'")
+    interval = query.get('interval', '1d')
+    if interval not in ('1d', '1wk') and interval not in INTRADAY_INTERVALS:
+      raise RequestError(400, f"Unsupported interval '{interval}'")
+    today = datetime.date.today()
+    end = parseDate(query.get('end'), today)
+    start = parseDate(query.get('start'), end - datetime.timedelta(days=365))
+    if start > end:
+      raise RequestError(400, "start is after end")
+    columns = [c for c in query['columns'].split(',') if c] if query.get('columns') else None
+    allIndicators = query.get('indicators', '0') in ('1', 'true', 'yes')
+    fmt = query.get('format') or ('arrow' if 'arrow' in self.headers.get('Accept', '') else 'json')
+    if fmt not in ('json', 'arrow'):
+      raise RequestError(400, f"Unsupported format '{fmt}', use json or arrow")
+    df, version = self.service.candles(ticker, interval, start, end, columns, allIndicators)
+    if df.empty:
+      raise RequestError(404, f"No data for {ticker} ({interval}) in [{start}, {end}]")
+    etag = '"' + hashlib.sha1(f"{version}|{ticker}|{interval}|{start}|{end}|{columns}|{allIndicators}|{fmt}".encode()).hexdigest()[:24] + '"'
+    if etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+      self.service.count('notModified')
+      self.sendBody(304, b'', None, etag)
+      return
+    if fmt == 'arrow':
+      self.sendBody(200, toArrow(df), ARROW_MIME, etag)
+    else:
+      self.sendBody(200, toJson(df, ticker, interval), 'application/json', etag)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def sendBody(self, status: int, body: bytes, contentType: Optional[str], etag: Optional[str] = None):
+    if contentType == 'application/json' and len(body) > 1024 and 'gzip' in self.headers.get('Accept-Encoding', ''):
+      body = gzip.compress(body, compresslevel=5)
+      encoding = 'gzip'
+    else:
+      encoding = None
+    self.send_response(status)
+    if contentType:
+      self.send_header('Content-Type', contentType)
+    if encoding:
+      self.send_header('Content-Encoding', encoding)
+    if etag:
+      self.send_header('ETag', etag)
+      self.send_header('Cache-Control', 'no-cache') # clients revalidate with If-None-Match
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    if status != 304:
+      self.wfile.write(body)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def log_message(self, format: str, *args):
+    if not self.server.quiet:
+      super().log_message(format, *args)
+#--------------------------------------------------------------------------------------------------------------------------------
+def createServer(service: CandleService, host: str = '127.0.0.1', port: int = DEFAULT_PORT, quiet: bool = False) -> ThreadingHTTPServer:
+  handler = type('BoundCandleRequestHandler', (CandleRequestHandler,), {'service': service})
+  server = ThreadingHTTPServer((host, port), handler)
+  server.daemon_threads = True
+  server.quiet = quiet
+  return server
+#--------------------------------------------------------------------------------------------------------------------------------
+def main(argv: Optional[List[str]] = None) -> int:
+  parser = argparse.ArgumentParser(description="Serves the cached bars and indicators of stockAnalyzer over HTTP.")
+  parser.add_argument("--host", default='127.0.0.1', help="Address to listen on (default: only this machine).")
+  parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+  parser.add_argument("--data", default="data", help="Data directory relative to src/.")
+  parser.add_argument("--ttl", type=float, default=DEFAULT_TTL, help="Seconds a ticker is served from memory before the loader is asked again.")
+  parser.add_argument("--ibkr", action='store_true', help="Fetch daily/weekly bars from IBKR instead of Yahoo.")
+  parser.add_argument("--offline", action='store_true', help="Serve the local files only, never download.")
+  parser.add_argument("--quiet", action='store_true', help="No request log.")
+  parser.add_argument("--memory-mb", type=float, default=globalsSa.FRAME_MEMORY_MB, help="Memory budget of the cached frames.")
+  parser.add_argument("--compact", action='store_true', help="Keep the indicator columns as float32 (compactFrame).")
+  opt = parser.parse_args(argv)
+
+  globalsSa.FRAME_MEMORY_MB = opt.memory_mb
+  globalsSa.COMPACT_FRAMES = globalsSa.COMPACT_FRAMES or opt.compact
+  service = CandleService(opt.data, opt.ttl, opt.ibkr, opt.offline)
+  server = createServer(service, opt.host, opt.port, opt.quiet)
+  print(f"Serving {os.path.abspath(os.path.dirname(loader.constructParquetFilePath('X', '1d', opt.data)))} on http://{opt.host}:{server.server_port}/")
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+  return 0
+#----------------------------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,360 @@
+"""A local fake TWS/IB Gateway speaking enough of the IB socket protocol to exercise IbkrTws.IbApi end to end.
+
+Supported: handshake, startApi (nextValidId, managedAccounts), reqHistoricalData, reqFundamentalData,
+reqAccountUpdates (account values with exchange rates, `positions` synthetic positions in USD and EUR, their market prices
+move every `portfolioInterval` s),
+reqScannerParameters and reqScannerSubscription (a new snapshot of the ranks every `scannerInterval` s),
+reqMktData with the news tick 292 (the last NEWS_BACKLOG headlines again, then a new one every `newsInterval` s).
+Bars come from parquet fixtures ({symbol}_{interval}.parquet, same naming as data/) or are synthetic.
+Unknown symbols (not in the fixtures when allowSynthetic is False) get error 200 like the real TWS.
+
+  python fakeTws.py --port 7496 --fixtures fixtures --latency 0.1 --positions 200
+"""
+import argparse
+import datetime
+import os
+import random
+import socketserver
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+import loader
+from syntheticData import generateOhlcv
+#--------------------------------------------------------------------------------------------------------------------------------
+SERVER_VERSION = 157  # MIN_SERVER_VER_REPLACE_FA_END, the highest version ibapi 9.81 speaks
+# incoming message ids (client -> server)
+REQ_MKT_DATA, CANCEL_MKT_DATA = 1, 2
+REQ_ACCT_DATA, REQ_HISTORICAL_DATA, REQ_SCANNER_SUBSCRIPTION, CANCEL_SCANNER_SUBSCRIPTION, REQ_SCANNER_PARAMETERS = 6, 20, 22, 23, 24
+REQ_FUNDAMENTAL_DATA, START_API = 52, 71
+# outgoing message ids (server -> client)
+ERR_MSG, ACCT_VALUE, PORTFOLIO_VALUE, NEXT_VALID_ID, MANAGED_ACCTS, HISTORICAL_DATA = 4, 6, 7, 9, 15, 17
+SCANNER_PARAMETERS, SCANNER_DATA, FUNDAMENTAL_DATA, ACCT_DOWNLOAD_END, TICK_NEWS = 19, 20, 51, 54, 84
+SCAN_CODES = {'TOP_PERC_GAIN': "Top % Gainers", 'TOP_PERC_LOSE': "Top % Losers", 'HOT_BY_VOLUME': "Hot Contracts by Volume",
+              'MOST_ACTIVE': "Most Active"}
+NEWS_BACKLOG = 5 # headlines sent again on every subscription, like the TWS does
+NEWS_EVENTS = ("beats estimates", "misses estimates", "raises guidance", "announces buyback", "upgraded", "downgraded",
+               "files 10-Q", "names new CFO")
+ACCOUNT = "DU0000000"
+EXCHANGE_RATES = {'USD': 1.0, 'EUR': 1.08} # base currency USD, every fifth position is traded in EUR
+#--------------------------------------------------------------------------------------------------------------------------------
+def makeMessage(*fields) -> bytes:
+  text = "".join(f"{field}\0" for field in fields).encode()
+  return struct.pack("!I", len(text)) + text
+#--------------------------------------------------------------------------------------------------------------------------------
+def durationToDays(duration: str) -> int:
+  """'3 Y' -> 1095, '2 M' -> 60, '4 W' -> 28, '5 D' -> 5"""
+  value, unit = duration.split()
+  return max(1, int(int(value) * {'S': 1 / 86400, 'D': 1, 'W': 7, 'M': 30, 'Y': 365}[unit.upper()]))
+#--------------------------------------------------------------------------------------------------------------------------------
+def barSizeToInterval(barSize: str) -> str:
+  return {'1 day': '1d', '1 week': '1wk', '1 month': '1mo', '1 hour': '1h', '1 min': '1m'}.get(barSize, '1d')
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class FakeTwsHandler(socketserver.BaseRequestHandler):
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def recvExactly(self, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+      chunk = self.request.recv(size - len(data))
+      if not chunk:
+        raise ConnectionError("client disconnected")
+      data += chunk
+    return data
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def recvMessage(self) -> List[str]:
+    size = struct.unpack("!I", self.recvExactly(4))[0]
+    return self.recvExactly(size).decode().split("\0")[:-1]
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def send(self, *fields):
+    if self.server.latency > 0:
+      time.sleep(self.server.latency)
+    with self.sendLock:
+      self.request.sendall(makeMessage(*fields))
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def handle(self):
+    self.sendLock = threading.Lock()
+    self.accountUpdates = threading.Event() # set while the client is subscribed to the account updates
+    self.scanners: Dict[int, threading.Event] = {} # reqId -> set while subscribed
+    self.news: Dict[int, threading.Event] = {} # reqId -> set while subscribed
+    try:
+      if self.recvExactly(4) != b"API\0":
+        return
+      self.recvMessage() # supported client versions, e.g. "v100..157"
+      connectionTime = datetime.datetime.now().strftime("%Y%m%d %H:%M:%S")
+      self.request.sendall(makeMessage(SERVER_VERSION, connectionTime))
+      while True:
+        fields = self.recvMessage()
+        if not fields:
+          continue
+        self.server.countRequest(int(fields[0]))
+        self.dispatch(int(fields[0]), fields)
+    except (ConnectionError, OSError):
+      pass
+    finally:
+      self.accountUpdates.clear()
+      for subscribed in list(self.scanners.values()) + list(self.news.values()):
+        subscribed.clear()
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def dispatch(self, msgId: int, fields: List[str]):
+    if msgId == START_API:
+      self.send(NEXT_VALID_ID, 1, 1)
+      self.send(MANAGED_ACCTS, 1, ACCOUNT)
+    elif msgId == REQ_HISTORICAL_DATA:
+      self.handleHistoricalData(fields)
+    elif msgId == REQ_FUNDAMENTAL_DATA:
+      self.handleFundamentalData(fields)
+    elif msgId == REQ_ACCT_DATA:
+      self.handleAccountUpdates(fields)
+    elif msgId == REQ_SCANNER_PARAMETERS:
+      self.send(SCANNER_PARAMETERS, 1, self.server.getScannerParametersXml())
+    elif msgId == REQ_SCANNER_SUBSCRIPTION:
+      self.handleScannerSubscription(fields)
+    elif msgId == CANCEL_SCANNER_SUBSCRIPTION:
+      subscribed = self.scanners.pop(int(fields[2]), None)
+      if subscribed is not None:
+        subscribed.clear()
+    elif msgId == REQ_MKT_DATA:
+      self.handleMarketData(fields)
+    elif msgId == CANCEL_MKT_DATA:
+      subscribed = self.news.pop(int(fields[2]), None)
+      if subscribed is not None:
+        subscribed.clear()
+    # everything else (market data ticks, orders ...) is silently ignored
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def handleHistoricalData(self, fields: List[str]):
+    # msgId, reqId, conId, symbol, secType, lastTradeDate, strike, right, multiplier, exchange, primaryExchange,
+    # currency, localSymbol, tradingClass, includeExpired, endDateTime, barSize, duration, useRTH, whatToShow, formatDate, ...
+    reqId, symbol, barSize, duration = int(fields[1]), fields[3], fields[16], fields[17]
+    df = self.server.getBars(symbol, barSizeToInterval(barSize), durationToDays(duration))
+    if df is None or df.empty:
+      self.send(ERR_MSG, 2, reqId, 200, "No security definition has been found for the request")
+      return
+    out: List = [HISTORICAL_DATA, reqId, df.index[0].strftime("%Y%m%d"), df.index[-1].strftime("%Y%m%d"), len(df)]
+    volumes = df['Volume'] if 'Volume' in df.columns else pd.Series(0, index=df.index)
+    for ts, o, h, l, c, v in zip(df.index, df['Open'], df['High'], df['Low'], df['Close'], volumes):
+      out += [ts.strftime("%Y%m%d"), o, h, l, c, int(v), (o + h + l + c) / 4, 1]
+    self.send(*out)
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def handleFundamentalData(self, fields: List[str]):
+    # msgId, version, reqId, conId, symbol, secType, exchange, primaryExchange, currency, localSymbol, reportType, options
+    reqId, symbol, reportType = int(fields[2]), fields[4], fields[10]
+    self.send(FUNDAMENTAL_DATA, 1, reqId, self.server.getFundamentalXml(symbol, reportType))
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def handleAccountUpdates(self, fields: List[str]):
+    # msgId, version, subscribe, acctCode
+    if fields[2] != '1':
+      self.accountUpdates.clear()
+      return
+    if self.accountUpdates.is_set():
+      return
+    self.accountUpdates.set()
+    positions = self.server.getPositions()
+    netLiquidation = 100000.0 + sum(p[2] * p[3] * EXCHANGE_RATES[currencyOf(p[0])] for p in positions)
+    for key, value in (('NetLiquidation', netLiquidation), ('TotalCashValue', 100000.0), ('BuyingPower', 400000.0)):
+      self.send(ACCT_VALUE, 2, key, f"{value:.2f}", 'USD', ACCOUNT)
+    for currency, rate in [('BASE', 1.0)] + list(EXCHANGE_RATES.items()):
+      self.send(ACCT_VALUE, 2, 'ExchangeRate', f"{rate:.4f}", currency, ACCOUNT)
+    for position in positions:
+      self.sendPosition(*position)
+    self.send(ACCT_DOWNLOAD_END, 1, ACCOUNT)
+    threading.Thread(target=self.sendPortfolioUpdates, args=(positions,), name='fakeTwsPortfolio', daemon=True).start()
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def handleScannerSubscription(self, fields: List[str]):
+    # msgId, reqId, numberOfRows, instrument, locationCode, scanCode, ... (server version >= 143, no version field)
+    reqId, scanCode = int(fields[1]), fields[5]
+    rows = min(50, int(fields[2])) if fields[2] else 50
+    if scanCode not in SCAN_CODES:
+      self.send(ERR_MSG, 2, reqId, 165, f"Historical Market Data Service query message:no items retrieved ({scanCode})")
+      return
+    subscribed = threading.Event()
+    subscribed.set()
+    self.scanners[reqId] = subscribed
+    threading.Thread(target=self.sendScannerSnapshots, args=(reqId, scanCode, rows, subscribed), name='fakeTwsScanner', daemon=True).start()
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def sendScannerSnapshots(self, reqId: int, scanCode: str, rows: int, subscribed: threading.Event):
+    """Scores of 3 * rows symbols random walk, every snapshot ranks the best rows of them like the TWS does."""
+    rng = random.Random(zlib.crc32(scanCode.encode()))
+    scores = {f"SYN{i:04d}": rng.random() for i in range(3 * rows)}
+    try:
+      while subscribed.is_set():
+        ranked = sorted(scores, key=scores.get, reverse=True)[:rows]
+        out: List = [SCANNER_DATA, 3, reqId, len(ranked)]
+        for rank, symbol in enumerate(ranked):
+          out += [rank, 1000 + int(symbol[3:]), symbol, 'STK', '', 0.0, '', 'SMART', 'USD', symbol, 'NMS', 'NMS', '', '', '', '']
+        self.send(*out)
+        for symbol in rng.sample(list(scores), max(1, len(scores) // 5)):
+          scores[symbol] += rng.gauss(0, 0.1)
+        time.sleep(self.server.scannerInterval)
+    except OSError:
+      pass
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def handleMarketData(self, fields: List[str]):
+    # msgId, version, reqId, conId, symbol, secType, lastTradeDate, strike, right, multiplier, exchange, primaryExchange,
+    # currency, localSymbol, tradingClass, deltaNeutral, genericTickList, snapshot, ...
+    reqId, symbol, secType, genericTicks = int(fields[2]), fields[4], fields[5], fields[16].split(',')
+    if '292' not in (tick.split(':')[0] for tick in genericTicks):
+      return
+    subscribed = threading.Event()
+    subscribed.set()
+    self.news[reqId] = subscribed
+    symbols = [symbol] if secType != 'NEWS' else [f"SYN{i:04d}" for i in range(20)] # the broad tape has news of all stocks
+    threading.Thread(target=self.sendNews, args=(reqId, symbols, subscribed), name='fakeTwsNews', daemon=True).start()
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def sendNews(self, reqId: int, symbols: List[str], subscribed: threading.Event):
+    """Headline n of a symbol has the article id FAKE$symbol$n and is dated n minutes after the start of the server."""
+    rng = random.Random(reqId)
+    try:
+      count = self.server.newsCount(symbols[0])
+      for n in range(max(0, count - NEWS_BACKLOG), count):
+        self.sendHeadline(reqId, symbols[0], n)
+      while subscribed.is_set() and self.server.newsInterval > 0:
+        time.sleep(self.server.newsInterval)
+        if subscribed.is_set():
+          symbol = rng.choice(symbols)
+          self.sendHeadline(reqId, symbol, self.server.nextNews(symbol))
+    except OSError:
+      pass
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def sendHeadline(self, reqId: int, symbol: str, n: int):
+    timeStamp = int((self.server.started + n * 60) * 1000)
+    event = NEWS_EVENTS[zlib.crc32(f"{symbol}{n}".encode()) % len(NEWS_EVENTS)]
+    self.send(TICK_NEWS, reqId, timeStamp, 'BRFG', f"FAKE${symbol}${n}", f"{{A:800015:L:en:K:n/a:C:0.5}}{symbol} {event} ({n})", f"A:{symbol}")
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def sendPosition(self, conId: int, symbol: str, position: float, price: float, averageCost: float, realizedPnl: float):
+    marketValue = position * price
+    currency = currencyOf(conId)
+    exchange, tradingClass = ('IBIS', 'XETRA') if currency == 'EUR' else ('NASDAQ', 'NMS')
+    self.send(PORTFOLIO_VALUE, 8, conId, symbol, 'STK', '', 0.0, '', '', exchange, currency, symbol, tradingClass, position,
+              round(price, 4), round(marketValue, 2), averageCost, round(marketValue - position * averageCost, 2), realizedPnl, ACCOUNT)
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def sendPortfolioUpdates(self, positions: List[Tuple[int, str, float, float, float, float]]):
+    """A random tenth of the positions gets a new market price every portfolioInterval seconds."""
+    rng = random.Random(len(positions))
+    prices = {p[0]: p[3] for p in positions}
+    try:
+      while self.server.portfolioInterval > 0 and self.accountUpdates.wait(1.0):
+        time.sleep(self.server.portfolioInterval)
+        for conId, symbol, position, _, averageCost, realizedPnl in rng.sample(positions, max(1, len(positions) // 10)):
+          prices[conId] *= 1 + rng.gauss(0, 0.002)
+          self.sendPosition(conId, symbol, position, prices[conId], averageCost, realizedPnl)
+    except OSError:
+      pass
+#--------------------------------------------------------------------------------------------------------------------------------
+def currencyOf(conId: int) -> str:
+  return 'EUR' if conId % 5 == 0 else 'USD'
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class FakeTwsServer(socketserver.ThreadingTCPServer):
+  daemon_threads = True
+  allow_reuse_address = True
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, port: int = 0, fixtureDir: str = "fixtures", latency: float = 0.0, allowSynthetic: bool = True,
+               positions: int = 20, portfolioInterval: float = 1.0, scannerInterval: float = 1.0, newsInterval: float = 1.0):
+    super().__init__(('127.0.0.1', port), FakeTwsHandler)
+    self.fixtureDir = fixtureDir
+    self.latency = latency
+    self.allowSynthetic = allowSynthetic
+    self.positions = positions
+    self.portfolioInterval = portfolioInterval
+    self.scannerInterval = scannerInterval
+    self.newsInterval = newsInterval
+    self.newsCounts: Dict[str, int] = {} # symbol -> headlines so far
+    self.started = time.time()
+    self.replay = loader.ReplayProvider(fixtureDir)
+    self.requestCounts = {}
+    self.lock = threading.Lock()
+  #--------------------------------------------------------------------------------------------------------------------------------
+  @property
+  def port(self) -> int:
+    return self.server_address[1]
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def countRequest(self, msgId: int):
+    with self.lock:
+      self.requestCounts[msgId] = self.requestCounts.get(msgId, 0) + 1
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def newsCount(self, symbol: str) -> int:
+    with self.lock:
+      return self.newsCounts.get(symbol, 0)
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def nextNews(self, symbol: str) -> int:
+    with self.lock:
+      n = self.newsCounts[symbol] = self.newsCounts.get(symbol, 0) + 1
+      return n - 1
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def getBars(self, symbol: str, interval: str, days: int) -> Optional[pd.DataFrame]:
+    endDate = datetime.date.today()
+    startDate = endDate - datetime.timedelta(days=days)
+    df = self.replay.loadFixture(symbol, interval)
+    if (df is None or df.empty) and self.allowSynthetic:
+      df = generateOhlcv(int(days * 5 / 7) + 1, seed=zlib.crc32(symbol.encode()))
+      df.index = pd.bdate_range(end=endDate, periods=len(df), name=df.index.name)
+      if interval == '1wk':
+        df = df.resample('W-MON', label='left', closed='left').agg(loader.YFinanceProvider.resampleMap()) # IB labels weeks by their first day
+    if df is None or df.empty:
+      return None
+    return df[df.index >= pd.Timestamp(startDate)]
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def getFundamentalXml(self, symbol: str, reportType: str) -> str:
+    path = os.path.join(os.path.dirname(loader.constructParquetFilePath(symbol, '1d', self.fixtureDir)), f"{symbol}_{reportType}.xml")
+    if os.path.exists(path):
+      with open(path) as f:
+        return f.read()
+    price = 100 + zlib.crc32(symbol.encode()) % 200
+    return ("<REPORTSNAPSHOT><ConsEstimates><FYEstimates>"
+            f"<ConsEstimate type=\"Mean\"><ConsValue dateType=\"CURR\">{price * 1.1:.2f}</ConsValue><ConsValue dateType=\"NumOfEst\">12</ConsValue></ConsEstimate>"
+            f"<ConsEstimate type=\"Median\"><ConsValue dateType=\"CURR\">{price * 1.05:.2f}</ConsValue><ConsValue dateType=\"NumOfEst\">12</ConsValue></ConsEstimate>"
+            "</FYEstimates></ConsEstimates></REPORTSNAPSHOT>")
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def getPositions(self) -> List[Tuple[int, str, float, float, float, float]]:
+    """(conId, symbol, position, market price, average cost, realized P&L), the same on every subscription."""
+    rng = random.Random(self.positions)
+    result = []
+    for i in range(self.positions):
+      symbol = f"SYN{i:04d}"
+      price = 20 + zlib.crc32(symbol.encode()) % 480
+      position = float(rng.choice([-1, 1, 1, 1]) * rng.randint(1, 50) * 10)
+      result.append((1000 + i, symbol, position, float(price), round(price * rng.uniform(0.7, 1.2), 4), round(rng.uniform(-500, 500), 2)))
+    return result
+  #--------------------------------------------------------------------------------------------------------------------------------
+  @staticmethod
+  def getScannerParametersXml() -> str:
+    scanTypes = "".join(f"<ScanType><displayName>{name}</displayName><scanCode>{code}</scanCode><instruments>STK,ETF.EQ.US</instruments>"
+                        "<absoluteColumns>false</absoluteColumns></ScanType>" for code, name in SCAN_CODES.items())
+    return ("<?xml version=\"1.0\" encoding=\"UTF-8\"?><ScanParameterResponse>"
+            "<InstrumentList varName=\"fullInstrumentList\"><Instrument><name>US Stocks</name><type>STK</type><filters>PRICE,VOLUME</filters></Instrument>"
+            "<Instrument><name>US Equity ETFs</name><type>ETF.EQ.US</type><filters>PRICE</filters></Instrument></InstrumentList>"
+            "<LocationTree><Location><displayName>US Stocks</displayName><locationCode>STK.US</locationCode><instruments>STK</instruments>"
+            "<LocationTree><Location><displayName>Listed/NASDAQ</displayName><locationCode>STK.US.MAJOR</locationCode><instruments>STK</instruments></Location>"
+            "</LocationTree></Location></LocationTree>"
+            f"<ScanTypeList>{scanTypes}</ScanTypeList></ScanParameterResponse>")
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def start(self) -> 'FakeTwsServer':
+    threading.Thread(target=self.serve_forever, name='fakeTws', daemon=True).start()
+    return self
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def stop(self):
+    self.shutdown()
+    self.server_close()
+#----------------------------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Fake TWS server for offline tests.")
+  parser.add_argument("--port", type=int, default=7496)
+  parser.add_argument("--fixtures", default="fixtures", help="Directory with parquet fixtures.")
+  parser.add_argument("--latency", type=float, default=0.0, help="Delay per response in seconds.")
+  parser.add_argument("--no-synthetic", action='store_true', help="Answer unknown symbols with error 200.")
+  parser.add_argument("--positions", type=int, default=20, help="Positions of the account.")
+  parser.add_argument("--portfolio-interval", type=float, default=1.0, help="Seconds between portfolio updates, 0: none.")
+  parser.add_argument("--news-interval", type=float, default=1.0, help="Seconds between headlines of a news subscription, 0: none.")
+  opt = parser.parse_args()
+  server = FakeTwsServer(opt.port, opt.fixtures, opt.latency, not opt.no_synthetic, opt.positions, opt.portfolio_interval,
+                         newsInterval=opt.news_interval)
+  print(f"Fake TWS listening on 127.0.0.1:{server.port} (server version {SERVER_VERSION})")
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    server.server_close()
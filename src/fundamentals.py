@@ -0,0 +1,265 @@
+"""Consensus estimates of IBKR (RESC reports) for the whole watchlist and the fair value computed from them.
+
+  data/fundamentals/estimates.parquet   one row per consensus estimate: ticker, fetched, item, period, estimate, value, weight
+
+fetchEstimates() keeps up to MAX_IN_FLIGHT requests outstanding at the TWS (IbkrTws.requestFundamentalData, one reqId
+each) and sends at most one every REQUEST_INTERVAL seconds, which stays below the pacing limit of the TWS.
+The reports are parsed with iterparse: the values of a ConsEstimate are read when it ends and every element is
+cleared and dropped from its parent as soon as it ends, so a report is never held as a whole tree.
+Tickers whose rows are older than MAX_AGE_DAYS are requested again. A ticker without estimates (e.g. error 430) gets
+a row with NaN values, so it is not requested again on every refresh.
+
+fairValues() computes the fair value of all tickers in one pass: the NumOfEst weighted average of the Median and of the
+Mean estimates and the average of both, the same value as the former IbkrTws.calculateFairValue of one report.
+
+  python fundamentals.py AAPL MSFT             # fetches the stale tickers from IBKR and prints the fair values
+  python fundamentals.py --watchlist --max-age 0
+  python fundamentals.py --compare report.xml  # iterparse vs. the tree parser: same value, time and memory
+"""
+import argparse
+import io
+import os
+import queue
+import sys
+import threading
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import pandas as pd
+
+import atomicIo
+#--------------------------------------------------------------------------------------------------------------------------------
+MAX_IN_FLIGHT = 4        # outstanding fundamental requests at the TWS
+REQUEST_INTERVAL = 0.5   # seconds between two requests
+REQUEST_TIMEOUT = 20.0   # a request without answer is cancelled, the ticker is requested again on the next refresh
+MAX_AGE_DAYS = 7         # consensus estimates change slowly
+ESTIMATE_GROUPS = ('FYEstimate', 'NPEstimate') # elements whose type attribute names the estimated item (EPS, TargetPrice ...)
+COLUMNS = ['ticker', 'fetched', 'item', 'period', 'estimate', 'value', 'weight']
+EstimateRow = Tuple[str, str, str, float, float] # item, period, estimate (Mean, Median, High ...), value, weight
+#--------------------------------------------------------------------------------------------------------------------------------
+def estimatesPath(dataDirName: str = "data") -> str:
+  return os.path.join(os.path.dirname(os.path.abspath(__file__)), dataDirName, "fundamentals", "estimates.parquet")
+#--------------------------------------------------------------------------------------------------------------------------------
+def emptyEstimates() -> pd.DataFrame:
+  return pd.DataFrame({'ticker': pd.Series(dtype=object), 'fetched': pd.Series(dtype='datetime64[ns]'),
+                       'item': pd.Series(dtype=object), 'period': pd.Series(dtype=object), 'estimate': pd.Series(dtype=object),
+                       'value': pd.Series(dtype=float), 'weight': pd.Series(dtype=float)})
+#--------------------------------------------------------------------------------------------------------------------------------
+def parseEstimates(xmlData: Union[str, bytes]) -> List[EstimateRow]:
+  """The ConsEstimate elements of a RESC report: first CURR value, first NumOfEst as weight (1 if missing)."""
+  if isinstance(xmlData, str):
+    xmlData = xmlData.encode('utf-8')
+  rows: List[EstimateRow] = []
+  stack: List[ET.Element] = []
+  item, period = '', ''
+  estimate: Optional[List[Any]] = None # [type, CURR text, NumOfEst text] of the open ConsEstimate
+  for event, elem in ET.iterparse(io.BytesIO(xmlData), events=('start', 'end')):
+    tag = elem.tag
+    if event == 'start': # attributes are there, the text not yet
+      if tag in ESTIMATE_GROUPS:
+        item, period = elem.get('type', ''), ''
+      elif tag == 'FYPeriod':
+        period = f"{elem.get('periodType', '')}{elem.get('fYear', '')}"
+      elif tag == 'ConsEstimate':
+        estimate = [elem.get('type', ''), None, None]
+      stack.append(elem)
+      continue
+    stack.pop()
+    if estimate is not None:
+      if tag == 'ConsValue':
+        dateType = elem.get('dateType')
+        if dateType == 'CURR' and estimate[1] is None:
+          estimate[1] = elem.text
+        elif dateType == 'NumOfEst' and estimate[2] is None:
+          estimate[2] = elem.text
+      elif tag == 'ConsEstimate':
+        if estimate[1]:
+          try:
+            rows.append((item, period, estimate[0], float(estimate[1]), float(estimate[2]) if estimate[2] else 1.0))
+          except ValueError:
+            print(f"Invalid value encountered: {estimate[1]}")
+        estimate = None
+    if tag == 'FYPeriod':
+      period = ''
+    elem.clear()
+    if stack:
+      stack[-1].remove(elem) # always the first child left, the earlier ones are gone already
+  return rows
+#--------------------------------------------------------------------------------------------------------------------------------
+def estimatesFrame(ticker: str, rows: Optional[List[EstimateRow]], fetched: pd.Timestamp) -> pd.DataFrame:
+  """Rows of one report as columns, a NaN row if the ticker has no estimates."""
+  rows = rows or [('', '', '', float('nan'), float('nan'))]
+  item, period, estimate, value, weight = zip(*rows)
+  return pd.DataFrame({'ticker': ticker, 'fetched': fetched, 'item': list(item), 'period': list(period),
+                       'estimate': list(estimate), 'value': list(value), 'weight': list(weight)}, columns=COLUMNS)
+#--------------------------------------------------------------------------------------------------------------------------------
+def fairValues(estimates: pd.DataFrame, items: Optional[Iterable[str]] = None) -> pd.Series:
+  """Fair value per ticker: mean of the weighted Median and the weighted Mean estimates (or the one there is).
+  items restricts the estimated items (e.g. ['TargetPrice']), None takes all like calculateFairValue did.
+  """
+  rows = estimates[estimates['estimate'].isin(('Median', 'Mean')) & estimates['value'].notna()]
+  if items is not None:
+    rows = rows[rows['item'].isin(list(items))]
+  if rows.empty:
+    return pd.Series(dtype=float, name='fairValue')
+  sums = pd.DataFrame({'ticker': rows['ticker'], 'estimate': rows['estimate'], 'weighted': rows['value'] * rows['weight'],
+                       'weight': rows['weight']}).groupby(['ticker', 'estimate'], sort=False)[['weighted', 'weight']].sum()
+  byEstimate = (sums['weighted'] / sums['weight'].where(sums['weight'] > 0)).unstack('estimate')
+  return byEstimate.mean(axis=1, skipna=True).dropna().rename('fairValue')
+#--------------------------------------------------------------------------------------------------------------------------------
+def fairValueOfXml(xmlData: Union[str, bytes]) -> Optional[float]:
+  values = fairValues(estimatesFrame('', parseEstimates(xmlData), pd.Timestamp.now()))
+  return float(values.iloc[0]) if len(values) else None
+#--------------------------------------------------------------------------------------------------------------------------------
+# cache file
+#--------------------------------------------------------------------------------------------------------------------------------
+loaded: Dict[str, Tuple[Tuple[int, int], pd.DataFrame, pd.Series]] = {} # path -> (mtime and size, estimates, fair values)
+loadedLock = threading.Lock()
+#--------------------------------------------------------------------------------------------------------------------------------
+def readEstimates(path: str) -> pd.DataFrame:
+  try:
+    return pd.read_parquet(path)
+  except FileNotFoundError:
+    return emptyEstimates()
+#--------------------------------------------------------------------------------------------------------------------------------
+def loadEstimates(dataDirName: str = "data") -> Tuple[pd.DataFrame, pd.Series]:
+  """Estimates and fair values of all cached tickers, read again only when the file changed."""
+  path = estimatesPath(dataDirName)
+  try:
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+  except FileNotFoundError:
+    version = (0, 0)
+  with loadedLock:
+    entry = loaded.get(path)
+    if entry is not None and entry[0] == version:
+      return entry[1], entry[2]
+  estimates = readEstimates(path) if version != (0, 0) else emptyEstimates()
+  values = fairValues(estimates)
+  with loadedLock:
+    loaded[path] = (version, estimates, values)
+  return estimates, values
+#--------------------------------------------------------------------------------------------------------------------------------
+def saveEstimates(newRows: pd.DataFrame, dataDirName: str = "data"):
+  """Replaces the rows of the tickers in newRows, other processes may have added tickers meanwhile."""
+  path = estimatesPath(dataDirName)
+  with atomicIo.fileLock(path):
+    old = readEstimates(path)
+    old = old[~old['ticker'].isin(newRows['ticker'].unique())]
+    df = pd.concat([old, newRows], ignore_index=True) if not old.empty else newRows.reset_index(drop=True)
+    atomicIo.writeParquet(df.sort_values('ticker', kind='stable', ignore_index=True), path)
+#--------------------------------------------------------------------------------------------------------------------------------
+def cachedFairValues(tickers: Iterable[str], dataDirName: str = "data") -> Dict[str, float]:
+  values = loadEstimates(dataDirName)[1]
+  return {ticker: float(values[ticker]) for ticker in tickers if ticker in values.index}
+#--------------------------------------------------------------------------------------------------------------------------------
+def staleTickers(tickers: Iterable[str], maxAgeDays: float = MAX_AGE_DAYS, dataDirName: str = "data") -> List[str]:
+  """Stocks (no indices) without estimates fetched in the last maxAgeDays."""
+  estimates = loadEstimates(dataDirName)[0]
+  fetched = estimates.groupby('ticker')['fetched'].max()
+  limit = pd.Timestamp.now() - pd.Timedelta(days=maxAgeDays)
+  return [t for t in dict.fromkeys(tickers) if not t.startswith('^') and (t not in fetched.index or fetched[t] < limit)]
+#--------------------------------------------------------------------------------------------------------------------------------
+# IBKR
+#--------------------------------------------------------------------------------------------------------------------------------
+def fetchEstimates(tickers: List[str], maxInFlight: int = MAX_IN_FLIGHT, interval: float = REQUEST_INTERVAL,
+                   timeout: float = REQUEST_TIMEOUT, app: Any = None) -> pd.DataFrame:
+  """RESC reports of the tickers, several outstanding at a time, parsed while the next ones are on the way."""
+  if app is None:
+    import IbkrTws as ib
+    if not ib.isOpen():
+      ib.open()
+    app = ib.IbApi.app
+  results: queue.Queue = queue.Queue()
+  todo = list(dict.fromkeys(tickers))
+  pending: Dict[str, Tuple[int, float]] = {} # ticker -> (reqId, deadline)
+  frames, missing, timedOut = [], 0, []
+  fetched = pd.Timestamp.now()
+  start = time.monotonic()
+  lastRequest = -interval
+  while todo or pending:
+    now = time.monotonic()
+    if todo and len(pending) < maxInFlight and now - lastRequest >= interval:
+      ticker = todo.pop(0)
+      pending[ticker] = (app.requestFundamentalData(ticker, results), now + timeout)
+      lastRequest = now
+      continue
+    wait = min(deadline for _, deadline in pending.values()) - now if pending else interval
+    if todo and len(pending) < maxInFlight:
+      wait = min(wait, lastRequest + interval - now)
+    try:
+      ticker, xmlData = results.get(timeout=max(0.01, wait))
+    except queue.Empty:
+      for ticker, (reqId, deadline) in list(pending.items()):
+        if deadline <= time.monotonic():
+          app.cancelFundamentalRequest(reqId)
+          del pending[ticker]
+          timedOut.append(ticker)
+      continue
+    if pending.pop(ticker, None) is None:
+      continue
+    rows = parseEstimates(xmlData) if xmlData else None
+    missing += not rows
+    frames.append(estimatesFrame(ticker, rows, fetched))
+  print(f"Fundamentals: {len(frames)} reports in {time.monotonic() - start:.1f}s, {missing} without estimates"
+        + (f", timed out: {' '.join(timedOut)}" if timedOut else ""))
+  return pd.concat(frames, ignore_index=True) if frames else emptyEstimates()
+#--------------------------------------------------------------------------------------------------------------------------------
+def refreshEstimates(tickers: Iterable[str], maxAgeDays: float = MAX_AGE_DAYS, dataDirName: str = "data", app: Any = None) -> List[str]:
+  """Fetches the stale tickers and stores them, returns the tickers which got new rows."""
+  stale = staleTickers(tickers, maxAgeDays, dataDirName)
+  if not stale:
+    return []
+  rows = fetchEstimates(stale, app=app)
+  if rows.empty:
+    return []
+  saveEstimates(rows, dataDirName)
+  return list(rows['ticker'].unique())
+#--------------------------------------------------------------------------------------------------------------------------------
+def compareParsers(path: str):
+  """Streaming parser against IbkrTws.calculateFairValueTree: fair value, time and peak memory."""
+  import contextlib
+  import IbkrTws as ib
+  with open(path, 'rb') as f:
+    xmlData = f.read()
+  for name, function in (('tree', ib.calculateFairValueTree), ('iterparse', fairValueOfXml)):
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()): # the tree version reports every value
+      value = function(xmlData)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{name:10} fair value {value}  {seconds * 1000:.1f}ms  peak {peak / 2**20:.1f} MiB")
+#--------------------------------------------------------------------------------------------------------------------------------
+def main(argv: Optional[List[str]] = None) -> int:
+  parser = argparse.ArgumentParser(description="Consensus estimates from IBKR and the fair values of the tickers.")
+  parser.add_argument("tickers", nargs='*')
+  parser.add_argument("--watchlist", action='store_true', help="All tickers of the watchlist (listStocks).")
+  parser.add_argument("--max-age", type=float, default=MAX_AGE_DAYS, help="Days after which estimates are requested again.")
+  parser.add_argument("--data", default="data", help="Data directory relative to src/.")
+  parser.add_argument("--compare", metavar="XML", help="Parse a saved report with both parsers.")
+  opt = parser.parse_args(argv)
+  if opt.compare:
+    compareParsers(opt.compare)
+    return 0
+  tickers = [t.upper() for t in opt.tickers]
+  if opt.watchlist:
+    import stockList
+    tickers += stockList.loadStockListFromFile()
+  if not tickers:
+    parser.error("no tickers")
+  try:
+    refreshEstimates(tickers, opt.max_age, opt.data)
+  finally:
+    if 'IbkrTws' in sys.modules:
+      sys.modules['IbkrTws'].close()
+  values = cachedFairValues(tickers, opt.data)
+  for ticker in dict.fromkeys(tickers):
+    print(f"{ticker:8} {values[ticker]:10.2f}" if ticker in values else f"{ticker:8} {'N/A':>10}")
+  return 0
+#----------------------------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+  sys.exit(main())
@@ -1,6 +1,15 @@
+import importlib.util
 INTERVAL = '1d'            # 1d, 1wk, 1mo 
 WEEKLY   = False
-HAS_IBKR = False
+HAS_IBKR = importlib.util.find_spec("ibapi") is not None # IbkrTws itself is imported on first use
 WORK_WITH_FILES = False
+WORKER_POOL = True         # indicators and charts in worker processes (workerPool.py), False: all in the GUI process
+RASTER_CHARTS = True       # charts as images rendered by the workers, False: interactive figures with toolbar
+INDICATOR_PANELS = []      # optional chart panels shown at start: 'Vwap', 'Vola20', 'Atr', 'Adx', 'Obv'
+INDICATOR_CACHE = True     # indicator columns persisted in data/indicators (indicatorCache.py), only new bars are computed
+COMPACT_FRAMES = False     # processed frames with float32 indicators, int32 volume and constant columns as scalars (compactFrame.py)
+FRAME_MEMORY_MB = 256      # budget of the frames kept in memory (compactFrame.MemoryManager), least recently used are evicted
+HTTP_CACHE = True          # Yahoo responses cached in data/httpCache.sqlite (httpCache.py), served while rate limited
+HTTP_CACHE_MB = 200        # size of the response cache, least recently used responses are removed
 class CustomError(Exception):
   pass
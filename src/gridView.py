@@ -0,0 +1,223 @@
+"""Small multiples: 16-64 compact charts of the watchlist drawn into one figure.
+
+All cells share a single Axes in grid coordinates (cell (row, col) covers [col, col+1] x [row, row+1]).
+The candles of all cells are two PolyCollections (bodies) and two LineCollections (wicks), so a page is
+a handful of artists instead of one mplfinance figure per ticker. The hover frame is blitted.
+Imported when the grid is opened, after the heavy modules are loaded.
+"""
+import math
+import threading
+import time
+import tkinter as tk
+from tkinter import ttk
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.figure import Figure
+from matplotlib.patches import Rectangle
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+#--------------------------------------------------------------------------------------------------------------------------------
+UP_COLOR, DOWN_COLOR = '#26a69a', '#ef5350'
+CELL_COUNTS = [16, 36, 64]
+#--------------------------------------------------------------------------------------------------------------------------------
+def gridShape(cells: int) -> Tuple[int, int]:
+  cols = math.ceil(math.sqrt(cells))
+  return math.ceil(cells / cols), cols
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class GridFigure:
+  """The artists of the grid on a matplotlib Figure, independent of the GUI backend."""
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, figure: Figure, cells: int):
+    self.figure = figure
+    self.rows, self.cols = gridShape(cells)
+    self.tickers: List[str] = []
+    figure.clear()
+    self.ax = figure.add_axes([0, 0, 1, 1])
+    self.ax.set_axis_off()
+    self.ax.set_xlim(0, self.cols)
+    self.ax.set_ylim(self.rows, 0)
+    self.upBodies = self.ax.add_collection(PolyCollection([], facecolors=UP_COLOR, edgecolors='none'))
+    self.downBodies = self.ax.add_collection(PolyCollection([], facecolors=DOWN_COLOR, edgecolors='none'))
+    self.upWicks = self.ax.add_collection(LineCollection([], colors=UP_COLOR, linewidths=0.6))
+    self.downWicks = self.ax.add_collection(LineCollection([], colors=DOWN_COLOR, linewidths=0.6))
+    self.closeLines = self.ax.add_collection(LineCollection([], colors='#1f77b4', linewidths=0.8))
+    borders = [[(c, 0), (c, self.rows)] for c in range(1, self.cols)] + [[(0, r), (self.cols, r)] for r in range(1, self.rows)]
+    self.ax.add_collection(LineCollection(borders, colors='#c0c0c0', linewidths=0.5))
+    self.labels = [self.ax.text(c + 0.03, r + 0.04, '', va='top', ha='left', fontsize=8)
+                   for r in range(self.rows) for c in range(self.cols)]
+    self.highlight = self.ax.add_patch(Rectangle((0, 0), 1, 1, fill=False, edgecolor='#1f77b4', linewidth=2, animated=True, visible=False))
+  #------------------------------------------------------------------------------------------------------------------------------
+  def cellAt(self, x: Optional[float], y: Optional[float]) -> Optional[int]:
+    if x is None or y is None or not (0 <= x < self.cols and 0 <= y < self.rows):
+      return None
+    i = int(y) * self.cols + int(x)
+    return i if i < len(self.tickers) else None
+  #------------------------------------------------------------------------------------------------------------------------------
+  def setData(self, frames: List[Tuple[str, Optional[pd.DataFrame]]], mode: str = 'candles'):
+    """frames: (ticker, bars) per cell in display order, bars may be None if there is no local data."""
+    self.tickers = [ticker for ticker, _ in frames]
+    bodies, wicks, up, lines = [], [], [], []
+    for i, label in enumerate(self.labels):
+      if i >= len(frames):
+        label.set_text('')
+        continue
+      ticker, df = frames[i]
+      row, col = divmod(i, self.cols)
+      if df is None or len(df) < 2:
+        label.set_text(f"{ticker}  n/a")
+        label.set_color('gray')
+        continue
+      close = df['Close'].to_numpy(dtype='float64')
+      change = (close[-1] / close[-2] - 1) * 100 if close[-2] else 0.0
+      label.set_text(f"{ticker}  {close[-1]:.2f}  {change:+.1f}%")
+      label.set_color(UP_COLOR if change >= 0 else DOWN_COLOR)
+      hasOhlc = all(c in df.columns for c in ('Open', 'High', 'Low'))
+      high = df['High'].to_numpy(dtype='float64') if hasOhlc else close
+      low = df['Low'].to_numpy(dtype='float64') if hasOhlc else close
+      lo, hi = np.nanmin(low), np.nanmax(high)
+      scale = 0.72 / (hi - lo) if hi > lo else 0.0
+      toY = lambda price: row + 0.22 + (hi - price) * scale
+      n = len(close)
+      width = 0.94 / n
+      x = col + 0.03 + (np.arange(n) + 0.5) * width
+      if mode == 'line' or not hasOhlc:
+        lines.append(np.column_stack([x, toY(close)]))
+        continue
+      openPrice = df['Open'].to_numpy(dtype='float64')
+      top, bottom = toY(np.maximum(openPrice, close)), toY(np.minimum(openPrice, close))
+      bottom = np.maximum(bottom, top + 0.002) # doji stay visible
+      half = width * 0.35
+      bodies.append(np.stack([np.column_stack([x - half, top]), np.column_stack([x + half, top]),
+                              np.column_stack([x + half, bottom]), np.column_stack([x - half, bottom])], axis=1))
+      wicks.append(np.stack([np.column_stack([x, toY(high)]), np.column_stack([x, toY(low)])], axis=1))
+      up.append(close >= openPrice)
+    if bodies:
+      bodies, wicks, up = np.concatenate(bodies), np.concatenate(wicks), np.concatenate(up)
+      self.upBodies.set_verts(bodies[up])
+      self.downBodies.set_verts(bodies[~up])
+      self.upWicks.set_segments(wicks[up])
+      self.downWicks.set_segments(wicks[~up])
+    else:
+      for collection in (self.upBodies, self.downBodies):
+        collection.set_verts([])
+      for collection in (self.upWicks, self.downWicks):
+        collection.set_segments([])
+    self.closeLines.set_segments(lines)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def setHighlight(self, cell: Optional[int]) -> bool:
+    """Moves the hover frame, returns True if it changed."""
+    visible = cell is not None
+    position = divmod(cell, self.cols)[::-1] if visible else (0, 0)
+    if visible == self.highlight.get_visible() and tuple(self.highlight.get_xy()) == position:
+      return False
+    self.highlight.set_visible(visible)
+    self.highlight.set_xy(position)
+    return True
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class GridView:
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, root: tk.Tk, tickers: List[str], loadBars: Callable[[List[str], str, int], Dict[str, pd.DataFrame]],
+               onOpen: Callable[[str], None], cells: int = 36, nBars: int = 60):
+    self.root = root
+    self.tickers = tickers
+    self.loadBars = loadBars
+    self.onOpen = onOpen
+    self.nBars = nBars
+    self.page = 0
+    self.background = None
+    self.loadToken = 0
+    self.window = tk.Toplevel(root)
+    self.window.title("Watchlist Grid")
+    self.window.geometry("1400x900")
+    self.cellsVar = tk.IntVar(value=cells)
+    self.modeVar = tk.StringVar(value='candles')
+    self.setupUserInterface()
+    self.window.protocol("WM_DELETE_WINDOW", self.close)
+    self.loadPage()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def setupUserInterface(self):
+    controls = ttk.Frame(self.window, padding=3)
+    controls.pack(side=tk.TOP, fill=tk.X)
+    ttk.Button(controls, text="<", width=3, command=lambda: self.changePage(-1)).pack(side=tk.LEFT)
+    ttk.Button(controls, text=">", width=3, command=lambda: self.changePage(1)).pack(side=tk.LEFT, padx=(2, 8))
+    ttk.Label(controls, text="Charts:").pack(side=tk.LEFT)
+    cellsBox = ttk.Combobox(controls, textvariable=self.cellsVar, values=CELL_COUNTS, state="readonly", width=4)
+    cellsBox.pack(side=tk.LEFT, padx=(2, 8))
+    cellsBox.bind("<<ComboboxSelected>>", lambda event: self.changePage(0))
+    modeBox = ttk.Combobox(controls, textvariable=self.modeVar, values=['candles', 'line'], state="readonly", width=8)
+    modeBox.pack(side=tk.LEFT)
+    modeBox.bind("<<ComboboxSelected>>", lambda event: self.loadPage())
+    self.statusLabel = ttk.Label(controls, text="")
+    self.statusLabel.pack(side=tk.RIGHT)
+    self.figure = Figure(figsize=(14, 9), dpi=100) # no pyplot, the figure lives as long as the window
+    self.canvas = FigureCanvasTkAgg(self.figure, master=self.window)
+    self.canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+    self.canvas.mpl_connect('draw_event', self.handleDraw)
+    self.canvas.mpl_connect('motion_notify_event', self.handleMotion)
+    self.canvas.mpl_connect('button_press_event', self.handleClick)
+    self.grid = GridFigure(self.figure, self.cellsVar.get())
+  #------------------------------------------------------------------------------------------------------------------------------
+  def pageTickers(self) -> List[str]:
+    cells = self.cellsVar.get()
+    return self.tickers[self.page * cells:(self.page + 1) * cells]
+  #------------------------------------------------------------------------------------------------------------------------------
+  def changePage(self, step: int):
+    cells = self.cellsVar.get()
+    lastPage = max(0, (len(self.tickers) - 1) // cells)
+    self.page = max(0, min(lastPage, self.page + step))
+    if gridShape(cells) != (self.grid.rows, self.grid.cols):
+      self.grid = GridFigure(self.figure, cells)
+    self.loadPage()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def loadPage(self):
+    tickers = self.pageTickers()
+    self.loadToken += 1
+    token = self.loadToken
+    self.statusLabel.config(text=f"Loading {len(tickers)} charts ...")
+    def load():
+      try:
+        frames = self.loadBars(tickers, '1d', self.nBars)
+      except Exception as e:
+        print(f"Error loading grid data: {e}")
+        frames = {}
+      self.window.after(0, self.showPage, token, [(t, frames.get(t)) for t in tickers])
+    threading.Thread(target=load, name='gridData', daemon=True).start()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def showPage(self, token: int, frames: List[Tuple[str, Optional[pd.DataFrame]]]):
+    if token != self.loadToken or not self.window.winfo_exists():
+      return # a newer page was requested meanwhile
+    start = time.perf_counter()
+    self.grid.setData(frames, self.modeVar.get())
+    self.canvas.draw()
+    pages = max(1, math.ceil(len(self.tickers) / self.cellsVar.get()))
+    self.statusLabel.config(text=f"Page {self.page + 1}/{pages}, {len(frames)} charts drawn in {(time.perf_counter() - start) * 1000:.0f} ms")
+  #------------------------------------------------------------------------------------------------------------------------------
+  def handleDraw(self, event):
+    # everything except the animated hover frame, restored before each blit
+    self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+    self.blitHighlight()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def blitHighlight(self):
+    if self.background is None:
+      return
+    self.canvas.restore_region(self.background)
+    self.grid.ax.draw_artist(self.grid.highlight)
+    self.canvas.blit(self.figure.bbox)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def handleMotion(self, event):
+    if self.grid.setHighlight(self.grid.cellAt(event.xdata, event.ydata)):
+      self.blitHighlight()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def handleClick(self, event):
+    cell = self.grid.cellAt(event.xdata, event.ydata)
+    if cell is not None:
+      self.onOpen(self.grid.tickers[cell])
+  #------------------------------------------------------------------------------------------------------------------------------
+  def close(self):
+    self.loadToken += 1
+    self.figure.clear()
+    self.window.destroy()
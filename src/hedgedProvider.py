@@ -0,0 +1,280 @@
+"""Market data provider which sends a request to a primary provider (IBKR) and, if it has not answered after the
+hedge delay, the same request to the secondary provider (Yahoo). The first usable answer wins, a failed provider
+fails over to the next one at once.
+
+Each provider has a circuit breaker instead of being switched off for good: after FAILURE_THRESHOLD failures in a row
+it is skipped for OPEN_SECONDS, then one request is let through again (half open) and decides whether it closes again.
+The latencies of the last LATENCY_WINDOW requests give the percentiles and, if no delay is set, the hedge delay
+(p95 of the primary, between MIN_HEDGE_DELAY and MAX_HEDGE_DELAY). The frames of all providers are brought to the
+same schema (normalizeFrame), so bars of IBKR and Yahoo can be merged into one file.
+"""
+import concurrent.futures
+import datetime
+import threading
+import time
+import tkinter as tk
+from collections import deque
+from tkinter import ttk
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import globalsSa
+import loader
+import tradingCalendar
+#--------------------------------------------------------------------------------------------------------------------------------
+FAILURE_THRESHOLD = 3
+OPEN_SECONDS = 30.0
+LATENCY_WINDOW = 200
+MIN_HEDGE_DELAY = 0.3
+MAX_HEDGE_DELAY = 2.0
+MIN_SAMPLES = 20          # latencies needed before the hedge delay follows the primary's p95
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+REFRESH_MS = 2000
+#--------------------------------------------------------------------------------------------------------------------------------
+class ProvidersUnavailable(globalsSa.CustomError):
+  pass
+#--------------------------------------------------------------------------------------------------------------------------------
+def normalizeFrame(df: Optional[pd.DataFrame], tickerSymbol: str, interval: str) -> pd.DataFrame:
+  """OHLCV (+ action columns) as float64 on a sorted, unique, tz-naive UTC index named Date.
+  IBKR gives daily bars at midnight without time zone, Yahoo the midnight of the exchange in UTC: the IBKR bars are
+  moved to the Yahoo time.
+  """
+  if df is None or df.empty:
+    return pd.DataFrame()
+  df = df.rename(columns={col: col.capitalize() for col in df.columns if col in ['open', 'high', 'low', 'close', 'volume']})
+  columns = {col: pd.to_numeric(df[col], errors='coerce').astype('float64') if col in df.columns else np.nan
+             for col in PRICE_COLUMNS + [c for c in loader.corporateActions.ACTION_COLUMNS if c in df.columns]}
+  result = pd.DataFrame(columns, index=pd.DatetimeIndex(pd.to_datetime(df.index)))
+  if result.index.tz is not None:
+    result.index = result.index.tz_convert(None)
+  elif interval in ('1d', '1wk') and (result.index == result.index.normalize()).all():
+    result.index = result.index.tz_localize(tradingCalendar.exchangeFor(tickerSymbol).tz).tz_convert(None)
+  result.index.name = 'Date'
+  result = result[~result.index.duplicated(keep='last')].sort_index()
+  return result
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class CircuitBreaker:
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, failureThreshold: int = FAILURE_THRESHOLD, openSeconds: float = OPEN_SECONDS):
+    self.failureThreshold = failureThreshold
+    self.openSeconds = openSeconds
+    self.failures = 0
+    self.openedAt: Optional[float] = None
+    self.trialRunning = False
+    self.lock = threading.Lock()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def state(self) -> str:
+    with self.lock:
+      if self.openedAt is None:
+        return 'closed'
+      return 'half open' if time.monotonic() - self.openedAt >= self.openSeconds else 'open'
+  #------------------------------------------------------------------------------------------------------------------------------
+  def allow(self) -> bool:
+    """Whether a request may go to the provider, in the half open state only one at a time."""
+    with self.lock:
+      if self.openedAt is None:
+        return True
+      if time.monotonic() - self.openedAt < self.openSeconds or self.trialRunning:
+        return False
+      self.trialRunning = True
+      return True
+  #------------------------------------------------------------------------------------------------------------------------------
+  def recordSuccess(self):
+    with self.lock:
+      self.failures = 0
+      self.openedAt = None
+      self.trialRunning = False
+  #------------------------------------------------------------------------------------------------------------------------------
+  def recordFailure(self):
+    with self.lock:
+      self.failures += 1
+      if self.trialRunning or self.failures >= self.failureThreshold:
+        self.openedAt = time.monotonic() # (re)opens, a failed trial waits another openSeconds
+      self.trialRunning = False
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class ProviderSlot:
+  """One provider of the HedgedProvider with its breaker and statistics."""
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, name: str, factory: Callable[[], loader.MarketDataProvider]):
+    self.name = name
+    self.factory = factory # called per request like getProvider() before, YFinanceProvider keeps state per request
+    self.breaker = CircuitBreaker()
+    self.latencies: 'deque[float]' = deque(maxlen=LATENCY_WINDOW)
+    self.lock = threading.Lock()
+    self.stats = {'requests': 0, 'errors': 0, 'empty': 0, 'wins': 0, 'hedges': 0}
+    self.lastError = ''
+  #------------------------------------------------------------------------------------------------------------------------------
+  def count(self, name: str):
+    with self.lock:
+      self.stats[name] += 1
+  #------------------------------------------------------------------------------------------------------------------------------
+  def call(self, method: str, args: Tuple, isEmpty: Callable[[Any], bool]) -> Any:
+    """Calls the provider and records latency, errors and the breaker, exceptions are passed on."""
+    start = time.perf_counter()
+    self.count('requests')
+    try:
+      result = getattr(self.factory(), method)(*args) # a failing constructor (TWS not running) is an error as well
+    except Exception as e:
+      with self.lock:
+        self.stats['errors'] += 1
+        self.lastError = f"{type(e).__name__}: {e}"
+        self.latencies.append(time.perf_counter() - start)
+      self.breaker.recordFailure()
+      raise
+    with self.lock:
+      self.latencies.append(time.perf_counter() - start)
+      if isEmpty(result):
+        self.stats['empty'] += 1
+    self.breaker.recordSuccess() # an empty answer (no trading day, unknown ticker) is no failure of the service
+    return result
+  #------------------------------------------------------------------------------------------------------------------------------
+  def percentile(self, p: float) -> float:
+    with self.lock:
+      return float(np.percentile(self.latencies, p)) if self.latencies else float('nan')
+  #------------------------------------------------------------------------------------------------------------------------------
+  def summary(self) -> Dict[str, Any]:
+    with self.lock:
+      stats = dict(self.stats)
+      latencies = np.array(self.latencies)
+    p50, p95, p99 = (float(v) for v in np.percentile(latencies, [50, 95, 99])) if len(latencies) else (float('nan'),) * 3
+    return dict(stats, name=self.name, state=self.breaker.state(), p50=p50, p95=p95, p99=p99,
+                errorRate=stats['errors'] / stats['requests'] if stats['requests'] else 0.0, lastError=self.lastError)
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class HedgedProvider(loader.MarketDataProvider):
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, slots: List[ProviderSlot], hedgeDelay: Optional[float] = None,
+               actionSource: Optional[Callable[[str, datetime.date, datetime.date], Optional[pd.DataFrame]]] = None):
+    """slots: the providers in the order of preference. hedgeDelay: seconds, None: adaptive.
+    actionSource: fetches the corporate actions outside the slots, None: the bars carry them."""
+    self.slots = slots
+    self.hedgeDelay = hedgeDelay
+    self.actionSource = actionSource
+    # losing requests keep running until they are done, their latency still counts
+    self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=4 * len(slots), thread_name_prefix='hedged')
+  #------------------------------------------------------------------------------------------------------------------------------
+  def currentHedgeDelay(self) -> float:
+    if self.hedgeDelay is not None:
+      return self.hedgeDelay
+    primary = self.slots[0]
+    with primary.lock:
+      samples = len(primary.latencies)
+    if samples < MIN_SAMPLES:
+      return MAX_HEDGE_DELAY
+    return min(MAX_HEDGE_DELAY, max(MIN_HEDGE_DELAY, primary.percentile(95)))
+  #------------------------------------------------------------------------------------------------------------------------------
+  def request(self, method: str, args: Tuple, isEmpty: Callable[[Any], bool]) -> Any:
+    """The first non-empty answer of the providers, else the first empty one, else the last error is raised."""
+    candidates = list(self.slots)
+    pending: Dict[concurrent.futures.Future, ProviderSlot] = {}
+    emptyResult, lastError = None, None
+    def startNext(hedge: bool) -> bool:
+      while candidates:
+        slot = candidates.pop(0)
+        if slot.breaker.allow(): # asked only when the provider is really used, a half open breaker lets one request through
+          if hedge:
+            slot.count('hedges')
+          pending[self.executor.submit(slot.call, method, args, isEmpty)] = slot
+          return True
+      return False
+    if not startNext(False):
+      raise ProvidersUnavailable(f"All data providers are paused after errors: {'; '.join(s.name + ': ' + s.lastError for s in self.slots)}")
+    while pending:
+      done, _ = concurrent.futures.wait(pending, timeout=self.currentHedgeDelay() if candidates else None,
+                                        return_when=concurrent.futures.FIRST_COMPLETED)
+      if not done: # the running requests are slow, ask the next provider as well
+        startNext(True)
+        continue
+      for future in done:
+        slot = pending.pop(future)
+        try:
+          result = future.result()
+        except Exception as e:
+          lastError = e
+          continue
+        if not isEmpty(result):
+          slot.count('wins')
+          return result
+        emptyResult = result if emptyResult is None else emptyResult
+      if not pending: # failed or empty: fail over without waiting
+        startNext(False)
+    if emptyResult is not None or lastError is None:
+      return emptyResult
+    raise lastError
+  #------------------------------------------------------------------------------------------------------------------------------
+  def getHistoricalData(self, tickerSymbol: str, startDate: datetime.date, endDate: datetime.date, interval: str ='1d') -> pd.DataFrame:
+    df = self.request('getHistoricalData', (tickerSymbol, startDate, endDate, interval), lambda df: df is None or df.empty)
+    return normalizeFrame(df, tickerSymbol, interval)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def getActions(self, tickerSymbol: str, startDate: datetime.date, endDate: datetime.date, interval: str ='1d') -> Optional[pd.DataFrame]:
+    # IBKR's actions come from Yahoo: asked directly, so Yahoo's latency and failures do not count for the IBKR slot
+    return self.actionSource(tickerSymbol, startDate, endDate) if self.actionSource is not None else None
+  #------------------------------------------------------------------------------------------------------------------------------
+  def getCompanyInfo(self, tickerSymbol: str) -> Dict[str, Any]:
+    return self.request('getCompanyInfo', (tickerSymbol,), lambda info: not info or bool(info.get('error')))
+#--------------------------------------------------------------------------------------------------------------------------------
+# the providers of the process, the slots (and with them breakers and statistics) are shared by all composites
+#--------------------------------------------------------------------------------------------------------------------------------
+slots: Dict[str, ProviderSlot] = {}
+composites: Dict[bool, HedgedProvider] = {}
+registryLock = threading.Lock()
+#--------------------------------------------------------------------------------------------------------------------------------
+def getComposite(useIbkr: bool) -> HedgedProvider:
+  """IBKR hedged by Yahoo, or Yahoo alone (still with breaker and statistics)."""
+  with registryLock:
+    if not slots:
+      slots['IBKR'] = ProviderSlot('IBKR', loader.InteractiveBrokersProvider)
+      slots['Yahoo'] = ProviderSlot('Yahoo', loader.YFinanceProvider)
+    if useIbkr not in composites:
+      composites[useIbkr] = HedgedProvider([slots['IBKR'], slots['Yahoo']], actionSource=loader.fetchYahooActions) if useIbkr \
+                            else HedgedProvider([slots['Yahoo']])
+    return composites[useIbkr]
+#--------------------------------------------------------------------------------------------------------------------------------
+def providerSummary() -> List[Dict[str, Any]]:
+  """summary() of every provider used so far, the primary of the hedged composite with its hedge delay."""
+  with registryLock:
+    rows = [slot.summary() for slot in slots.values() if slot.stats['requests'] > 0]
+    hedged = composites.get(True)
+  for row in rows:
+    row['hedgeAfter'] = f"{hedged.currentHedgeDelay():.2f}" if hedged is not None and row['name'] == hedged.slots[0].name else ''
+  return rows
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class ProviderStatsView:
+  """Window with the latency percentiles, error rates and breaker states of the providers, refreshed every REFRESH_MS."""
+  COLUMNS = (('name', 'Provider', 90), ('state', 'Breaker', 80), ('requests', 'Requests', 70), ('wins', 'Won', 50),
+             ('hedges', 'Hedged', 60), ('errorRate', 'Errors', 60), ('p50', 'p50 ms', 60), ('p95', 'p95 ms', 60),
+             ('p99', 'p99 ms', 60), ('hedgeAfter', 'Hedge after s', 90), ('lastError', 'Last error', 300))
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, root: tk.Tk, getSummary: Callable[[], List[Dict[str, Any]]] = providerSummary):
+    self.getSummary = getSummary
+    self.window = tk.Toplevel(root)
+    self.window.title("Data Providers")
+    self.window.geometry("1000x140")
+    self.tree = ttk.Treeview(self.window, columns=[c[0] for c in self.COLUMNS], show='headings', height=4)
+    for column, text, width in self.COLUMNS:
+      self.tree.heading(column, text=text)
+      self.tree.column(column, width=width, anchor='w' if column in ('name', 'state', 'lastError') else 'e')
+    self.tree.pack(fill=tk.BOTH, expand=True)
+    self.refresh()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def exists(self) -> bool:
+    try:
+      return bool(self.window.winfo_exists())
+    except tk.TclError:
+      return False
+  #------------------------------------------------------------------------------------------------------------------------------
+  def refresh(self):
+    if not self.exists():
+      return
+    def ms(seconds: float) -> str:
+      return '-' if seconds != seconds else f"{seconds * 1000:.0f}"
+    self.tree.delete(*self.tree.get_children())
+    for row in self.getSummary():
+      values = dict(row, errorRate=f"{row['errorRate']:.0%}", p50=ms(row['p50']), p95=ms(row['p95']), p99=ms(row['p99']))
+      self.tree.insert('', tk.END, values=[values[c[0]] for c in self.COLUMNS])
+    self.window.after(REFRESH_MS, self.refresh)
@@ -0,0 +1,72 @@
+"""Hot tier in front of the parquet files: uncompressed Arrow IPC (Feather v2) files which are memory-mapped.
+
+  data/AAPL_1d.parquet      cold store, compressed
+  data/hot/AAPL_1d.arrow    hot copy of the same frame, mapped and handed to pandas without decoding
+
+The numeric columns of a loaded frame point directly into the mapped pages, so they are read-only and
+several processes (GUI, export, screener) reading the same ticker share the page cache.
+A hot file is only used if it is at least as new as its parquet file. Files are replaced with
+os.replace() (atomicIo), so readers which still map the old file keep a consistent view.
+"""
+import os
+import time
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+import atomicIo
+#--------------------------------------------------------------------------------------------------------------------------------
+MAX_HOT_FILES = 200  # recently used frames kept in the hot tier per data directory
+#--------------------------------------------------------------------------------------------------------------------------------
+def hotPath(parquetFilePath: str) -> str:
+  directory, fileName = os.path.split(parquetFilePath)
+  return os.path.join(directory, "hot", os.path.splitext(fileName)[0] + ".arrow")
+#--------------------------------------------------------------------------------------------------------------------------------
+def load(parquetFilePath: str) -> Optional[pd.DataFrame]:
+  """The frame from the hot tier, None if there is no valid hot file."""
+  path = hotPath(parquetFilePath)
+  try:
+    if os.path.getmtime(path) < os.path.getmtime(parquetFilePath):
+      return None # parquet was written after the hot file
+    table = feather.read_table(path, memory_map=True)
+    # split_blocks keeps one block per column, so pandas does not consolidate (= copy) them
+    return table.to_pandas(split_blocks=True)
+  except (OSError, pa.ArrowInvalid):
+    return None
+#--------------------------------------------------------------------------------------------------------------------------------
+def store(parquetFilePath: str, df: pd.DataFrame) -> Optional[str]:
+  path = hotPath(parquetFilePath)
+  try:
+    # no fsync, after a crash the hot file is just older than the parquet file and not used
+    atomicIo.replaceFile(path, lambda f: feather.write_feather(df, f, compression='uncompressed'), durable=False)
+  except OSError as e:
+    # e.g. on windows a file can not be replaced while another process has it mapped
+    print(f"Could not write hot cache file {path}: {e}")
+    return None
+  evict(os.path.dirname(path))
+  return path
+#--------------------------------------------------------------------------------------------------------------------------------
+def touch(parquetFilePath: str):
+  """Marks a hot file as used, the access time is what evict() sorts by."""
+  path = hotPath(parquetFilePath)
+  try:
+    os.utime(path, (time.time(), os.path.getmtime(path)))
+  except OSError:
+    pass
+#--------------------------------------------------------------------------------------------------------------------------------
+def evict(hotDir: str, maxFiles: int = MAX_HOT_FILES):
+  """Removes the least recently used hot files above maxFiles."""
+  try:
+    entries = [e for e in os.scandir(hotDir) if e.name.endswith('.arrow')]
+  except FileNotFoundError:
+    return
+  if len(entries) <= maxFiles:
+    return
+  entries.sort(key=lambda e: e.stat().st_atime)
+  for entry in entries[:len(entries) - maxFiles]:
+    try:
+      os.remove(entry.path) # processes which have the file mapped keep their pages
+    except OSError:
+      pass
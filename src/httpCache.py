@@ -0,0 +1,207 @@
+"""Persistent response cache for the curl_cffi session of loader (Yahoo chart, quote and quoteSummary requests).
+
+  data/httpCache.sqlite     responses keyed by method + normalized URL (sorted parameters, without the crumb)
+
+The lifetime of a response depends on the endpoint (responseTtl):
+  chart with an intraday interval       INTRADAY_TTL
+  chart of a range which ended a day ago HISTORICAL_TTL, the bars of closed sessions do not change any more
+  other chart requests                  RECENT_TTL
+  quote / quoteSummary (company info)   QUOTE_TTL / INFO_TTL
+  anything else (cookie, crumb, consent) not cached
+Only successful GET responses are stored. When Yahoo answers 429 (rate limited) an expired response of up to
+MAX_STALE seconds is returned instead. The file is kept below HTTP_CACHE_MB by removing the least recently used
+responses. CachedSession is a curl_cffi Session, so yfinance takes it as its session.
+
+  python httpCache.py               # entries and bytes of the cache file
+  python httpCache.py --clear
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import urllib.parse
+from typing import Any, Dict, List, Optional, Tuple
+
+from curl_cffi import requests
+from curl_cffi.requests import Headers, Response
+
+import globalsSa
+#--------------------------------------------------------------------------------------------------------------------------------
+INTRADAY_TTL = 60.0
+RECENT_TTL = 300.0
+HISTORICAL_TTL = 7 * 86400.0
+QUOTE_TTL = 60.0
+INFO_TTL = 3600.0
+MAX_STALE = 7 * 86400.0         # oldest response served while rate limited
+IGNORED_PARAMETERS = {'crumb'}  # changes with the cookie, not part of the key
+DROPPED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding'} # the stored content is decoded
+#--------------------------------------------------------------------------------------------------------------------------------
+def cachePath(dataDirName: str = "data") -> str:
+  return os.path.join(os.path.dirname(os.path.abspath(__file__)), dataDirName, "httpCache.sqlite")
+#--------------------------------------------------------------------------------------------------------------------------------
+def normalizedKey(method: str, url: str, params: Any = None) -> Tuple[str, str, Dict[str, str]]:
+  """(key, path, parameters) of a request, the parameters of url and params are merged and sorted."""
+  parts = urllib.parse.urlsplit(url)
+  query = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+  if isinstance(params, dict):
+    query += [(str(k), str(v)) for k, v in params.items() if v is not None]
+  elif params:
+    query += [(str(k), str(v)) for k, v in params]
+  query = sorted((k, v) for k, v in query if k not in IGNORED_PARAMETERS)
+  normalized = urllib.parse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, urllib.parse.urlencode(query), ''))
+  return f"{method.upper()} {normalized}", parts.path, dict(query)
+#--------------------------------------------------------------------------------------------------------------------------------
+def responseTtl(path: str, params: Dict[str, str], now: Optional[float] = None) -> float:
+  """Seconds a response of this endpoint is served from the cache, 0: not cached."""
+  now = time.time() if now is None else now
+  if '/finance/chart/' in path:
+    interval = params.get('interval', '1d')
+    if interval.endswith('m') or interval.endswith('h'):
+      return INTRADAY_TTL
+    period2 = params.get('period2')
+    if period2 is not None and period2.lstrip('-').isdigit() and int(period2) < now - 86400:
+      return HISTORICAL_TTL
+    return RECENT_TTL
+  if '/finance/quoteSummary/' in path:
+    return INFO_TTL
+  if '/finance/quote' in path:
+    return QUOTE_TTL
+  return 0.0
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class ResponseStore:
+  """The SQLite file, shared by the threads of a process and by other processes (WAL)."""
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, path: str, maxBytes: int):
+    self.path = path
+    self.maxBytes = maxBytes
+    self.lock = threading.Lock()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    self.db = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+    self.db.execute("PRAGMA journal_mode=WAL")
+    self.db.execute("PRAGMA synchronous=NORMAL")
+    self.db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, url TEXT, status INTEGER, headers TEXT, "
+                    "content BLOB, storedAt REAL, expiresAt REAL, accessedAt REAL, size INTEGER)")
+    self.db.execute("CREATE INDEX IF NOT EXISTS responsesAccessed ON responses (accessedAt)")
+    self.totalBytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+  #------------------------------------------------------------------------------------------------------------------------------
+  def get(self, key: str) -> Optional[Tuple[str, int, str, bytes, float, float]]:
+    """(url, status, headers, content, storedAt, expiresAt) or None."""
+    with self.lock:
+      row = self.db.execute("SELECT url, status, headers, content, storedAt, expiresAt FROM responses WHERE key = ?", (key,)).fetchone()
+      if row is not None:
+        self.db.execute("UPDATE responses SET accessedAt = ? WHERE key = ?", (time.time(), key))
+      return row
+  #------------------------------------------------------------------------------------------------------------------------------
+  def put(self, key: str, url: str, status: int, headers: str, content: bytes, ttl: float) -> int:
+    """Stores a response, returns the number of responses evicted for it."""
+    now = time.time()
+    size = len(content) + len(headers) + len(key)
+    with self.lock:
+      old = self.db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+      self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                      (key, url, status, headers, content, now, now + ttl, now, size))
+      self.totalBytes += size - (old[0] if old else 0)
+      return self.evict() if self.totalBytes > self.maxBytes else 0
+  #------------------------------------------------------------------------------------------------------------------------------
+  def evict(self) -> int:
+    """Removes the least recently used responses down to 90% of maxBytes, the lock is held by the caller."""
+    self.totalBytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0] # other processes write too
+    excess = self.totalBytes - int(self.maxBytes * 0.9)
+    if excess <= 0:
+      return 0
+    keys = []
+    for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY accessedAt"):
+      if excess <= 0:
+        break
+      keys.append(key)
+      excess -= size
+      self.totalBytes -= size
+    self.db.executemany("DELETE FROM responses WHERE key = ?", [(key,) for key in keys])
+    return len(keys)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def usage(self) -> Dict[str, Any]:
+    with self.lock:
+      entries, size, expired = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(expiresAt < ?), 0) FROM responses",
+                                               (time.time(),)).fetchone()
+    return {'entries': entries, 'bytes': size, 'expired': expired, 'maxBytes': self.maxBytes}
+  #------------------------------------------------------------------------------------------------------------------------------
+  def clear(self):
+    with self.lock:
+      self.db.execute("DELETE FROM responses")
+      self.db.execute("VACUUM")
+      self.totalBytes = 0
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class CachedSession(requests.Session):
+  """curl_cffi Session which answers cacheable GET requests from the ResponseStore.
+  The store must not be called `cache`: yfinance refuses sessions with that attribute (requests_cache).
+  """
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, dataDirName: str = "data", maxBytes: Optional[int] = None, **kwargs):
+    super().__init__(**kwargs)
+    self.responseStore = ResponseStore(cachePath(dataDirName), int(globalsSa.HTTP_CACHE_MB * 2**20) if maxBytes is None else maxBytes)
+    self.statsLock = threading.Lock()
+    self.stats = {'hits': 0, 'misses': 0, 'staleHits': 0, 'stores': 0, 'evictions': 0, 'bypassed': 0, 'rateLimited': 0}
+  #------------------------------------------------------------------------------------------------------------------------------
+  def count(self, name: str, n: int = 1):
+    with self.statsLock:
+      self.stats[name] += n
+  #------------------------------------------------------------------------------------------------------------------------------
+  def request(self, method, url, params=None, *args, **kwargs) -> Response:
+    key, path, query = normalizedKey(method, url, params)
+    ttl = responseTtl(path, query) if method.upper() == 'GET' and not kwargs.get('stream') else 0.0
+    if ttl <= 0:
+      self.count('bypassed')
+      return super().request(method, url, params, *args, **kwargs)
+    cached = self.responseStore.get(key)
+    if cached is not None and cached[5] > time.time():
+      self.count('hits')
+      return self.cachedResponse(cached)
+    self.count('misses')
+    response = super().request(method, url, params, *args, **kwargs)
+    if response.status_code == 429:
+      self.count('rateLimited')
+      if cached is not None and time.time() - cached[4] < MAX_STALE:
+        self.count('staleHits')
+        print(f"Rate limited, using the response cached {(time.time() - cached[4]) / 60:.0f} min ago for {path}.")
+        return self.cachedResponse(cached)
+    elif response.status_code == 200:
+      headers = json.dumps([(k, v) for k, v in response.headers.multi_items() if k.lower() not in DROPPED_HEADERS])
+      evicted = self.responseStore.put(key, response.url, response.status_code, headers, response.content, ttl)
+      self.count('stores')
+      self.count('evictions', evicted)
+    return response
+  #------------------------------------------------------------------------------------------------------------------------------
+  @staticmethod
+  def cachedResponse(cached: Tuple[str, int, str, bytes, float, float]) -> Response:
+    response = Response()
+    response.url, response.status_code, response.content = cached[0], cached[1], cached[3]
+    response.headers = Headers([(k, v) for k, v in json.loads(cached[2])])
+    response.ok = 200 <= response.status_code < 400
+    return response
+  #------------------------------------------------------------------------------------------------------------------------------
+  def metrics(self) -> Dict[str, Any]:
+    with self.statsLock:
+      stats = dict(self.stats)
+    lookups = stats['hits'] + stats['misses']
+    return dict(stats, hitRate=stats['hits'] / lookups if lookups else 0.0, **self.responseStore.usage())
+#--------------------------------------------------------------------------------------------------------------------------------
+def main(argv: Optional[List[str]] = None) -> int:
+  parser = argparse.ArgumentParser(description="Shows or clears the HTTP response cache of the loader.")
+  parser.add_argument("--data", default="data", help="Data directory relative to src/.")
+  parser.add_argument("--clear", action='store_true', help="Removes all cached responses.")
+  opt = parser.parse_args(argv)
+  store = ResponseStore(cachePath(opt.data), int(globalsSa.HTTP_CACHE_MB * 2**20))
+  if opt.clear:
+    store.clear()
+  usage = store.usage()
+  print(f"{store.path}: {usage['entries']} responses ({usage['expired']} expired), "
+        f"{usage['bytes'] / 2**20:.1f} of {usage['maxBytes'] / 2**20:.0f} MiB")
+  return 0
+#----------------------------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+  sys.exit(main())
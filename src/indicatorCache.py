@@ -0,0 +1,319 @@
+"""Persisted indicator columns next to the price data, so an app start or a ticker click computes only the new bars.
+
+  data/AAPL_1d.parquet                 raw bars (loader)
+  data/indicators/AAPL_1d.arrow        indicator columns of the adjusted bars, uncompressed Arrow IPC, memory-mapped
+
+The file holds the columns of every Calculator method in Calculator.GROUPS for the first `rows` bars of the frame.
+Its metadata keeps per group the hash of the method's source (a changed parameter or formula of addMacd only
+recomputes the Macd columns) and for the frame the first bar, a hash of the price columns of all cached bars and of
+all but the last one (the last bar may have been incomplete, or a split adjusted the history).
+
+New bars are computed by the Calculator method on a tail of the frame: warmup bars + the new bars. The tail has to
+reproduce the last reused bar. If it does not (ewm not converged yet) the warmup is doubled, up to the whole frame.
+The warmup that worked is kept for the next time. Columns which depend on the whole history never agree on a tail:
+Cma and Ema, Obv and Vola are extended from a carry in the metadata instead (see CARRIES), so they neither take part
+in the comparison nor make the other columns of their group start from the first bar. Sma is extended from its window
+of closes along with them, addMovingAverages and addVolatility need no tail at all.
+"""
+import hashlib
+import inspect
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+import atomicIo
+import globalsSa
+import indicators
+import loader
+#--------------------------------------------------------------------------------------------------------------------------------
+FORMAT_VERSION = 1
+MIN_BARS = 250           # shorter frames are computed directly, the windows (up to 200) would give pd.NA columns
+INITIAL_WARMUP = 256
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+# module functions a Calculator method depends on, they are part of its parameter hash
+GROUP_DEPENDENCIES = {
+  'addStochastic': [indicators.Calculator.addStochasticOscillator],
+  'addFusedIndicators': [indicators.fusedIndicators, indicators.wilderSmooth, indicators.rollingSums],
+}
+RELATIVE_TOLERANCE = 1e-9
+#--------------------------------------------------------------------------------------------------------------------------------
+groupHashes: Dict[str, str] = {}
+#--------------------------------------------------------------------------------------------------------------------------------
+def groupHash(group: str) -> str:
+  """Hash of the source of a Calculator method and its dependencies."""
+  if group not in groupHashes:
+    functions = [getattr(indicators.Calculator, group)] + GROUP_DEPENDENCIES.get(group, [])
+    source = ''.join(inspect.getsource(function) for function in functions)
+    groupHashes[group] = hashlib.blake2b(source.encode('utf-8'), digest_size=8).hexdigest()
+  return groupHashes[group]
+#--------------------------------------------------------------------------------------------------------------------------------
+def cachePath(ticker: str, interval: str, dataDirName: str = "data") -> str:
+  directory, fileName = os.path.split(loader.constructParquetFilePath(ticker, interval, dataDirName))
+  return os.path.join(directory, "indicators", os.path.splitext(fileName)[0] + ".arrow")
+#--------------------------------------------------------------------------------------------------------------------------------
+def sourceHash(df: pd.DataFrame, rows: int) -> str:
+  """Hash of the index and the price columns of the first rows bars."""
+  digest = hashlib.blake2b(digest_size=16)
+  digest.update(np.ascontiguousarray(df.index.asi8[:rows]).tobytes())
+  for col in PRICE_COLUMNS:
+    if col in df.columns:
+      digest.update(col.encode('ascii'))
+      digest.update(np.ascontiguousarray(df[col].to_numpy(dtype='float64')[:rows]).tobytes())
+  return digest.hexdigest()
+#--------------------------------------------------------------------------------------------------------------------------------
+def computeGroup(df: pd.DataFrame, group: str) -> pd.DataFrame:
+  """The columns a Calculator method adds to df."""
+  calc = indicators.Calculator().setDataframe(df)
+  getattr(calc, group)()
+  result = calc.get()
+  return result[[col for col in result.columns if col not in df.columns]]
+#--------------------------------------------------------------------------------------------------------------------------------
+def matches(computed: np.ndarray, cached: np.ndarray, scale: np.ndarray) -> bool:
+  """computed and cached (one row each) agree up to RELATIVE_TOLERANCE of the value or, near 0, of the column scale."""
+  close = np.abs(computed - cached) <= RELATIVE_TOLERANCE * np.maximum(np.abs(cached), scale)
+  return bool(np.all(close | (np.isnan(computed) & np.isnan(cached))))
+#--------------------------------------------------------------------------------------------------------------------------------
+# Carries of the whole-history columns. state() is the carry after the first `rows` bars of the computed values, rows is
+# all but the last bar (it may still change). extend() returns the whole columns for df from the cached ones and the
+# carry, and the carry for the new frame; None if it can't (a missing close), the group is then computed from scratch.
+#--------------------------------------------------------------------------------------------------------------------------------
+def closes(df: pd.DataFrame, start: int) -> Optional[np.ndarray]:
+  close = df['Close'].to_numpy(dtype='float64')[start:]
+  return None if np.isnan(close).any() else close
+#--------------------------------------------------------------------------------------------------------------------------------
+class MovingAverageCarry:
+  """Cma# (expanding mean: sum and count of the closes) and Ema# (the recursion of pandas ewm with adjust=True: the
+  average and the weight of the older bars). Sma# needs no carry, the window is in df: with it the group needs no tail."""
+  #------------------------------------------------------------------------------------------------------------------------------
+  @staticmethod
+  def owns(column: str) -> bool:
+    return column.startswith(('Sma', 'Cma', 'Ema'))
+  #------------------------------------------------------------------------------------------------------------------------------
+  @staticmethod
+  def state(df: pd.DataFrame, values: Dict[str, np.ndarray], rows: int) -> Optional[Dict[str, Any]]:
+    close = closes(df.iloc[:rows], 0)
+    if close is None or rows < 1:
+      return None
+    ema = {}
+    for col in values:
+      if col.startswith('Ema'):
+        factor = 1 - 2 / (int(col[3:]) + 1)
+        ema[col] = [float(values[col][rows - 1]), (1 - factor ** rows) / (1 - factor)]
+    return {'rows': rows, 'sum': float(close.sum()), 'ema': ema}
+  #------------------------------------------------------------------------------------------------------------------------------
+  @staticmethod
+  def extend(df: pd.DataFrame, cached: Dict[str, np.ndarray], state: Dict[str, Any]) -> Optional[Tuple[Dict[str, np.ndarray], Dict[str, Any]]]:
+    rows = state['rows']
+    new = closes(df, rows)
+    if new is None or not state['ema'] or any(not np.isfinite(v[0]) for v in state['ema'].values()):
+      return None
+    cma = (state['sum'] + np.cumsum(new)) / (rows + np.arange(1, len(new) + 1))
+    values = {}
+    ema = {}
+    for col in cached:
+      if col.startswith('Cma'):
+        values[col] = np.concatenate([cached[col][:rows], cma])
+        continue
+      if col.startswith('Sma'):
+        window = int(col[3:])
+        if rows < window: # the first bars average fewer closes (min_periods=1)
+          return None
+        sma = np.lib.stride_tricks.sliding_window_view(closes(df, rows - window + 1), window).mean(axis=1)
+        values[col] = np.concatenate([cached[col][:rows], sma])
+        continue
+      factor = 1 - 2 / (int(col[3:]) + 1)
+      weighted, oldWeight = state['ema'][col]
+      extension = np.empty(len(new))
+      for i, cur in enumerate(new.tolist()):
+        if i == len(new) - 1:
+          ema[col] = [weighted, oldWeight]
+        oldWeight *= factor
+        if weighted != cur:
+          weighted = (oldWeight * weighted + cur) / (oldWeight + 1)
+        oldWeight += 1
+        extension[i] = weighted
+      values[col] = np.concatenate([cached[col][:rows], extension])
+    return values, {'rows': len(df) - 1, 'sum': state['sum'] + float(new[:-1].sum()), 'ema': ema}
+#--------------------------------------------------------------------------------------------------------------------------------
+class ObvCarry:
+  """Obv, the cumulative sum of the volume signed by the close change: the last value."""
+  #------------------------------------------------------------------------------------------------------------------------------
+  @staticmethod
+  def owns(column: str) -> bool:
+    return column == 'Obv'
+  #------------------------------------------------------------------------------------------------------------------------------
+  @staticmethod
+  def state(df: pd.DataFrame, values: Dict[str, np.ndarray], rows: int) -> Optional[Dict[str, Any]]:
+    obv = float(values['Obv'][rows - 1]) if 'Obv' in values and rows >= 1 else float('nan')
+    return {'rows': rows, 'obv': obv} if np.isfinite(obv) else None # NaN: bars without volume
+  #------------------------------------------------------------------------------------------------------------------------------
+  @staticmethod
+  def extend(df: pd.DataFrame, cached: Dict[str, np.ndarray], state: Dict[str, Any]) -> Optional[Tuple[Dict[str, np.ndarray], Dict[str, Any]]]:
+    rows = state['rows']
+    close = closes(df, rows - 1)
+    if close is None or 'Volume' not in df.columns:
+      return None
+    volume = np.nan_to_num(df['Volume'].to_numpy(dtype='float64')[rows:], nan=0.0)
+    obv = state['obv'] + np.cumsum(np.sign(np.diff(close)) * volume)
+    lastObv = float(obv[-2]) if len(obv) > 1 else state['obv']
+    return {'Obv': np.concatenate([cached['Obv'][:rows], obv])}, {'rows': len(df) - 1, 'obv': lastObv}
+#--------------------------------------------------------------------------------------------------------------------------------
+class VolatilityCarry:
+  """Vola, one standard deviation of the log returns for all bars: count, mean and sum of squared deviations
+  (combined with those of the new returns like Chan et al.)."""
+  #------------------------------------------------------------------------------------------------------------------------------
+  @staticmethod
+  def owns(column: str) -> bool:
+    return column == 'Vola'
+  #------------------------------------------------------------------------------------------------------------------------------
+  @staticmethod
+  def combine(state: Dict[str, Any], returns: np.ndarray) -> Dict[str, Any]:
+    if not len(returns):
+      return dict(state)
+    count, mean = state['count'], state['mean']
+    batchMean = float(returns.mean())
+    total = count + len(returns)
+    delta = batchMean - mean
+    return dict(state, count=total, mean=mean + delta * len(returns) / total,
+                m2=state['m2'] + float(((returns - batchMean) ** 2).sum()) + delta * delta * count * len(returns) / total)
+  #------------------------------------------------------------------------------------------------------------------------------
+  @staticmethod
+  def state(df: pd.DataFrame, values: Dict[str, np.ndarray], rows: int) -> Optional[Dict[str, Any]]:
+    close = closes(df.iloc[:rows], 0)
+    if close is None:
+      return None
+    with np.errstate(divide='ignore', invalid='ignore'):
+      returns = np.log(close[1:] / close[:-1])
+    if not np.isfinite(returns).all():
+      return None
+    return VolatilityCarry.combine({'rows': rows, 'count': 0, 'mean': 0.0, 'm2': 0.0}, returns)
+  #------------------------------------------------------------------------------------------------------------------------------
+  @staticmethod
+  def extend(df: pd.DataFrame, cached: Dict[str, np.ndarray], state: Dict[str, Any]) -> Optional[Tuple[Dict[str, np.ndarray], Dict[str, Any]]]:
+    rows = state['rows']
+    close = closes(df, rows - 1)
+    if close is None or rows < 1:
+      return None
+    with np.errstate(divide='ignore', invalid='ignore'):
+      returns = np.log(close[1:] / close[:-1])
+    if not np.isfinite(returns).all():
+      return None
+    newState = VolatilityCarry.combine(state, returns[:-1])
+    final = VolatilityCarry.combine(newState, returns[-1:])
+    vola = (final['m2'] / (final['count'] - 1)) ** .5 * 252 ** .5 * 100 if final['count'] > 1 else float('nan')
+    return {'Vola': np.full(len(df), vola)}, dict(newState, rows=len(df) - 1)
+#--------------------------------------------------------------------------------------------------------------------------------
+CARRIES = {'addMovingAverages': MovingAverageCarry, 'addFusedIndicators': ObvCarry, 'addVolatility': VolatilityCarry}
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class IndicatorStore:
+  """The cached indicator columns of one ticker and interval."""
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, path: str):
+    self.path = path
+    self.meta: Dict[str, Any] = {}
+    self.columns: Dict[str, np.ndarray] = {}
+    self.load()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def load(self):
+    try:
+      table = feather.read_table(self.path, memory_map=True)
+      meta = json.loads(table.schema.metadata[b'indicatorCache'])
+    except (OSError, pa.ArrowInvalid, KeyError, TypeError, ValueError):
+      return
+    if meta.get('version') != FORMAT_VERSION:
+      return
+    self.meta = meta
+    self.columns = {name: table.column(name).to_numpy() for name in table.column_names}
+  #------------------------------------------------------------------------------------------------------------------------------
+  def reusableRows(self, df: pd.DataFrame) -> int:
+    """Number of leading bars of df whose cached indicator values are still valid."""
+    rows = self.meta.get('rows', 0)
+    if rows == 0 or self.meta.get('firstBar') != int(df.index.asi8[0]) or rows > len(df) + 1:
+      return 0
+    if rows <= len(df) and sourceHash(df, rows) == self.meta['sourceHash']:
+      return rows
+    if rows - 1 <= len(df) and sourceHash(df, rows - 1) == self.meta['prefixHash']:
+      return rows - 1 # the last cached bar changed (incomplete bar updated)
+    return 0
+  #------------------------------------------------------------------------------------------------------------------------------
+  def group(self, df: pd.DataFrame, group: str, reusable: int) -> Tuple[Dict[str, np.ndarray], bool]:
+    """The columns of a group for df, and whether anything was computed."""
+    info = self.meta.get('groups', {}).get(group)
+    valid = info is not None and info['hash'] == groupHash(group)
+    warmup = info.get('warmup', INITIAL_WARMUP) if valid else INITIAL_WARMUP
+    if reusable == 0 or not valid:
+      return self.computeAll(df, group, warmup), True
+    cached = {col: self.columns[col][:reusable] for col in info['columns']}
+    if reusable == len(df):
+      return cached, False
+    values: Dict[str, np.ndarray] = {}
+    carryState = None
+    carry = CARRIES.get(group)
+    if carry is not None:
+      extended = carry.extend(df, {col: cached[col] for col in cached if carry.owns(col)}, info['carry']) if info.get('carry') else None
+      if extended is None:
+        return self.computeAll(df, group, warmup), True
+      values, carryState = extended
+    windowed = [col for col in cached if col not in values]
+    if windowed:
+      lastRow = np.array([cached[col][-1] for col in windowed])
+      scale = np.array([np.nan_to_num(np.abs(cached[col][-50:])).max() for col in windowed])
+      while True:
+        start = max(0, reusable - 1 - warmup)
+        computed = computeGroup(df.iloc[start:], group)
+        tail = {col: computed[col].to_numpy(dtype='float64') for col in windowed}
+        if start == 0 or matches(np.array([values[reusable - 1 - start] for values in tail.values()]), lastRow, scale):
+          break
+        warmup *= 2
+      if start == 0:
+        return self.computeAll(df, group, warmup, computed), True
+      values.update({col: np.concatenate([cached[col], tail[col][reusable - start:]]) for col in windowed})
+    self.setGroupInfo(group, list(cached), warmup, carryState)
+    return {col: values[col] for col in cached}, True
+  #------------------------------------------------------------------------------------------------------------------------------
+  def computeAll(self, df: pd.DataFrame, group: str, warmup: int, computed: Optional[pd.DataFrame] = None) -> Dict[str, np.ndarray]:
+    """The columns of a group computed on the whole frame, with a new carry."""
+    computed = computeGroup(df, group) if computed is None else computed
+    values = {col: computed[col].to_numpy(dtype='float64') for col in computed.columns}
+    carry = CARRIES.get(group)
+    carryState = carry.state(df, {col: v for col, v in values.items() if carry.owns(col)}, len(df) - 1) if carry is not None else None
+    self.setGroupInfo(group, list(values), warmup, carryState)
+    return values
+  #------------------------------------------------------------------------------------------------------------------------------
+  def setGroupInfo(self, group: str, columns: List[str], warmup: int, carry: Optional[Dict[str, Any]] = None):
+    self.meta.setdefault('groups', {})[group] = {'hash': groupHash(group), 'columns': columns, 'warmup': warmup, 'carry': carry}
+  #------------------------------------------------------------------------------------------------------------------------------
+  def save(self, df: pd.DataFrame, values: Dict[str, np.ndarray]):
+    self.meta.update(version=FORMAT_VERSION, firstBar=int(df.index.asi8[0]), rows=len(df),
+                     sourceHash=sourceHash(df, len(df)), prefixHash=sourceHash(df, len(df) - 1))
+    self.meta['groups'] = {group: info for group, info in self.meta.get('groups', {}).items() if group in indicators.Calculator.GROUPS}
+    table = pa.Table.from_arrays([pa.array(array) for array in values.values()], names=list(values))
+    table = table.replace_schema_metadata({'indicatorCache': json.dumps(self.meta)})
+    try:
+      atomicIo.replaceFile(self.path, lambda f: feather.write_feather(table, f, compression='uncompressed'), durable=False)
+    except OSError as e:
+      print(f"Could not write indicator cache {self.path}: {e}")
+#--------------------------------------------------------------------------------------------------------------------------------
+def calculate(df: pd.DataFrame, ticker: str, interval: str, dataDirName: str = "data") -> pd.DataFrame:
+  """Same result as Calculator().setDataframe(df).calculate().get(), with the cached columns of the previous calls."""
+  if not globalsSa.INDICATOR_CACHE or len(df) < MIN_BARS or not isinstance(df.index, pd.DatetimeIndex) or not df.index.is_monotonic_increasing:
+    return indicators.Calculator().setDataframe(df).calculate().get()
+  store = IndicatorStore(cachePath(ticker, interval, dataDirName))
+  reusable = store.reusableRows(df)
+  values: Dict[str, np.ndarray] = {}
+  changed = False
+  for group in indicators.Calculator.GROUPS:
+    groupValues, computed = store.group(df, group, reusable)
+    values.update(groupValues)
+    changed = changed or computed
+  if changed:
+    store.save(df, values)
+  # one block for all indicator columns, inserting them one by one would cost more than reading them
+  indicatorDf = pd.DataFrame(np.column_stack(list(values.values())), index=df.index, columns=list(values))
+  return pd.concat([df, indicatorDf], axis=1, copy=False)
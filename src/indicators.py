@@ -2,19 +2,110 @@ import pandas as pd
 import numpy as np
 from typing import List, Dict, Any, Optional, Tuple
 #--------------------------------------------------------------------------------------------------------------------------------
+# fused kernels on contiguous arrays, one row per series: several indicators are smoothed or summed in the same call
+#--------------------------------------------------------------------------------------------------------------------------------
+WILDER_BLOCK = 128 # bars per block of wilderSmooth, d**-WILDER_BLOCK must stay far from overflow
+FUSED_COLUMNS = ['Vola20', 'Atr', 'PlusDi', 'MinusDi', 'Adx', 'Obv', 'Vwap']
+#--------------------------------------------------------------------------------------------------------------------------------
+def wilderSmooth(values: np.ndarray, window: int) -> np.ndarray:
+  """Wilder's moving average (ewm(alpha=1/window, adjust=False)) of each row of values (rows x bars), no NaN allowed.
+  Within a block of bars y[j] = d**(j+1) * carry + d**j * cumsum(a * x[k] / d**k), only the carry is passed on in a loop.
+  """
+  rows, n = values.shape
+  if n == 0 or window <= 1:
+    return values.copy()
+  a = 1.0 / window
+  d = 1.0 - a
+  nBlocks = -(-n // WILDER_BLOCK)
+  blocks = np.zeros((rows, nBlocks * WILDER_BLOCK))
+  blocks[:, :n] = values
+  blocks = blocks.reshape(rows, nBlocks, WILDER_BLOCK)
+  powers = d ** np.arange(WILDER_BLOCK)
+  partial = np.cumsum(blocks * (a / powers), axis=2) * powers # result of each block for carry 0
+  decay = powers * d
+  carries = np.empty((rows, nBlocks))
+  carry = values[:, 0] # seed: y[0] = x[0]
+  for b in range(nBlocks):
+    carries[:, b] = carry
+    carry = decay[-1] * carry + partial[:, b, -1]
+  return (partial + carries[:, :, None] * decay).reshape(rows, -1)[:, :n]
+#--------------------------------------------------------------------------------------------------------------------------------
+def rollingSums(values: np.ndarray, window: int) -> np.ndarray:
+  """Sums over the last window bars of each row, NaN before the first full window."""
+  sums = np.cumsum(values, axis=1)
+  result = np.full(sums.shape, np.nan)
+  if window <= sums.shape[1]:
+    result[:, window - 1:] = sums[:, window - 1:]
+    result[:, window:] -= sums[:, :-window]
+  return result
+#--------------------------------------------------------------------------------------------------------------------------------
+def fusedIndicators(high: np.ndarray, low: np.ndarray, close: np.ndarray, volume: Optional[np.ndarray],
+                    volaWindow: int = 20, atrWindow: int = 14, vwapWindow: int = 20) -> Dict[str, np.ndarray]:
+  """Rolling volatility (Vola{volaWindow}), ATR, DMI/ADX, OBV and rolling VWAP from one derivation of the shared intermediates.
+  volume None (IBKR bars without volume) gives NaN for Obv and Vwap.
+  """
+  n = len(close)
+  prevClose = np.empty(n)
+  prevClose[0] = close[0]
+  prevClose[1:] = close[:-1]
+  # true range and directional movement
+  trueRange = np.maximum(high - low, np.maximum(np.abs(high - prevClose), np.abs(low - prevClose)))
+  up = np.zeros(n)
+  down = np.zeros(n)
+  up[1:] = high[1:] - high[:-1]
+  down[1:] = low[:-1] - low[1:]
+  plusDm = np.where((up > down) & (up > 0), up, 0.0)
+  minusDm = np.where((down > up) & (down > 0), down, 0.0)
+  atr, plusSmooth, minusSmooth = wilderSmooth(np.stack([trueRange, plusDm, minusDm]), atrWindow)
+  with np.errstate(divide='ignore', invalid='ignore'):
+    plusDi = np.where(atr > 0, 100 * plusSmooth / atr, 0.0)
+    minusDi = np.where(atr > 0, 100 * minusSmooth / atr, 0.0)
+    diSum = plusDi + minusDi
+    dx = np.where(diSum > 0, 100 * np.abs(plusDi - minusDi) / diSum, 0.0)
+  adx = wilderSmooth(dx[None, :], atrWindow)[0]
+  # log returns, the first bar has none
+  logReturns = np.zeros(n)
+  with np.errstate(divide='ignore', invalid='ignore'):
+    logReturns[1:] = np.log(close[1:] / close[:-1])
+  rows = [logReturns, logReturns * logReturns]
+  hasVolume = volume is not None
+  if hasVolume:
+    rows += [(high + low + close) / 3 * volume, volume]
+  if volaWindow == vwapWindow:
+    sums = rollingSums(np.stack(rows), volaWindow)
+    returnSums, volumeSums = sums[:2], sums[2:]
+  else:
+    returnSums = rollingSums(np.stack(rows[:2]), volaWindow)
+    volumeSums = rollingSums(np.stack(rows[2:]), vwapWindow) if hasVolume else None
+  variance = np.maximum(returnSums[1] - returnSums[0] ** 2 / volaWindow, 0.0) / max(volaWindow - 1, 1)
+  vola = np.sqrt(variance) * 252 ** .5 * 100
+  vola[:volaWindow] = np.nan # the first window would contain the missing return of the first bar
+  result = {f'Vola{volaWindow}': vola, 'Atr': atr, 'PlusDi': plusDi, 'MinusDi': minusDi, 'Adx': adx}
+  if hasVolume:
+    with np.errstate(divide='ignore', invalid='ignore'):
+      result['Vwap'] = np.where(volumeSums[1] > 0, volumeSums[0] / volumeSums[1], np.nan)
+    direction = np.sign(close - prevClose)
+    result['Obv'] = np.cumsum(direction * volume)
+  else:
+    result['Vwap'] = np.full(n, np.nan)
+    result['Obv'] = np.full(n, np.nan)
+  return result
+#--------------------------------------------------------------------------------------------------------------------------------
 class Calculator:
+  # the methods of calculate(), each adds its own columns from the price columns only (indicatorCache stores them per method)
+  GROUPS = ['addMovingAverages', 'addBollingerBands', 'addMacd', 'addRsi', 'addStochastic', 'addVolatility', 'addFusedIndicators']
   def __init__(self):
     self.df = pd.DataFrame()  
   #--------------------------------------------------------------------------------------------------------------------------------
   def setDataframe(self, df: pd.DataFrame) -> 'Calculator': 
-    self.df = df.copy()
+    self.df = df.copy(deep=False) # the indicators are added as new columns, the price data is not modified
     return self
   #--------------------------------------------------------------------------------------------------------------------------------
   def get(self) -> pd.DataFrame:
     return self.df
   #----------------------------------------------------------------------------------------------------------------------  
   def addStochasticOscillator(self, kWindow:int=14, dWindow:int=3) -> pd.DataFrame:
-    df = self.df.copy()
+    df = self.df.copy(deep=False)
     if 'Close' not in df.columns or 'Low' not in df.columns or 'High' not in df.columns: return df
     if kWindow <= len(df):
       lowMin = df['Low'].rolling(window=kWindow, min_periods=1).min()
@@ -36,15 +127,15 @@ class Calculator:
     #self.df = self.addStochasticOscillator(kWindow, dWindow)
     stoch = self.addStochasticOscillator(kWindow, dWindow)
     # make slow Stochastic Oscillator with standard window 3
-    self.df['stochK'] = stoch["%K"].copy()
-    self.df['stochD'] = stoch["%D"].copy()
+    self.df['stochK'] = stoch["%K"]
+    self.df['stochD'] = stoch["%D"]
     # make average of stochastic k and signal
     # 20, 5; 15, 12; 18, 14
     #df['stochKSlow'] = df['stochK'].rolling(window=12).mean()
     #df['StMaS'] = df['stochSignalK'].rolling(window=9).mean()
     stoch = self.addStochasticOscillator(44,5)
-    self.df['stochKSlow'] = stoch["%K"].copy()
-    self.df['stochDSlow'] = stoch["%D"].copy()
+    self.df['stochKSlow'] = stoch["%K"]
+    self.df['stochDSlow'] = stoch["%D"]
   #--------------------------------------------------------------------------------------------------------------------------------
   def addMacd(self,slow=29, fast=12, smooth=6):
     # MACD
@@ -128,14 +219,29 @@ class Calculator:
   #----------------------------------------------------------------------------------------------------------------------  
   def addVolatility(self):
     # from https://www.learnpythonwithrune.org/calculate-the-volatility-of-historic-stock-prices-with-pandas-and-python/
+    # one value for the whole history, the rolling volatility is Vola20 of addFusedIndicators
     self.df['Vola'] = np.log(self.df['Close']/self.df['Close'].shift()).std()*252**.5*100
   #----------------------------------------------------------------------------------------------------------------------  
+  def addFusedIndicators(self, volaWindow: int = 20, atrWindow: int = 14, vwapWindow: int = 20):
+    """Adds Vola20, Atr, PlusDi, MinusDi, Adx, Obv and Vwap, computed together by fusedIndicators.
+    Bars without volume (all 0 or missing) get NaN in Obv and Vwap.
+    """
+    df = self.df
+    if not all(col in df.columns for col in ['High', 'Low', 'Close']) or len(df) < 2:
+      return
+    prices = df[['High', 'Low', 'Close']].to_numpy(dtype='float64').T.copy() # one contiguous row per series
+    if np.isnan(prices).any():
+      prices = df[['High', 'Low', 'Close']].ffill().bfill().to_numpy(dtype='float64').T.copy()
+    volume = None
+    if 'Volume' in df.columns:
+      volume = np.nan_to_num(df['Volume'].to_numpy(dtype='float64'), nan=0.0)
+      if not (volume > 0).any():
+        volume = None
+    result = fusedIndicators(prices[0], prices[1], prices[2], volume, volaWindow, atrWindow, vwapWindow)
+    df[list(result)] = np.column_stack(list(result.values())) # one block instead of a column insert per indicator
+  #----------------------------------------------------------------------------------------------------------------------  
   def calculate(self)-> 'Calculator':
     if not self.df.empty: 
-      self.addMovingAverages()
-      self.addBollingerBands()
-      self.addMacd()
-      self.addRsi()
-      self.addStochastic()
-      self.addVolatility()
+      for group in self.GROUPS:
+        getattr(self, group)()
     return self
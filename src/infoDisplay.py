@@ -1,6 +1,6 @@
 import tkinter as tk
 from tkinter import ttk 
-from typing import Optional, Dict, Any, Tuple
+from typing import Optional, Dict, Any, List, Tuple
 import datetime
 #--------------------------------------------------------------------------------------------------------------------------------
 class CompanyInfoDisplay:
@@ -20,6 +20,7 @@ class CompanyInfoDisplay:
   def clearContent(self):
     if self.infoTextWidget:
       self.infoTextWidget.delete('1.0', tk.END)
+      self.infoTextWidget.mark_unset('news')
   #------------------------------------------------------------------------------------------------------------------------------
   def showMessage(self, message: str):
     self.clearContent()
@@ -70,6 +71,21 @@ class CompanyInfoDisplay:
     except Exception: 
       pass
   #------------------------------------------------------------------------------------------------------------------------------
+  def showHeadlines(self, headlines: List[str]):
+    """Replaces the news section below the company details, called again when new headlines arrive."""
+    if not self.infoTextWidget:
+      return
+    if 'news' in self.infoTextWidget.mark_names():
+      self.infoTextWidget.delete('news', tk.END)
+    else:
+      self.infoTextWidget.mark_set('news', 'end-1c')
+      self.infoTextWidget.mark_gravity('news', tk.LEFT)
+    if not headlines:
+      return
+    self.insertHeaderWithTag("\n--- News ---\n", 'header2', ('Segoe UI', 10, 'bold'), spacing1=5, spacing3=3)
+    for headline in headlines:
+      self.infoTextWidget.insert(tk.END, headline + "\n")
+  #------------------------------------------------------------------------------------------------------------------------------
   def displayDetails(self, companyInfo: Dict[str, Any], ticker: str):
     self.clearContent()
     if not companyInfo or companyInfo.get("error"):
@@ -102,6 +118,8 @@ class CompanyInfoDisplay:
       "52 Week Low": "fiftyTwoWeekLow",
       "Avg. Volume": "averageVolume", 
       "Current Price": "currentPrice",
+      "Fair Value (consensus)": "consensusFairValue",
+      "Fair Value Upside %": "consensusUpside",
       "Regular Market Price": "regularMarketPrice",
       "Open": "open",
       "Previous Close": "previousClose", 
@@ -0,0 +1,231 @@
+"""Store for 1-minute bars, one parquet partition per ticker and day (UTC dates, tz-naive UTC index like the data cache).
+
+  data/intraday/{ticker}/{YYYY-MM-DD}.parquet     1-minute bars of one day
+  data/intraday/{ticker}/_agg_v2_{interval}.parquet  aggregated bars of all closed days (rollup cache)
+
+Writes are append-only per day: bars older than the last stored bar of a day are ignored, only the last
+(possibly still forming) bar may be replaced. Aggregations (5m, 15m, 1h, 1d, 1wk, ...) follow
+YFinanceProvider.resampleMap(). Intraday bins start at the session open of the exchange (tradingCalendar), like the
+1h bars of the providers: 13:30, 14:30, ... UTC for a US ticker in summer. Days before the newest partition are closed,
+their aggregates are kept in the rollup so a request only reads the partitions which are newer than the rollup.
+
+  python intradayStore.py --check    checks the 1h and 90m bins of known US sessions
+Files are replaced atomically, writers of other processes are serialized by atomicIo.fileLock() of the ticker directory.
+"""
+import argparse
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+
+import pandas as pd
+
+import atomicIo
+import tradingCalendar
+#--------------------------------------------------------------------------------------------------------------------------------
+INTRADAY_INTERVALS = ['1m', '2m', '5m', '15m', '30m', '60m', '90m', '1h']
+#--------------------------------------------------------------------------------------------------------------------------------
+def resampleMap() -> Dict[str, str]:
+  # same as loader.YFinanceProvider.resampleMap(), loader imports this module so it can not be imported here
+  return {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'}
+#--------------------------------------------------------------------------------------------------------------------------------
+def intervalToFrequency(interval: str) -> str:
+  """yfinance interval -> pandas resample rule"""
+  if interval == '1d':  return 'D'
+  if interval == '1wk': return 'W'
+  if interval == '1h':  return '60min'
+  if interval.endswith('m') and interval[:-1].isdigit(): return interval[:-1] + 'min'
+  raise ValueError(f"Unsupported interval {interval}")
+#--------------------------------------------------------------------------------------------------------------------------------
+def sessionOrigin(ticker: str, day: datetime.date) -> pd.Timestamp:
+  """Session open of the exchange of the ticker on day, tz-naive UTC like the stored bars."""
+  return pd.Timestamp(tradingCalendar.exchangeFor(ticker).sessionBounds(day)[0], unit='s')
+#--------------------------------------------------------------------------------------------------------------------------------
+def normalizeIndex(df: pd.DataFrame) -> pd.DataFrame:
+  if isinstance(df.index, pd.DatetimeIndex) and df.index.tz is not None:
+    df = df.copy()
+    df.index = df.index.tz_convert('UTC').tz_localize(None)
+  return df
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class IntradayStore:
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, dataDirName: str = "data", cacheSize: int = 256):
+    scriptDir = os.path.dirname(os.path.abspath(__file__))
+    self.rootDir = os.path.join(scriptDir, dataDirName, "intraday")
+    self.lock = threading.RLock()
+    self.cacheSize = cacheSize
+    # (ticker, interval, day) -> aggregated bars of the newest (open) day, valid as long as the partition mtime matches
+    self.openDayCache: "OrderedDict[Tuple[str, str, datetime.date], Tuple[float, pd.DataFrame]]" = OrderedDict()
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def tickerDir(self, ticker: str) -> str:
+    return os.path.join(self.rootDir, ticker)
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def partitionPath(self, ticker: str, day: datetime.date) -> str:
+    return os.path.join(self.tickerDir(ticker), f"{day.isoformat()}.parquet")
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def rollupPath(self, ticker: str, interval: str) -> str:
+    return os.path.join(self.tickerDir(ticker), f"_agg_v2_{interval}.parquet") # v2: bins from the session open
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def days(self, ticker: str) -> List[datetime.date]:
+    try:
+      names = os.listdir(self.tickerDir(ticker))
+    except FileNotFoundError:
+      return []
+    return sorted(datetime.date.fromisoformat(n[:-8]) for n in names if n.endswith('.parquet') and not n.startswith('_'))
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def readPartition(self, ticker: str, day: datetime.date) -> Optional[pd.DataFrame]:
+    path = self.partitionPath(ticker, day)
+    if not os.path.exists(path):
+      return None
+    return pd.read_parquet(path)
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def append(self, ticker: str, bars: pd.DataFrame) -> int:
+    """Appends 1-minute bars, returns the number of new bars."""
+    if bars is None or bars.empty:
+      return 0
+    bars = normalizeIndex(bars)
+    bars = bars[[c for c in resampleMap() if c in bars.columns]]
+    bars = bars[~bars.index.duplicated(keep='last')].sort_index()
+    added = 0
+    with self.lock, atomicIo.fileLock(self.tickerDir(ticker)):
+      os.makedirs(self.tickerDir(ticker), exist_ok=True)
+      storedDays = self.days(ticker)
+      for day, dayBars in bars.groupby(bars.index.date):
+        existing = self.readPartition(ticker, day)
+        if existing is not None and not existing.empty:
+          lastTs = existing.index[-1]
+          dayBars = dayBars[dayBars.index >= lastTs] # the last stored bar may still have been forming
+          if dayBars.empty:
+            continue
+          added += int((dayBars.index > lastTs).sum())
+          dayBars = pd.concat([existing[existing.index < dayBars.index[0]], dayBars])
+        else:
+          added += len(dayBars)
+        atomicIo.writeParquet(dayBars, self.partitionPath(ticker, day))
+        if storedDays and day < storedDays[-1]:
+          self.invalidateRollups(ticker, day) # backfill of an already closed day
+    return added
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def invalidateRollups(self, ticker: str, fromDay: datetime.date):
+    for name in os.listdir(self.tickerDir(ticker)):
+      if name.startswith('_agg_'):
+        try:
+          os.remove(os.path.join(self.tickerDir(ticker), name))
+        except FileNotFoundError:
+          pass # removed by another process
+    for key in [k for k in self.openDayCache if k[0] == ticker]:
+      del self.openDayCache[key]
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def load(self, ticker: str, start: Optional[datetime.date] = None, end: Optional[datetime.date] = None) -> pd.DataFrame:
+    """1-minute bars of [start, end], reads only the partitions of these days."""
+    frames = [self.readPartition(ticker, d) for d in self.days(ticker) if (start is None or d >= start) and (end is None or d <= end)]
+    frames = [f for f in frames if f is not None and not f.empty]
+    return pd.concat(frames) if frames else pd.DataFrame(columns=list(resampleMap()))
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def aggregateDay(self, minuteBars: pd.DataFrame, interval: str, ticker: str) -> pd.DataFrame:
+    """Bars of the interval, the intraday bins of each day start at the session open of the ticker."""
+    rules = {c: a for c, a in resampleMap().items() if c in minuteBars.columns}
+    if interval == '1m' or minuteBars.empty:
+      return minuteBars
+    frequency = intervalToFrequency(interval)
+    if interval in ('1d', '1wk'):
+      return minuteBars.resample(frequency).agg(rules).dropna(subset=['Close'])
+    frames = [dayBars.resample(frequency, origin=sessionOrigin(ticker, day)).agg(rules)
+              for day, dayBars in minuteBars.groupby(minuteBars.index.date)]
+    return pd.concat(frames).dropna(subset=['Close'])
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def aggregateOpenDay(self, ticker: str, day: datetime.date, interval: str) -> pd.DataFrame:
+    key = (ticker, interval, day)
+    mtime = os.path.getmtime(self.partitionPath(ticker, day))
+    cached = self.openDayCache.get(key)
+    if cached is not None and cached[0] == mtime:
+      self.openDayCache.move_to_end(key)
+      return cached[1]
+    aggregated = self.aggregateDay(self.readPartition(ticker, day), interval, ticker)
+    self.openDayCache[key] = (mtime, aggregated)
+    while len(self.openDayCache) > self.cacheSize:
+      self.openDayCache.popitem(last=False)
+    return aggregated
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def updateRollup(self, ticker: str, interval: str, closedDays: List[datetime.date]) -> pd.DataFrame:
+    """Rollup with the aggregates of all closed days, extended by the days which are not in it yet."""
+    path = self.rollupPath(ticker, interval)
+    rollup = pd.read_parquet(path) if os.path.exists(path) else None
+    if rollup is None:
+      try:
+        os.remove(os.path.join(self.tickerDir(ticker), f"_agg_{interval}.parquet")) # rollup of the midnight bins before v2
+      except FileNotFoundError:
+        pass
+    lastRolledDay = rollup.index[-1].date() if rollup is not None and not rollup.empty else None
+    missingDays = [d for d in closedDays if lastRolledDay is None or d > lastRolledDay]
+    if not missingDays:
+      return rollup
+    # aggregate day by day, so never more than one day of minute bars is in memory
+    newAggregates = [self.aggregateDay(self.readPartition(ticker, d), interval, ticker) for d in missingDays]
+    rollup = pd.concat([f for f in [rollup] + newAggregates if f is not None and not f.empty])
+    atomicIo.writeParquet(rollup, path, durable=False) # rebuilt from the partitions if lost
+    return rollup
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def aggregate(self, ticker: str, interval: str, start: Optional[datetime.date] = None, end: Optional[datetime.date] = None) -> pd.DataFrame:
+    """Bars of the given interval for [start, end] built from the minute bars."""
+    if interval == '1wk':
+      daily = self.aggregate(ticker, '1d', start, end)
+      return daily.resample('W').agg({c: a for c, a in resampleMap().items() if c in daily.columns}).dropna(subset=['Close'])
+    with self.lock, atomicIo.fileLock(self.tickerDir(ticker)):
+      days = self.days(ticker)
+      if not days:
+        return pd.DataFrame(columns=list(resampleMap()))
+      if interval == '1m':
+        return self.load(ticker, start, end)
+      rollup = self.updateRollup(ticker, interval, days[:-1])
+      frames = [rollup, self.aggregateOpenDay(ticker, days[-1], interval)]
+    df = pd.concat([f for f in frames if f is not None and not f.empty])
+    if start is not None:
+      df = df[df.index >= pd.Timestamp(start)]
+    if end is not None:
+      df = df[df.index < pd.Timestamp(end) + pd.Timedelta(days=1)]
+    return df
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+def checkSessionBins():
+  """Aggregates the regular sessions of AAPL on a winter day (open 14:30 UTC) and a summer day (13:30 UTC)
+  through the rollup and the open day, the bins must start at the open like the 1h bars of yahoo."""
+  sessions = {datetime.date(2024, 1, 16): '14:30', datetime.date(2024, 3, 15): '13:30'}
+  expected = {'1h':  ['+0:00', '+1:00', '+2:00', '+3:00', '+4:00', '+5:00', '+6:00'],
+              '90m': ['+0:00', '+1:30', '+3:00', '+4:30', '+6:00']}
+  dataDir = tempfile.mkdtemp(prefix='intradayCheck')
+  try:
+    store = IntradayStore(dataDir)
+    for day, openTime in sessions.items():
+      index = pd.date_range(f"{day} {openTime}", periods=390, freq='min') # 6.5 h
+      store.append('AAPL', pd.DataFrame({'Open': range(390), 'High': range(1, 391), 'Low': range(390),
+                                         'Close': range(1, 391), 'Volume': 1}, index=index, dtype=float))
+    for interval, offsets in expected.items():
+      bars = store.aggregate('AAPL', interval)
+      for day, openTime in sessions.items():
+        dayBars = bars[bars.index.date == day]
+        openTs = pd.Timestamp(f"{day} {openTime}")
+        expectedIndex = [openTs + pd.Timedelta(hours=int(o[1]), minutes=int(o[3:])) for o in offsets]
+        assert list(dayBars.index) == expectedIndex, f"{interval} {day}: {list(dayBars.index)}"
+        assert dayBars['Open'].iloc[0] == 0 and dayBars['Volume'].sum() == 390, f"{interval} {day}: {dayBars.iloc[0].to_dict()}"
+      print(f"{interval}: bins start at the session open on {len(sessions)} days")
+  finally:
+    shutil.rmtree(dataDir, ignore_errors=True)
+#--------------------------------------------------------------------------------------------------------------------------------
+def main(argv: Optional[List[str]] = None) -> int:
+  parser = argparse.ArgumentParser(description="Checks of the intraday store.")
+  parser.add_argument("--check", action='store_true', help="Check the 1h and 90m bins of known US sessions.")
+  opt = parser.parse_args(argv)
+  if opt.check:
+    checkSessionBins()
+  else:
+    parser.print_help()
+  return 0
+#--------------------------------------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+  sys.exit(main())
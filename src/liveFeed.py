@@ -0,0 +1,310 @@
+"""Live update path: bars of a feed -> incremental indicator state -> watchlist rows, alerts and the chart of the shown ticker.
+
+A feed (marketReplay.py, a live IBKR feed) pushes LiveBar updates from its own thread, push never blocks. The worker
+thread of LiveUpdatePump applies them in order: per ticker the last close, the % change and the RSI are updated with the
+incremental state of alerts.py, and the alert rules are evaluated (AlertEngine.processLiveBar). A final bar is committed,
+an update of the forming bar is evaluated on a copy of the state. The results are coalesced per ticker: once per frame
+(FRAME_MS) the GUI takes the latest values of the changed tickers and repaints the visible rows among them. The chart of
+the shown ticker is recomputed (indicators.Calculator through indicatorCache) and drawn at most every CHART_REFRESH_MS.
+
+LiveMetrics counts what the path does: bars pushed and applied per second, updates coalesced, the end-to-end latency from
+the push of a bar to the repaint of its row and to the drawn chart (p50/p95/p99/max), frames and dropped frames (a frame
+that started a whole frame or more too late, the Tk thread was busy) and the queue depths (bars waiting for the worker,
+rows waiting for a frame).
+"""
+import collections
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import alerts
+#--------------------------------------------------------------------------------------------------------------------------------
+FRAME_MS = 50              # the GUI takes the changes this often (20 frames/s)
+CHART_REFRESH_MS = 1000    # the chart of the shown ticker is recomputed and drawn at most this often
+CHART_HISTORY_BARS = 1000  # bars kept per ticker for the chart, enough warmup for the 200 bar averages
+LIVE_CHART_BARS = 300      # bars shown by the live chart
+LATENCY_WINDOW = 20000     # latencies kept for the percentiles
+BATCH = 1000               # bars the worker applies before it looks at the queue again
+DAY_NS = 86400 * 10**9
+RowUpdate = Tuple[float, float, float] # last close, % change, rsi (watchlistView.RowValues without the fair value)
+#--------------------------------------------------------------------------------------------------------------------------------
+class LiveBar(NamedTuple):
+  ticker: str
+  time: pd.Timestamp
+  open: float
+  high: float
+  low: float
+  close: float
+  volume: float
+  final: bool    # False: an update of the forming bar, the next update of the same time replaces it
+  sentAt: float  # time.perf_counter() when the feed pushed it
+  #------------------------------------------------------------------------------------------------------------------------------
+  def values(self) -> Dict[str, float]:
+    return {'Open': self.open, 'High': self.high, 'Low': self.low, 'Close': self.close, 'Volume': self.volume}
+#--------------------------------------------------------------------------------------------------------------------------------
+def percentiles(values: collections.deque) -> Tuple[float, float, float, float]:
+  if not values:
+    return (float('nan'),) * 4
+  p50, p95, p99 = (float(v) for v in np.percentile(np.fromiter(values, float, len(values)), [50, 95, 99]))
+  return p50, p95, p99, max(values)
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class LiveMetrics:
+  """Counters, latencies and queue depths of the live update path, written by the feed, the worker and the GUI thread."""
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.started = time.perf_counter()
+    self.counts: collections.Counter = collections.Counter() # pushed, applied, coalesced, frames, droppedFrames, charts, alerts
+    self.latencies: collections.deque = collections.deque(maxlen=LATENCY_WINDOW)      # push -> row repainted, seconds
+    self.chartLatencies: collections.deque = collections.deque(maxlen=LATENCY_WINDOW) # push -> chart drawn
+    self.frameWork: collections.deque = collections.deque(maxlen=LATENCY_WINDOW)      # seconds the GUI thread spent per frame
+    self.queueDepths: collections.deque = collections.deque(maxlen=LATENCY_WINDOW)
+    self.pendingRows: collections.deque = collections.deque(maxlen=LATENCY_WINDOW)
+    self.maxQueueDepth = 0
+    self.maxLag = 0.0 # seconds the feed was behind its schedule
+  #------------------------------------------------------------------------------------------------------------------------------
+  def count(self, name: str, n: int = 1):
+    with self.lock:
+      self.counts[name] += n
+  #------------------------------------------------------------------------------------------------------------------------------
+  def frame(self, lateSeconds: float, workSeconds: float, queueDepth: int, rows: int, latencies: List[float]):
+    """One frame of the consumer: how late it started, its work, the queue depths it saw and the latencies of its rows."""
+    with self.lock:
+      self.counts['frames'] += 1
+      if lateSeconds >= FRAME_MS / 1000:
+        self.counts['droppedFrames'] += int(lateSeconds * 1000 // FRAME_MS)
+      self.frameWork.append(workSeconds)
+      self.queueDepths.append(queueDepth)
+      self.pendingRows.append(rows)
+      self.maxQueueDepth = max(self.maxQueueDepth, queueDepth)
+      self.latencies.extend(latencies)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def chart(self, latency: float):
+    with self.lock:
+      self.counts['charts'] += 1
+      self.chartLatencies.append(latency)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def lag(self, seconds: float):
+    if seconds > self.maxLag:
+      self.maxLag = seconds
+  #------------------------------------------------------------------------------------------------------------------------------
+  def summary(self) -> Dict[str, float]:
+    with self.lock:
+      seconds = max(1e-9, time.perf_counter() - self.started)
+      latency = percentiles(self.latencies)
+      chartLatency = percentiles(self.chartLatencies)
+      result = {
+        'seconds': seconds,
+        'pushedPerSecond': self.counts['pushed'] / seconds,
+        'appliedPerSecond': self.counts['applied'] / seconds,
+        'latencyP50': latency[0], 'latencyP95': latency[1], 'latencyP99': latency[2], 'latencyMax': latency[3],
+        'chartLatencyP50': chartLatency[0], 'chartLatencyMax': chartLatency[3],
+        'frameWorkP95': percentiles(self.frameWork)[1],
+        'queueDepthMean': float(np.mean(self.queueDepths)) if self.queueDepths else 0.0,
+        'queueDepthMax': self.maxQueueDepth,
+        'pendingRowsMean': float(np.mean(self.pendingRows)) if self.pendingRows else 0.0,
+        'maxLag': self.maxLag,
+      }
+      result.update(self.counts)
+      return result
+  #------------------------------------------------------------------------------------------------------------------------------
+  def statusLine(self) -> str:
+    s = self.summary()
+    return (f"Live: {s['appliedPerSecond']:.0f} bars/s, latency p95 {s['latencyP95'] * 1000:.0f} ms, "
+            f"dropped frames {s.get('droppedFrames', 0)}/{s.get('frames', 0)}, queue {self.queueDepths[-1] if self.queueDepths else 0}")
+  #------------------------------------------------------------------------------------------------------------------------------
+  def format(self) -> str:
+    s = self.summary()
+    ms = lambda key: f"{s[key] * 1000:8.1f} ms"
+    return "\n".join([
+      f"duration            {s['seconds']:8.1f} s",
+      f"bars pushed         {s.get('pushed', 0):8d}  ({s['pushedPerSecond']:.0f}/s)",
+      f"bars applied        {s.get('applied', 0):8d}  ({s['appliedPerSecond']:.0f}/s), {s.get('coalesced', 0)} coalesced before a frame",
+      f"latency bar->row    p50 {ms('latencyP50')}  p95 {ms('latencyP95')}  p99 {ms('latencyP99')}  max {ms('latencyMax')}",
+      f"latency bar->chart  p50 {ms('chartLatencyP50')}  max {ms('chartLatencyMax')}  ({s.get('charts', 0)} charts)",
+      f"frames              {s.get('frames', 0):8d}  dropped {s.get('droppedFrames', 0)}, work p95 {ms('frameWorkP95')}",
+      f"queue depth         mean {s['queueDepthMean']:.1f}  max {s['queueDepthMax']}, rows per frame {s['pendingRowsMean']:.1f}",
+      f"feed behind         max {s['maxLag']:.2f} s, alerts {s.get('alerts', 0)}",
+    ])
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class LiveTicker:
+  """Watchlist values of one ticker: last close, % change to the close of the previous day and RSI (alerts.RsiState)."""
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, history: pd.DataFrame):
+    self.rsi = alerts.RsiState()
+    self.rsi.warmup(history[['Close']])
+    days = history.index.asi8 // DAY_NS
+    closes = history['Close'].to_numpy(dtype='float64')
+    self.day = int(days[-1])
+    self.lastClose = float(closes[-1]) # of the last final bar
+    before = np.flatnonzero(days < self.day)
+    self.reference = float(closes[before[-1]]) if len(before) else float(history['Open'].iloc[0] if 'Open' in history.columns else closes[0])
+  #------------------------------------------------------------------------------------------------------------------------------
+  def apply(self, bar: LiveBar) -> RowUpdate:
+    day = bar.time.value // DAY_NS
+    if day != self.day: # daily bars: every bar, intraday bars: the first bar of a day
+      self.day, self.reference = day, self.lastClose
+    if bar.final:
+      rsi = self.rsi.update({'Close': bar.close})['Rsi']
+      self.lastClose = bar.close
+    else:
+      rsi = self.rsi.clone().update({'Close': bar.close})['Rsi']
+    return bar.close, (bar.close / self.reference - 1) * 100 if self.reference else 0.0, rsi
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class LiveUpdatePump:
+  """Applies the bars of a feed in a worker thread, the GUI takes the coalesced results once per frame (takeChanges)."""
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, interval: str = '1d', alertEngine: Optional[alerts.AlertEngine] = None, metrics: Optional[LiveMetrics] = None,
+               cacheInterval: Optional[str] = None):
+    self.interval = interval
+    self.cacheInterval = cacheInterval or interval # interval name of the indicator cache files of the live chart
+    self.alertEngine = alertEngine
+    self.metrics = metrics or LiveMetrics()
+    self.queue: queue.SimpleQueue = queue.SimpleQueue()
+    self.lock = threading.Lock()
+    self.tickers: Dict[str, LiveTicker] = {}
+    self.histories: Dict[str, pd.DataFrame] = {} # last CHART_HISTORY_BARS before the feed started
+    self.changes: Dict[str, Tuple[RowUpdate, float]] = {} # ticker -> values, sentAt of the oldest update not taken yet
+    self.newAlerts: List[alerts.Alert] = []
+    self.chartTicker: Optional[str] = None
+    self.chartBars: 'collections.OrderedDict[pd.Timestamp, LiveBar]' = collections.OrderedDict()
+    self.chartSentAt: Optional[float] = None # oldest bar of the chart ticker not drawn yet
+    self.stopped = threading.Event()
+    self.thread: Optional[threading.Thread] = None
+  #------------------------------------------------------------------------------------------------------------------------------
+  def addTicker(self, ticker: str, history: pd.DataFrame):
+    """Warms up the state with the bars before the feed starts, at least one."""
+    state = LiveTicker(history)
+    with self.lock:
+      self.tickers[ticker] = state
+      self.histories[ticker] = history.iloc[-CHART_HISTORY_BARS:]
+  #------------------------------------------------------------------------------------------------------------------------------
+  def start(self) -> 'LiveUpdatePump':
+    self.stopped.clear()
+    self.thread = threading.Thread(target=self.run, name='livePump', daemon=True)
+    self.thread.start()
+    return self
+  #------------------------------------------------------------------------------------------------------------------------------
+  def stop(self):
+    self.stopped.set()
+    if self.thread is not None:
+      self.thread.join(timeout=2.0)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def push(self, bar: LiveBar):
+    self.queue.put(bar)
+    self.metrics.count('pushed')
+  #------------------------------------------------------------------------------------------------------------------------------
+  def queueDepth(self) -> int:
+    return self.queue.qsize()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def idle(self) -> bool:
+    """All pushed bars applied and taken."""
+    counts = self.metrics.counts
+    return counts['applied'] >= counts['pushed'] and not self.changes
+  #------------------------------------------------------------------------------------------------------------------------------
+  def run(self):
+    while not self.stopped.is_set():
+      try:
+        batch = [self.queue.get(timeout=0.2)]
+      except queue.Empty:
+        continue
+      try:
+        while len(batch) < BATCH:
+          batch.append(self.queue.get_nowait())
+      except queue.Empty:
+        pass
+      for bar in batch:
+        try:
+          self.apply(bar)
+        except Exception as e:
+          print(f"Live update of {bar.ticker} failed: {e}")
+      self.metrics.count('applied', len(batch))
+  #------------------------------------------------------------------------------------------------------------------------------
+  def apply(self, bar: LiveBar):
+    state = self.tickers.get(bar.ticker)
+    if state is None: # no history, the open of the first bar starts the state
+      self.addTicker(bar.ticker, pd.DataFrame({'Open': [bar.open], 'Close': [bar.open]}, index=[bar.time - pd.Timedelta(days=1)]))
+      state = self.tickers[bar.ticker]
+    values = state.apply(bar)
+    newAlerts = []
+    if self.alertEngine is not None:
+      newAlerts = self.alertEngine.processLiveBar(bar.ticker, bar.time, bar.values(), bar.final, self.histories.get(bar.ticker))
+    with self.lock:
+      previous = self.changes.get(bar.ticker)
+      if previous is not None:
+        self.metrics.counts['coalesced'] += 1
+      self.changes[bar.ticker] = (values, bar.sentAt if previous is None else previous[1])
+      if newAlerts:
+        self.newAlerts.extend(newAlerts)
+        self.metrics.counts['alerts'] += len(newAlerts)
+      if bar.ticker == self.chartTicker:
+        self.chartBars[bar.time] = bar # an update of the forming bar replaces the previous one
+        if len(self.chartBars) > CHART_HISTORY_BARS:
+          self.chartBars.popitem(last=False)
+        if self.chartSentAt is None:
+          self.chartSentAt = bar.sentAt
+  #------------------------------------------------------------------------------------------------------------------------------
+  def takeChanges(self) -> Tuple[Dict[str, Tuple[RowUpdate, float]], List[alerts.Alert]]:
+    """The values of the tickers changed since the last call and the new alerts, for one frame."""
+    with self.lock:
+      changes, self.changes = self.changes, {}
+      newAlerts, self.newAlerts = self.newAlerts, []
+    return changes, newAlerts
+  #------------------------------------------------------------------------------------------------------------------------------
+  def setChartTicker(self, ticker: Optional[str]):
+    with self.lock:
+      if ticker != self.chartTicker:
+        self.chartTicker = ticker
+        self.chartBars.clear()
+        self.chartSentAt = None
+  #------------------------------------------------------------------------------------------------------------------------------
+  def takeChartFrame(self) -> Optional[Tuple[str, pd.DataFrame, float]]:
+    """(ticker, history + bars of the feed, sentAt of the oldest bar not drawn yet), None if the chart did not change."""
+    with self.lock:
+      if self.chartTicker is None or self.chartSentAt is None:
+        return None
+      ticker, sentAt = self.chartTicker, self.chartSentAt
+      bars = list(self.chartBars.values())
+      history = self.histories.get(ticker)
+      self.chartSentAt = None
+    live = pd.DataFrame([bar.values() for bar in bars], index=pd.DatetimeIndex([bar.time for bar in bars]))
+    if history is not None and not history.empty:
+      history = history[history.index < live.index[0]]
+      live = pd.concat([history[[c for c in live.columns if c in history.columns]], live])
+    return ticker, live.iloc[-CHART_HISTORY_BARS:], sentAt
+#--------------------------------------------------------------------------------------------------------------------------------
+def runHeadless(pump: LiveUpdatePump, seconds: float, drawChart: Optional[Callable[[str, pd.DataFrame], Any]] = None,
+                until: Optional[Callable[[], bool]] = None):
+  """Takes the changes every FRAME_MS like the GUI does, without one: the "repaint" is the take.
+  drawChart(ticker, frame) is called in a thread of its own at most every CHART_REFRESH_MS, e.g. the indicators and an Agg figure."""
+  frameSeconds = FRAME_MS / 1000
+  end = time.perf_counter() + seconds
+  due = time.perf_counter() + frameSeconds
+  chartThread: Optional[threading.Thread] = None
+  chartDue = 0.0
+  while time.perf_counter() < end and not (until is not None and until() and pump.idle()):
+    time.sleep(max(0.0, due - time.perf_counter()))
+    started = time.perf_counter()
+    changes, _ = pump.takeChanges()
+    now = time.perf_counter()
+    if drawChart is not None and now >= chartDue and (chartThread is None or not chartThread.is_alive()):
+      chart = pump.takeChartFrame()
+      if chart is not None:
+        def draw(ticker: str = chart[0], frame: pd.DataFrame = chart[1], sentAt: float = chart[2]):
+          drawChart(ticker, frame)
+          pump.metrics.chart(time.perf_counter() - sentAt)
+        chartThread = threading.Thread(target=draw, name='liveChart', daemon=True)
+        chartThread.start()
+        chartDue = now + CHART_REFRESH_MS / 1000
+    done = time.perf_counter()
+    pump.metrics.frame(started - due, done - started, pump.queueDepth(), len(changes), [done - sentAt for _, sentAt in changes.values()])
+    due = max(due + frameSeconds, done) # a late frame is not made up by a burst of frames
+  if chartThread is not None:
+    chartThread.join()
@@ -0,0 +1,129 @@
+"""Offline load test of the fetch pipeline (loader.fetchAndProcessIntervalData) with the ReplayProvider or the fake TWS.
+
+  python loadTest.py --tickers 50 --threads 8 --latency 0.2 --jitter 0.1 --rate-limit 0.05
+  python loadTest.py --ibkr --threads 4          # IbkrTws.IbApi against fakeTws.FakeTwsServer
+
+With --ibkr the provider is the hedged IBKR slot alone, without the Yahoo hedge and the Yahoo action lookup: the run
+stays offline and measures the TWS path only.
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import datetime
+import io
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from typing import List, Dict, Any, Optional
+
+import loader
+from syntheticData import generateOhlcv
+#--------------------------------------------------------------------------------------------------------------------------------
+def createFixtures(fixtureDir: str, tickers: List[str], nBars: int):
+  """Synthetic daily fixtures ending today, one per ticker."""
+  import pandas as pd
+  for i, ticker in enumerate(tickers):
+    df = generateOhlcv(nBars, seed=i)
+    df.index = pd.bdate_range(end=datetime.date.today(), periods=len(df), name=df.index.name)
+    loader.saveData(df, loader.constructParquetFilePath(ticker, '1d', fixtureDir))
+#--------------------------------------------------------------------------------------------------------------------------------
+def percentile(values: List[float], p: float) -> float:
+  if not values:
+    return float('nan')
+  values = sorted(values)
+  return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+#--------------------------------------------------------------------------------------------------------------------------------
+def runLoadTest(tickers: List[str], threads: int, rounds: int, useIbkr: bool, dataDir: str, years: int = 3) -> Dict[str, Any]:
+  endDt = datetime.date.today()
+  startDt = endDt - datetime.timedelta(days=365 * years)
+  latencies: List[float] = []
+  errors: Dict[str, int] = {}
+  lock = threading.Lock()
+  def fetchOne(ticker: str):
+    start = time.perf_counter()
+    error = None
+    try:
+      df = loader.fetchAndProcessIntervalData(ticker, startDt, endDt, '1d', useIbkr, dataDir)
+      if df is None or df.empty:
+        raise loader.globalsSa.CustomError("empty result")
+    except Exception as e:
+      error = type(e).__name__
+    with lock:
+      if error is not None:
+        errors[error] = errors.get(error, 0) + 1
+      latencies.append(time.perf_counter() - start)
+  start = time.perf_counter()
+  for _ in range(rounds):
+    # loader reports every file access, redirect once for all threads
+    with contextlib.redirect_stdout(io.StringIO()), concurrent.futures.ThreadPoolExecutor(max_workers=threads) as pool:
+      list(pool.map(fetchOne, tickers))
+    # next round starts from an empty cache again, otherwise it would only measure the parquet files
+    shutil.rmtree(dataDir, ignore_errors=True)
+  duration = time.perf_counter() - start
+  return {
+    'requests': len(latencies),
+    'seconds': duration,
+    'throughput': len(latencies) / duration if duration > 0 else 0,
+    'p50': percentile(latencies, 50),
+    'p95': percentile(latencies, 95),
+    'p99': percentile(latencies, 99),
+    'errors': errors,
+  }
+#--------------------------------------------------------------------------------------------------------------------------------
+def main(argv: Optional[List[str]] = None) -> int:
+  parser = argparse.ArgumentParser(description="Offline load test of the fetch pipeline.")
+  parser.add_argument("--tickers", type=int, default=50, help="Number of synthetic tickers.")
+  parser.add_argument("--bars", type=int, default=1000, help="Bars per fixture.")
+  parser.add_argument("--threads", type=int, default=8)
+  parser.add_argument("--rounds", type=int, default=1)
+  parser.add_argument("--latency", type=float, default=0.05, help="Service latency in seconds.")
+  parser.add_argument("--jitter", type=float, default=0.05, help="Additional random latency in seconds.")
+  parser.add_argument("--rate-limit", type=float, default=0.0, help="Probability of a rate limit error.")
+  parser.add_argument("--partial", type=float, default=0.0, help="Probability of a truncated response.")
+  parser.add_argument("--fixtures", default=None, help="Use existing fixtures instead of synthetic ones.")
+  parser.add_argument("--ibkr", action='store_true', help="Go through IbkrTws and the fake TWS server.")
+  opt = parser.parse_args(argv)
+
+  workDir = tempfile.mkdtemp(prefix='stockAnalyzerLoad')
+  fixtureDir = opt.fixtures or os.path.join(workDir, 'fixtures')
+  dataDir = os.path.join(workDir, 'data')
+  tickers = [f"SYN{i:04d}" for i in range(opt.tickers)]
+  server = None
+  try:
+    if opt.fixtures is None:
+      with contextlib.redirect_stdout(io.StringIO()):
+        createFixtures(fixtureDir, tickers, opt.bars)
+    if opt.ibkr:
+      import config
+      import fakeTws
+      import hedgedProvider
+      server = fakeTws.FakeTwsServer(0, fixtureDir, latency=opt.latency).start()
+      config.port = server.port
+      # no actionSource: the actions are not looked up at Yahoo
+      loader.providerOverride = hedgedProvider.HedgedProvider([hedgedProvider.ProviderSlot('IBKR', loader.InteractiveBrokersProvider)])
+    else:
+      loader.providerOverride = loader.ReplayProvider(fixtureDir, opt.latency, opt.jitter, opt.rate_limit, opt.partial)
+    result = runLoadTest(tickers, opt.threads, opt.rounds, opt.ibkr, dataDir)
+  finally:
+    if loader.ib is not None:
+      loader.ib.close() # the ibapi reader thread would keep the process alive
+    if server is not None:
+      server.stop()
+    shutil.rmtree(workDir, ignore_errors=True)
+  provider, loader.providerOverride = loader.providerOverride, None
+  print(f"requests   {result['requests']}")
+  print(f"duration   {result['seconds']:.2f}s, {result['throughput']:.1f} req/s")
+  print(f"latency    p50 {result['p50']*1000:.0f}ms  p95 {result['p95']*1000:.0f}ms  p99 {result['p99']*1000:.0f}ms")
+  print(f"errors     {result['errors'] or 'none'}")
+  if isinstance(provider, loader.ReplayProvider):
+    print(f"provider   {provider.stats}")
+  elif provider is not None:
+    print(f"provider   {[slot.summary() for slot in provider.slots]}")
+  return 0
+#----------------------------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+  sys.exit(main())
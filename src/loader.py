@@ -3,7 +3,13 @@ import pandas as pd
 import datetime
 import requests
 import os
-from typing import List, Dict, Any, Optional, Tuple
+import json
+import random
+import threading
+import time
+import itertools
+import queue
+from typing import List, Dict, Any, Iterable, Optional, Tuple
 #--------------------------------------------------------------------------------------------------------------------------------
 # This is needed to prevent 'Too Many Requests. Rate limited. Try after a while.'
 # see https://github.com/ranaroussi/yfinance/issues/2422
@@ -12,11 +18,43 @@ global session
 session = None
 #------------------------------------------------------------------------------
 import globalsSa
-try:
-  import IbkrTws as ib
-  globalsSa.HAS_IBKR = True
-except:
-  globalsSa.HAS_IBKR = False
+# IbkrTws (and with it ibapi) is imported by InteractiveBrokersProvider when IBKR is used the first time
+ib = None
+# the watchlist file handling lives in the lightweight stockList module, kept here for existing callers
+from stockList import loadStockListFromFile, saveStockListToFile
+from intradayStore import IntradayStore, INTRADAY_INTERVALS
+import hotCache
+import corporateActions
+import atomicIo
+import tradingCalendar
+# if set, getProvider() returns this provider, e.g. a ReplayProvider for offline load tests
+providerOverride = None
+PREFETCH_WORKERS = 2
+PREFETCH_DAYS = 2 * 365 + 300 # what the app loads for the default of 2 years (display + indicator warmup)
+#--------------------------------------------------------------------------------------------------------------------------------
+class RateLimitError(globalsSa.CustomError):
+  pass
+#--------------------------------------------------------------------------------------------------------------------------------
+sessionLock = threading.Lock()
+#--------------------------------------------------------------------------------------------------------------------------------
+def getSession() -> requests.Session:
+  """The curl_cffi session of all Yahoo requests, with the response cache of httpCache if globalsSa.HTTP_CACHE is set."""
+  global session
+  with sessionLock:
+    if session is None:
+      if globalsSa.HTTP_CACHE:
+        try:
+          import httpCache
+          session = httpCache.CachedSession(impersonate="chrome")
+        except Exception as e: # e.g. the data directory is read only
+          print(f"HTTP response cache not available: {e}")
+      if session is None:
+        session = requests.Session(impersonate="chrome")
+    return session
+#--------------------------------------------------------------------------------------------------------------------------------
+def httpCacheStats() -> Dict[str, Any]:
+  """Hits, misses, stale responses and size of the response cache, empty without it."""
+  return session.metrics() if session is not None and hasattr(session, 'metrics') else {}
 #--------------------------------------------------------------------------------------------------------------------------------
 #--------------------------------------------------------------------------------------------------------------------------------
 class MarketDataProvider:
@@ -26,6 +64,10 @@ class MarketDataProvider:
   #--------------------------------------------------------------------------------------------------------------------------------
   def getCompanyInfo(self, tickerSymbol: str) -> Dict[str, Any]:
     raise NotImplementedError
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def getActions(self, tickerSymbol: str, startDate: datetime.date, endDate: datetime.date, interval: str ='1d') -> Optional[pd.DataFrame]:
+    """Splits and dividends in [startDate, endDate], only needed if getHistoricalData does not return the action columns."""
+    return None
 #--------------------------------------------------------------------------------------------------------------------------------
 #--------------------------------------------------------------------------------------------------------------------------------
 class YFinanceProvider(MarketDataProvider):
@@ -43,8 +85,8 @@ class YFinanceProvider(MarketDataProvider):
           'Volume': 'sum'
       }
   #--------------------------------------------------------------------------------------------------------------------------------
-  def isInvalid(self) -> bool:
-    return self.df.empty or pd.Timestamp.now(tz='UTC').weekday() >= 5
+  def isInvalid(self, tickerSymbol: str) -> bool:
+    return self.df.empty or not tradingCalendar.isSessionDay(tickerSymbol)
   #--------------------------------------------------------------------------------------------------------------------------------
   def getTimeDifference(self) -> int:
     currentTime = pd.Timestamp.now(tz='UTC')
@@ -59,27 +101,36 @@ class YFinanceProvider(MarketDataProvider):
     return self.getTimeDifference().days
   #--------------------------------------------------------------------------------------------------------------------------------
   def handleCurrentDay(self, ticker: yf.Ticker, interval: str) -> pd.DataFrame:
-    # if empty or current day is saturday or sunday, no need to update
-    if self.isInvalid():
+    # if empty, today is no trading day or the session has not started yet, no need to update
+    if self.isInvalid(ticker.ticker) or not tradingCalendar.sessionStarted(ticker.ticker):
       return
     if self.getTimeDifferenceInMinutes() > 1 and 'Close' in self.df.columns:
-      dfNew = ticker.history(period='1d', interval='1m', auto_adjust=True, prepost=False)      
+      dfNew = ticker.history(period='1d', interval='1m', auto_adjust=False, prepost=False)      
+      if not dfNew.empty:
+        getIntradayStore().append(ticker.ticker, dfNew) # keep the minute bars instead of throwing them away
       dfNewD = dfNew.resample('D').agg(YFinanceProvider.resampleMap()) # resample minute to daily
+      for col in corporateActions.ACTION_COLUMNS: # keep a split or dividend of today
+        if col in self.df.columns:
+          dfNewD[col] = self.df[col].reindex(dfNewD.index).fillna(0.0)
       self.df = pd.concat([self.df, dfNewD])
       self.df = self.df[~self.df.index.duplicated(keep='last')]
   #--------------------------------------------------------------------------------------------------------------------------------
   def handleCurrentWeek(self, ticker: yf.Ticker) -> pd.DataFrame:
-    if self.isInvalid():
+    if self.isInvalid(ticker.ticker):
       return
     # we have the days already in self.df, so just resample to weeks
-    self.df = self.df.resample('W').agg(YFinanceProvider.resampleMap()) # resample daily to weekly
+    rules = YFinanceProvider.resampleMap()
+    if 'Dividends' in self.df.columns:
+      rules['Dividends'] = 'sum'
+    if 'Stock Splits' in self.df.columns:
+      self.df['Stock Splits'] = self.df['Stock Splits'].replace(0.0, 1.0)
+      rules['Stock Splits'] = 'prod'
+    self.df = self.df.resample('W').agg(rules) # resample daily to weekly
   #--------------------------------------------------------------------------------------------------------------------------------
   def getHistoricalData(self, tickerSymbol: str, startDate: datetime.date, endDate: datetime.date, interval: str ='1d') -> pd.DataFrame:
-    global session
-    if session is None:
-      session = requests.Session(impersonate="chrome")
-    ticker = yf.Ticker(tickerSymbol, session=session)
-    self.df = ticker.history(start=startDate, end=endDate, interval=interval, auto_adjust=True, prepost=False)
+    ticker = yf.Ticker(tickerSymbol, session=getSession())
+    # split adjusted but not dividend adjusted, with the Dividends and Stock Splits columns for the actions cache
+    self.df = ticker.history(start=startDate, end=endDate, interval=interval, auto_adjust=False, prepost=False)
     if self.df.empty:
       return pd.DataFrame()
     if "d" in interval:
@@ -93,7 +144,7 @@ class YFinanceProvider(MarketDataProvider):
     return self.df
   #--------------------------------------------------------------------------------------------------------------------------------
   def getCompanyInfo(self, tickerSymbol: str) -> Dict[str, Any]:
-    ticker = yf.Ticker(tickerSymbol)
+    ticker = yf.Ticker(tickerSymbol, session=getSession())
     try:
       info = ticker.info
       if not info or (info.get('regularMarketPrice') is None and \
@@ -106,10 +157,31 @@ class YFinanceProvider(MarketDataProvider):
     except Exception as e:
       return {"error": f"Could not retrieve company info for {tickerSymbol}: {str(e)}"}
 #--------------------------------------------------------------------------------------------------------------------------------
+def fetchYahooActions(tickerSymbol: str, startDate: datetime.date, endDate: datetime.date) -> Optional[pd.DataFrame]:
+  """Splits and dividends in [startDate, endDate] from yahoo, for providers whose bars have no action columns."""
+  try:
+    # Ticker.actions is get_actions(period='max'), the smallest period covering startDate is enough
+    days = (datetime.date.today() - startDate).days
+    period = next((p for p, d in (('1y', 365), ('2y', 730), ('5y', 1826), ('10y', 3652)) if days < d), 'max')
+    actions = yf.Ticker(tickerSymbol, session=getSession()).get_actions(period=period)
+  except Exception as e:
+    print(f"Could not fetch corporate actions for {tickerSymbol}: {e}")
+    return None
+  if actions is None or actions.empty:
+    return corporateActions.emptyActions()
+  actions = actions.reindex(columns=corporateActions.ACTION_COLUMNS, fill_value=0.0)
+  if actions.index.tz is not None:
+    actions.index = actions.index.tz_convert(None)
+  actions = actions[(actions.index >= pd.Timestamp(startDate)) & (actions.index < pd.Timestamp(endDate) + pd.Timedelta(days=1))]
+  return corporateActions.extractActions(actions)
+#--------------------------------------------------------------------------------------------------------------------------------
 #--------------------------------------------------------------------------------------------------------------------------------
 class InteractiveBrokersProvider(MarketDataProvider):
   def __init__(self):
+    global ib
     try:
+      if ib is None:
+        import IbkrTws as ib
       if not ib.isOpen():
         ib.open()
     except Exception as e:
@@ -117,7 +189,7 @@ class InteractiveBrokersProvider(MarketDataProvider):
   #--------------------------------------------------------------------------------------------------------------------------------
   def getHistoricalData(self, tickerSymbol: str, startDate: datetime.date, endDate: datetime.date, interval: str ='1d') -> pd.DataFrame:
     if ib.isOpen():
-      ib.Interval.set(interval)
+      # interval and period go with the request, not through ib.Interval: a hedged request which lost still runs
       # calculate period
       period = endDate - startDate
       strPeriod = f""
@@ -130,11 +202,10 @@ class InteractiveBrokersProvider(MarketDataProvider):
         strPeriod = f"{(period.days+29) // 30} M" 
       else: # more than a year
         strPeriod = f"{(period.days+364) // 365} Y"
-      ib.Interval.setPeriod(strPeriod)  
       try:
-        df = ib.get(tickerSymbol)
-      except Exception:
-        raise Exception("No data returned from Interactive Brokers API.")
+        df = ib.get(tickerSymbol, interval, strPeriod)
+      except Exception as e:
+        raise Exception(f"No data returned from Interactive Brokers API: {e}")
     if df.empty:
       return pd.DataFrame()
     df.rename(columns={col: col.capitalize() for col in df.columns if col in ['open', 'high', 'low', 'close', 'volume']}, inplace=True)
@@ -144,9 +215,13 @@ class InteractiveBrokersProvider(MarketDataProvider):
         df.index = df.index.tz_convert(None)
     return df
   #--------------------------------------------------------------------------------------------------------------------------------
+  def getActions(self, tickerSymbol: str, startDate: datetime.date, endDate: datetime.date, interval: str ='1d') -> Optional[pd.DataFrame]:
+    # TWS historical data has no corporate actions, take them from yahoo
+    return fetchYahooActions(tickerSymbol, startDate, endDate)
+  #--------------------------------------------------------------------------------------------------------------------------------
   def getCompanyInfo(self, tickerSymbol: str) -> Dict[str, Any]:
     #return ib.getFundamentalData(tickerSymbol)
-    ticker = yf.Ticker(tickerSymbol)
+    ticker = yf.Ticker(tickerSymbol, session=getSession())
     try:
       info = ticker.info
       if not info or (info.get('regularMarketPrice') is None and \
@@ -159,27 +234,121 @@ class InteractiveBrokersProvider(MarketDataProvider):
     except Exception as e:
       return {"error": f"Could not retrieve company info for {tickerSymbol}: {str(e)}"}
 #--------------------------------------------------------------------------------------------------------------------------------
-def getProvider(useIbkr:bool = True) -> MarketDataProvider:
-  """Returns the market data provider based on the configuration."""
-  # Check if Interactive Brokers is available
-  if globalsSa.HAS_IBKR and useIbkr:
+#--------------------------------------------------------------------------------------------------------------------------------
+class ReplayProvider(MarketDataProvider):
+  """Serves recorded fixtures instead of a live service, for offline and load tests.
+  Fixtures are {ticker}_{interval}.parquet (same naming as the data cache, so a copy of data/ works) and {ticker}_info.json.
+  Latency, jitter, rate limit errors and partial (truncated) responses can be injected.
+  """
+  def __init__(self, fixtureDir: str = "fixtures", latency: float = 0.0, jitter: float = 0.0,
+               rateLimitProbability: float = 0.0, partialProbability: float = 0.0, seed: Optional[int] = None):
+    self.fixtureDir = fixtureDir
+    self.latency = latency
+    self.jitter = jitter
+    self.rateLimitProbability = rateLimitProbability
+    self.partialProbability = partialProbability
+    self.random = random.Random(seed)
+    self.lock = threading.Lock()
+    self.stats = {'requests': 0, 'rateLimited': 0, 'partial': 0, 'missing': 0}
+    self.fixtures: Dict[str, pd.DataFrame] = {}
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def count(self, key: str):
+    with self.lock:
+      self.stats[key] += 1
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def simulateService(self):
+    """Sleeps like a remote service would and raises the injected rate limit errors."""
+    self.count('requests')
+    with self.lock:
+      delay = self.latency + self.random.uniform(0, self.jitter)
+      rateLimited = self.random.random() < self.rateLimitProbability
+    if delay > 0:
+      time.sleep(delay)
+    if rateLimited:
+      self.count('rateLimited')
+      raise RateLimitError("Too Many Requests. Rate limited. Try after a while. (replay)")
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def loadFixture(self, tickerSymbol: str, interval: str) -> Optional[pd.DataFrame]:
+    key = f"{tickerSymbol}_{interval}"
+    with self.lock:
+      if key in self.fixtures:
+        return self.fixtures[key]
+    df = loadLocalData(constructParquetFilePath(tickerSymbol, interval, self.fixtureDir), tickerSymbol, interval)
+    with self.lock:
+      self.fixtures[key] = df
+    return df
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def getHistoricalData(self, tickerSymbol: str, startDate: datetime.date, endDate: datetime.date, interval: str ='1d') -> pd.DataFrame:
+    self.simulateService()
+    df = self.loadFixture(tickerSymbol, interval)
+    if df is None or df.empty:
+      self.count('missing')
+      return pd.DataFrame()
+    df = df[(df.index >= pd.Timestamp(startDate)) & (df.index < pd.Timestamp(endDate) + pd.Timedelta(days=1))]
+    with self.lock:
+      partial = len(df) > 1 and self.random.random() < self.partialProbability
+      cut = self.random.randint(1, len(df) - 1) if partial else len(df)
+    if partial:
+      self.count('partial')
+    return df.iloc[:cut].copy()
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def getCompanyInfo(self, tickerSymbol: str) -> Dict[str, Any]:
     try:
-      provider = InteractiveBrokersProvider()
-      print("### Using Ibkr as data provider ###")
-      return provider
-    except Exception as e:
-      globalsSa.HAS_IBKR = False
-      return YFinanceProvider()
-  else:
-    return YFinanceProvider()    
+      self.simulateService()
+    except RateLimitError as e:
+      return {"error": f"Could not retrieve company info for {tickerSymbol}: {str(e)}"}
+    infoPath = os.path.join(os.path.dirname(constructParquetFilePath(tickerSymbol, '1d', self.fixtureDir)), f"{tickerSymbol}_info.json")
+    try:
+      with open(infoPath) as f:
+        return json.load(f)
+    except FileNotFoundError:
+      self.count('missing')
+      return {"error": f"No substantial company information found for {tickerSymbol}."}
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class RecordingProvider(MarketDataProvider):
+  """Forwards to a live provider and stores every response as fixture for the ReplayProvider."""
+  def __init__(self, provider: MarketDataProvider, fixtureDir: str = "fixtures"):
+    self.provider = provider
+    self.fixtureDir = fixtureDir
+    self.lock = threading.Lock()
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def getHistoricalData(self, tickerSymbol: str, startDate: datetime.date, endDate: datetime.date, interval: str ='1d') -> pd.DataFrame:
+    df = self.provider.getHistoricalData(tickerSymbol, startDate, endDate, interval=interval)
+    if df is not None and not df.empty:
+      path = constructParquetFilePath(tickerSymbol, interval, self.fixtureDir)
+      with self.lock:
+        saveData(mergeData(loadLocalData(path, tickerSymbol, interval), df), path)
+    return df
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def getActions(self, tickerSymbol: str, startDate: datetime.date, endDate: datetime.date, interval: str ='1d') -> Optional[pd.DataFrame]:
+    return self.provider.getActions(tickerSymbol, startDate, endDate, interval)
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def getCompanyInfo(self, tickerSymbol: str) -> Dict[str, Any]:
+    info = self.provider.getCompanyInfo(tickerSymbol)
+    if info and not info.get("error"):
+      infoPath = os.path.join(os.path.dirname(constructParquetFilePath(tickerSymbol, '1d', self.fixtureDir)), f"{tickerSymbol}_info.json")
+      with self.lock:
+        atomicIo.writeText(infoPath, json.dumps(info, indent=1, default=str))
+    return info
+#--------------------------------------------------------------------------------------------------------------------------------
+def getProvider(useIbkr:bool = True) -> MarketDataProvider:
+  """Returns the market data provider based on the configuration.
+  With IBKR: IBKR hedged by Yahoo (hedgedProvider), a failing TWS is paused by its circuit breaker, not switched off.
+  """
+  if providerOverride is not None:
+    return providerOverride
+  import hedgedProvider # imports this module
+  return hedgedProvider.getComposite(globalsSa.HAS_IBKR and useIbkr)
 #--------------------------------------------------------------------------------------------------------------------------------
 #--------------------------------------------------------------------------------------------------------------------------------
 def determineFetchParameters(
     localData: Optional[pd.DataFrame],
     startDateParam: datetime.date, endDateParam: datetime.date, interval: str,
-    tickerSymbol: str
+    tickerSymbol: str, lastUpdate: Optional[float] = None
   ) -> Tuple[Optional[datetime.date], pd.DataFrame]:
-  """We either use the whole file or we load all data from the data provider"""
+  """We either use the whole file or we load all data from the data provider.
+  lastUpdate is the time the file was written (epoch seconds), without a trading session since then nothing is fetched."""
   if localData is None or localData.empty:
     print(f"No local data available for {tickerSymbol} ({interval}). Fetching from {startDateParam} to {endDateParam}.")
     return startDateParam, endDateParam
@@ -194,6 +363,9 @@ def determineFetchParameters(
     # use part from file
     if endDateParam < fileMaxDate:
       fetchStartDate, fetchEndDate =  None, None # this means all data from file
+    elif lastUpdate is not None and not tradingCalendar.hasSessionActivityBetween(tickerSymbol, lastUpdate):
+      print(f"No trading session for {tickerSymbol} since the last update.")
+      fetchStartDate, fetchEndDate =  None, None
     else:
       # now only load data from internet which is still missing
       fetchStartDate = fileMaxDate # for safety load the last day in case the data is not from day end
@@ -201,46 +373,174 @@ def determineFetchParameters(
 
   return fetchStartDate, fetchEndDate
 #------------------------------------------------------------------------------------------------------------------------------
-def fetchAndProcessIntervalData(ticker: str, startDt: datetime.date, endDt: datetime.date, interval: str, useIbkr:bool) -> Optional[pd.DataFrame]:
-  path = constructParquetFilePath(ticker, interval)
+intradayStores: Dict[str, IntradayStore] = {}
+intradayStoresLock = threading.Lock()
+#------------------------------------------------------------------------------------------------------------------------------
+def getIntradayStore(dataDirName: str = "data") -> IntradayStore:
+  with intradayStoresLock:
+    if dataDirName not in intradayStores:
+      intradayStores[dataDirName] = IntradayStore(dataDirName)
+    return intradayStores[dataDirName]
+#------------------------------------------------------------------------------------------------------------------------------
+def fetchIntradayData(ticker: str, interval: str, days: int, dataDirName: str = "data") -> Optional[pd.DataFrame]:
+  """Updates the minute bars of the intraday store and returns them aggregated to interval for the last days."""
+  store = getIntradayStore(dataDirName)
+  endDt = datetime.date.today()
+  startDt = endDt - datetime.timedelta(days=days)
+  # yahoo serves 1 minute bars only for the last 30 days and at most 8 days per request
+  fetchStart = max(startDt, endDt - datetime.timedelta(days=29))
+  storedDays = store.days(ticker)
+  if storedDays and storedDays[-1] >= fetchStart:
+    fetchStart = storedDays[-1] # the last stored day may be incomplete
+    lastUpdate = os.path.getmtime(store.partitionPath(ticker, storedDays[-1]))
+    if time.time() - lastUpdate < 60 or not tradingCalendar.hasSessionActivityBetween(ticker, lastUpdate):
+      fetchStart = None # updated less than a minute ago or no trading since then
+  if fetchStart is not None:
+    # minute bars always come from yahoo, the ibkr provider only handles daily and weekly bars
+    provider = providerOverride if providerOverride is not None else YFinanceProvider()
+    chunkStart = fetchStart
+    while chunkStart <= endDt:
+      chunkEnd = min(chunkStart + datetime.timedelta(days=7), endDt + datetime.timedelta(days=1))
+      try:
+        newData = provider.getHistoricalData(ticker, chunkStart, chunkEnd, interval='1m')
+      except Exception as e:
+        print(f"Error fetching minute bars for {ticker} [{chunkStart}, {chunkEnd}]: {e}")
+        break
+      print(f"Storing {store.append(ticker, newData)} new minute bars for {ticker} [{chunkStart}, {chunkEnd}[.")
+      chunkStart = chunkEnd
+  return store.aggregate(ticker, interval, startDt, endDt)
+#------------------------------------------------------------------------------------------------------------------------------
+def fetchAndProcessIntervalData(ticker: str, startDt: datetime.date, endDt: datetime.date, interval: str, useIbkr:bool, dataDirName: str = "data") -> Optional[pd.DataFrame]:
+  """Adjusted bars of the local file, updated to cover [startDt, endDt]. The file keeps the raw bars and the actions are applied when reading.
+  The frame starts with the first stored bar, so the indicators (and indicatorCache) see the same history on every call.
+  """
+  path = constructParquetFilePath(ticker, interval, dataDirName)
   dfFromFile = loadLocalData(path, ticker, interval)
+  actions = corporateActions.loadActions(path)
+  if dfFromFile is not None and actions is None:
+    print(f"Local data for {ticker} ({interval}) has adjusted prices from an older version. Fetching all again.")
+    dfFromFile = None
 
-  fetchStartDate, fetchEndDate = determineFetchParameters(dfFromFile, startDt, endDt, interval, ticker)
+  lastUpdate = os.path.getmtime(path) if dfFromFile is not None else None
+  fetchStartDate, fetchEndDate = determineFetchParameters(dfFromFile, startDt, endDt, interval, ticker, lastUpdate)
   if fetchStartDate is None:
     print(f"No fetch needed for {ticker} ({interval}). Using existing local data.")
-    # filter data from file for startDt and endDt
-    finalDf = dfFromFile.copy()
-    finalDf = finalDf[finalDf.index.date >= startDt]
-    finalDf = finalDf[finalDf.index.date <= endDt]  
+    finalDf = dfFromFile
   else:
     print(f"Fetch needed for {ticker} ({interval}). Using file from [{startDt}, {fetchStartDate}[. Fetching [{fetchStartDate}, {endDt}].")
-    newData = getProvider(useIbkr).getHistoricalData(ticker, fetchStartDate, fetchEndDate, interval=interval)
-    # now merge the data
-    finalDf = pd.concat([dfFromFile, newData])
-    finalDf = finalDf[~finalDf.index.duplicated(keep='last')]
-    finalDf = finalDf.sort_index()      
-    saveData(finalDf, path)
+    provider = getProvider(useIbkr)
+    newData = provider.getHistoricalData(ticker, fetchStartDate, fetchEndDate, interval=interval)
+    newActions = corporateActions.extractActions(newData)
+    if newActions is None:
+      newActions = provider.getActions(ticker, fetchStartDate, fetchEndDate, interval)
+    if newActions is not None and not newActions.empty:
+      print(f"Corporate actions for {ticker} ({interval}): {newActions.to_dict('index')}")
+      newActions = corporateActions.unadjustDividends(newActions, corporateActions.mergeActions(actions, newActions))
+    actions = corporateActions.mergeActions(actions, newActions)
+    # the bars before a split stay as they are in the file, only the new bars are converted back to raw prices
+    newData = corporateActions.unadjust(newData, actions)
+    with atomicIo.fileLock(path): # other processes (prefetcher, export) may have written the file since it was read
+      if dfFromFile is not None and os.path.exists(path) and os.path.getmtime(path) != lastUpdate:
+        currentDf = loadLocalData(path, ticker, interval)
+        dfFromFile = currentDf if currentDf is not None else dfFromFile
+        actions = corporateActions.mergeActions(corporateActions.loadActions(path), actions)
+      finalDf = mergeData(dfFromFile, newData)
+      # actions first: a reader between the two renames adjusts the old bars by a new split, which is right
+      corporateActions.saveActions(actions, path)
+      saveData(finalDf, path)
+  return corporateActions.adjust(finalDf, actions)
+#--------------------------------------------------------------------------------------------------------------------------------
+def mergeData(dfFromFile: Optional[pd.DataFrame], newData: pd.DataFrame) -> pd.DataFrame:
+  """Merges freshly fetched bars into the local data, newer bars win."""
+  finalDf = pd.concat([dfFromFile, newData])
+  finalDf = finalDf[~finalDf.index.duplicated(keep='last')]
+  finalDf = finalDf.sort_index()      
   return finalDf
 #--------------------------------------------------------------------------------------------------------------------------------
-def loadStockListFromFile(filename: str = "listStocks") -> List[str]:
-  defaultStocks = ['AAPL', 'MSFT', 'GOOGL', 'AMZN', 'TSLA', 'NVDA', 'VOW.DE', 'META', 'JPM', 'BTC-USD', 'ETH-USD']
-  scriptDir = os.path.dirname(os.path.abspath(__file__))
-  filePath = os.path.join(scriptDir, filename)
-  stocks = None
-  try:
-    with open(filePath, 'r') as f:
-      stocks = [line.strip() for line in f if line.strip()]
-    if not stocks:
-      print(f"Warning: Stock file '{filePath}' is empty. Using default stocks.")
-  except FileNotFoundError:
-    print(f"Warning: Stock file '{filePath}' not found. Using default stocks and creating file.")
-  except Exception as e:
-    print(f"Error reading stock file '{filePath}': {e}. Using default stocks.")
-    stocks = defaultStocks
-  finally:
-    if not stocks:
-      saveStockListToFile(defaultStocks, filename)
-    return stocks if stocks else defaultStocks
+#--------------------------------------------------------------------------------------------------------------------------------
+class Prefetcher:
+  """Fetches the daily and weekly bars of tickers in background threads, so opening them later only reads the local files.
+  Lower priority values come first (e.g. the scanner rank). A ticker which is queued or being fetched is not queued again.
+  """
+  def __init__(self, workers: int = PREFETCH_WORKERS, days: int = PREFETCH_DAYS, intervals: Tuple[str, ...] = ('1d', '1wk'),
+               useIbkr: bool = False, dataDirName: str = "data"):
+    self.workers = workers
+    self.days = days
+    self.intervals = intervals
+    self.useIbkr = useIbkr
+    self.dataDirName = dataDirName
+    self.queue: queue.PriorityQueue = queue.PriorityQueue()
+    self.order = itertools.count() # equal priorities in the order they were added
+    self.pending: set = set()
+    self.lock = threading.Lock()
+    self.threads: List[threading.Thread] = []
+    self.stats = {'queued': 0, 'fetched': 0, 'failed': 0}
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def add(self, tickers: Iterable[str], priority: float = 0.0) -> int:
+    """Queues the tickers, returns how many were new. The worker threads are started on first use."""
+    added = 0
+    with self.lock:
+      for ticker in tickers:
+        if ticker in self.pending:
+          continue
+        self.pending.add(ticker)
+        self.queue.put((priority, next(self.order), ticker))
+        added += 1
+      self.stats['queued'] += added
+      while len(self.threads) < min(self.workers, len(self.pending)):
+        thread = threading.Thread(target=self.work, name=f"prefetch{len(self.threads)}", daemon=True)
+        self.threads.append(thread)
+        thread.start()
+    return added
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def work(self):
+    while True:
+      _, _, ticker = self.queue.get()
+      endDt = datetime.date.today()
+      startDt = endDt - datetime.timedelta(days=self.days)
+      result = 'fetched'
+      try:
+        for interval in self.intervals:
+          fetchAndProcessIntervalData(ticker, startDt, endDt, interval, self.useIbkr, self.dataDirName)
+      except Exception as e:
+        print(f"Prefetch of {ticker} failed: {e}")
+        result = 'failed'
+      with self.lock:
+        self.pending.discard(ticker)
+        self.stats[result] += 1
+      self.queue.task_done()
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def join(self):
+    """Waits until the queue is empty, for scripts and tests."""
+    self.queue.join()
+#--------------------------------------------------------------------------------------------------------------------------------
+prefetcher: Optional[Prefetcher] = None
+prefetcherLock = threading.Lock()
+#--------------------------------------------------------------------------------------------------------------------------------
+def getPrefetcher() -> Prefetcher:
+  global prefetcher
+  with prefetcherLock:
+    if prefetcher is None:
+      prefetcher = Prefetcher()
+    return prefetcher
+#--------------------------------------------------------------------------------------------------------------------------------
+def loadRecentBars(tickers: List[str], interval: str = '1d', nBars: int = 100, dataDirName: str = "data") -> Dict[str, pd.DataFrame]:
+  """The last nBars (adjusted) of many tickers from the local files only, tickers without a file are left out."""
+  result = {}
+  for ticker in tickers:
+    path = constructParquetFilePath(ticker, interval, dataDirName)
+    if not os.path.exists(path):
+      continue
+    df = hotCache.load(path)
+    if df is None:
+      try:
+        df = pd.read_parquet(path)
+      except Exception as e:
+        print(f"Error reading parquet file {path}: {e}.")
+        continue
+    if not df.empty:
+      result[ticker] = corporateActions.adjust(df.iloc[-nBars:], corporateActions.loadActions(path))
+  return result
 #--------------------------------------------------------------------------------------------------------------------------------
 # file handling
 #--------------------------------------------------------------------------------------------------------------------------------
@@ -251,20 +551,14 @@ def constructParquetFilePath(tickerSymbol: str, interval: str, dataDirName: str
   os.makedirs(dataDirPath, exist_ok=True)
   return os.path.join(dataDirPath, f"{tickerSymbol}_{intervalSuffix}.parquet")
 #--------------------------------------------------------------------------------------------------------------------------------
-def saveStockListToFile(tickers, filename: str = "listStocks"):
-  scriptDir = os.path.dirname(os.path.abspath(__file__))
-  filePath = os.path.join(scriptDir, filename)
-  try:
-    with open(filePath, 'w') as f:
-      for ticker in tickers:
-        f.write(f"{ticker}\n")
-    print(f"Stocklist saved to '{filePath}'.")
-  except Exception as e:
-    print(f"Error saving stocklist to '{filePath}': {e}")
-#--------------------------------------------------------------------------------------------------------------------------------
 def loadLocalData(parquetFilePath: str, tickerSymbol: str, interval: str) -> Optional[pd.DataFrame]:
   if os.path.exists(parquetFilePath):
     try:
+      localDfCandidate = hotCache.load(parquetFilePath)
+      if localDfCandidate is not None:
+        hotCache.touch(parquetFilePath)
+        print(f"Loaded {interval} data for {tickerSymbol} from the hot cache.")
+        return localDfCandidate
       print(f"Attempting to load {interval} data for {tickerSymbol} from {parquetFilePath}")
       localDfCandidate = pd.read_parquet(parquetFilePath)
       if not localDfCandidate.empty and isinstance(localDfCandidate.index, pd.DatetimeIndex):
@@ -273,6 +567,7 @@ def loadLocalData(parquetFilePath: str, tickerSymbol: str, interval: str) -> Opt
         if localDfCandidate.index.tz is not None:
           localDfCandidate.index = localDfCandidate.index.tz_convert(None)
         print(f"Successfully loaded from {minDate} to {maxDate} for {tickerSymbol} from local parquet.")
+        hotCache.store(parquetFilePath, localDfCandidate)
         return localDfCandidate
       else:
         print(f"Local parquet file for {tickerSymbol} ({interval}) was empty or had invalid index.")
@@ -286,6 +581,8 @@ def saveData(dataToSave: pd.DataFrame, parquetFile: str) -> None:
     return
   print(f"Saving data for {parquetFile}.")
   try:
-    dataToSave.to_parquet(parquetFile, engine='pyarrow', index=True)
+    with atomicIo.fileLock(parquetFile): # readers see the old or the new file, never a partly written one
+      atomicIo.writeParquet(dataToSave, parquetFile)
+      hotCache.store(parquetFile, dataToSave)
   except Exception as e:
     print(f"Error saving data to parquet {parquetFile}: {e}")
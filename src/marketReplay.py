@@ -0,0 +1,243 @@
+"""Accelerated market replay: cached bars played as a live feed into liveFeed.LiveUpdatePump, to stress-test the live update path.
+
+The last --bars bars of every ticker are replayed, the bars before them warm up the indicator state. All tickers move
+together bar by bar (distinct timestamps, gaps such as nights and weekends take no time). At speed 1 a bar takes as long
+as in the market (1m: 60 s, 1h: 3600 s, 1d: a session of 6.5 h), at speed 1000 a thousand times less, speed 0 replays
+as fast as the feed thread can push. Each bar is sent as --ticks updates: the forming bar walks from the open over the
+low and the high (or the high and the low for a falling bar) to the close, the last update is the final bar.
+
+  python marketReplay.py --watchlist --interval 1d --speed 1000 --seconds 30   # daily bars of data/, GUI-less consumer
+  python marketReplay.py AAPL MSFT --interval 1m --speed 100                   # minute bars of data/intraday
+  python marketReplay.py --synthetic 500 --interval 1m --speed 1000 --alerts   # synthetic tickers, no cache needed
+  python stockAnalyzer.py --replay 100 --replay-interval 1m                    # the same feed into the GUI
+
+Without the GUI the consumer takes the changes once per frame as the GUI would and computes the chart of the first
+ticker (indicatorCache) on an Agg figure. The report (liveFeed.LiveMetrics) gives the bars per second, the latency
+from the push of a bar to its row and to the chart, dropped frames and the queue depths.
+"""
+import argparse
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import globalsSa
+import liveFeed
+#--------------------------------------------------------------------------------------------------------------------------------
+TICKS_PER_BAR = 4       # updates per bar, the last one is the final bar
+REPLAY_BARS = 390       # bars replayed per ticker
+HISTORY_BARS = 1000     # bars before the replay, warmup of the indicator state and of the chart
+SESSION_SECONDS = 23400 # 9:30 - 16:00, duration of a daily bar at speed 1
+MAX_SPEED = 1000.0
+#--------------------------------------------------------------------------------------------------------------------------------
+def intervalSeconds(interval: str) -> int:
+  if interval == '1d':
+    return SESSION_SECONDS
+  if interval == '1wk':
+    return 5 * SESSION_SECONDS
+  units = {'m': 60, 'h': 3600}
+  if interval[-1] in units and interval[:-1].isdigit():
+    return int(interval[:-1]) * units[interval[-1]]
+  raise globalsSa.CustomError(f"Unknown interval {interval}.")
+#--------------------------------------------------------------------------------------------------------------------------------
+def cacheInterval(interval: str) -> str:
+  """Interval name of the indicator cache of replayed charts, the cache files of the real data stay untouched."""
+  return f"{interval}.replay"
+#--------------------------------------------------------------------------------------------------------------------------------
+def loadFrames(tickers: List[str], interval: str, nBars: int, dataDirName: str = "data") -> Dict[str, pd.DataFrame]:
+  """The last nBars of the tickers from the local cache: data/*.parquet for 1d and 1wk, the intraday store below."""
+  import loader
+  if interval in ('1d', '1wk'):
+    return loader.loadRecentBars(tickers, interval, nBars, dataDirName)
+  store = loader.getIntradayStore(dataDirName)
+  frames = {}
+  for ticker in tickers:
+    minuteBars = store.load(ticker)
+    if not minuteBars.empty:
+      frames[ticker] = store.aggregateDay(minuteBars, interval, ticker).iloc[-nBars:]
+  return frames
+#--------------------------------------------------------------------------------------------------------------------------------
+def syntheticFrames(count: int, interval: str, nBars: int) -> Dict[str, pd.DataFrame]:
+  """Random walks SYN0, SYN1, ..., intraday bars are the daily walk scaled down and laid on the sessions of the last days."""
+  from syntheticData import generateOhlcv
+  step = intervalSeconds(interval)
+  intraday = step < SESSION_SECONDS
+  perDay = max(1, SESSION_SECONDS // step)
+  frames = {}
+  if intraday:
+    days = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=nBars // perDay + 1)
+    offsets = pd.to_timedelta(np.arange(perDay) * step + 34200, unit='s') # from 9:30
+    times = pd.DatetimeIndex((days.values[:, None] + offsets.values[None, :]).ravel()[-nBars:])
+  for k in range(count):
+    df = generateOhlcv(nBars, seed=k, startPrice=20.0 + k % 200, splitProbability=0.0,
+                       annualVola=0.3 / np.sqrt(perDay) if intraday else 0.3)
+    if intraday:
+      df.index = times[-len(df):]
+    frames[f"SYN{k}"] = df
+  return frames
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class MarketReplay:
+  """Pushes the last replayBars bars of the frames into the pump at speed times real time, from a thread of its own."""
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, frames: Dict[str, pd.DataFrame], pump: liveFeed.LiveUpdatePump, speed: float = 1.0,
+               replayBars: int = REPLAY_BARS, ticksPerBar: int = TICKS_PER_BAR, interval: str = '1d'):
+    if not (speed == 0 or 1 <= speed <= MAX_SPEED):
+      raise globalsSa.CustomError(f"Replay speed {speed} not 0 or between 1 and {MAX_SPEED:.0f}.")
+    self.pump = pump
+    self.speed = speed
+    self.ticksPerBar = max(1, ticksPerBar)
+    self.stepSeconds = intervalSeconds(interval) / speed if speed else 0.0
+    self.stopped = threading.Event()
+    self.finished = threading.Event()
+    self.thread: Optional[threading.Thread] = None
+    self.barsSent = 0
+    columns = ['Open', 'High', 'Low', 'Close', 'Volume']
+    times, tickers, values = [], [], []
+    for ticker, df in frames.items():
+      df = df[~df.index.duplicated(keep='last')].sort_index()
+      df = df.assign(**{c: 0.0 for c in columns if c not in df.columns})
+      live = df.iloc[-replayBars:]
+      if len(df) > len(live):
+        pump.addTicker(ticker, df.iloc[:-len(live)])
+      times.append(live.index.asi8)
+      tickers.append(np.full(len(live), ticker, dtype=object))
+      values.append(live[columns].to_numpy(dtype='float64'))
+    self.tickers = list(frames)
+    if not times:
+      self.steps: List[Tuple[pd.Timestamp, np.ndarray, np.ndarray]] = []
+      return
+    allTimes, allTickers, allValues = np.concatenate(times), np.concatenate(tickers), np.concatenate(values)
+    order = np.argsort(allTimes, kind='stable')
+    allTimes, allTickers, allValues = allTimes[order], allTickers[order], allValues[order]
+    bounds = np.flatnonzero(np.diff(allTimes)) + 1
+    self.steps = [(pd.Timestamp(t[0]), k, v) for t, k, v in
+                  zip(np.split(allTimes, bounds), np.split(allTickers, bounds), np.split(allValues, bounds))]
+  #------------------------------------------------------------------------------------------------------------------------------
+  def start(self) -> 'MarketReplay':
+    self.thread = threading.Thread(target=self.run, name='marketReplay', daemon=True)
+    self.thread.start()
+    return self
+  #------------------------------------------------------------------------------------------------------------------------------
+  def stop(self):
+    self.stopped.set()
+    if self.thread is not None:
+      self.thread.join(timeout=2.0)
+  #------------------------------------------------------------------------------------------------------------------------------
+  @staticmethod
+  def formingBars(values: np.ndarray, fraction: float) -> np.ndarray:
+    """OHLCV of the forming bars after fraction of the bar: open -> low -> high -> close (rising bar) or open -> high -> low -> close."""
+    o, h, l, c, v = values.T
+    rising = c >= o
+    path = np.stack([o, np.where(rising, l, h), np.where(rising, h, l), c])
+    position = fraction * 3
+    segment = min(int(position), 2)
+    price = path[segment] + (position - segment) * (path[segment + 1] - path[segment])
+    visited = path[:segment + 1]
+    return np.column_stack([o, np.maximum(visited.max(axis=0), price), np.minimum(visited.min(axis=0), price), price, v * fraction])
+  #------------------------------------------------------------------------------------------------------------------------------
+  def run(self):
+    metrics = self.pump.metrics
+    tickSeconds = self.stepSeconds / self.ticksPerBar
+    begin = time.perf_counter()
+    tick = 0
+    for barTime, tickers, values in self.steps:
+      for k in range(1, self.ticksPerBar + 1):
+        if self.stopped.is_set():
+          return
+        tick += 1
+        due = begin + tick * tickSeconds
+        now = time.perf_counter()
+        if due > now:
+          time.sleep(due - now)
+        elif tickSeconds:
+          metrics.lag(now - due)
+        final = k == self.ticksPerBar
+        bars = values if final else self.formingBars(values, k / self.ticksPerBar)
+        sentAt = time.perf_counter()
+        for ticker, (o, h, l, c, v) in zip(tickers, bars.tolist()):
+          self.pump.push(liveFeed.LiveBar(ticker, barTime, o, h, l, c, v, final, sentAt))
+      self.barsSent += len(tickers)
+    self.finished.set()
+#--------------------------------------------------------------------------------------------------------------------------------
+def aggChartDrawer(interval: str):
+  """drawChart for liveFeed.runHeadless: indicators of the frame (indicatorCache) and a chart drawn on an Agg figure."""
+  import matplotlib
+  matplotlib.use('Agg')
+  import stockAnalyzer
+  stockAnalyzer.importHeavyModules()
+  chartUtils = stockAnalyzer.ChartingUtils()
+  def draw(ticker: str, frame: pd.DataFrame):
+    df = stockAnalyzer.calculateIndicators(frame, frame.index[-min(len(frame), liveFeed.LIVE_CHART_BARS)], ticker, interval)
+    fig = chartUtils.createStockChartFigure(df, ticker, 'Replay')
+    try:
+      fig.canvas.draw()
+    finally:
+      stockAnalyzer.plt.close(fig)
+  return draw
+#--------------------------------------------------------------------------------------------------------------------------------
+def main(argv: Optional[List[str]] = None) -> int:
+  parser = argparse.ArgumentParser(description="Replay cached bars as a live feed and measure the live update path.")
+  parser.add_argument("tickers", nargs='*')
+  parser.add_argument("--watchlist", action='store_true', help="All tickers of the watchlist (listStocks).")
+  parser.add_argument("--interval", default='1d', help="1d, 1wk (data/*.parquet) or 1m, 5m, 15m, 30m, 1h (data/intraday).")
+  parser.add_argument("--speed", type=float, default=100.0, help=f"Times real time, 1 to {MAX_SPEED:.0f}, 0: as fast as possible.")
+  parser.add_argument("--bars", type=int, default=REPLAY_BARS, help="Bars replayed per ticker.")
+  parser.add_argument("--history", type=int, default=HISTORY_BARS, help="Bars before the replay, for the warmup.")
+  parser.add_argument("--ticks", type=int, default=TICKS_PER_BAR, help="Updates per bar.")
+  parser.add_argument("--seconds", type=float, default=30.0, help="Stop after this many seconds, the replay may end earlier.")
+  parser.add_argument("--synthetic", type=int, default=0, metavar='N', help="N synthetic tickers instead of the cache.")
+  parser.add_argument("--alerts", action='store_true', help="Evaluate the rules of alertRules on every update.")
+  parser.add_argument("--no-chart", action='store_true', help="No chart of the first ticker.")
+  parser.add_argument("--data", default="data")
+  args = parser.parse_args(argv)
+  if not (args.speed == 0 or 1 <= args.speed <= MAX_SPEED):
+    parser.error(f"--speed must be 0 or between 1 and {MAX_SPEED:.0f}")
+  try:
+    intervalSeconds(args.interval)
+  except globalsSa.CustomError as e:
+    parser.error(str(e))
+  if args.synthetic:
+    frames = syntheticFrames(args.synthetic, args.interval, args.history + args.bars)
+  else:
+    tickers = list(args.tickers)
+    if args.watchlist:
+      import stockList
+      tickers += stockList.loadStockListFromFile()
+    if not tickers:
+      parser.error("no tickers, give some, --watchlist or --synthetic N")
+    frames = loadFrames(list(dict.fromkeys(tickers)), args.interval, args.history + args.bars, args.data)
+  if not frames:
+    print(f"No cached {args.interval} bars of these tickers in {args.data}.")
+    return 1
+  alertEngine = None
+  if args.alerts:
+    import alerts
+    alertEngine = alerts.AlertEngine(alerts.loadRules(), args.interval, args.data)
+  pump = liveFeed.LiveUpdatePump(args.interval, alertEngine, cacheInterval=cacheInterval(args.interval))
+  replay = MarketReplay(frames, pump, args.speed, args.bars, args.ticks, args.interval)
+  drawChart = None
+  if not args.no_chart:
+    drawChart = aggChartDrawer(pump.cacheInterval)
+    pump.setChartTicker(replay.tickers[0])
+  print(f"Replaying {len(replay.steps)} {args.interval} bars of {len(frames)} tickers at {args.speed:g}x"
+        f" ({replay.stepSeconds:.3f} s per bar, {args.ticks} updates each).")
+  pump.metrics = liveFeed.LiveMetrics() # the warmup is not measured
+  pump.start()
+  replay.start()
+  try:
+    liveFeed.runHeadless(pump, args.seconds, drawChart, until=replay.finished.is_set)
+  except KeyboardInterrupt:
+    pass
+  finally:
+    replay.stop()
+    pump.stop()
+  print(f"{replay.barsSent} bars replayed{' (complete)' if replay.finished.is_set() else ''}.")
+  print(pump.metrics.format())
+  return 0
+#----------------------------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,290 @@
+"""News headlines of IBKR in a bounded store with per ticker and time indexes, fed by long lived news subscriptions.
+
+  data/news/headlines.parquet   the headlines of the store when the app closed, loaded again on the next start
+
+NewsStore is a ring buffer of the last `capacity` headlines: headline number seq is in slot seq % capacity and the oldest
+one is evicted when a new one needs its slot. Every ticker has a list of (time, seq) sorted by time and so has the whole
+store, so the last n headlines of a ticker or those of a time range are found with bisect, O(log n + k), instead of
+scanning all of them. Headlines are deduplicated by article id: the TWS sends the latest headlines again on every
+subscription and the same article may come for several tickers (it is then indexed for each of them).
+
+NewsFeed keeps a news subscription (reqMktData, generic tick 292) for the last NEWS_MAX_TICKERS shown tickers, a market
+data line each, and optionally the broad tape. The headlines go straight into the store from the IBKR thread.
+
+  python newsStore.py NVDA AAPL --seconds 30 --last 20   # subscribes and prints the newest headlines per ticker
+  python newsStore.py NVDA --fake --seconds 5            # against fakeTws
+  python newsStore.py --benchmark 200000                 # indexed queries vs. a scan of all headlines
+"""
+import argparse
+import bisect
+import collections
+import datetime
+import os
+import random
+import re
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+
+import atomicIo
+#--------------------------------------------------------------------------------------------------------------------------------
+NEWS_CAPACITY = 20000     # headlines kept, the oldest are evicted
+NEWS_MAX_TICKERS = 10     # news subscriptions of single tickers, each needs a market data line
+NEWS_HEADLINES = 30       # shown in the info panel
+COLUMNS = ['time', 'tickers', 'provider', 'articleId', 'text', 'extra']
+HEADLINE_META = re.compile(r"^\{[^}]*\}") # e.g. {A:800015:L:en:K:0.97:C:0.97}, language and sentiment of the article
+#--------------------------------------------------------------------------------------------------------------------------------
+class Headline(NamedTuple):
+  time: float                # seconds since the epoch
+  tickers: Tuple[str, ...]   # empty for headlines of the broad tape
+  provider: str
+  articleId: str
+  text: str
+  extra: str
+#--------------------------------------------------------------------------------------------------------------------------------
+def newsPath(dataDirName: str = "data") -> str:
+  return os.path.join(os.path.dirname(os.path.abspath(__file__)), dataDirName, "news", "headlines.parquet")
+#--------------------------------------------------------------------------------------------------------------------------------
+def formatHeadline(headline: Headline) -> str:
+  return f"{datetime.datetime.fromtimestamp(headline.time):%Y-%m-%d %H:%M}  {headline.provider}  {headline.text}"
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class NewsStore:
+  """Thread safe, written by the IBKR thread and read by the UI. onHeadline(headline) is called for every new headline."""
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, capacity: int = NEWS_CAPACITY, onHeadline: Optional[Callable[[Headline], None]] = None):
+    self.capacity = capacity
+    self.onHeadline = onHeadline
+    self.slots: List[Optional[Headline]] = [None] * capacity
+    self.next = 0                                     # seq of the next headline
+    self.byId: Dict[str, int] = {}                    # articleId -> seq
+    self.byTicker: Dict[str, List[Tuple[float, int]]] = {}
+    self.byTime: List[Tuple[float, int]] = []
+    self.lock = threading.Lock()
+    self.stats = {'added': 0, 'duplicates': 0, 'evicted': 0}
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __len__(self) -> int:
+    return len(self.byTime)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __contains__(self, articleId: str) -> bool:
+    return articleId in self.byId
+  #------------------------------------------------------------------------------------------------------------------------------
+  def add(self, timestamp: float, ticker: str, provider: str, articleId: str, text: str, extra: str = "") -> bool:
+    """False for an article which is already stored, it is only indexed for ticker too."""
+    articleId = articleId or f"{provider}:{timestamp}:{text}"
+    text = HEADLINE_META.sub("", text).strip()
+    with self.lock:
+      seq = self.byId.get(articleId)
+      isNew = seq is None
+      if not isNew:
+        self.stats['duplicates'] += 1
+        old = self.slots[seq % self.capacity]
+        if not ticker or ticker in old.tickers:
+          return False
+        headline = self.slots[seq % self.capacity] = old._replace(tickers=old.tickers + (ticker,))
+        bisect.insort(self.byTicker.setdefault(ticker, []), (old.time, seq))
+      else:
+        if self.next >= self.capacity:
+          self.evict(self.next - self.capacity)
+        seq = self.next
+        self.next += 1
+        headline = Headline(timestamp, (ticker,) if ticker else (), provider, articleId, text, extra)
+        self.slots[seq % self.capacity] = headline
+        self.byId[articleId] = seq
+        key = (timestamp, seq)
+        bisect.insort(self.byTime, key) # appends in the usual case of a headline newer than all others
+        if ticker:
+          bisect.insort(self.byTicker.setdefault(ticker, []), key)
+        self.stats['added'] += 1
+    if self.onHeadline is not None:
+      self.onHeadline(headline)
+    return isNew
+  #------------------------------------------------------------------------------------------------------------------------------
+  def evict(self, seq: int):
+    headline = self.slots[seq % self.capacity]
+    self.slots[seq % self.capacity] = None
+    if headline is None:
+      return
+    del self.byId[headline.articleId]
+    key = (headline.time, seq)
+    del self.byTime[bisect.bisect_left(self.byTime, key)]
+    for ticker in headline.tickers:
+      index = self.byTicker[ticker]
+      del index[bisect.bisect_left(index, key)]
+      if not index:
+        del self.byTicker[ticker]
+    self.stats['evicted'] += 1
+  #------------------------------------------------------------------------------------------------------------------------------
+  def tickNews(self, ticker: str, timeStamp: int, providerCode: str, articleId: str, headline: str, extraData: str):
+    """Listener of IbkrTws.subscribeNews, timeStamp in milliseconds."""
+    self.add(timeStamp / 1000, ticker, providerCode, articleId, headline, extraData)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def latest(self, ticker: Optional[str] = None, n: int = NEWS_HEADLINES, before: Optional[float] = None) -> List[Headline]:
+    """The n newest headlines (of ticker, of all tickers if None) before the time before, newest first."""
+    with self.lock:
+      index = self.byTime if ticker is None else self.byTicker.get(ticker, [])
+      end = len(index) if before is None else bisect.bisect_left(index, (before, -1))
+      return [self.slots[seq % self.capacity] for _, seq in reversed(index[max(0, end - n):end])]
+  #------------------------------------------------------------------------------------------------------------------------------
+  def between(self, start: float, end: float, ticker: Optional[str] = None) -> List[Headline]:
+    """Headlines with start <= time < end, oldest first."""
+    with self.lock:
+      index = self.byTime if ticker is None else self.byTicker.get(ticker, [])
+      first, last = bisect.bisect_left(index, (start, -1)), bisect.bisect_left(index, (end, -1))
+      return [self.slots[seq % self.capacity] for _, seq in index[first:last]]
+  #------------------------------------------------------------------------------------------------------------------------------
+  def tickers(self) -> List[str]:
+    with self.lock:
+      return sorted(self.byTicker)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def toFrame(self) -> pd.DataFrame:
+    with self.lock:
+      rows = [self.slots[seq % self.capacity] for _, seq in self.byTime]
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    df['time'] = pd.to_datetime(df['time'], unit='s')
+    df['tickers'] = df['tickers'].map(",".join)
+    return df
+  #------------------------------------------------------------------------------------------------------------------------------
+  def addFrame(self, df: pd.DataFrame):
+    times = df['time'].astype('int64') / 1e9
+    for timestamp, tickers, provider, articleId, text, extra in zip(times, df['tickers'], df['provider'], df['articleId'], df['text'], df['extra']):
+      for ticker in (tickers.split(",") if tickers else [""]):
+        self.add(timestamp, ticker, provider, articleId, text, extra)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def save(self, dataDirName: str = "data"):
+    """Merged with the file, another process may have saved headlines meanwhile."""
+    path = newsPath(dataDirName)
+    with atomicIo.fileLock(path):
+      df = self.toFrame()
+      old = readHeadlines(path)
+      if not old.empty:
+        df = pd.concat([old, df], ignore_index=True).drop_duplicates('articleId', keep='last')
+      atomicIo.writeParquet(df.sort_values('time', kind='stable', ignore_index=True).tail(self.capacity), path)
+  #------------------------------------------------------------------------------------------------------------------------------
+  @classmethod
+  def load(cls, dataDirName: str = "data", capacity: int = NEWS_CAPACITY) -> 'NewsStore':
+    store = cls(capacity)
+    store.addFrame(readHeadlines(newsPath(dataDirName)).tail(capacity))
+    return store
+#--------------------------------------------------------------------------------------------------------------------------------
+def readHeadlines(path: str) -> pd.DataFrame:
+  if not os.path.exists(path):
+    return pd.DataFrame(columns=COLUMNS)
+  try:
+    return pd.read_parquet(path)
+  except Exception as e:
+    print(f"Error reading headlines {path}: {e}")
+    return pd.DataFrame(columns=COLUMNS)
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class NewsFeed:
+  """News subscriptions of the recently shown tickers (least recently shown is cancelled first), all feeding one store."""
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, store: NewsStore, maxTickers: int = NEWS_MAX_TICKERS, dataDirName: str = "data"):
+    self.store = store
+    self.maxTickers = maxTickers
+    self.dataDirName = dataDirName
+    self.subscriptions: 'collections.OrderedDict[str, int]' = collections.OrderedDict() # ticker -> reqId, '' for the broad tape
+    self.lock = threading.Lock()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def watch(self, ticker: str):
+    """Subscribes to the news of ticker ('' for the broad tape) unless it is subscribed already. IbkrTws must be open."""
+    if ticker.startswith('^'):
+      return # no news for indices
+    import IbkrTws as ib
+    with self.lock:
+      if ticker in self.subscriptions:
+        self.subscriptions.move_to_end(ticker)
+        return
+      self.subscriptions[ticker] = ib.subscribeNews(ticker, self.store)
+      tickers = [t for t in self.subscriptions if t]
+      for oldest in tickers[:max(0, len(tickers) - self.maxTickers)]:
+        ib.unsubscribeNews(self.subscriptions.pop(oldest))
+  #------------------------------------------------------------------------------------------------------------------------------
+  def stop(self, save: bool = True):
+    import IbkrTws as ib
+    with self.lock:
+      for reqId in self.subscriptions.values():
+        ib.unsubscribeNews(reqId)
+      self.subscriptions.clear()
+    if save and len(self.store):
+      self.store.save(self.dataDirName)
+#--------------------------------------------------------------------------------------------------------------------------------
+newsFeed: Optional[NewsFeed] = None
+newsFeedLock = threading.Lock()
+#--------------------------------------------------------------------------------------------------------------------------------
+def getNewsFeed() -> NewsFeed:
+  """The feed of the app, its store starts with the headlines saved by the last session."""
+  global newsFeed
+  with newsFeedLock:
+    if newsFeed is None:
+      newsFeed = NewsFeed(NewsStore.load())
+    return newsFeed
+#--------------------------------------------------------------------------------------------------------------------------------
+def benchmark(count: int, tickers: int = 500, queries: int = 2000):
+  store = NewsStore(capacity=count)
+  rng = random.Random(1)
+  symbols = [f"SYN{i:04d}" for i in range(tickers)]
+  start = time.time() - count
+  t0 = time.perf_counter()
+  for i in range(count):
+    store.add(start + i + rng.random(), rng.choice(symbols), 'BRFG', f"A{i}", f"headline {i}")
+  addSeconds = time.perf_counter() - t0
+  for i in range(count // 10): # a tenth arrives again, e.g. after a reconnect
+    store.add(start + i, rng.choice(symbols), 'BRFG', f"A{i}", f"headline {i}")
+  picks = [rng.choice(symbols) for _ in range(queries)]
+  t0 = time.perf_counter()
+  indexed = [store.latest(ticker, 50) for ticker in picks]
+  indexedSeconds = time.perf_counter() - t0
+  t0 = time.perf_counter()
+  scanned = []
+  for ticker in picks[:max(1, queries // 100)]:
+    scanned.append(sorted((h for h in store.slots if h is not None and ticker in h.tickers), key=lambda h: h.time, reverse=True)[:50])
+  scanSeconds = (time.perf_counter() - t0) / len(scanned)
+  assert scanned == indexed[:len(scanned)]
+  print(f"{count} headlines added in {addSeconds:.2f} s ({count / addSeconds:.0f}/s), {store.stats}")
+  print(f"last 50 of a ticker: {indexedSeconds / queries * 1e6:.1f} us indexed, {scanSeconds * 1e6:.0f} us by a scan")
+#--------------------------------------------------------------------------------------------------------------------------------
+def main(argv: Optional[List[str]] = None) -> int:
+  parser = argparse.ArgumentParser(description="Subscribes to the IBKR news of tickers and prints their newest headlines.")
+  parser.add_argument("tickers", nargs='*')
+  parser.add_argument("--seconds", type=float, default=10.0)
+  parser.add_argument("--last", type=int, default=NEWS_HEADLINES, help="Headlines printed per ticker.")
+  parser.add_argument("--broad-tape", action='store_true', help="Subscribe to the broad tape (news of all stocks) too.")
+  parser.add_argument("--fake", action='store_true', help="Use fakeTws instead of the TWS.")
+  parser.add_argument("--data", default="data", help="Data directory relative to src/.")
+  parser.add_argument("--benchmark", type=int, default=0, metavar="N", help="Time the queries of a store of N headlines, no TWS.")
+  opt = parser.parse_args(argv)
+  if opt.benchmark:
+    benchmark(opt.benchmark)
+    return 0
+  import config
+  import IbkrTws as ib
+  server = None
+  if opt.fake:
+    import fakeTws
+    server = fakeTws.FakeTwsServer(0).start()
+    config.port = server.port
+  try:
+    ib.open()
+    feed = NewsFeed(NewsStore.load(opt.data), dataDirName=opt.data)
+    for ticker in [t.upper() for t in opt.tickers] + ([''] if opt.broad_tape else []):
+      feed.watch(ticker)
+    time.sleep(opt.seconds)
+    feed.stop()
+    for ticker in [t.upper() for t in opt.tickers] + ([None] if opt.broad_tape else []):
+      print(f"--- {ticker or 'all'} ---")
+      for headline in feed.store.latest(ticker, opt.last):
+        print(formatHeadline(headline))
+    print(f"{len(feed.store)} headlines stored, {feed.store.stats}")
+  finally:
+    ib.close()
+    if server is not None:
+      server.stop()
+  return 0
+#----------------------------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,375 @@
+"""Live portfolio from the IBKR account updates (reqAccountUpdates) in a typed, array-backed positions table.
+
+  PositionTable    one row per contract, the columns are numpy arrays updated in place by the IbApi callbacks
+  PortfolioView    Toplevel with a Treeview, redrawn at most every REDRAW_MS and only for the rows which changed
+
+Market value and unrealized P&L of a row are recomputed when its position or price changes, the totals (P&L, long,
+short, gross and net exposure) are corrected by the difference of the changed rows instead of being summed again.
+Totals are kept per currency of the positions, summary() converts them into the base currency of the account with the
+ExchangeRate account values (a currency without a rate yet is reported unconverted).
+IBKR sends the market price of a position only every few minutes, setPrices() applies the latest closes of the local
+files (or any other price source) to all matching rows in one vectorized step. A price older than the one of the row
+is ignored.
+
+  python portfolio.py                          # subscribe, print the positions after the download, unsubscribe
+  python portfolio.py --fake 500 --seconds 10  # against fakeTws with 500 positions, prints the update rate
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import tkinter as tk
+from tkinter import ttk
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+#--------------------------------------------------------------------------------------------------------------------------------
+REDRAW_MS = 500            # the view draws the changes at most this often
+PRICE_REFRESH_MS = 60000   # latest closes of the local files
+INITIAL_CAPACITY = 64
+ARRAYS = ('position', 'averageCost', 'price', 'priceTime', 'multiplier', 'marketValue', 'unrealizedPnl', 'realizedPnl')
+TOTALS = ('marketValue', 'unrealizedPnl', 'realizedPnl', 'long', 'short')
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class PositionTable:
+  """Positions as columns. Written by the IbApi reader thread, read by the GUI, all access holds the lock.
+  Implements the account update callbacks of EWrapper, so it can be the portfolioListener of IbApi.
+  """
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, capacity: int = INITIAL_CAPACITY):
+    self.lock = threading.RLock()
+    self.rows: Dict[Any, int] = {}   # conId (symbol if there is none) -> row
+    self.symbols: List[str] = []
+    self.secTypes: List[str] = []
+    self.currencies: List[str] = []
+    self.columns: Dict[str, np.ndarray] = {name: np.zeros(capacity) for name in ARRAYS}
+    self.totals: Dict[str, Dict[str, float]] = {}      # currency -> TOTALS in that currency
+    self.accountValues: Dict[str, Tuple[str, str]] = {} # key -> (value, currency)
+    self.exchangeRates: Dict[str, float] = {}           # currency -> value of one unit in the base currency
+    self.dirty: set = set()
+    self.version = 0       # incremented by every change, the view skips a redraw without one
+    self.updates = 0       # updatePortfolio calls
+    self.downloaded = threading.Event()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __len__(self) -> int:
+    return len(self.symbols)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def column(self, name: str) -> np.ndarray:
+    """The used part of a column (a view, not a copy)."""
+    return self.columns[name][:len(self.symbols)]
+  #------------------------------------------------------------------------------------------------------------------------------
+  def rowOf(self, key: Any, symbol: str, secType: str, currency: str) -> int:
+    row = self.rows.get(key)
+    if row is not None:
+      return row
+    row = len(self.symbols)
+    if row == len(self.columns['position']):
+      for name, column in self.columns.items():
+        grown = np.zeros(2 * len(column))
+        grown[:row] = column
+        self.columns[name] = grown
+    self.columns['multiplier'][row] = 1.0
+    self.rows[key] = row
+    self.symbols.append(symbol)
+    self.secTypes.append(secType)
+    self.currencies.append(currency)
+    return row
+  #------------------------------------------------------------------------------------------------------------------------------
+  def totalsOf(self, currency: str) -> Dict[str, float]:
+    totals = self.totals.get(currency)
+    if totals is None:
+      totals = self.totals[currency] = dict.fromkeys(TOTALS, 0.0)
+    return totals
+  #------------------------------------------------------------------------------------------------------------------------------
+  def recompute(self, rows: np.ndarray):
+    """Market value and unrealized P&L of rows (same convention as IB: averageCost includes the multiplier),
+    the totals of their currencies change by the difference to the old values."""
+    c = self.columns
+    oldValue = c['marketValue'][rows]
+    oldPnl = c['unrealizedPnl'][rows]
+    value = c['position'][rows] * c['price'][rows] * c['multiplier'][rows]
+    pnl = value - c['position'][rows] * c['averageCost'][rows]
+    c['marketValue'][rows] = value
+    c['unrealizedPnl'][rows] = pnl
+    currencies = [self.currencies[row] for row in rows.tolist()]
+    distinct = set(currencies)
+    for currency in distinct:
+      mask = slice(None) if len(distinct) == 1 else np.array(currencies, dtype=object) == currency
+      v, old = value[mask], oldValue[mask]
+      totals = self.totalsOf(currency)
+      totals['marketValue'] += v.sum() - old.sum()
+      totals['unrealizedPnl'] += pnl[mask].sum() - oldPnl[mask].sum()
+      totals['long'] += v[v > 0].sum() - old[old > 0].sum()
+      totals['short'] += v[v < 0].sum() - old[old < 0].sum()
+    self.dirty.update(rows.tolist())
+    self.version += 1
+  #------------------------------------------------------------------------------------------------------------------------------
+  def resum(self):
+    """Totals summed from scratch, removes the rounding errors the incremental updates collect."""
+    with self.lock:
+      currencies = np.array(self.currencies, dtype=object)
+      value, pnl, realized = self.column('marketValue'), self.column('unrealizedPnl'), self.column('realizedPnl')
+      self.totals = {}
+      for currency in set(self.currencies):
+        mask = currencies == currency
+        v = value[mask]
+        self.totals[currency] = dict(marketValue=float(v.sum()), unrealizedPnl=float(pnl[mask].sum()), realizedPnl=float(realized[mask].sum()),
+                                     long=float(v[v > 0].sum()), short=float(v[v < 0].sum()))
+  #------------------------------------------------------------------------------------------------------------------------------
+  # EWrapper callbacks, called by IbApi on its reader thread
+  #------------------------------------------------------------------------------------------------------------------------------
+  def updatePortfolio(self, contract: Any, position: float, marketPrice: float, marketValue: float, averageCost: float,
+                      unrealizedPNL: float, realizedPNL: float, accountName: str):
+    symbol = contract.localSymbol if contract.secType in ('OPT', 'FOP', 'FUT') and contract.localSymbol else contract.symbol
+    with self.lock:
+      row = self.rowOf(contract.conId or symbol, symbol, contract.secType, contract.currency)
+      c = self.columns
+      c['position'][row] = float(position)
+      c['averageCost'][row] = averageCost
+      c['multiplier'][row] = float(contract.multiplier) if contract.multiplier else 1.0
+      c['price'][row] = marketPrice
+      c['priceTime'][row] = time.time()
+      self.totalsOf(contract.currency)['realizedPnl'] += realizedPNL - c['realizedPnl'][row]
+      c['realizedPnl'][row] = realizedPNL
+      self.recompute(np.array([row]))
+      self.updates += 1
+  #------------------------------------------------------------------------------------------------------------------------------
+  def updateAccountValue(self, key: str, val: str, currency: str, accountName: str):
+    with self.lock:
+      self.accountValues[key] = (val, currency)
+      if key == 'ExchangeRate' and currency != 'BASE': # one per currency of the account, the base currency has 1.00
+        try:
+          self.exchangeRates[currency] = float(val)
+        except ValueError:
+          pass
+      self.version += 1
+  #------------------------------------------------------------------------------------------------------------------------------
+  def accountDownloadEnd(self, accountName: str):
+    self.resum()
+    self.downloaded.set()
+  #------------------------------------------------------------------------------------------------------------------------------
+  # prices and reading
+  #------------------------------------------------------------------------------------------------------------------------------
+  def setPrices(self, prices: Dict[str, float], asOf: Optional[float] = None) -> int:
+    """Latest prices by symbol (stocks only), applied to the rows whose price is older than asOf. Returns the rows changed."""
+    asOf = time.time() if asOf is None else asOf
+    with self.lock:
+      symbols = np.array(self.symbols, dtype=object)
+      if not len(symbols):
+        return 0
+      known = np.array([s in prices for s in self.symbols]) & (np.array(self.secTypes, dtype=object) == 'STK')
+      rows = np.flatnonzero(known & (self.column('priceTime') <= asOf))
+      if not len(rows):
+        return 0
+      self.columns['price'][rows] = np.array([prices[s] for s in symbols[rows]], dtype=float)
+      self.columns['priceTime'][rows] = asOf
+      self.recompute(rows)
+      return len(rows)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def accountValue(self, key: str) -> Optional[float]:
+    with self.lock:
+      value = self.accountValues.get(key)
+    try:
+      return float(value[0]) if value else None
+    except ValueError:
+      return None
+  #------------------------------------------------------------------------------------------------------------------------------
+  def baseCurrency(self) -> Optional[str]:
+    """Currency of the NetLiquidation value, the base currency of the account; the one with the rate 1 without it."""
+    with self.lock:
+      value = self.accountValues.get('NetLiquidation')
+      if value and value[1] and value[1] != 'BASE':
+        return value[1]
+      return next((currency for currency, rate in self.exchangeRates.items() if rate == 1.0), None)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def rates(self) -> Tuple[Optional[str], Dict[str, float]]:
+    """Base currency and the rates into it. An account in a single currency needs no rate."""
+    base = self.baseCurrency()
+    with self.lock:
+      rates = dict(self.exchangeRates)
+      if base is None and len(set(self.currencies)) == 1:
+        base = self.currencies[0]
+    if base is not None:
+      rates[base] = 1.0
+    return base, rates
+  #------------------------------------------------------------------------------------------------------------------------------
+  def summary(self) -> Dict[str, Any]:
+    """Totals in the base currency, exposure and net liquidation (None before the account values are there).
+    'unconverted' has the totals of the currencies without an exchange rate yet, they are not in the sums."""
+    base, rates = self.rates()
+    with self.lock:
+      byCurrency = {currency: dict(totals) for currency, totals in self.totals.items()}
+      positions = len(self.symbols)
+    totals: Dict[str, Any] = dict.fromkeys(TOTALS, 0.0)
+    unconverted = {}
+    for currency, values in sorted(byCurrency.items()):
+      rate = rates.get(currency)
+      if rate is None:
+        unconverted[currency] = values
+        continue
+      for name in TOTALS:
+        totals[name] += values[name] * rate
+    totals.update(gross=totals['long'] - totals['short'], net=totals['long'] + totals['short'], positions=positions,
+                  netLiquidation=self.accountValue('NetLiquidation'), currency=base, byCurrency=byCurrency, unconverted=unconverted)
+    return totals
+  #------------------------------------------------------------------------------------------------------------------------------
+  def rowValues(self, row: int, netLiquidation: Optional[float], rates: Dict[str, float]) -> Tuple[Any, ...]:
+    c = self.columns
+    currency = self.currencies[row]
+    weight = c['marketValue'][row] * rates.get(currency, float('nan')) / netLiquidation * 100 if netLiquidation else float('nan')
+    return (self.symbols[row], c['position'][row], c['averageCost'][row], c['price'][row], c['marketValue'][row],
+            c['unrealizedPnl'][row], c['realizedPnl'][row], weight, currency)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def takeChanges(self) -> List[Tuple[int, Tuple[Any, ...]]]:
+    """(row, values) of the rows changed since the last call, for the view."""
+    netLiquidation = self.accountValue('NetLiquidation')
+    rates = self.rates()[1]
+    with self.lock:
+      rows = sorted(self.dirty)
+      self.dirty.clear()
+      return [(row, self.rowValues(row, netLiquidation, rates)) for row in rows]
+  #------------------------------------------------------------------------------------------------------------------------------
+  def allRows(self) -> List[Tuple[Any, ...]]:
+    netLiquidation = self.accountValue('NetLiquidation')
+    rates = self.rates()[1]
+    with self.lock:
+      return [self.rowValues(row, netLiquidation, rates) for row in range(len(self.symbols))]
+#--------------------------------------------------------------------------------------------------------------------------------
+def cachedPrices(symbols: Sequence[str], dataDirName: str = "data") -> Tuple[Dict[str, float], float]:
+  """Last close of the local daily files and the time of the oldest file, the prices are at least that recent."""
+  import loader
+  frames = loader.loadRecentBars(list(symbols), nBars=1, dataDirName=dataDirName)
+  prices = {s: float(df['Close'].iloc[-1]) for s, df in frames.items() if 'Close' in df.columns}
+  times = [os.path.getmtime(loader.constructParquetFilePath(s, '1d', dataDirName)) for s in prices]
+  return prices, min(times) if times else 0.0
+#--------------------------------------------------------------------------------------------------------------------------------
+def applyCachedPrices(table: PositionTable, dataDirName: str = "data") -> int:
+  """Latest closes of the local files for the stock positions, returns the rows changed."""
+  with table.lock:
+    symbols = [symbol for symbol, secType in zip(table.symbols, table.secTypes) if secType == 'STK']
+  prices, asOf = cachedPrices(symbols, dataDirName)
+  return table.setPrices(prices, asOf)
+#--------------------------------------------------------------------------------------------------------------------------------
+def formatNumber(value: float, digits: int = 2) -> str:
+  return '' if value != value else f"{value:,.{digits}f}"
+#--------------------------------------------------------------------------------------------------------------------------------
+def formatSummary(s: Dict[str, Any]) -> str:
+  """One line of totals in the base currency, followed by the totals of currencies without an exchange rate yet."""
+  liquidation = f"Net liq. {formatNumber(s['netLiquidation'])}   " if s['netLiquidation'] is not None else ""
+  text = (f"{s['currency'] or '?'}  {liquidation}Value {formatNumber(s['marketValue'])}   Unrl. P&L {formatNumber(s['unrealizedPnl'])}   "
+          f"Rlzd. P&L {formatNumber(s['realizedPnl'])}   Long {formatNumber(s['long'])}   Short {formatNumber(s['short'])}   "
+          f"Gross {formatNumber(s['gross'])}   Net {formatNumber(s['net'])}   ({s['positions']} positions)")
+  for currency, totals in s['unconverted'].items():
+    text += f"   no rate: {currency} value {formatNumber(totals['marketValue'])} unrl. {formatNumber(totals['unrealizedPnl'])}"
+  return text
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class PortfolioView:
+  """Window of the positions: only the rows which changed since the last redraw are written to the Treeview."""
+  COLUMNS = (('symbol', 'Symbol', 90), ('position', 'Position', 80), ('averageCost', 'Avg cost', 80), ('price', 'Price', 80),
+             ('marketValue', 'Value', 100), ('unrealizedPnl', 'Unrl. P&L', 90), ('realizedPnl', 'Rlzd. P&L', 90), ('weight', 'Weight %', 70),
+             ('currency', 'Ccy', 45))
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, root: tk.Tk, table: PositionTable, onClose: Optional[Any] = None, refreshPrices: Optional[Any] = None):
+    self.table = table
+    self.onClose = onClose
+    self.refreshPrices = refreshPrices
+    self.drawnVersion = -1
+    self.items: Dict[int, str] = {} # row -> Treeview item
+    self.redraws = 0
+    self.window = tk.Toplevel(root)
+    self.window.title("Portfolio")
+    self.window.geometry("780x480")
+    self.summaryLabel = ttk.Label(self.window, anchor='w', padding=4)
+    self.summaryLabel.pack(fill=tk.X)
+    frame = ttk.Frame(self.window)
+    frame.pack(fill=tk.BOTH, expand=True)
+    self.tree = ttk.Treeview(frame, columns=[c[0] for c in self.COLUMNS], show='headings')
+    for column, text, width in self.COLUMNS:
+      self.tree.heading(column, text=text)
+      self.tree.column(column, width=width, anchor='w' if column == 'symbol' else 'e')
+    scrollbar = ttk.Scrollbar(frame, orient="vertical", command=self.tree.yview)
+    self.tree.configure(yscrollcommand=scrollbar.set)
+    self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+    scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+    self.tree.tag_configure('loss', foreground='#c00000')
+    self.window.protocol("WM_DELETE_WINDOW", self.close)
+    self.redraw()
+    if self.refreshPrices is not None:
+      self.window.after(0, self.schedulePriceRefresh)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def exists(self) -> bool:
+    try:
+      return bool(self.window.winfo_exists())
+    except tk.TclError:
+      return False
+  #------------------------------------------------------------------------------------------------------------------------------
+  def close(self):
+    if self.onClose is not None:
+      self.onClose()
+    self.window.destroy()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def redraw(self):
+    if not self.exists():
+      return
+    if self.table.version != self.drawnVersion:
+      self.drawnVersion = self.table.version
+      self.redraws += 1
+      for row, values in self.table.takeChanges():
+        texts = (values[0], formatNumber(values[1], 0)) + tuple(formatNumber(v) for v in values[2:8]) + (values[8],)
+        tags = ('loss',) if values[5] < 0 else ()
+        item = self.items.get(row)
+        if item is None:
+          self.items[row] = self.tree.insert('', tk.END, values=texts, tags=tags)
+        else:
+          self.tree.item(item, values=texts, tags=tags)
+      self.summaryLabel.config(text=formatSummary(self.table.summary()))
+    self.window.after(REDRAW_MS, self.redraw)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def schedulePriceRefresh(self):
+    if not self.exists():
+      return
+    threading.Thread(target=self.refreshPrices, name='portfolioPrices', daemon=True).start()
+    self.window.after(PRICE_REFRESH_MS, self.schedulePriceRefresh)
+#--------------------------------------------------------------------------------------------------------------------------------
+def main(argv: Optional[List[str]] = None) -> int:
+  parser = argparse.ArgumentParser(description="Positions and P&L of the IBKR account.")
+  parser.add_argument("--fake", type=int, metavar="N", help="Use fakeTws with N positions instead of the TWS.")
+  parser.add_argument("--seconds", type=float, default=0.0, help="Keep the subscription open and count the updates.")
+  parser.add_argument("--interval", type=float, default=0.05, help="Seconds between the fakeTws update rounds.")
+  opt = parser.parse_args(argv)
+  import config
+  import IbkrTws as ib
+  server = None
+  if opt.fake:
+    import fakeTws
+    server = fakeTws.FakeTwsServer(0, positions=opt.fake, portfolioInterval=opt.interval).start()
+    config.port = server.port
+  table = PositionTable()
+  try:
+    ib.open()
+    start = time.perf_counter()
+    ib.subscribePortfolio(table)
+    print(f"download   {len(table)} positions in {time.perf_counter() - start:.2f}s")
+    if opt.seconds > 0:
+      updates = table.updates
+      time.sleep(opt.seconds)
+      print(f"updates    {(table.updates - updates) / opt.seconds:.0f}/s")
+    ib.unsubscribePortfolio()
+  finally:
+    ib.close()
+    if server is not None:
+      server.stop()
+  for values in table.allRows()[:50]:
+    print(f"{values[0]:10} {values[1]:8.0f} {values[2]:10.2f} {values[3]:10.2f} {values[4]:12.2f} {values[5]:12.2f} {values[6]:10.2f} {values[7]:7.2f}% {values[8]}")
+  if len(table) > 50:
+    print(f"... {len(table) - 50} more")
+  s = table.summary()
+  for currency, totals in s['byCurrency'].items():
+    print(f"{currency}   value {totals['marketValue']:,.2f}  unrealized {totals['unrealizedPnl']:,.2f}  realized {totals['realizedPnl']:,.2f}")
+  print(formatSummary(s))
+  return 0
+#----------------------------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,395 @@
+"""IBKR market scanner: the subscriptions stay open and every snapshot (the rows up to scannerDataEnd) becomes a ranked table.
+
+  data/scanner/parameters.xml                   scanner parameters of the TWS (reqScannerParameters, megabytes), fetched once a day
+  data/scanner/parameters.json                  what the app needs of it: instruments, location codes, scan codes
+  data/scanner/{scanCode}_{locationCode}.parquet results of a scan, shown before the first snapshot arrives
+
+The TWS sends a new snapshot of a scan about every 30 s. ScannerSubscription collects the rows until scannerDataEnd and
+compares the snapshot with the previous one: only the symbols which entered, left or changed their rank are passed on
+(ScanDiff), so the view moves a few Treeview rows instead of building the list again. The results table keeps per symbol
+the current and best rank, the number of snapshots it was in and when it was first and last seen.
+Symbols entering a scan can be queued for loader.Prefetcher (top ranks first) and added to the watchlist.
+
+  python scanner.py --list                                # scan codes of the cached parameters
+  python scanner.py TOP_PERC_GAIN --seconds 60            # snapshots and their differences
+  python scanner.py TOP_PERC_GAIN --fake --seconds 5      # against fakeTws
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import sys
+import threading
+import time
+import tkinter as tk
+import xml.etree.ElementTree as ET
+from tkinter import ttk
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+
+import atomicIo
+#--------------------------------------------------------------------------------------------------------------------------------
+PARAMETERS_MAX_AGE = 86400.0  # seconds, the parameters change with TWS releases only
+DEFAULT_INSTRUMENT = 'STK'
+DEFAULT_LOCATION = 'STK.US.MAJOR'
+DEFAULT_ROWS = 50             # the most the TWS sends per scan
+PARAMETER_RECORDS = {'Instrument': ('name', 'type'), 'Location': ('displayName', 'locationCode', 'instruments'),
+                     'ScanType': ('displayName', 'scanCode', 'instruments')}
+RESULT_COLUMNS = ['symbol', 'rank', 'previousRank', 'bestRank', 'snapshots', 'firstSeen', 'lastSeen']
+#--------------------------------------------------------------------------------------------------------------------------------
+def scannerDir(dataDirName: str = "data") -> str:
+  return os.path.join(os.path.dirname(os.path.abspath(__file__)), dataDirName, "scanner")
+#--------------------------------------------------------------------------------------------------------------------------------
+def parseScannerParameters(xmlData: str) -> Dict[str, List[Dict[str, str]]]:
+  """Instruments, locations and scan types of the parameter XML, streamed: a record is cleared once its fields are read."""
+  result: Dict[str, List[Dict[str, str]]] = {tag: [] for tag in PARAMETER_RECORDS}
+  depth = 0
+  for event, elem in ET.iterparse(io.BytesIO(xmlData.encode('utf-8')), events=('start', 'end')):
+    if event == 'start':
+      depth += 1
+      continue
+    depth -= 1
+    fields = PARAMETER_RECORDS.get(elem.tag)
+    if fields is not None:
+      result[elem.tag].append({field: (elem.findtext(field) or '').strip() for field in fields})
+      elem.clear()
+    elif depth <= 1: # a whole section the app does not use (filters, settings ...)
+      elem.clear()
+  return result
+#--------------------------------------------------------------------------------------------------------------------------------
+def loadScannerParameters(dataDirName: str = "data", maxAge: float = PARAMETERS_MAX_AGE, fetch: bool = True) -> Optional[Dict[str, List[Dict[str, str]]]]:
+  """The parsed parameters, requested from the TWS (IbkrTws must be open) when the cache is older than maxAge."""
+  directory = scannerDir(dataDirName)
+  jsonPath = os.path.join(directory, "parameters.json")
+  cached = None
+  if os.path.exists(jsonPath):
+    with open(jsonPath) as f:
+      cached = json.load(f)
+    if time.time() - os.path.getmtime(jsonPath) < maxAge or not fetch:
+      return cached
+  elif not fetch:
+    return None
+  import IbkrTws as ib
+  try:
+    xmlData = ib.getScannerParameters()
+  except Exception as e:
+    print(f"Could not fetch the scanner parameters: {e}")
+    xmlData = None
+  if not xmlData:
+    return cached # older parameters are better than none
+  parameters = parseScannerParameters(xmlData)
+  atomicIo.writeText(os.path.join(directory, "parameters.xml"), xmlData, durable=False)
+  atomicIo.writeText(jsonPath, json.dumps(parameters, indent=1), durable=False)
+  return parameters
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class ScanRow(NamedTuple):
+  rank: int
+  symbol: str
+  secType: str
+  exchange: str
+  currency: str
+  conId: int
+  distance: str
+  benchmark: str
+  projection: str
+#--------------------------------------------------------------------------------------------------------------------------------
+class ScanDiff(NamedTuple):
+  snapshot: int                         # number of the snapshot, 1 is the first
+  entered: Dict[str, int]               # symbol -> rank
+  left: List[str]
+  moved: Dict[str, Tuple[int, int]]     # symbol -> (old rank, new rank)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def changed(self) -> bool:
+    return bool(self.entered or self.left or self.moved)
+#--------------------------------------------------------------------------------------------------------------------------------
+def diffSnapshots(old: Dict[str, int], new: Dict[str, int], snapshot: int) -> ScanDiff:
+  """Differences of two snapshots (symbol -> rank)."""
+  entered = {symbol: rank for symbol, rank in new.items() if symbol not in old}
+  left = [symbol for symbol in old if symbol not in new]
+  moved = {symbol: (old[symbol], rank) for symbol, rank in new.items() if symbol in old and old[symbol] != rank}
+  return ScanDiff(snapshot, entered, left, moved)
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class ScannerSubscription:
+  """One scan kept open at the TWS. scannerData, scannerDataEnd and scannerError are called by IbApi on its reader thread,
+  onDiff(diff) too: a GUI has to pass the diff to its own thread.
+  """
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, scanCode: str, instrument: str = DEFAULT_INSTRUMENT, locationCode: str = DEFAULT_LOCATION,
+               rows: int = DEFAULT_ROWS, onDiff: Optional[Callable[[ScanDiff], None]] = None,
+               filters: Optional[Dict[str, str]] = None, dataDirName: str = "data"):
+    self.scanCode = scanCode
+    self.instrument = instrument
+    self.locationCode = locationCode
+    self.rows = rows
+    self.onDiff = onDiff
+    self.filters = filters or {}
+    self.path = os.path.join(scannerDir(dataDirName), f"{scanCode}_{locationCode}.parquet")
+    self.lock = threading.Lock()
+    self.building: List[ScanRow] = []         # rows of the snapshot being received
+    self.current: Dict[str, ScanRow] = {}     # symbol -> row of the last complete snapshot
+    self.snapshots = 0
+    self.reqId: Optional[int] = None
+    self.lastError: Optional[str] = None
+    self.results: Dict[str, List[Any]] = self.loadResults() # symbol -> [rank, previousRank, bestRank, snapshots, firstSeen, lastSeen]
+  #------------------------------------------------------------------------------------------------------------------------------
+  def subscription(self) -> Any:
+    from ibapi.scanner import ScannerSubscription as IbScannerSubscription
+    subscription = IbScannerSubscription()
+    subscription.instrument = self.instrument
+    subscription.locationCode = self.locationCode
+    subscription.scanCode = self.scanCode
+    subscription.numberOfRows = self.rows
+    return subscription
+  #------------------------------------------------------------------------------------------------------------------------------
+  def start(self) -> 'ScannerSubscription':
+    import IbkrTws as ib
+    from ibapi.tag_value import TagValue
+    self.reqId = ib.startScanner(self.subscription(), [TagValue(k, v) for k, v in self.filters.items()], self)
+    return self
+  #------------------------------------------------------------------------------------------------------------------------------
+  def stop(self):
+    if self.reqId is not None:
+      import IbkrTws as ib
+      ib.stopScanner(self.reqId)
+      self.reqId = None
+  #------------------------------------------------------------------------------------------------------------------------------
+  # IbApi callbacks
+  #------------------------------------------------------------------------------------------------------------------------------
+  def scannerData(self, rank: int, contractDetails: Any, distance: str, benchmark: str, projection: str, legsStr: str):
+    contract = contractDetails.contract
+    with self.lock:
+      self.building.append(ScanRow(rank, contract.symbol, contract.secType, contract.exchange, contract.currency,
+                                   contract.conId, distance, benchmark, projection))
+  #------------------------------------------------------------------------------------------------------------------------------
+  def scannerDataEnd(self):
+    with self.lock:
+      rows, self.building = self.building, []
+      new = {}
+      for row in sorted(rows):
+        new.setdefault(row.symbol, row) # a symbol listed twice keeps its best rank
+      diff = diffSnapshots({s: r.rank for s, r in self.current.items()}, {s: r.rank for s, r in new.items()}, self.snapshots + 1)
+      self.current = new
+      self.snapshots += 1
+      self.updateResults(diff)
+    self.saveResults()
+    if self.onDiff is not None and (diff.changed() or diff.snapshot == 1):
+      self.onDiff(diff)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def scannerError(self, errorCode: int, errorString: str):
+    self.lastError = f"{errorCode}: {errorString}"
+  #------------------------------------------------------------------------------------------------------------------------------
+  # results table
+  #------------------------------------------------------------------------------------------------------------------------------
+  def updateResults(self, diff: ScanDiff):
+    """Only the symbols of the diff change, the others keep their rank (the lock is held by the caller)."""
+    now = time.time()
+    for symbol, row in self.current.items():
+      entry = self.results.get(symbol)
+      if entry is None:
+        self.results[symbol] = [row.rank, float('nan'), row.rank, 1, now, now]
+        continue
+      if symbol in diff.entered or symbol in diff.moved:
+        entry[1] = entry[0]
+        entry[0] = row.rank
+        entry[2] = min(entry[2], row.rank)
+      entry[3] += 1
+      entry[5] = now
+    for symbol in diff.left:
+      entry = self.results[symbol]
+      entry[1], entry[0] = entry[0], float('nan')
+  #------------------------------------------------------------------------------------------------------------------------------
+  def resultsFrame(self, by: str = 'rank') -> pd.DataFrame:
+    """All symbols seen, sorted by a column (rank, bestRank, snapshots ...), rank is NaN for symbols not in the last snapshot."""
+    with self.lock:
+      rows = [[symbol] + entry for symbol, entry in self.results.items()]
+    df = pd.DataFrame(rows, columns=RESULT_COLUMNS)
+    for column in ('firstSeen', 'lastSeen'):
+      df[column] = pd.to_datetime(df[column], unit='s')
+    return df.sort_values(by, ascending=by not in ('snapshots', 'lastSeen'), ignore_index=True)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def loadResults(self) -> Dict[str, List[Any]]:
+    """The results of the last session, their ranks are not current any more."""
+    try:
+      df = pd.read_parquet(self.path)
+    except (FileNotFoundError, OSError):
+      return {}
+    results = {}
+    for row in df.itertuples(index=False):
+      results[row.symbol] = [float('nan'), row.rank, row.bestRank, row.snapshots, row.firstSeen.timestamp(), row.lastSeen.timestamp()]
+    return results
+  #------------------------------------------------------------------------------------------------------------------------------
+  def saveResults(self):
+    try:
+      atomicIo.writeParquet(self.resultsFrame(), self.path, durable=False)
+    except OSError as e:
+      print(f"Could not save the scanner results {self.path}: {e}")
+  #------------------------------------------------------------------------------------------------------------------------------
+  def ranked(self) -> List[ScanRow]:
+    with self.lock:
+      return sorted(self.current.values())
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class ScannerView:
+  """Window of one scan at a time. A snapshot only touches the Treeview rows of the symbols which changed."""
+  COLUMNS = (('rank', 'Rank', 50), ('symbol', 'Symbol', 90), ('change', 'Last move', 70), ('bestRank', 'Best', 50))
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, root: tk.Tk, parameters: Optional[Dict[str, List[Dict[str, str]]]],
+               addToWatchlist: Callable[[List[str]], None], prefetch: Optional[Callable[[List[str]], None]] = None,
+               openTicker: Optional[Callable[[str], None]] = None):
+    self.addToWatchlist = addToWatchlist
+    self.prefetch = prefetch
+    self.openTicker = openTicker
+    self.subscription: Optional[ScannerSubscription] = None
+    self.items: Dict[str, str] = {} # symbol -> Treeview item
+    scanTypes = (parameters or {}).get('ScanType') or [{'displayName': 'Top % Gainers', 'scanCode': 'TOP_PERC_GAIN'}]
+    self.scanCodes = {f"{s['displayName']} ({s['scanCode']})": s['scanCode'] for s in scanTypes}
+    locations = [l['locationCode'] for l in (parameters or {}).get('Location', []) if l['locationCode'].startswith(DEFAULT_INSTRUMENT)]
+    self.window = tk.Toplevel(root)
+    self.window.title("Market Scanner")
+    self.window.geometry("420x560")
+    controls = ttk.Frame(self.window, padding=4)
+    controls.pack(fill=tk.X)
+    controls.columnconfigure(0, weight=1)
+    self.scanVar = tk.StringVar(value=next(iter(self.scanCodes)))
+    ttk.Combobox(controls, textvariable=self.scanVar, values=sorted(self.scanCodes), state="readonly").grid(row=0, column=0, columnspan=2, sticky="ew")
+    self.locationVar = tk.StringVar(value=DEFAULT_LOCATION)
+    ttk.Combobox(controls, textvariable=self.locationVar, values=sorted(set(locations) | {DEFAULT_LOCATION}), width=16).grid(row=1, column=0, sticky="ew", pady=(2,0))
+    self.startButton = ttk.Button(controls, text="Start", command=self.toggle, width=8)
+    self.startButton.grid(row=1, column=1, sticky="e", pady=(2,0))
+    self.prefetchVar = tk.BooleanVar(value=prefetch is not None)
+    ttk.Checkbutton(controls, text="Prefetch new symbols", variable=self.prefetchVar).grid(row=2, column=0, sticky="w", pady=(2,0))
+    ttk.Button(controls, text="To watchlist", command=self.addSelectionToWatchlist).grid(row=2, column=1, sticky="e", pady=(2,0))
+    self.statusLabel = ttk.Label(controls, text="")
+    self.statusLabel.grid(row=3, column=0, columnspan=2, sticky="w")
+    self.tree = ttk.Treeview(self.window, columns=[c[0] for c in self.COLUMNS], show='headings')
+    for column, text, width in self.COLUMNS:
+      self.tree.heading(column, text=text)
+      self.tree.column(column, width=width, anchor='w' if column == 'symbol' else 'e')
+    self.tree.tag_configure('up', foreground='#008000')
+    self.tree.tag_configure('down', foreground='#c00000')
+    self.tree.pack(fill=tk.BOTH, expand=True)
+    self.tree.bind("<Double-1>", self.handleDoubleClick)
+    self.window.protocol("WM_DELETE_WINDOW", self.close)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def exists(self) -> bool:
+    try:
+      return bool(self.window.winfo_exists())
+    except tk.TclError:
+      return False
+  #------------------------------------------------------------------------------------------------------------------------------
+  def toggle(self):
+    if self.subscription is not None:
+      self.stop()
+      return
+    self.tree.delete(*self.tree.get_children())
+    self.items = {}
+    self.subscription = ScannerSubscription(self.scanCodes[self.scanVar.get()], locationCode=self.locationVar.get(),
+                                            onDiff=lambda diff: self.window.after(0, self.applyDiff, diff))
+    try:
+      self.subscription.start()
+    except Exception as e:
+      self.subscription = None
+      self.statusLabel.config(text=f"Scanner not started: {e}")
+      return
+    self.startButton.config(text="Stop")
+    self.statusLabel.config(text="Waiting for the first snapshot...")
+  #------------------------------------------------------------------------------------------------------------------------------
+  def stop(self):
+    if self.subscription is not None:
+      self.subscription.stop()
+      self.subscription = None
+    self.startButton.config(text="Start")
+  #------------------------------------------------------------------------------------------------------------------------------
+  def close(self):
+    self.stop()
+    self.window.destroy()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def rowValues(self, symbol: str, rank: int, oldRank: Optional[int]) -> Tuple[Tuple[Any, ...], Tuple[str, ...]]:
+    """oldRank None: entered the scan, equal to rank: first snapshot."""
+    entry = self.subscription.results.get(symbol) if self.subscription is not None else None
+    change = 'new' if oldRank is None else ('' if oldRank == rank else f"{oldRank - rank:+d}")
+    tags = () if oldRank is None or oldRank == rank else (('up',) if rank < oldRank else ('down',))
+    return (rank + 1, symbol, change, entry[2] + 1 if entry else ''), tags
+  #------------------------------------------------------------------------------------------------------------------------------
+  def applyDiff(self, diff: ScanDiff):
+    if not self.exists() or self.subscription is None:
+      return
+    for symbol in diff.left:
+      item = self.items.pop(symbol, None)
+      if item is not None:
+        self.tree.delete(item)
+    changed = sorted([(rank, symbol, None) for symbol, rank in diff.entered.items()] +
+                     [(new, symbol, old) for symbol, (old, new) in diff.moved.items()])
+    for _, symbol, _ in changed:
+      if symbol in self.items:
+        self.tree.detach(self.items[symbol])
+    # the unchanged rows are in rank order, the changed ones are put back at their rank from the top
+    for rank, symbol, oldRank in changed:
+      values, tags = self.rowValues(symbol, rank, oldRank if diff.snapshot > 1 else rank)
+      item = self.items.get(symbol)
+      if item is None:
+        self.items[symbol] = self.tree.insert('', rank, values=values, tags=tags)
+      else:
+        self.tree.item(item, values=values, tags=tags)
+        self.tree.move(item, '', rank)
+    self.statusLabel.config(text=f"Snapshot {diff.snapshot} at {datetime.datetime.now():%H:%M:%S}: {len(diff.entered)} new, "
+                                 f"{len(diff.moved)} moved, {len(diff.left)} left" + (f" ({self.subscription.lastError})" if self.subscription.lastError else ""))
+    if self.prefetch is not None and self.prefetchVar.get() and diff.entered:
+      self.prefetch(sorted(diff.entered, key=diff.entered.get))
+  #------------------------------------------------------------------------------------------------------------------------------
+  def selectedSymbols(self) -> List[str]:
+    items = self.tree.selection() or self.tree.get_children()
+    return [self.tree.set(item, 'symbol') for item in items]
+  #------------------------------------------------------------------------------------------------------------------------------
+  def addSelectionToWatchlist(self):
+    symbols = self.selectedSymbols()
+    if symbols:
+      self.addToWatchlist(symbols)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def handleDoubleClick(self, event):
+    item = self.tree.identify_row(event.y)
+    if item and self.openTicker is not None:
+      self.openTicker(self.tree.set(item, 'symbol'))
+#--------------------------------------------------------------------------------------------------------------------------------
+def main(argv: Optional[List[str]] = None) -> int:
+  parser = argparse.ArgumentParser(description="Runs an IBKR market scan and prints the differences of its snapshots.")
+  parser.add_argument("scanCode", nargs='?', default='TOP_PERC_GAIN')
+  parser.add_argument("--location", default=DEFAULT_LOCATION)
+  parser.add_argument("--rows", type=int, default=DEFAULT_ROWS)
+  parser.add_argument("--seconds", type=float, default=60.0)
+  parser.add_argument("--list", action='store_true', help="Print the scan codes of the (cached) scanner parameters.")
+  parser.add_argument("--fake", action='store_true', help="Use fakeTws instead of the TWS.")
+  parser.add_argument("--data", default="data", help="Data directory relative to src/.")
+  opt = parser.parse_args(argv)
+  import config
+  import IbkrTws as ib
+  server = None
+  if opt.fake:
+    import fakeTws
+    server = fakeTws.FakeTwsServer(0).start()
+    config.port = server.port
+  try:
+    ib.open()
+    if opt.list:
+      parameters = loadScannerParameters(opt.data) or {}
+      for scanType in parameters.get('ScanType', []):
+        print(f"{scanType['scanCode']:30} {scanType['displayName']}")
+      return 0
+    def printDiff(diff: ScanDiff):
+      print(f"snapshot {diff.snapshot}: entered {diff.entered}  left {diff.left}  moved {diff.moved}")
+    subscription = ScannerSubscription(opt.scanCode, locationCode=opt.location, rows=opt.rows, onDiff=printDiff, dataDirName=opt.data).start()
+    time.sleep(opt.seconds)
+    subscription.stop()
+    print(subscription.resultsFrame().head(20).to_string())
+  finally:
+    ib.close()
+    if server is not None:
+      server.stop()
+  return 0
+#----------------------------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,351 @@
+"""Soak test of the chart path: thousands of ticker switches, memory growth sampled and checked against thresholds.
+
+  python soakTest.py --switches 2000                  # headless: the displayProcessedData path on Agg figures
+  python soakTest.py --switches 2000 --gui            # drives StockAnalyzerApp itself (needs a display)
+  python soakTest.py --switches 500 --referrers       # who holds the figures and DataFrames that outlived their switch
+
+Offline: synthetic fixtures served by loader.ReplayProvider, the tickers cycle through --tickers names (SOAK0000, ...).
+Every --sample switches it records the RSS, the figures known to pyplot, the Figure and DataFrame objects alive (gc),
+and with --gui the Tk widgets and Tcl commands. The first --warmup switches fill the caches (compactFrame budget, hot
+tier, font cache), their end is the baseline. tracemalloc traces the last --trace switches (it about quadruples the time
+of a switch), at the end the allocations grown in them are listed by source line. The test fails (exit code 1) if after
+the warmup the RSS grows by more than --max-rss-mb, the figures, widgets or Tcl commands by more than --max-objects or
+the DataFrames by more than --max-frames.
+Files the run writes for the SOAK tickers (cache, hot tier, indicator cache) are removed at the end.
+"""
+import argparse
+import collections
+import contextlib
+import gc
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from typing import Any, Dict, List, Optional, Set
+
+import loader
+from loadTest import createFixtures
+try:
+  import psutil # optional, the fallbacks in rssMb cover linux, windows and macOS without it
+except ImportError:
+  psutil = None
+#--------------------------------------------------------------------------------------------------------------------------------
+PREFIX = 'SOAK'
+REFERRER_DEPTH = 6
+TRACE_FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__)]
+#--------------------------------------------------------------------------------------------------------------------------------
+def rssMb() -> float:
+  """Current resident set size of this process. Not ru_maxrss: a peak cannot show growth (and is bytes on macOS)."""
+  if psutil is not None:
+    return psutil.Process().memory_info().rss / 2**20
+  if sys.platform == 'win32':
+    return windowsWorkingSet() / 2**20
+  if os.path.exists('/proc/self/statm'):
+    with open('/proc/self/statm') as f:
+      return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+  # macOS and the BSDs have no procfs, ps reports the current RSS in KiB
+  out = subprocess.run(['ps', '-o', 'rss=', '-p', str(os.getpid())], capture_output=True, text=True, check=True).stdout
+  return int(out.strip()) / 1024
+#--------------------------------------------------------------------------------------------------------------------------------
+def windowsWorkingSet() -> int:
+  """WorkingSetSize in bytes from GetProcessMemoryInfo, the value the task manager shows as memory."""
+  import ctypes
+  from ctypes import wintypes
+  class ProcessMemoryCounters(ctypes.Structure):
+    _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + \
+      [(name, ctypes.c_size_t) for name in ('PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                                            'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage')]
+  counters = ProcessMemoryCounters()
+  counters.cb = ctypes.sizeof(counters)
+  getCurrentProcess = ctypes.windll.kernel32.GetCurrentProcess
+  getCurrentProcess.restype = wintypes.HANDLE
+  getProcessMemoryInfo = ctypes.windll.psapi.GetProcessMemoryInfo
+  getProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(ProcessMemoryCounters), wintypes.DWORD]
+  if not getProcessMemoryInfo(getCurrentProcess(), ctypes.byref(counters), counters.cb):
+    raise ctypes.WinError()
+  return counters.WorkingSetSize
+#--------------------------------------------------------------------------------------------------------------------------------
+def liveObjects() -> Dict[str, List[Any]]:
+  """Figure and DataFrame objects alive after a full collection."""
+  import pandas as pd
+  from matplotlib.figure import Figure
+  gc.collect()
+  result: Dict[str, List[Any]] = {'figures': [], 'dataFrames': []}
+  for obj in gc.get_objects():
+    if isinstance(obj, Figure):
+      result['figures'].append(obj)
+    elif isinstance(obj, pd.DataFrame):
+      result['dataFrames'].append(obj)
+  return result
+#--------------------------------------------------------------------------------------------------------------------------------
+def moduleOf(holder: Any) -> Optional[types.ModuleType]:
+  """The module whose globals holder is."""
+  if isinstance(holder, dict) and isinstance(holder.get('__name__'), str):
+    module = sys.modules.get(holder['__name__'])
+    if module is not None and vars(module) is holder:
+      return module
+  return None
+#--------------------------------------------------------------------------------------------------------------------------------
+def describe(holder: Any, obj: Any, withKey: bool = True) -> str:
+  """Type of the holder and the key or attribute under which it holds obj."""
+  name = type(holder).__qualname__
+  if isinstance(holder, dict):
+    key = next((k for k, v in holder.items() if v is obj), None)
+    module = moduleOf(holder)
+    if module is not None:
+      return f"{module.__name__}.{key}"
+    return f"dict[{key!r}]" if withKey and key is not None else f"dict({len(holder)})"
+  if isinstance(holder, (list, tuple, collections.deque)):
+    return f"{name}({len(holder)})"
+  if isinstance(holder, types.ModuleType):
+    return f"module {holder.__name__}"
+  return f"{type(holder).__module__}.{name}"
+#--------------------------------------------------------------------------------------------------------------------------------
+def referrerChain(obj: Any, ignore: Set[int], depth: int = REFERRER_DEPTH, firstKey: bool = True) -> str:
+  """The first referrer of obj, of that one and so on up to a module or class: where an object is retained.
+  firstKey=False leaves out the key of the first container, so the chains of the entries of one cache are equal."""
+  chain, current = [], obj
+  for level in range(depth):
+    referrers = [r for r in gc.get_referrers(current)
+                 if id(r) not in ignore and not isinstance(r, (types.FrameType, types.GeneratorType))] # not the callers
+    ignore.add(id(referrers))
+    if not referrers:
+      chain.append("(unreferenced cycle)")
+      break
+    holder = referrers[0]
+    chain.append(describe(holder, current, firstKey or level > 0))
+    if isinstance(holder, (types.ModuleType, type)) or moduleOf(holder) is not None:
+      break
+    current = holder
+  return " <- ".join(chain)
+#--------------------------------------------------------------------------------------------------------------------------------
+def removeSoakFiles(dataDirName: str = "data"):
+  """Files of the SOAK tickers in a data directory and its subdirectories (hot tier, indicator cache)."""
+  dataDir = os.path.dirname(loader.constructParquetFilePath(PREFIX, '1d', dataDirName))
+  for directory, _, files in os.walk(dataDir):
+    for fileName in files:
+      if fileName.startswith(PREFIX):
+        try:
+          os.remove(os.path.join(directory, fileName))
+        except OSError as e:
+          print(f"Could not remove {fileName}: {e}")
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class HeadlessDriver:
+  """processDataInBackground + displayProcessedData without Tk: fetch, indicators, the two figures drawn on Agg canvases,
+  the figures of the previous ticker closed the way clearPreviousCharts does."""
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, dataDir: str, years: int = 2):
+    import matplotlib
+    matplotlib.use('Agg')
+    import stockAnalyzer
+    stockAnalyzer.importHeavyModules()
+    self.sa = stockAnalyzer
+    self.chartUtils = stockAnalyzer.ChartingUtils()
+    self.dataDir = dataDir
+    self.years = years
+    self.figures: List[Any] = []
+  #------------------------------------------------------------------------------------------------------------------------------
+  def indicators(self, df: Any, displayStart: Any, ticker: str, interval: str) -> Any:
+    """StockAnalyzerApp.applyIndicatorsAndFilterData without the worker pool."""
+    sa = self.sa
+    if df is None or df.empty:
+      return df
+    key = ('indicators', ticker, interval, displayStart, len(df), df.index[-1], float(df['Close'].iloc[-1]))
+    result = sa.compactFrame.getManager().get(key)
+    if result is None:
+      result = sa.calculateIndicators(df, displayStart, ticker, interval)
+      if result is not None and not result.empty:
+        sa.compactFrame.getManager().put(key, result)
+    return result
+  #------------------------------------------------------------------------------------------------------------------------------
+  def switch(self, ticker: str):
+    sa = self.sa
+    startDt, endDt, displayStart = sa.calculateDateRanges(self.years)
+    figures = []
+    for interval, timeframe in (('1d', 'Daily'), ('1wk', 'Weekly')):
+      raw = sa.loader.fetchAndProcessIntervalData(ticker, startDt, endDt, interval, False, self.dataDir)
+      df = self.indicators(raw, displayStart, ticker, interval)
+      if df is not None and not df.empty:
+        fig = self.chartUtils.createStockChartFigure(df, ticker, timeframe)
+      else:
+        fig = self.chartUtils.createErrorFigure(f"No/Bad {timeframe} Data: {ticker}")
+      fig.canvas.draw()
+      figures.append(fig)
+    for fig in self.figures:
+      sa.plt.close(fig)
+    self.figures = figures
+  #------------------------------------------------------------------------------------------------------------------------------
+  def currentFigures(self) -> List[Any]:
+    return self.figures
+  #------------------------------------------------------------------------------------------------------------------------------
+  def tkCounts(self) -> Dict[str, int]:
+    return {}
+  #------------------------------------------------------------------------------------------------------------------------------
+  def close(self):
+    for fig in self.figures:
+      self.sa.plt.close(fig)
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class GuiDriver:
+  """The app itself: the loading placeholders, processDataInBackground and handleDataForCharting of every switch in
+  the Tk thread, the window updated after each step. Charts rendered by worker processes (RASTER_CHARTS) are not
+  measured by the RSS of this process."""
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self):
+    import tkinter as tk
+    import stockAnalyzer
+    self.sa = stockAnalyzer
+    self.root = tk.Tk()
+    self.app = stockAnalyzer.StockAnalyzerApp(self.root)
+    while self.app.alertEngine is None: # the warmUp thread is done
+      self.root.update()
+      time.sleep(0.05)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def switch(self, ticker: str):
+    app = self.app
+    app.currentTicker.set(ticker)
+    app.updateUiForLoading(ticker)
+    self.root.update()
+    chartSizes = {chartType: app.chartSize(chartType) for chartType in ("Daily", "Weekly")}
+    app.handleDataForCharting(app.processDataInBackground(ticker, app.displayYearsVar.get(), '1d', chartSizes, app.selectedPanels()))
+    self.root.update()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def currentFigures(self) -> List[Any]:
+    return [fig for fig in (self.app.dailyFig, self.app.weeklyFig) if fig is not None]
+  #------------------------------------------------------------------------------------------------------------------------------
+  def tkCounts(self) -> Dict[str, int]:
+    widgets, pending = 0, [self.root]
+    while pending:
+      widget = pending.pop()
+      widgets += 1
+      pending.extend(widget.winfo_children())
+    return {'widgets': widgets, 'tclCommands': len(self.root.tk.splitlist(self.root.tk.call('info', 'commands')))}
+  #------------------------------------------------------------------------------------------------------------------------------
+  def close(self):
+    if self.sa.workerPool is not None:
+      self.sa.workerPool.shutdownPool()
+    self.root.destroy()
+#--------------------------------------------------------------------------------------------------------------------------------
+def takeSample(switches: int, started: float, driver: Any) -> Dict[str, float]:
+  import matplotlib.pyplot as plt
+  objects = liveObjects()
+  sample = {'switches': switches, 'seconds': time.perf_counter() - started, 'rssMb': rssMb(),
+            'pyplotFigures': len(plt.get_fignums()), 'figures': len(objects['figures']), 'dataFrames': len(objects['dataFrames'])}
+  sample.update(driver.tkCounts())
+  if tracemalloc.is_tracing():
+    sample['tracedMb'] = tracemalloc.get_traced_memory()[0] / 2**20
+  return sample
+#--------------------------------------------------------------------------------------------------------------------------------
+def formatSample(sample: Dict[str, float]) -> str:
+  text = (f"{sample['switches']:6d} switches {sample['seconds']:7.1f} s  rss {sample['rssMb']:7.1f} MB  figures {sample['figures']:3d}"
+          f" (pyplot {sample['pyplotFigures']})  dataFrames {sample['dataFrames']:5d}")
+  if 'widgets' in sample:
+    text += f"  widgets {sample['widgets']:4d}  tcl commands {sample['tclCommands']:5d}"
+  if 'tracedMb' in sample:
+    text += f"  traced {sample['tracedMb']:7.1f} MB"
+  return text
+#--------------------------------------------------------------------------------------------------------------------------------
+def printRetained(driver: Any):
+  """Referrer chains of the figures that are not shown anymore and a tally of the holders of the DataFrames."""
+  objects = liveObjects()
+  ignore = {id(objects), id(objects['figures']), id(objects['dataFrames'])}
+  current = {id(fig) for fig in driver.currentFigures()}
+  retained = [fig for fig in objects['figures'] if id(fig) not in current]
+  print(f"\nFigures alive but not shown: {len(retained)}")
+  for fig in retained[:5]:
+    print(f"  {referrerChain(fig, set(ignore))}")
+  holders: collections.Counter = collections.Counter()
+  for df in objects['dataFrames']:
+    holders[referrerChain(df, set(ignore), firstKey=False)] += 1
+  print(f"DataFrames alive: {len(objects['dataFrames'])}, by holder:")
+  for chain, count in holders.most_common(10):
+    print(f"  {count:5d}  {chain}")
+#--------------------------------------------------------------------------------------------------------------------------------
+def main(argv: Optional[List[str]] = None) -> int:
+  parser = argparse.ArgumentParser(description="Soak test of the chart path: memory growth over many ticker switches.")
+  parser.add_argument("--switches", type=int, default=2000)
+  parser.add_argument("--tickers", type=int, default=50, help="Distinct synthetic tickers the switches cycle through.")
+  parser.add_argument("--bars", type=int, default=1500, help="Daily bars per fixture.")
+  parser.add_argument("--sample", type=int, default=100, help="Sample every this many switches.")
+  parser.add_argument("--warmup", type=int, default=200, help="Switches before the baseline.")
+  parser.add_argument("--gui", action='store_true', help="Drive StockAnalyzerApp (needs a display).")
+  parser.add_argument("--max-rss-mb", type=float, default=64.0, help="Allowed RSS growth after the warmup.")
+  parser.add_argument("--max-objects", type=int, default=4, help="Allowed growth of figures, widgets and Tcl commands.")
+  parser.add_argument("--max-frames", type=int, default=100, help="Allowed growth of the DataFrames alive.")
+  parser.add_argument("--trace", type=int, default=100, help="Last switches traced by tracemalloc, 0: none.")
+  parser.add_argument("--top", type=int, default=15, help="Source lines listed of the traced allocations.")
+  parser.add_argument("--referrers", action='store_true', help="Show who holds the figures and DataFrames at the end.")
+  opt = parser.parse_args(argv)
+  opt.warmup = min(opt.warmup, opt.switches)
+  traceFrom = max(opt.warmup, opt.switches - opt.trace) if opt.trace > 0 else None
+
+  workDir = tempfile.mkdtemp(prefix='stockAnalyzerSoak')
+  fixtureDir = os.path.join(workDir, 'fixtures')
+  tickers = [f"{PREFIX}{i:04d}" for i in range(opt.tickers)]
+  devNull = open(os.devnull, 'w') # loader reports every file access
+  driver = None
+  samples: List[Dict[str, float]] = []
+  baseline, traceBaseline = None, None
+  try:
+    with contextlib.redirect_stdout(devNull):
+      createFixtures(fixtureDir, tickers, opt.bars)
+    loader.providerOverride = loader.ReplayProvider(fixtureDir)
+    driver = GuiDriver() if opt.gui else HeadlessDriver(os.path.join(workDir, 'data'))
+    started = time.perf_counter()
+    for n in range(1, opt.switches + 1):
+      with contextlib.redirect_stdout(devNull):
+        driver.switch(tickers[(n - 1) % len(tickers)])
+      if n in (opt.warmup, traceFrom, opt.switches) or n % opt.sample == 0:
+        samples.append(takeSample(n, started, driver))
+        print(formatSample(samples[-1]), flush=True)
+      if n == opt.warmup:
+        baseline = samples[-1]
+      if n == traceFrom:
+        tracemalloc.start()
+      elif traceFrom is not None and n == traceFrom + 1: # the figures shown now are replaced by the same amount later
+        traceBaseline = tracemalloc.take_snapshot().filter_traces(TRACE_FILTERS)
+    last = samples[-1]
+    if traceBaseline is not None:
+      print(f"\nAllocations grown from switch {traceFrom + 1} to {opt.switches}:")
+      for stat in tracemalloc.take_snapshot().filter_traces(TRACE_FILTERS).compare_to(traceBaseline, 'lineno')[:opt.top]:
+        print(f"  {stat}")
+    if opt.referrers:
+      printRetained(driver)
+  finally:
+    tracemalloc.stop()
+    if driver is not None:
+      driver.close()
+    loader.providerOverride = None
+    removeSoakFiles()
+    shutil.rmtree(workDir, ignore_errors=True)
+    devNull.close()
+
+  failures = []
+  growth = {key: last[key] - baseline[key] for key in last if key in baseline and key not in ('switches', 'seconds')}
+  # tracemalloc keeps memory of its own and fragments the heap, the RSS is judged on the switches before it started
+  untraced = [s for s in samples if opt.warmup <= s['switches'] and 'tracedMb' not in s]
+  growth['rssMb'] = untraced[-1]['rssMb'] - baseline['rssMb']
+  switches = untraced[-1]['switches'] - baseline['switches']
+  if switches > 0:
+    print(f"\nRSS growth from switch {baseline['switches']} to {untraced[-1]['switches']}: {growth['rssMb']:+.1f} MB"
+          f" ({growth['rssMb'] / switches * 1000:+.1f} MB per 1000 switches)")
+  if growth['rssMb'] > opt.max_rss_mb:
+    failures.append(f"RSS grew by {growth['rssMb']:.1f} MB > {opt.max_rss_mb:.0f} MB")
+  for key in ('figures', 'pyplotFigures', 'widgets', 'tclCommands'):
+    if growth.get(key, 0) > opt.max_objects:
+      failures.append(f"{key} grew by {growth[key]:.0f} > {opt.max_objects}")
+  if growth['dataFrames'] > opt.max_frames:
+    failures.append(f"dataFrames grew by {growth['dataFrames']:.0f} > {opt.max_frames}")
+  for failure in failures:
+    print(f"FAIL: {failure}")
+  if not failures:
+    print(f"OK: {last['switches']} switches within the thresholds.")
+  return 1 if failures else 0
+#----------------------------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,74 @@
+"""Startup timing: time-to-first-window, time-to-first-chart and the duration of the deferred heavy imports."""
+import json
+import os
+import sys
+import time
+import threading
+from typing import List, Dict, Any, Optional
+#--------------------------------------------------------------------------------------------------------------------------------
+def processStartTime() -> float:
+  """Start of the process in time.time() seconds, falls back to 'now' if the OS does not tell."""
+  try:
+    # linux: field 22 of /proc/self/stat is the start time in clock ticks after boot
+    with open('/proc/self/stat') as f:
+      startTicks = int(f.read().rsplit(')', 1)[1].split()[19])
+    with open('/proc/uptime') as f:
+      uptime = float(f.read().split()[0])
+    return time.time() - uptime + startTicks / os.sysconf('SC_CLK_TCK')
+  except Exception:
+    return time.time()
+#--------------------------------------------------------------------------------------------------------------------------------
+class Startup:
+  origin = processStartTime()
+  marks: List[Dict[str, Any]] = []
+  imports: Dict[str, float] = {}
+  lock = threading.Lock()
+  #----------------------------------------------------
+  @staticmethod
+  def elapsed() -> float:
+    return time.time() - Startup.origin
+  #----------------------------------------------------
+  @staticmethod
+  def mark(name: str):
+    """Records the first occurrence of an event, later ones are ignored."""
+    with Startup.lock:
+      if any(m['name'] == name for m in Startup.marks):
+        return
+      Startup.marks.append({'name': name, 'seconds': round(Startup.elapsed(), 4), 'thread': threading.current_thread().name})
+  #----------------------------------------------------
+  @staticmethod
+  def hasMark(name: str) -> bool:
+    return any(m['name'] == name for m in Startup.marks)
+  #----------------------------------------------------
+  @staticmethod
+  def timeImport(moduleName: str):
+    """Imports a module and records how long it took (0 if it was already imported)."""
+    start = time.perf_counter()
+    alreadyLoaded = moduleName in sys.modules
+    module = __import__(moduleName, fromlist=['*'])
+    with Startup.lock:
+      Startup.imports.setdefault(moduleName, 0.0 if alreadyLoaded else round(time.perf_counter() - start, 4))
+    return module
+  #----------------------------------------------------
+  @staticmethod
+  def report() -> Dict[str, Any]:
+    with Startup.lock:
+      return {'marks': list(Startup.marks), 'imports': dict(Startup.imports)}
+  #----------------------------------------------------
+  @staticmethod
+  def printReport():
+    report = Startup.report()
+    print("--- startup report (seconds since process start) ---")
+    for m in report['marks']:
+      print(f"{m['name']:<48}{m['seconds']:>8.3f}  [{m['thread']}]")
+    for name, seconds in report['imports'].items():
+      print(f"  import {name:<40}{seconds:>8.3f}")
+  #----------------------------------------------------
+  @staticmethod
+  def writeReport(filePath: Optional[str] = None) -> str:
+    if filePath is None:
+      filePath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'log', 'startup.json')
+    os.makedirs(os.path.dirname(filePath), exist_ok=True)
+    with open(filePath, 'w') as f:
+      json.dump(Startup.report(), f, indent=2)
+    return filePath
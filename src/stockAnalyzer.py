@@ -1,17 +1,48 @@
+from __future__ import annotations # type hints refer to the deferred modules below
+from startup import Startup
 import tkinter as tk
-from tkinter import ttk, messagebox, Listbox, Scrollbar, END
-import pandas as pd
+from tkinter import ttk, messagebox, END
 import datetime
-import mplfinance as mpf
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
-import matplotlib.pyplot as plt
 import threading
-from typing import List, Dict, Any, Optional, Tuple
+import time
+import concurrent.futures
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 import os 
 
-import loader
-import indicators
+import globalsSa
+import stockList
 import infoDisplay as info
+from watchlistView import WatchlistView
+#--------------------------------------------------------------------------------------------------------------------------------
+# pandas, matplotlib, mplfinance and the data modules (yfinance, curl_cffi) take a second or more to import.
+# They are imported by importHeavyModules() in a background thread after the window is shown.
+pd = mpf = plt = FigureCanvasTkAgg = NavigationToolbar2Tk = loader = indicators = indicatorCache = compactFrame = workerPool = None
+heavyModulesLoaded = threading.Event()
+heavyModulesLock = threading.Lock()
+CHART_INTERVALS = ['1d', '1h', '15m', '5m', '1m'] # left chart, everything below 1d comes from the intraday store
+INTRADAY_FETCH_DAYS = 29   # minute bars yahoo serves, older ones only come from the intraday store
+INTRADAY_DISPLAY_DAYS = 5
+ALERT_SCAN_MS = 60 * 1000  # the alert engine checks the cache files of the watchlist this often
+NEWS_REFRESH_MS = 1000     # new headlines of the shown ticker redraw the news of the info panel at most this often
+OPTIONAL_PANELS = {'Vwap': 'VWAP', 'Vola20': 'Vola', 'Atr': 'ATR', 'Adx': 'ADX', 'Obv': 'OBV'} # column -> label, Vwap is drawn on the price panel
+#--------------------------------------------------------------------------------------------------------------------------------
+def importHeavyModules():
+  global pd, mpf, plt, FigureCanvasTkAgg, NavigationToolbar2Tk, loader, indicators, indicatorCache, compactFrame, workerPool
+  with heavyModulesLock:
+    if heavyModulesLoaded.is_set():
+      return
+    pd = Startup.timeImport('pandas')
+    plt = Startup.timeImport('matplotlib.pyplot')
+    backendTkAgg = Startup.timeImport('matplotlib.backends.backend_tkagg')
+    FigureCanvasTkAgg, NavigationToolbar2Tk = backendTkAgg.FigureCanvasTkAgg, backendTkAgg.NavigationToolbar2Tk
+    mpf = Startup.timeImport('mplfinance')
+    indicators = Startup.timeImport('indicators')
+    loader = Startup.timeImport('loader')
+    indicatorCache = Startup.timeImport('indicatorCache')
+    compactFrame = Startup.timeImport('compactFrame')
+    workerPool = Startup.timeImport('workerPool')
+    Startup.mark('heavyImportsDone')
+    heavyModulesLoaded.set()
 #--------------------------------------------------------------------------------------------------------------------------------
 def calculateDateRanges(yearsToDisplay: int) -> Tuple[datetime.date, datetime.date, pd.Timestamp]:
   if not (1 <= yearsToDisplay <= 20): 
@@ -23,6 +54,40 @@ def calculateDateRanges(yearsToDisplay: int) -> Tuple[datetime.date, datetime.da
   displayStartDateTimestamp = pd.Timestamp(displayStartDate)
   return startDateForDataFetch, endDate, displayStartDateTimestamp
 #--------------------------------------------------------------------------------------------------------------------------------
+def calculateIndicators(dataFrame: pd.DataFrame, displayStartDateTs: pd.Timestamp, ticker: str, interval: str) -> Optional[pd.DataFrame]:
+  """Indicators of the whole frame, returns the displayed part. Runs in the GUI process or in a worker of workerPool."""
+  if dataFrame is None or dataFrame.empty:
+    return pd.DataFrame(columns=['Open', 'High', 'Low', 'Close', 'Volume'], index=pd.to_datetime([]))
+  df = dataFrame.copy(deep=False) # only the index may be replaced here, the data may be memory-mapped
+  if not isinstance(df.index, pd.DatetimeIndex):
+    try:
+      df.index = pd.to_datetime(df.index)
+    except Exception as e:
+      print(f"Index conversion error {ticker} ({interval}): {e}")
+      return pd.DataFrame(columns=df.columns, index=pd.to_datetime([]))
+  if df.index.tz is not None: 
+    df.index = df.index.tz_localize(None)
+  df = indicatorCache.calculate(df, ticker, interval) # only the bars added since the last call are computed
+  startTsN = displayStartDateTs.tz_localize(None) if df.index.tz is None and displayStartDateTs.tz is not None else displayStartDateTs
+  startTsN = startTsN.tz_convert(None) if hasattr(startTsN, 'tz') and startTsN.tz is not None else startTsN
+  df.sort_index(inplace=True)
+  try:
+    compTs = startTsN
+    if df.index.tz != getattr(startTsN, 'tz', None):
+      if df.index.tz is None and startTsN.tz is not None:
+        compTs = startTsN.tz_localize(None)
+      elif df.index.tz is not None and startTsN.tz is None:
+        compTs = pd.Timestamp(startTsN, tz=df.index.tz)
+      else:
+        compTs = startTsN.tz_convert(df.index.tz) if df.index.tz else startTsN
+    filteredDf = df[df.index >= compTs]
+    if filteredDf.empty:
+      print(f"Warning: Filtered DF empty {ticker} ({interval}) date {compTs}.")
+    return compactFrame.compact(filteredDf) if globalsSa.COMPACT_FRAMES else filteredDf
+  except Exception as eF:
+    print(f"Date filter error {ticker} ({interval}): {eF}")
+    return pd.DataFrame(columns=df.columns, index=pd.to_datetime([]))
+#--------------------------------------------------------------------------------------------------------------------------------
 #--------------------------------------------------------------------------------------------------------------------------------
 class ChartingUtils:
   #--------------------------------------------------------------------------------------------------------------------------------
@@ -124,7 +189,21 @@ class ChartingUtils:
       return True
     return False
   #--------------------------------------------------------------------------------------------------------------------------------
-  def configureIndicatorPlots(self, plotDf: pd.DataFrame, addPlots: List[Dict[str, Any]]) -> Tuple[List[int], int]:
+  def addOptionalPanelToPlot(self, plotDf: pd.DataFrame, addPlots: List[Dict[str, Any]], column: str, currentPanelId: int) -> bool:
+    """One of the OPTIONAL_PANELS, False if the column is missing or empty (Obv and Vwap of bars without volume)."""
+    if column not in plotDf.columns or plotDf[column].isnull().all():
+      return False
+    if column == 'Vwap':
+      addPlots.append(mpf.make_addplot(plotDf['Vwap'], panel=0, color='darkorange', width=0.8))
+      return False # no panel of its own
+    addPlots.append(mpf.make_addplot(plotDf[column], panel=currentPanelId, color='teal', ylabel=OPTIONAL_PANELS[column], width=0.8))
+    if column == 'Adx' and 'PlusDi' in plotDf.columns:
+      addPlots.append(mpf.make_addplot(plotDf['PlusDi'], panel=currentPanelId, color='green', width=0.6))
+      addPlots.append(mpf.make_addplot(plotDf['MinusDi'], panel=currentPanelId, color='red', width=0.6))
+    return True
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def configureIndicatorPlots(self, plotDf: pd.DataFrame, addPlots: List[Dict[str, Any]], panels: Sequence[str] = ()) -> Tuple[List[int], int]:
+    """Adds the indicator panels below price and volume, returns their panel ratios and the next free panel id."""
     self.macdPanelId, self.rsiPanelId, self.stochPanelId = -1, -1, -1
     nextIndicatorPanelId = 2
     indicatorPanelRatioValues: List[int] = []
@@ -135,16 +214,22 @@ class ChartingUtils:
       indicatorPanelRatioValues.append(1)
       nextIndicatorPanelId += 1
     if self.addMacdToPlot(plotDf, addPlots, nextIndicatorPanelId):
-      indicatorPanelRatioValues.append(nrOfAppends)
+      indicatorPanelRatioValues.append(3)
       self.macdPanelId = nextIndicatorPanelId
       nextIndicatorPanelId += 1
     if self.addRsiToPlot(plotDf, addPlots, nextIndicatorPanelId):
-      indicatorPanelRatioValues.append(nrOfAppends)
+      indicatorPanelRatioValues.append(3)
       self.rsiPanelId = nextIndicatorPanelId
       nextIndicatorPanelId += 1
     if self.addStochasticToPlot(plotDf, addPlots, nextIndicatorPanelId):
       indicatorPanelRatioValues.append(nrOfAppends)
       self.stochPanelId = nextIndicatorPanelId
+      nextIndicatorPanelId += 1
+    # after the fixed panels, so the axes indices used in createStockChartFigure stay the same
+    for column in OPTIONAL_PANELS:
+      if column in panels and self.addOptionalPanelToPlot(plotDf, addPlots, column, nextIndicatorPanelId):
+        indicatorPanelRatioValues.append(nrOfAppends)
+        nextIndicatorPanelId += 1
     return indicatorPanelRatioValues, nextIndicatorPanelId
   #--------------------------------------------------------------------------------------------------------------------------------
   def createMpfStyle(self) -> Dict:
@@ -160,7 +245,9 @@ class ChartingUtils:
                               chartTimeframe: str = 'Daily',
                               movingAverageWindows: Optional[Tuple[int, ...]] = (10, 20, 50, 100, 200),
                               rsiYlabelOverride: Optional[str] = None,
+                              panels: Optional[Sequence[str]] = None,
                               ) -> plt.Figure:
+    """panels: the OPTIONAL_PANELS to show, default globalsSa.INDICATOR_PANELS."""
     plotDf = self.preparePlotData(dataFrame, tickerSymbol, chartTimeframe)
     if plotDf is None:
       msg = f"Data prep failed for {tickerSymbol} ({chartTimeframe})"
@@ -176,10 +263,11 @@ class ChartingUtils:
 
     addPlots: List[Dict[str, Any]] = []
     self.addBollingerBandsToPlot(plotDf, addPlots)
-    self.configureIndicatorPlots(plotDf, addPlots)
-    finalPanelRatios = tuple([6, 1, 3, 3, 2])
+    panelRatios, _ = self.configureIndicatorPlots(plotDf, addPlots, globalsSa.INDICATOR_PANELS if panels is None else panels)
+    finalPanelRatios = tuple([6, 1] + panelRatios)
     mpfStyle = self.createMpfStyle()
     fig: Optional[plt.Figure] = None
+    figuresBefore = set(plt.get_fignums())
 
     try:
       fig, _ = mpf.plot(
@@ -208,6 +296,8 @@ class ChartingUtils:
       print(f"Error in mplfinance.plot for {tickerSymbol} ({chartTimeframe}): {e}")
       import traceback
       traceback.print_exc()
+      for number in set(plt.get_fignums()) - figuresBefore: # the figure of a failed plot stays registered with pyplot
+        plt.close(number)
       return self.createErrorFigure(f"Plotting error for {tickerSymbol} ({chartTimeframe}):\n{str(e)[:100]}")
 
     if fig is None:
@@ -225,12 +315,12 @@ class StockAnalyzerApp:
     self.root = root
     self.root.title("Stock Analyzer")
     self.root.minsize(1600, 900)
-    self.dataProvider = loader.getProvider()
-    self.indicatorCalc = indicators.Calculator()
+    self.dataProvider: Optional[loader.MarketDataProvider] = None # created on first use, may connect to IBKR
+    self.indicatorCalc: Optional[indicators.Calculator] = None
     self.chartUtils = ChartingUtils()
     self.companyInfoDisplay: Optional[info.CompanyInfoDisplay] = None
     self.currentTicker = tk.StringVar(value='AAPL')
-    self.stockList: List[str] = loader.loadStockListFromFile()
+    self.stockList: List[str] = stockList.loadStockListFromFile()
     self.dailyChartCanvas: Optional[FigureCanvasTkAgg] = None
     self.weeklyChartCanvas: Optional[FigureCanvasTkAgg] = None
     self.dailyFig: Optional[plt.Figure] = None
@@ -238,19 +328,68 @@ class StockAnalyzerApp:
     self.dailyToolbar: Optional[NavigationToolbar2Tk] = None
     self.weeklyToolbar: Optional[NavigationToolbar2Tk] = None
     self.displayYearsVar = tk.IntVar(value=2)
-    self.ibkrVar = tk.BooleanVar(value=False) if loader.globalsSa.HAS_IBKR else None
+    self.chartIntervalVar = tk.StringVar(value='1d')
+    self.ibkrVar = tk.BooleanVar(value=False) if globalsSa.HAS_IBKR else None
+    self.panelVars = {column: tk.BooleanVar(value=column in globalsSa.INDICATOR_PANELS) for column in OPTIONAL_PANELS}
+    self.alertEngine = None # created by warmUp
+    self.alerts: List[Any] = []
+    self.alertPanel = None
+    self.providerStatsView = None
+    self.fundamentalsRefresh: Optional[threading.Thread] = None
+    self.portfolioView = None
+    self.scannerView = None
+    self.newsFeed = None          # newsStore.NewsFeed, created by the first data load
+    self.newsTicker: Optional[str] = None
+    self.newsRefreshPending = False
+    self.livePump = None          # liveFeed.LiveUpdatePump of the --replay feed
+    self.liveReplay = None
+    self.liveFrameDue = 0.0       # time.perf_counter() the next live frame should start
+    self.liveStatusDue = 0.0
+    self.liveChartDue = 0.0
+    self.liveChartRunning = False
+    self.liveQuitAt: Optional[float] = None
+    self.warmedUp = False
+    self.warmUpLock = threading.Lock()
+    self.rasterJobs: Dict[str, Dict[str, Any]] = {}   # chart type -> render job of the shown image (RASTER_CHARTS)
+    self.rasterLabels: Dict[str, tk.Label] = {}
+    self.rasterResizeAfter: Dict[str, str] = {}
     self.setupUserInterface()
     self.updateTickerListBox()
 
     self.root.protocol("WM_DELETE_WINDOW", self.onClosingApp)
+    self.root.after(0, Startup.mark, 'firstWindow')
+    threading.Thread(target=self.warmUp, name='warmUp', daemon=True).start()
 
     if self.stockList:
-      self.tickerListBox.selection_set(0)
-      self.handleTickerSelect(None)
+      self.watchlistView.selectIndex(0)
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def warmUp(self):
+    """Background thread: does the heavy imports while the window is already visible.
+    The first data loads call it too, they wait under warmUpLock until the one warm-up is done."""
+    importHeavyModules()
+    with self.warmUpLock:
+      if self.warmedUp:
+        return
+      self.indicatorCalc = indicators.Calculator()
+      pool = self.getWorkerPool()
+      if pool is not None:
+        pool.prewarm() # the first ticker should not wait for the worker start
+      import alerts
+      self.alertEngine = alerts.AlertEngine(alerts.loadRules())
+      self.root.after(0, self.scheduleAlertScan)
+      self.warmedUp = True
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def getWorkerPool(self) -> Optional[workerPool.WorkerPool]:
+    return workerPool.getPool() if workerPool is not None else None
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def getDataProvider(self) -> loader.MarketDataProvider:
+    if self.dataProvider is None:
+      self.dataProvider = loader.getProvider()
+    return self.dataProvider
   #--------------------------------------------------------------------------------------------------------------------------------
-  def onClosingApp(self):
+  def onClosingApp(self, askUser: bool = True):
     """Handles the event of the main window closing."""
-    if messagebox.askokcancel("Quit", "Do you want to quit the application?"):
+    if not askUser or messagebox.askokcancel("Quit", "Do you want to quit the application?"):
       if self.dailyFig:
         try:
           plt.close(self.dailyFig)
@@ -263,6 +402,16 @@ class StockAnalyzerApp:
         except Exception as e_fig_w:
           print(f">>> onClosingApp: Error closing weeklyFig: {e_fig_w}")
         self.weeklyFig = None
+      if self.liveReplay is not None:
+        self.liveReplay.stop()
+        self.livePump.stop()
+      if self.newsFeed is not None:
+        try:
+          self.newsFeed.stop() # saves the headlines for the next start
+        except Exception as e_news:
+          print(f">>> onClosingApp: Error saving the news: {e_news}")
+      if workerPool is not None:
+        workerPool.shutdownPool()
       try:
         if self.root.winfo_exists(): # Check if window still exists
           self.root.destroy()
@@ -289,17 +438,28 @@ class StockAnalyzerApp:
     removeTickerButton = ttk.Button(watchlistFrame, text="Remove Selected", command=self.removeSelectedTicker)
     removeTickerButton.grid(row=row, column=0, sticky="ew", pady=(5,0))
     row += 1
+    gridViewButton = ttk.Button(watchlistFrame, text="Grid View", command=self.openGridView)
+    gridViewButton.grid(row=row, column=0, sticky="ew", pady=(2,0))
+    row += 1
+    crossSectionButton = ttk.Button(watchlistFrame, text="Correlation / RS", command=self.openCrossSection)
+    crossSectionButton.grid(row=row, column=0, sticky="ew", pady=(2,0))
+    row += 1
+    self.alertsButton = ttk.Button(watchlistFrame, text="Alerts", command=self.openAlertPanel)
+    self.alertsButton.grid(row=row, column=0, sticky="ew", pady=(2,0))
+    row += 1
+    providersButton = ttk.Button(watchlistFrame, text="Providers", command=self.openProviderStats)
+    providersButton.grid(row=row, column=0, sticky="ew", pady=(2,0))
+    row += 1
+    portfolioButton = ttk.Button(watchlistFrame, text="Portfolio", command=self.openPortfolio)
+    portfolioButton.grid(row=row, column=0, sticky="ew", pady=(2,0))
+    row += 1
+    scannerButton = ttk.Button(watchlistFrame, text="Scanner", command=self.openScanner)
+    scannerButton.grid(row=row, column=0, sticky="ew", pady=(2,5))
+    row += 1
     watchlistFrame.rowconfigure(row, weight=1)
-    listboxFrame = ttk.Frame(watchlistFrame)
-    listboxFrame.grid(row=row, column=0, sticky="nsew")
-    listboxFrame.rowconfigure(0, weight=1)
-    listboxFrame.columnconfigure(0, weight=1)
-    self.tickerListBox = Listbox(listboxFrame, selectmode=tk.SINGLE, exportselection=False, activestyle='none')
-    self.tickerListBox.grid(row=0, column=0, sticky="nsew")
-    self.tickerListBox.bind("<<ListboxSelect>>", self.handleTickerSelect)
-    listScrollbar = Scrollbar(listboxFrame, orient="vertical", command=self.tickerListBox.yview)
-    listScrollbar.grid(row=0, column=1, sticky="ns")
-    self.tickerListBox.config(yscrollcommand=listScrollbar.set)
+    # only the visible rows are drawn, with a search field and the last close, fair value, % change and RSI from the local files
+    self.watchlistView = WatchlistView(watchlistFrame, self.handleTickerSelect, self.fetchWatchlistValues)
+    self.watchlistView.grid(row=row, column=0, sticky="nsew")
     row += 1
     timePeriodFrame = ttk.Frame(watchlistFrame, padding=(0, 5, 0, 0))
     timePeriodFrame.grid(row=row, column=0, sticky="ew", pady=(10,0))
@@ -311,10 +471,21 @@ class StockAnalyzerApp:
     self.yearsEntry.bind("<Return>", lambda event: self.updateDisplayPeriodAndReload())
     updatePeriodButton = ttk.Button(timePeriodFrame, text="Update", command=self.updateDisplayPeriodAndReload, width=7)
     updatePeriodButton.grid(row=0, column=2, sticky="e")
+    # Row 1 in timePeriodFrame for the interval of the left chart
+    ttk.Label(timePeriodFrame, text="Interval:").grid(row=1, column=0, sticky="w", padx=(0,2), pady=(5,0))
+    self.intervalCombobox = ttk.Combobox(timePeriodFrame, textvariable=self.chartIntervalVar, values=CHART_INTERVALS, state="readonly", width=5)
+    self.intervalCombobox.grid(row=1, column=1, columnspan=2, sticky="ew", pady=(5,0))
+    self.intervalCombobox.bind("<<ComboboxSelected>>", lambda event: self.updateDisplayPeriodAndReload())
     if self.ibkrVar is not None:
-      # Row 1 in timePeriodFrame for IBKR Checkbutton
+      # Row 2 in timePeriodFrame for IBKR Checkbutton
       self.ibkrCheckbutton = ttk.Checkbutton(timePeriodFrame, text="IBKR", variable=self.ibkrVar)
-      self.ibkrCheckbutton.grid(row=1, column=0, columnspan=3, sticky="w", pady=(5,0))
+      self.ibkrCheckbutton.grid(row=2, column=0, columnspan=3, sticky="w", pady=(5,0))
+    # Row 3 in timePeriodFrame for the optional indicator panels
+    panelsFrame = ttk.Frame(timePeriodFrame)
+    panelsFrame.grid(row=3, column=0, columnspan=3, sticky="w", pady=(5,0))
+    for i, (column, label) in enumerate(OPTIONAL_PANELS.items()):
+      ttk.Checkbutton(panelsFrame, text=label, variable=self.panelVars[column],
+                      command=self.updateDisplayPeriodAndReload).grid(row=i // 3, column=i % 3, sticky="w")
 
     parentPane.add(watchlistFrame, weight=widthWatchlist)
   #------------------------------------------------------------------------------------------------------------------------------
@@ -322,6 +493,9 @@ class StockAnalyzerApp:
     """Checks if the IBKR checkbutton is currently selected."""
     return self.ibkrVar.get() if self.ibkrVar is not None else False
   #------------------------------------------------------------------------------------------------------------------------------
+  def selectedPanels(self) -> List[str]:
+    return [column for column, var in self.panelVars.items() if var.get()]
+  #------------------------------------------------------------------------------------------------------------------------------
   def setupContentAreaPanes(self, parentPane: ttk.PanedWindow):
     widthDaily         = 8
     widthWeeklyAndInfo = 6
@@ -347,7 +521,11 @@ class StockAnalyzerApp:
     years = self.displayYearsVar.get()
     yearsText = f"({years} Year{'s' if years != 1 else ''})"
     if hasattr(self, 'dailyChartFrameContainer') and self.dailyChartFrameContainer.winfo_exists():
-      self.dailyChartFrameContainer.config(text=f"Daily Chart {yearsText}")
+      interval = self.chartIntervalVar.get()
+      if interval == '1d':
+        self.dailyChartFrameContainer.config(text=f"Daily Chart {yearsText}")
+      else:
+        self.dailyChartFrameContainer.config(text=f"{interval} Chart ({INTRADAY_DISPLAY_DAYS} Days)")
     if hasattr(self, 'weeklyChartFrameContainer') and self.weeklyChartFrameContainer.winfo_exists():
       self.weeklyChartFrameContainer.config(text=f"Weekly Chart {yearsText}")
   #--------------------------------------------------------------------------------------------------------------------------------
@@ -371,9 +549,9 @@ class StockAnalyzerApp:
       self.displayYearsVar.set(2)
       return
     self.updateChartTitles()
-    selectedIndices = self.tickerListBox.curselection()
-    if selectedIndices:
-      self.loadStockData(self.tickerListBox.get(selectedIndices[0]))
+    selectedTicker = self.watchlistView.selection()
+    if selectedTicker:
+      self.loadStockData(selectedTicker)
     else:
       messagebox.showinfo("No selection", "Select a ticker from the watchlist to reload.")
   #------------------------------------------------------------------------------------------------------------------------------
@@ -386,34 +564,33 @@ class StockAnalyzerApp:
       messagebox.showinfo("Duplicate Ticker", f"{newTicker} is already in the watchlist.")
     else:
       self.stockList.append(newTicker)
-      self.stockList.sort()
-      self.updateTickerListBox()
-      loader.saveStockListToFile(self.stockList)
-      try:
-        idx = self.stockList.index(newTicker)
-        self.tickerListBox.selection_clear(0, END)
-        self.tickerListBox.selection_set(idx)
-        self.tickerListBox.see(idx)
-        self.handleTickerSelect(None)
-      except ValueError:
-        pass
+      stockList.addTicker(newTicker)
+      self.watchlistView.insert(newTicker)
+      self.watchlistView.select(newTicker)
     self.newTickerEntry.delete(0, END)
   #------------------------------------------------------------------------------------------------------------------------------
+  def addTickersToWatchlist(self, tickers: List[str]):
+    """Appends the tickers which are not in the watchlist yet, e.g. from the scanner."""
+    added = [t for t in dict.fromkeys(t.strip().upper() for t in tickers) if t and t not in self.stockList]
+    for ticker in added:
+      self.stockList.append(ticker)
+      stockList.addTicker(ticker)
+      self.watchlistView.insert(ticker)
+    self.statusBar.config(text=f"Added {len(added)} of {len(tickers)} tickers to the watchlist.")
+  #------------------------------------------------------------------------------------------------------------------------------
   def removeSelectedTicker(self):
-    selectedIndices = self.tickerListBox.curselection()
-    if not selectedIndices:
+    selectedTicker = self.watchlistView.selection()
+    if not selectedTicker:
       messagebox.showinfo("No selection", "Please select a ticker to remove.")
       return
-    selectedTicker = self.tickerListBox.get(selectedIndices[0])
     if not messagebox.askyesno("Confirm Removal", f"Remove {selectedTicker}?"):
       return
     if selectedTicker in self.stockList:
       self.stockList.remove(selectedTicker)
-      self.updateTickerListBox()
-      loader.saveStockListToFile(self.stockList)
+      stockList.removeTicker(selectedTicker)
+      self.watchlistView.remove(selectedTicker)
       if self.stockList:
-        self.tickerListBox.selection_set(0)
-        self.handleTickerSelect(None)
+        self.watchlistView.selectIndex(0)
       else:
         self.clearPreviousCharts()
         if self.companyInfoDisplay:
@@ -422,15 +599,201 @@ class StockAnalyzerApp:
         self.statusBar.config(text="Watchlist empty.")
   #--------------------------------------------------------------------------------------------------------------------------------
   def updateTickerListBox(self):
-    self.tickerListBox.delete(0, END)
-    for ticker in self.stockList: 
-      self.tickerListBox.insert(END, ticker)
-  #--------------------------------------------------------------------------------------------------------------------------------
-  def handleTickerSelect(self, event=None):
-    selectedIndices = self.tickerListBox.curselection()
-    if selectedIndices:
-      ticker = self.tickerListBox.get(selectedIndices[0])
-      if ticker != self.currentTicker.get() or not self.dailyFig or not self.weeklyFig :
+    self.watchlistView.setItems(self.stockList)
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def fetchWatchlistValues(self, tickers: List[str]) -> Dict[str, Tuple[float, float, float, float]]:
+    """Last close, % change, RSI and fair value of the watchlist rows, from the local files only. Runs in a background thread."""
+    self.warmUp()
+    import fundamentals
+    fairValues = fundamentals.cachedFairValues(tickers)
+    values = {}
+    for ticker, df in loader.loadRecentBars(tickers).items():
+      if len(df) < 2 or 'Close' not in df.columns:
+        continue
+      calc = indicators.Calculator().setDataframe(df[['Close']])
+      calc.addRsi()
+      close, previousClose = float(df['Close'].iloc[-1]), float(df['Close'].iloc[-2])
+      changePercent = (close / previousClose - 1) * 100 if previousClose else 0.0
+      values[ticker] = (close, changePercent, float(calc.get()['Rsi'].iloc[-1]), fairValues.get(ticker, float('nan')))
+    return values
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def refreshFundamentals(self):
+    """Consensus estimates of the watchlist from IBKR in a background thread, only tickers without recent ones are requested."""
+    if self.fundamentalsRefresh is not None and self.fundamentalsRefresh.is_alive():
+      return
+    import fundamentals
+    tickers = list(self.stockList)
+    def refresh():
+      try:
+        updated = fundamentals.refreshEstimates(tickers)
+      except Exception as e:
+        print(f"Error refreshing the consensus estimates: {e}")
+        return
+      if updated:
+        self.root.after(0, self.watchlistView.invalidateValues, updated)
+    self.fundamentalsRefresh = threading.Thread(target=refresh, name='fundamentals', daemon=True)
+    self.fundamentalsRefresh.start()
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def openGridView(self):
+    """Compact charts of the (filtered) watchlist in one figure, a click opens the ticker here."""
+    if not heavyModulesLoaded.is_set():
+      self.statusBar.config(text="Still loading modules, try again in a moment.")
+      return
+    import gridView
+    def openTicker(ticker: str):
+      self.watchlistView.select(ticker)
+      self.root.lift()
+    gridView.GridView(self.root, list(self.watchlistView.items), loader.loadRecentBars, openTicker)
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def openCrossSection(self):
+    """Correlation heatmap and relative strength of the watchlist vs. the S&P 500, from the daily files."""
+    if not heavyModulesLoaded.is_set():
+      self.statusBar.config(text="Still loading modules, try again in a moment.")
+      return
+    import crossSection
+    benchmark = crossSection.DEFAULT_BENCHMARK
+    def computeState(window: int):
+      frames = loader.loadRecentBars(self.stockList + [benchmark], nBars=2 * window + 10)
+      if benchmark not in frames: # the benchmark is not in the watchlist, fetch it once
+        endDt = datetime.date.today()
+        loader.fetchAndProcessIntervalData(benchmark, endDt - datetime.timedelta(days=365 * 2), endDt, '1d', False)
+        frames = loader.loadRecentBars(self.stockList + [benchmark], nBars=2 * window + 10)
+      if benchmark not in frames:
+        raise globalsSa.CustomError(f"No data for the benchmark {benchmark}")
+      return crossSection.updateCrossSection(frames, benchmark, window)
+    def openTicker(ticker: str):
+      self.watchlistView.select(ticker)
+      self.root.lift()
+    crossSection.CrossSectionView(self.root, computeState, openTicker)
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def scheduleAlertScan(self):
+    self.scanAlerts(list(self.stockList))
+    self.root.after(ALERT_SCAN_MS, self.scheduleAlertScan)
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def scanAlerts(self, tickers: List[str]):
+    """Evaluates the alert rules in a background thread for the tickers whose cache file changed."""
+    if self.alertEngine is None:
+      return
+    def scan():
+      newAlerts = self.alertEngine.scan(tickers)
+      if newAlerts:
+        self.root.after(0, self.showAlerts, newAlerts)
+    threading.Thread(target=scan, name='alertScan', daemon=True).start()
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def showAlerts(self, newAlerts: List[Any]):
+    import alerts
+    self.alerts = (self.alerts + newAlerts)[-alerts.MAX_ALERTS:]
+    self.alertsButton.config(text=f"Alerts ({len(self.alerts)})")
+    last = newAlerts[-1]
+    self.statusBar.config(text=f"Alert: {last.ticker} {last.rule} ({last.describe()})" + (f" and {len(newAlerts) - 1} more" if len(newAlerts) > 1 else ""))
+    if self.alertPanel is not None and self.alertPanel.exists():
+      self.alertPanel.addAlerts(newAlerts)
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def openAlertPanel(self):
+    if self.alertEngine is None:
+      self.statusBar.config(text="Still loading modules, try again in a moment.")
+      return
+    import alerts
+    if self.alertPanel is not None and self.alertPanel.exists():
+      self.alertPanel.window.lift()
+      return
+    def openTicker(ticker: str):
+      self.watchlistView.select(ticker)
+      self.root.lift()
+    def reloadRules():
+      self.alertEngine.setRules(alerts.loadRules())
+      self.scanAlerts(list(self.stockList))
+    self.alertPanel = alerts.AlertPanel(self.root, self.alerts, openTicker, reloadRules)
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def openProviderStats(self):
+    """Latency percentiles, error rates and circuit breakers of IBKR and Yahoo."""
+    if not heavyModulesLoaded.is_set():
+      self.statusBar.config(text="Still loading modules, try again in a moment.")
+      return
+    import hedgedProvider
+    if self.providerStatsView is not None and self.providerStatsView.exists():
+      self.providerStatsView.window.lift()
+      return
+    self.providerStatsView = hedgedProvider.ProviderStatsView(self.root)
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def openPortfolio(self):
+    """Positions, P&L and exposure of the IBKR account, kept up to date by the account updates."""
+    if not heavyModulesLoaded.is_set():
+      self.statusBar.config(text="Still loading modules, try again in a moment.")
+      return
+    if not globalsSa.HAS_IBKR:
+      self.statusBar.config(text="The portfolio needs the IBKR API (ibapi).")
+      return
+    if self.portfolioView is not None and self.portfolioView.exists():
+      self.portfolioView.window.lift()
+      return
+    import portfolio
+    table = portfolio.PositionTable()
+    def subscribe():
+      try:
+        import IbkrTws as ib
+        if not ib.isOpen():
+          ib.open()
+        ib.subscribePortfolio(table)
+      except Exception as e:
+        self.root.after(0, lambda: self.statusBar.config(text=f"Portfolio not available: {e}"))
+        return
+      self.root.after(0, self.showPortfolio, table)
+    self.statusBar.config(text="Subscribing to the account updates...")
+    threading.Thread(target=subscribe, name='portfolio', daemon=True).start()
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def showPortfolio(self, table: Any):
+    import portfolio
+    import IbkrTws as ib
+    self.statusBar.config(text=f"Portfolio: {len(table)} positions.")
+    self.portfolioView = portfolio.PortfolioView(self.root, table, onClose=ib.unsubscribePortfolio,
+                                                 refreshPrices=lambda: portfolio.applyCachedPrices(table))
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def openScanner(self):
+    """Streaming IBKR market scanner, new symbols can be prefetched and added to the watchlist."""
+    if not heavyModulesLoaded.is_set():
+      self.statusBar.config(text="Still loading modules, try again in a moment.")
+      return
+    if not globalsSa.HAS_IBKR:
+      self.statusBar.config(text="The scanner needs the IBKR API (ibapi).")
+      return
+    if self.scannerView is not None and self.scannerView.exists():
+      self.scannerView.window.lift()
+      return
+    def loadParameters():
+      try:
+        import IbkrTws as ib
+        import scanner
+        if not ib.isOpen():
+          ib.open()
+        parameters = scanner.loadScannerParameters()
+      except Exception as e:
+        self.root.after(0, lambda: self.statusBar.config(text=f"Scanner not available: {e}"))
+        return
+      self.root.after(0, self.showScanner, parameters)
+    self.statusBar.config(text="Loading the scanner parameters...")
+    threading.Thread(target=loadParameters, name='scanner', daemon=True).start()
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def showScanner(self, parameters: Any):
+    import scanner
+    import loader
+    prefetcher = loader.getPrefetcher()
+    prefetcher.useIbkr = self.isIbkrSelected()
+    self.statusBar.config(text="Scanner ready.")
+    self.scannerView = scanner.ScannerView(self.root, parameters, self.addTickersToWatchlist,
+                                           prefetch=lambda symbols: prefetcher.add(symbols, priority=1),
+                                           openTicker=self.showScannedTicker)
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def showScannedTicker(self, ticker: str):
+    if ticker not in self.stockList:
+      self.addTickersToWatchlist([ticker])
+    self.watchlistView.select(ticker)
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def handleTickerSelect(self, ticker: Optional[str] = None):
+    ticker = ticker or self.watchlistView.selection()
+    if ticker:
+      chartsShown = (self.dailyFig and self.weeklyFig) or len(self.rasterJobs) == 2
+      if ticker != self.currentTicker.get() or not chartsShown:
         self.currentTicker.set(ticker)
         self.loadStockData(ticker)
       else:
@@ -454,6 +817,7 @@ class StockAnalyzerApp:
         plt.close(fig)
       return None, None, None
 
+    self.rasterJobs, self.rasterLabels = {}, {}
     self.dailyFig, self.dailyChartCanvas, self.dailyToolbar = destroy_chart_elements(self.dailyChartCanvas, self.dailyFig, self.dailyToolbar)
     if hasattr(self, 'dailyChartFrameContainer') and self.dailyChartFrameContainer.winfo_exists():
       for w in self.dailyChartFrameContainer.winfo_children():
@@ -468,7 +832,7 @@ class StockAnalyzerApp:
         try:
           if w.winfo_exists():
             w.destroy()
-        except tk.Tcl.Error:
+        except tk.TclError:
           pass
   #------------------------------------------------------------------------------------------------------------------------------
   def displayError(self, message: str, ticker: str ="N/A"):
@@ -504,6 +868,57 @@ class StockAnalyzerApp:
     toolbar.pack(side=tk.BOTTOM, fill=tk.X)
     return fig, canvas, toolbar
   #--------------------------------------------------------------------------------------------------------------------------------
+  def chartContainer(self, chartType: str) -> ttk.LabelFrame:
+    return self.dailyChartFrameContainer if chartType == 'Daily' else self.weeklyChartFrameContainer
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def chartSize(self, chartType: str) -> Tuple[int, int]:
+    container = self.chartContainer(chartType)
+    width, height = container.winfo_width(), container.winfo_height()
+    return (width, height) if width >= 100 and height >= 100 else (1000, 700) # not mapped yet
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def displayRasterChart(self, image: bytes, job: Dict[str, Any], chartType: str):
+    """Shows a chart rendered by a worker (PPM), it is rendered again when the container changes its size."""
+    container = self.chartContainer(chartType)
+    for w in container.winfo_children():
+      try:
+        if w.winfo_exists():
+          w.destroy()
+      except tk.TclError:
+        pass
+    photo = tk.PhotoImage(data=image, format='ppm')
+    label = tk.Label(container, image=photo, width=1, height=1, anchor='nw', background='white', borderwidth=0) # size from the pane
+    label.image = photo
+    label.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+    label.bind("<Configure>", lambda event: self.scheduleRasterResize(chartType, event.width, event.height))
+    self.rasterJobs[chartType], self.rasterLabels[chartType] = job, label
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def scheduleRasterResize(self, chartType: str, width: int, height: int):
+    job = self.rasterJobs.get(chartType)
+    if job is None or (abs(width - job['width']) < 20 and abs(height - job['height']) < 20):
+      return
+    if self.rasterResizeAfter.get(chartType):
+      self.root.after_cancel(self.rasterResizeAfter[chartType])
+    self.rasterResizeAfter[chartType] = self.root.after(300, self.rerenderRasterChart, chartType, width, height)
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def rerenderRasterChart(self, chartType: str, width: int, height: int):
+    self.rasterResizeAfter[chartType] = None
+    if chartType not in self.rasterJobs:
+      return
+    job = self.rasterJobs[chartType] = dict(self.rasterJobs[chartType], width=width, height=height)
+    def render():
+      images = self.renderChartsInWorkers([job])
+      if images:
+        self.root.after(0, self.updateRasterChart, chartType, job, images[0])
+    threading.Thread(target=render, name='rasterResize', daemon=True).start()
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def updateRasterChart(self, chartType: str, job: Dict[str, Any], image: bytes):
+    label = self.rasterLabels.get(chartType)
+    if self.rasterJobs.get(chartType) is not job or label is None or not label.winfo_exists():
+      return # another ticker is shown by now
+    photo = tk.PhotoImage(data=image, format='ppm')
+    label.configure(image=photo)
+    label.image = photo
+  #--------------------------------------------------------------------------------------------------------------------------------
   def displayProcessedData(self, payload: Dict[str, Any]):
     if not self.root.winfo_exists():
       return
@@ -512,20 +927,43 @@ class StockAnalyzerApp:
     if err:
       self.displayError(err, ticker)
       return
-    self.dailyFig = self.chartUtils.createStockChartFigure(dataD, ticker, "Daily") if dataD is not None and not dataD.empty else self.chartUtils.createErrorFigure(f"No/Bad Daily Data: {ticker}")
+    timeframe = "Daily" if payload.get('interval', '1d') == '1d' else payload['interval']
+    images = payload.get('images')
+    if images:
+      self.displayRasterChart(images[0], payload['rasterJobs'][0], "Daily")
+      self.displayRasterChart(images[1], payload['rasterJobs'][1], "Weekly")
+    else:
+      self.displayFigures(dataD, dataW, ticker, timeframe, payload.get('panels'))
+    self.displayCompanyInfo(infoVal, ticker)
+    self.newsTicker = ticker
+    if self.livePump is not None:
+      self.livePump.setChartTicker(ticker)
+    if self.companyInfoDisplay and payload.get('headlines'):
+      self.companyInfoDisplay.showHeadlines(payload['headlines'])
+    if self.root.winfo_exists(): # Final check
+      self.statusBar.config(text=f"Displaying {ticker}")
+      self.updateChartTitles()
+      self.watchlistView.invalidateValues([ticker]) # the file may have new bars now
+      self.scanAlerts([ticker])
+    if not Startup.hasMark('firstChart'):
+      self.root.update_idletasks()
+      Startup.mark('firstChart')
+      Startup.printReport()
+      print(f"Startup report written to {Startup.writeReport()}")
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def displayFigures(self, dataD: pd.DataFrame, dataW: pd.DataFrame, ticker: str, timeframe: str, panels: Optional[List[str]] = None):
+    self.dailyFig = self.chartUtils.createStockChartFigure(dataD, ticker, timeframe, panels=panels) if dataD is not None and not dataD.empty else self.chartUtils.createErrorFigure(f"No/Bad {timeframe} Data: {ticker}")
     self.dailyFig, self.dailyChartCanvas, self.dailyToolbar = self.displaySingleChart(self.dailyFig, self.dailyChartFrameContainer, "Daily", ticker)
 
-    self.weeklyFig = self.chartUtils.createStockChartFigure(dataW, ticker, "Weekly") if dataW is not None and not dataW.empty else self.chartUtils.createErrorFigure(f"No/Bad Weekly Data: {ticker}")
+    self.weeklyFig = self.chartUtils.createStockChartFigure(dataW, ticker, "Weekly", panels=panels) if dataW is not None and not dataW.empty else self.chartUtils.createErrorFigure(f"No/Bad Weekly Data: {ticker}")
     self.weeklyFig, self.weeklyChartCanvas, self.weeklyToolbar = self.displaySingleChart(self.weeklyFig, self.weeklyChartFrameContainer, "Weekly", ticker)
-
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def displayCompanyInfo(self, infoVal: Any, ticker: str):
     if self.companyInfoDisplay:
       if infoVal:
         self.companyInfoDisplay.displayDetails(infoVal, ticker)
       else:
         self.companyInfoDisplay.showMessage(f"No company info for {ticker}.")
-    if self.root.winfo_exists(): # Final check
-      self.statusBar.config(text=f"Displaying {ticker}")
-      self.updateChartTitles()
   #------------------------------------------------------------------------------------------------------------------------------
   def handleDataForCharting(self, dataFromThread: Dict[str, Any]):
     if not self.root.winfo_exists():
@@ -550,59 +988,85 @@ class StockAnalyzerApp:
       self.statusBar.config(text=f"Ready. Last update: {self.currentTicker.get()}.")
   #--------------------------------------------------------------------------------------------------------------------------------
   def applyIndicatorsAndFilterData(self, dataFrame: pd.DataFrame, displayStartDateTs: pd.Timestamp, ticker: str, interval: str) -> Optional[pd.DataFrame]:
-    if dataFrame is None or dataFrame.empty:
-      return pd.DataFrame(columns=['Open', 'High', 'Low', 'Close', 'Volume'], index=pd.to_datetime([]))
-    df = dataFrame.copy()
-    if not isinstance(df.index, pd.DatetimeIndex):
+    key = None
+    if dataFrame is not None and not dataFrame.empty: # the processed frame stays valid while the bars do not change
+      key = ('indicators', ticker, interval, displayStartDateTs, len(dataFrame), dataFrame.index[-1], float(dataFrame['Close'].iloc[-1]))
+      cached = compactFrame.getManager().get(key)
+      if cached is not None:
+        return cached
+    result = None
+    pool = self.getWorkerPool()
+    if pool is not None and key is not None:
       try:
-        df.index = pd.to_datetime(df.index)
-      except Exception as e:
-        print(f"Index conversion error {ticker} ({interval}): {e}")
-        return pd.DataFrame(columns=df.columns, index=pd.to_datetime([]))
-    if df.index.tz is not None: 
-      df.index = df.index.tz_localize(None)
-    df = self.indicatorCalc.setDataframe(df).calculate().get()
-    startTsN = displayStartDateTs.tz_localize(None) if df.index.tz is None and displayStartDateTs.tz is not None else displayStartDateTs
-    startTsN = startTsN.tz_convert(None) if hasattr(startTsN, 'tz') and startTsN.tz is not None else startTsN
-    df.sort_index(inplace=True)
-    try:
-      compTs = startTsN
-      if df.index.tz != getattr(startTsN, 'tz', None):
-        if df.index.tz is None and startTsN.tz is not None:
-          compTs = startTsN.tz_localize(None)
-        elif df.index.tz is not None and startTsN.tz is None:
-          compTs = pd.Timestamp(startTsN, tz=df.index.tz)
-        else:
-          compTs = startTsN.tz_convert(df.index.tz) if df.index.tz else startTsN
-      filteredDf = df[df.index >= compTs]
-      if filteredDf.empty:
-        print(f"Warning: Filtered DF empty {ticker} ({interval}) date {compTs}.")
-      return filteredDf
-    except Exception as eF:
-      print(f"Date filter error {ticker} ({interval}): {eF}")
-      return pd.DataFrame(columns=df.columns, index=pd.to_datetime([]))
+        result = pool.calculate(dataFrame, displayStartDateTs, ticker, interval)
+      except concurrent.futures.process.BrokenProcessPool as e:
+        workerPool.disablePool(e)
+    if result is None:
+      result = calculateIndicators(dataFrame, displayStartDateTs, ticker, interval)
+    if key is not None and result is not None and not result.empty:
+      compactFrame.getManager().put(key, result)
+    return result
   #------------------------------------------------------------------------------------------------------------------------------
-  def fetchAndProcessIntervalData(self, ticker: str, startDt: datetime.date, endDt: datetime.date, dispStartTs: pd.Timestamp, interval: str) -> Optional[pd.DataFrame]:
-    finalDf = loader.fetchAndProcessIntervalData(ticker, startDt, endDt, interval, self.isIbkrSelected())
-    return self.applyIndicatorsAndFilterData(finalDf, dispStartTs, ticker, interval)
+  def fetchRawData(self, ticker: str, interval: str, startDt: datetime.date, endDt: datetime.date, dispStartTs: pd.Timestamp) -> Tuple[Optional[pd.DataFrame], pd.Timestamp]:
+    """Bars without indicators and the start of the displayed part."""
+    if interval in ('1d', '1wk'):
+      return loader.fetchAndProcessIntervalData(ticker, startDt, endDt, interval, self.isIbkrSelected()), dispStartTs
+    # the days before the displayed ones are the warm up of the indicators
+    finalDf = loader.fetchIntradayData(ticker, interval, INTRADAY_FETCH_DAYS)
+    return finalDf, pd.Timestamp(datetime.date.today() - datetime.timedelta(days=INTRADAY_DISPLAY_DAYS))
   #------------------------------------------------------------------------------------------------------------------------------
-  def processDataInBackground(self, ticker: str, years: int) -> Dict[str, Any]:
+  def renderChartsInWorkers(self, jobs: List[Dict[str, Any]]) -> Optional[List[bytes]]:
+    pool = self.getWorkerPool()
+    if pool is None:
+      return None
+    try:
+      return pool.renderCharts(jobs)
+    except concurrent.futures.process.BrokenProcessPool as e:
+      workerPool.disablePool(e)
+      return None
+    except Exception as e:
+      print(f"Rendering in the worker pool failed, rendering in the GUI process: {e}")
+      return None
+  #------------------------------------------------------------------------------------------------------------------------------
+  def processDataInBackground(self, ticker: str, years: int, interval: str = '1d', chartSizes: Optional[Dict[str, Tuple[int, int]]] = None,
+                              panels: Optional[List[str]] = None) -> Dict[str, Any]:
+    self.warmUp()
     try:
       startDt, endDt, dispStartTs = calculateDateRanges(years)
-      dailyDf = self.fetchAndProcessIntervalData(ticker, startDt, endDt, dispStartTs, '1d')
-      weeklyDf = self.fetchAndProcessIntervalData(ticker, startDt, endDt, dispStartTs, '1wk')
+      dailyRaw, dailyStartTs = self.fetchRawData(ticker, interval, startDt, endDt, dispStartTs)
+      weeklyRaw, weeklyStartTs = self.fetchRawData(ticker, '1wk', startDt, endDt, dispStartTs)
+      images, jobs = None, None
+      if globalsSa.RASTER_CHARTS and chartSizes:
+        # indicators and charts in the worker processes, only the images come back
+        emptyDf = pd.DataFrame(columns=['Open', 'High', 'Low', 'Close', 'Volume'], index=pd.to_datetime([]))
+        jobs = [dict(df=dailyRaw if dailyRaw is not None else emptyDf, displayStart=dailyStartTs, ticker=ticker, interval=interval,
+                     timeframe="Daily" if interval == '1d' else interval, width=chartSizes['Daily'][0], height=chartSizes['Daily'][1], panels=panels),
+                dict(df=weeklyRaw if weeklyRaw is not None else emptyDf, displayStart=weeklyStartTs, ticker=ticker, interval='1wk',
+                     timeframe="Weekly", width=chartSizes['Weekly'][0], height=chartSizes['Weekly'][1], panels=panels)]
+        images = self.renderChartsInWorkers(jobs)
+      if images is not None:
+        dailyDf, weeklyDf = dailyRaw, weeklyRaw # only for the checks below
+      else:
+        dailyDf = self.applyIndicatorsAndFilterData(dailyRaw, dailyStartTs, ticker, interval)
+        weeklyDf = self.applyIndicatorsAndFilterData(weeklyRaw, weeklyStartTs, ticker, '1wk')
       infoVal = ""
       try:
-        infoVal = self.dataProvider.getCompanyInfo(ticker)
+        infoVal = self.getDataProvider().getCompanyInfo(ticker)
       except Exception as e_info:
         print(f"Error fetching company info for {ticker}: {e_info}")
         infoVal = {"error": f"Failed to fetch company info: {e_info}"}  
       if isinstance(infoVal, dict) and infoVal.get("error"):
         print(f"Company info error {ticker}: {infoVal.get('error')}")
+      elif isinstance(infoVal, dict):
+        self.addFairValue(infoVal, ticker)
+      if self.isIbkrSelected():
+        self.refreshFundamentals()
+      headlines = self.watchNews(ticker)
       payload: Dict[str, Any] = {
         'daily_data': dailyDf if dailyDf is not None else pd.DataFrame(),
         'weekly_data': weeklyDf if weeklyDf is not None else pd.DataFrame(),
-        'company_info': infoVal, 'ticker': ticker, 'error': None
+        'company_info': infoVal, 'ticker': ticker, 'interval': interval, 'error': None,
+        'images': images, 'rasterJobs': jobs, 'panels': panels, 'headlines': headlines
       }
       if payload['daily_data'].empty and payload['weekly_data'].empty:
         errMsg = f"No chart data for {ticker}."
@@ -625,13 +1089,184 @@ class StockAnalyzerApp:
         'error': f"Crit err processing {ticker}: {e}"
       }
   #------------------------------------------------------------------------------------------------------------------------------
+  def addFairValue(self, infoVal: Dict[str, Any], ticker: str):
+    """Fair value of the cached consensus estimates and its distance to the price, shown by the info panel."""
+    import fundamentals
+    fairValue = fundamentals.cachedFairValues([ticker]).get(ticker)
+    if fairValue is None:
+      return
+    infoVal['consensusFairValue'] = fairValue
+    price = infoVal.get('currentPrice') or infoVal.get('regularMarketPrice')
+    if isinstance(price, (int, float)) and price > 0:
+      infoVal['consensusUpside'] = (fairValue / price - 1) * 100
+  #------------------------------------------------------------------------------------------------------------------------------
+  def watchNews(self, ticker: str) -> List[str]:
+    """Newest headlines of the ticker in the news store, with IBKR it is subscribed to the news of the ticker too."""
+    import newsStore
+    try:
+      feed = newsStore.getNewsFeed() # the first call loads the headlines of the last session
+      if feed.store.onHeadline is None:
+        feed.store.onHeadline = self.onHeadline
+      self.newsFeed = feed
+      if self.isIbkrSelected():
+        import IbkrTws as ib
+        if ib.isOpen():
+          feed.watch(ticker)
+      return [newsStore.formatHeadline(h) for h in feed.store.latest(ticker, newsStore.NEWS_HEADLINES)]
+    except Exception as e:
+      print(f"News of {ticker} not available: {e}")
+      return []
+  #------------------------------------------------------------------------------------------------------------------------------
+  def onHeadline(self, headline: Any):
+    # IBKR thread, the UI is updated once for a burst of headlines
+    if self.newsTicker in headline.tickers and not self.newsRefreshPending:
+      self.newsRefreshPending = True
+      self.root.after(NEWS_REFRESH_MS, self.refreshHeadlines)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def refreshHeadlines(self):
+    self.newsRefreshPending = False
+    if self.newsFeed is None or not self.companyInfoDisplay or self.newsTicker != self.currentTicker.get():
+      return # another ticker is loading
+    import newsStore
+    headlines = self.newsFeed.store.latest(self.newsTicker, newsStore.NEWS_HEADLINES)
+    self.companyInfoDisplay.showHeadlines([newsStore.formatHeadline(h) for h in headlines])
+  #------------------------------------------------------------------------------------------------------------------------------
+  # live updates (marketReplay.py feeds liveFeed.LiveUpdatePump)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def startReplay(self, speed: float, interval: str, seconds: Optional[float] = None):
+    """Replays the cached bars of the watchlist as a live feed, after seconds the metrics are printed and the app quits."""
+    self.statusBar.config(text=f"Loading the {interval} bars of the watchlist for the replay...")
+    def load():
+      importHeavyModules()
+      import alerts
+      import liveFeed
+      import marketReplay
+      try:
+        frames = marketReplay.loadFrames(list(self.stockList), interval, marketReplay.HISTORY_BARS + marketReplay.REPLAY_BARS)
+        if not frames:
+          raise globalsSa.CustomError(f"No cached {interval} bars of the watchlist.")
+        # an engine of its own: the alerts of the replay are shown, not logged
+        pump = liveFeed.LiveUpdatePump(interval, alerts.AlertEngine(alerts.loadRules(), interval), cacheInterval=marketReplay.cacheInterval(interval))
+        replay = marketReplay.MarketReplay(frames, pump, speed, interval=interval)
+      except Exception as e:
+        print(f"Replay not possible: {e}")
+        self.root.after(0, lambda: self.statusBar.config(text=f"Replay not possible: {e}"))
+        return
+      self.root.after(0, self.startLiveUpdates, pump, replay, seconds)
+    threading.Thread(target=load, name='replayLoad', daemon=True).start()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def startLiveUpdates(self, pump: Any, replay: Any, seconds: Optional[float] = None):
+    import liveFeed
+    self.livePump, self.liveReplay = pump, replay
+    pump.setChartTicker(self.currentTicker.get())
+    pump.metrics = liveFeed.LiveMetrics() # the warmup is not measured
+    pump.start()
+    replay.start()
+    now = time.perf_counter()
+    self.liveQuitAt = now + seconds if seconds is not None else None
+    self.liveFrameDue = now + liveFeed.FRAME_MS / 1000
+    self.root.after(liveFeed.FRAME_MS, self.liveFrame)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def liveFrame(self):
+    """One frame: repaints the changed rows of the watchlist, shows new alerts and starts a chart refresh if one is due."""
+    import liveFeed
+    pump = self.livePump
+    started = time.perf_counter()
+    changes, newAlerts = pump.takeChanges()
+    if changes:
+      self.watchlistView.updateLiveValues({ticker: values for ticker, (values, _) in changes.items()})
+    if newAlerts:
+      self.showAlerts(newAlerts)
+    self.refreshLiveChart()
+    self.root.update_idletasks() # the repaint, the latencies end here
+    done = time.perf_counter()
+    pump.metrics.frame(started - self.liveFrameDue, done - started, pump.queueDepth(), len(changes),
+                       [done - sentAt for _, sentAt in changes.values()])
+    if done >= self.liveStatusDue:
+      self.liveStatusDue = done + 1.0
+      self.statusBar.config(text=pump.metrics.statusLine())
+    finished = self.liveReplay.finished.is_set() and pump.idle() and not self.liveChartRunning
+    if finished or (self.liveQuitAt is not None and done >= self.liveQuitAt):
+      self.stopLiveUpdates()
+      return
+    self.liveFrameDue = max(self.liveFrameDue + liveFeed.FRAME_MS / 1000, done) # a late frame is not made up by a burst
+    self.root.after(max(1, int((self.liveFrameDue - time.perf_counter()) * 1000)), self.liveFrame)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def stopLiveUpdates(self):
+    self.liveReplay.stop()
+    self.livePump.stop()
+    print(f"Replay: {self.liveReplay.barsSent} bars{' (complete)' if self.liveReplay.finished.is_set() else ''}")
+    print(self.livePump.metrics.format())
+    self.statusBar.config(text="Replay done. " + self.livePump.metrics.statusLine())
+    if self.liveQuitAt is not None:
+      self.onClosingApp(askUser=False)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def refreshLiveChart(self):
+    """Recomputes the chart of the shown ticker with the new bars in a background thread, one at a time and at most every
+    liveFeed.CHART_REFRESH_MS. The indicators of the bars before are reused from the indicator cache."""
+    import liveFeed
+    now = time.perf_counter()
+    if self.liveChartRunning or now < self.liveChartDue:
+      return
+    chart = self.livePump.takeChartFrame()
+    if chart is None:
+      return
+    ticker, frame, sentAt = chart
+    if ticker != self.currentTicker.get():
+      return
+    self.liveChartRunning, self.liveChartDue = True, now + liveFeed.CHART_REFRESH_MS / 1000
+    interval = self.livePump.cacheInterval
+    displayStart = frame.index[-min(len(frame), liveFeed.LIVE_CHART_BARS)]
+    job = None
+    if globalsSa.RASTER_CHARTS and 'Daily' in self.rasterJobs:
+      width, height = self.chartSize('Daily')
+      job = dict(self.rasterJobs['Daily'], df=frame, displayStart=displayStart, interval=interval, width=width, height=height)
+    def compute():
+      df, image = None, None
+      try:
+        if job is not None:
+          images = self.renderChartsInWorkers([job])
+          image = images[0] if images else None
+        if image is None:
+          df = calculateIndicators(frame, displayStart, ticker, interval)
+      except Exception as e:
+        print(f"Live chart of {ticker} failed: {e}")
+      self.root.after(0, self.showLiveChart, ticker, df, job, image, sentAt)
+    threading.Thread(target=compute, name='liveChart', daemon=True).start()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def showLiveChart(self, ticker: str, df: Optional[pd.DataFrame], job: Optional[Dict[str, Any]], image: Optional[bytes], sentAt: float):
+    self.liveChartRunning = False
+    if ticker != self.currentTicker.get() or not self.root.winfo_exists():
+      return
+    if image is not None:
+      self.rasterJobs['Daily'] = job
+      self.updateRasterChart('Daily', job, image)
+    elif df is not None and not df.empty:
+      oldFig = self.dailyFig
+      fig = self.chartUtils.createStockChartFigure(df, ticker, f"Replay {self.livePump.interval}", panels=self.selectedPanels())
+      self.rasterJobs.pop('Daily', None)
+      self.dailyFig, self.dailyChartCanvas, self.dailyToolbar = self.displaySingleChart(fig, self.dailyChartFrameContainer, "Daily", ticker)
+      if oldFig is not None and oldFig is not self.dailyFig:
+        plt.close(oldFig) # the canvas of the old figure was destroyed by displaySingleChart
+    else:
+      return
+    self.root.update_idletasks()
+    self.livePump.metrics.chart(time.perf_counter() - sentAt)
+  #------------------------------------------------------------------------------------------------------------------------------
   def updateUiForLoading(self, ticker: str):
     if not self.root.winfo_exists(): return
-    self.clearPreviousCharts()
     if self.companyInfoDisplay:
       self.companyInfoDisplay.showLoadingMessage(ticker)
     self.statusBar.config(text=f"Loading {ticker}...")
     self.root.config(cursor="watch")
+    if globalsSa.RASTER_CHARTS and globalsSa.WORKER_POOL:
+      self.clearPreviousCharts() # placeholders without matplotlib, the Tk thread stays free
+      for chartType in ("Daily", "Weekly"):
+        ttk.Label(self.chartContainer(chartType), text=f"Loading {chartType}: {ticker}...", anchor='center').pack(fill=tk.BOTH, expand=True)
+      return
+    if not heavyModulesLoaded.is_set():
+      return # no matplotlib yet for the placeholder charts, the background thread finishes the imports first
+    self.clearPreviousCharts()
     loadFigD = self.chartUtils.createErrorFigure(f"Loading Daily: {ticker}...")
     self.dailyFig, self.dailyChartCanvas, self.dailyToolbar = self.displaySingleChart(loadFigD, self.dailyChartFrameContainer, "Daily", ticker)
     loadFigW = self.chartUtils.createErrorFigure(f"Loading Weekly: {ticker}...")
@@ -640,22 +1275,42 @@ class StockAnalyzerApp:
   def loadStockData(self, ticker: Optional[str] = None):
     if not self.root.winfo_exists(): return
     if ticker is None:
-      selIdx = self.tickerListBox.curselection()
-      if not selIdx:
+      ticker = self.watchlistView.selection()
+      if not ticker:
         self.statusBar.config(text="No ticker selected.")
         return
-      ticker = self.tickerListBox.get(selIdx[0])
     self.currentTicker.set(ticker)
     self.updateUiForLoading(ticker)
     yearsVal = self.displayYearsVar.get()
     if not (1 <= yearsVal <= 20):
       yearsVal = 2
       self.displayYearsVar.set(2)
-    threading.Thread(target=lambda: self.root.after(0, self.handleDataForCharting, self.processDataInBackground(ticker, yearsVal)), daemon=True).start()
+    intervalVal = self.chartIntervalVar.get()
+    chartSizes = {chartType: self.chartSize(chartType) for chartType in ("Daily", "Weekly")}
+    panels = self.selectedPanels()
+    threading.Thread(target=lambda: self.root.after(0, self.handleDataForCharting, self.processDataInBackground(ticker, yearsVal, intervalVal, chartSizes, panels)), daemon=True).start()
 #----------------------------------------------------------------------------------------------------------------------
 if __name__ == "__main__":
+  import argparse
+  parser = argparse.ArgumentParser(description="Stock Analyzer")
+  parser.add_argument("--startup-report", action='store_true', help="Quit after the first chart is shown (for measuring the startup).")
+  parser.add_argument("--replay", type=float, default=None, metavar='SPEED',
+                      help="Replay the cached bars of the watchlist as a live feed, SPEED times real time (1 to 1000, 0: as fast as possible).")
+  parser.add_argument("--replay-interval", default='1d', help="1d, 1wk or an intraday interval of the intraday store (1m, 5m, ...).")
+  parser.add_argument("--replay-seconds", type=float, default=None, help="Quit after this many seconds of replay, the metrics are printed.")
+  opt = parser.parse_args()
+  if opt.replay is not None and not (opt.replay == 0 or 1 <= opt.replay <= 1000):
+    parser.error("--replay must be 0 or between 1 and 1000")
   root = tk.Tk()
   app = StockAnalyzerApp(root)
+  if opt.replay is not None:
+    root.after(0, app.startReplay, opt.replay, opt.replay_interval, opt.replay_seconds)
+  if opt.startup_report:
+    def quitAfterFirstChart():
+      if Startup.hasMark('firstChart'):
+        app.onClosingApp(askUser=False)
+      root.after(100, quitAfterFirstChart)
+    root.after(100, quitAfterFirstChart)
   try:
     root.mainloop()
   except Exception as e_mainloop:
@@ -0,0 +1,85 @@
+"""Watchlist file handling. Kept free of pandas & co. so the GUI can show the watchlist before the heavy imports are done.
+
+The list is kept in listStocks (one ticker per line) plus the journal listStocks.journal, to which
+single edits are appended as '+TICKER' / '-TICKER'. When the journal grows beyond COMPACT_BYTES it is
+merged into listStocks. Replaying an edit twice does not change the result, so a crash between
+writing listStocks and deleting the journal does no harm. Other processes editing the list are serialized
+by atomicIo.fileLock() of listStocks, listStocks itself is replaced atomically.
+"""
+import os
+from typing import List
+
+import atomicIo
+#--------------------------------------------------------------------------------------------------------------------------------
+JOURNAL_SUFFIX = ".journal"
+COMPACT_BYTES = 16 * 1024
+#--------------------------------------------------------------------------------------------------------------------------------
+def stockListPath(filename: str = "listStocks") -> str:
+  scriptDir = os.path.dirname(os.path.abspath(__file__))
+  return os.path.join(scriptDir, filename)
+#--------------------------------------------------------------------------------------------------------------------------------
+def loadStockListFromFile(filename: str = "listStocks") -> List[str]:
+  defaultStocks = ['AAPL', 'MSFT', 'GOOGL', 'AMZN', 'TSLA', 'NVDA', 'VOW.DE', 'META', 'JPM', 'BTC-USD', 'ETH-USD']
+  filePath = stockListPath(filename)
+  stocks = None
+  try:
+    with open(filePath, 'r') as f:
+      stocks = [line.strip() for line in f if line.strip()]
+  except FileNotFoundError:
+    pass
+  except Exception as e:
+    print(f"Error reading stock file '{filePath}': {e}. Using default stocks.")
+    return defaultStocks
+  stocks = replayJournal(stocks or [], filename)
+  if not stocks:
+    print(f"Warning: Stock file '{filePath}' is empty or not found. Using default stocks and creating file.")
+    saveStockListToFile(defaultStocks, filename)
+    return defaultStocks
+  return stocks
+#--------------------------------------------------------------------------------------------------------------------------------
+def replayJournal(stocks: List[str], filename: str = "listStocks") -> List[str]:
+  journalPath = stockListPath(filename) + JOURNAL_SUFFIX
+  if not os.path.exists(journalPath):
+    return stocks
+  present = dict.fromkeys(stocks) # keeps the order
+  with open(journalPath, 'r') as f:
+    for line in f:
+      line = line.strip()
+      if line.startswith('+'):
+        present[line[1:]] = None
+      elif line.startswith('-'):
+        present.pop(line[1:], None)
+  return list(present)
+#--------------------------------------------------------------------------------------------------------------------------------
+def appendToJournal(operation: str, ticker: str, filename: str = "listStocks"):
+  journalPath = stockListPath(filename) + JOURNAL_SUFFIX
+  try:
+    with atomicIo.fileLock(stockListPath(filename)), open(journalPath, 'a') as f:
+      f.write(f"{operation}{ticker}\n")
+  except Exception as e:
+    print(f"Error writing stock journal '{journalPath}': {e}")
+    return
+  if os.path.getsize(journalPath) > COMPACT_BYTES:
+    compactStockList(filename)
+#--------------------------------------------------------------------------------------------------------------------------------
+def addTicker(ticker: str, filename: str = "listStocks"):
+  appendToJournal('+', ticker, filename)
+#--------------------------------------------------------------------------------------------------------------------------------
+def removeTicker(ticker: str, filename: str = "listStocks"):
+  appendToJournal('-', ticker, filename)
+#--------------------------------------------------------------------------------------------------------------------------------
+def compactStockList(filename: str = "listStocks"):
+  """Merges the journal into the stock file."""
+  with atomicIo.fileLock(stockListPath(filename)): # no edit may be appended between reading and removing the journal
+    saveStockListToFile(loadStockListFromFile(filename), filename)
+#--------------------------------------------------------------------------------------------------------------------------------
+def saveStockListToFile(tickers, filename: str = "listStocks"):
+  filePath = stockListPath(filename)
+  try:
+    with atomicIo.fileLock(filePath):
+      atomicIo.writeText(filePath, ''.join(f"{ticker}\n" for ticker in tickers))
+      if os.path.exists(filePath + JOURNAL_SUFFIX):
+        os.remove(filePath + JOURNAL_SUFFIX)
+    print(f"Stocklist saved to '{filePath}'.")
+  except Exception as e:
+    print(f"Error saving stocklist to '{filePath}': {e}")
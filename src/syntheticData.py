@@ -0,0 +1,37 @@
+"""Synthetic market data for benchmarks, load tests and the fake TWS server. Needs no network."""
+import numpy as np
+import pandas as pd
+#--------------------------------------------------------------------------------------------------------------------------------
+def generateOhlcv(nBars: int,
+                  seed: int = 0,
+                  startDate: str = '2000-01-03',
+                  startPrice: float = 50.0,
+                  annualVola: float = 0.3,
+                  gapProbability: float = 0.02,
+                  holidayProbability: float = 0.015,
+                  splitProbability: float = 0.0005,
+                  ) -> pd.DataFrame:
+  """Creates a synthetic daily OHLCV series.
+  Geometric random walk on business days (no weekends) with randomly dropped days (holidays),
+  overnight gaps and stock splits (prices divided, volume multiplied by the split ratio).
+  """
+  rng = np.random.default_rng(seed)
+  # draw some more business days than needed, holidays are removed afterwards
+  dates = pd.bdate_range(start=startDate, periods=int(nBars * (1 + holidayProbability) * 1.1) + 10)
+  dates = dates[rng.random(len(dates)) >= holidayProbability][:nBars]
+  n = len(dates)
+  dailyVola = annualVola / np.sqrt(252)
+  logReturns = rng.normal(0.0002, dailyVola, n)
+  gaps = np.where(rng.random(n) < gapProbability, rng.normal(0, 4 * dailyVola, n), 0.0)
+  splitRatios = np.where(rng.random(n) < splitProbability, rng.choice([2.0, 3.0, 4.0], n), 1.0)
+  splitRatios[0] = 1.0
+  # price level including the splits: after a split all prices are divided by the ratio
+  closes = startPrice * np.exp(np.cumsum(logReturns + gaps)) / np.cumprod(splitRatios)
+  prevCloses = np.concatenate([[startPrice], closes[:-1]]) / splitRatios
+  opens = prevCloses * np.exp(gaps + rng.normal(0, dailyVola / 4, n))
+  highs = np.maximum(opens, closes) * (1 + np.abs(rng.normal(0, dailyVola / 2, n)))
+  lows = np.minimum(opens, closes) * (1 - np.abs(rng.normal(0, dailyVola / 2, n)))
+  volumes = (rng.lognormal(15, 0.5, n) * np.cumprod(splitRatios)).astype(np.int64)
+  df = pd.DataFrame({'Open': opens, 'High': highs, 'Low': lows, 'Close': closes, 'Volume': volumes}, index=dates)
+  df.index.name = 'Date'
+  return df
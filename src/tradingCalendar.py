@@ -0,0 +1,160 @@
+"""Trading sessions of the exchanges, to skip requests when there can not be a new bar.
+
+  hasSessionActivityBetween('VOW.DE', fileMtime)   -> False after the Xetra close until the next open
+  sessionStarted('BTC-USD')                        -> always True, crypto trades 24/7
+
+The exchange is derived from the ticker suffix. Unknown suffixes get a conservative calendar
+(every weekday, all day), so a request is only skipped on weekends for them.
+Early closes are not modelled, the session is assumed to last until the regular close.
+"""
+import datetime
+import functools
+import time
+from typing import Dict, Optional, Set, Tuple
+from zoneinfo import ZoneInfo
+#--------------------------------------------------------------------------------------------------------------------------------
+CLOSE_DELAY = 15 * 60 # seconds after the close in which late prints and corrections may still change the last bar
+MAX_GAP_DAYS = 7      # there is no exchange without a session within this many days
+#--------------------------------------------------------------------------------------------------------------------------------
+def easterSunday(year: int) -> datetime.date:
+  # anonymous gregorian algorithm
+  a, b, c = year % 19, year // 100, year % 100
+  d, e = divmod(b, 4)
+  g = (8 * b + 13) // 25
+  h = (19 * a + b - d - g + 15) % 30
+  i, k = divmod(c, 4)
+  l = (32 + 2 * e + 2 * i - h - k) % 7
+  m = (a + 11 * h + 22 * l) // 451
+  month, day = divmod(h + l - 7 * m + 114, 31)
+  return datetime.date(year, month, day + 1)
+#--------------------------------------------------------------------------------------------------------------------------------
+def nthWeekday(year: int, month: int, weekday: int, n: int) -> datetime.date:
+  """n-th weekday (0=monday) of a month, n=-1 is the last one."""
+  if n > 0:
+    first = datetime.date(year, month, 1)
+    return first + datetime.timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+  last = datetime.date(year + month // 12, month % 12 + 1, 1) - datetime.timedelta(days=1)
+  return last - datetime.timedelta(days=(last.weekday() - weekday) % 7)
+#--------------------------------------------------------------------------------------------------------------------------------
+def observed(day: datetime.date) -> datetime.date:
+  """US rule: a holiday on saturday is observed on friday, one on sunday on monday."""
+  if day.weekday() == 5: return day - datetime.timedelta(days=1)
+  if day.weekday() == 6: return day + datetime.timedelta(days=1)
+  return day
+#--------------------------------------------------------------------------------------------------------------------------------
+def nyseHolidays(year: int) -> Set[datetime.date]:
+  days = {
+    nthWeekday(year, 1, 0, 3),                    # Martin Luther King Jr. Day
+    nthWeekday(year, 2, 0, 3),                    # Washington's Birthday
+    easterSunday(year) - datetime.timedelta(days=2), # Good Friday
+    nthWeekday(year, 5, 0, -1),                   # Memorial Day
+    observed(datetime.date(year, 7, 4)),          # Independence Day
+    nthWeekday(year, 9, 0, 1),                    # Labor Day
+    nthWeekday(year, 11, 3, 4),                   # Thanksgiving
+    observed(datetime.date(year, 12, 25)),        # Christmas
+  }
+  newYear = datetime.date(year, 1, 1)
+  if newYear.weekday() != 5: # not observed on the friday before, that would be in the old year
+    days.add(observed(newYear))
+  if year >= 2022:
+    days.add(observed(datetime.date(year, 6, 19))) # Juneteenth
+  return days
+#--------------------------------------------------------------------------------------------------------------------------------
+def xetraHolidays(year: int) -> Set[datetime.date]:
+  easter = easterSunday(year)
+  return {
+    datetime.date(year, 1, 1),
+    easter - datetime.timedelta(days=2), # Good Friday
+    easter + datetime.timedelta(days=1), # Easter Monday
+    datetime.date(year, 5, 1),
+    datetime.date(year, 12, 24),
+    datetime.date(year, 12, 25),
+    datetime.date(year, 12, 26),
+    datetime.date(year, 12, 31),
+  }
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class Exchange:
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, name: str, timezone: str, openTime: datetime.time, closeTime: Optional[datetime.time],
+               tradingWeekdays: Tuple[int, ...] = (0, 1, 2, 3, 4), holidays=None):
+    self.name = name
+    self.tz = ZoneInfo(timezone)
+    self.openTime = openTime
+    self.closeTime = closeTime # None: the session lasts the whole day
+    self.tradingWeekdays = tradingWeekdays
+    self.holidaysOfYear = functools.lru_cache(maxsize=64)(holidays) if holidays is not None else None
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def isSessionDay(self, day: datetime.date) -> bool:
+    if day.weekday() not in self.tradingWeekdays:
+      return False
+    return self.holidaysOfYear is None or day not in self.holidaysOfYear(day.year)
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def sessionBounds(self, day: datetime.date) -> Tuple[float, float]:
+    """Open and close of a session day in epoch seconds."""
+    start = datetime.datetime.combine(day, self.openTime, tzinfo=self.tz).timestamp()
+    if self.closeTime is None:
+      return start, datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time(0), tzinfo=self.tz).timestamp()
+    return start, datetime.datetime.combine(day, self.closeTime, tzinfo=self.tz).timestamp()
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def localDate(self, epochSeconds: float) -> datetime.date:
+    return datetime.datetime.fromtimestamp(epochSeconds, self.tz).date()
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def hasSessionActivityBetween(self, since: float, until: float) -> bool:
+    """True if the exchange traded at any time in [since, until] (epoch seconds)."""
+    if until - since > MAX_GAP_DAYS * 86400:
+      return True
+    day, lastDay = self.localDate(since - CLOSE_DELAY), self.localDate(until)
+    while day <= lastDay:
+      if self.isSessionDay(day):
+        start, end = self.sessionBounds(day)
+        if start <= until and since <= end + CLOSE_DELAY:
+          return True
+      day += datetime.timedelta(days=1)
+    return False
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def sessionStarted(self, now: float) -> bool:
+    """True if today (exchange time) is a session day and the session has opened."""
+    today = self.localDate(now)
+    return self.isSessionDay(today) and self.sessionBounds(today)[0] <= now
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+EXCHANGES: Dict[str, Exchange] = {
+  'XNYS':    Exchange('XNYS', 'America/New_York', datetime.time(9, 30), datetime.time(16, 0), holidays=nyseHolidays),
+  'XETR':    Exchange('XETR', 'Europe/Berlin', datetime.time(9, 0), datetime.time(17, 30), holidays=xetraHolidays),
+  'CRYPTO':  Exchange('CRYPTO', 'UTC', datetime.time(0, 0), None, tradingWeekdays=(0, 1, 2, 3, 4, 5, 6)),
+  'DEFAULT': Exchange('DEFAULT', 'UTC', datetime.time(0, 0), None),
+}
+SUFFIXES = {'.DE': 'XETR'}
+INDICES = {'^GDAXI': 'XETR', '^MDAXI': 'XETR', '^TECDAX': 'XETR'}
+CRYPTO_QUOTES = ('-USD', '-EUR', '-USDT', '-BTC')
+tickerExchanges: Dict[str, Exchange] = {}
+#--------------------------------------------------------------------------------------------------------------------------------
+def exchangeFor(tickerSymbol: str) -> Exchange:
+  exchange = tickerExchanges.get(tickerSymbol)
+  if exchange is not None:
+    return exchange
+  symbol = tickerSymbol.upper()
+  if symbol in INDICES:
+    name = INDICES[symbol]
+  elif symbol.endswith(CRYPTO_QUOTES):
+    name = 'CRYPTO'
+  elif '.' in symbol:
+    name = SUFFIXES.get(symbol[symbol.rindex('.'):], 'DEFAULT')
+  elif '=' in symbol: # currencies and futures trade almost around the clock
+    name = 'DEFAULT'
+  else:
+    name = 'XNYS'
+  exchange = tickerExchanges[tickerSymbol] = EXCHANGES[name]
+  return exchange
+#--------------------------------------------------------------------------------------------------------------------------------
+def hasSessionActivityBetween(tickerSymbol: str, since: float, until: Optional[float] = None) -> bool:
+  """Could there be a new or changed bar after since (epoch seconds, e.g. the mtime of the cache file)?"""
+  return exchangeFor(tickerSymbol).hasSessionActivityBetween(since, time.time() if until is None else until)
+#--------------------------------------------------------------------------------------------------------------------------------
+def sessionStarted(tickerSymbol: str, now: Optional[float] = None) -> bool:
+  return exchangeFor(tickerSymbol).sessionStarted(time.time() if now is None else now)
+#--------------------------------------------------------------------------------------------------------------------------------
+def isSessionDay(tickerSymbol: str, day: Optional[datetime.date] = None) -> bool:
+  exchange = exchangeFor(tickerSymbol)
+  return exchange.isSessionDay(exchange.localDate(time.time()) if day is None else day)
@@ -0,0 +1,307 @@
+"""Virtualized watchlist: only the visible rows exist as canvas items, so the list scales to thousands of tickers.
+
+The rows show ticker, last close, fair value (consensus estimates, fundamentals.py), % change and RSI. The values are
+requested in batches for the visible rows through fetchValues(tickers) -> {ticker: (close, changePercent, rsi, fairValue)},
+which runs in a background thread. fairValue is NaN for tickers without estimates.
+No pandas here, the widget is created before the heavy imports are done.
+"""
+import bisect
+import threading
+import tkinter as tk
+import tkinter.font as tkfont
+from tkinter import ttk
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+#--------------------------------------------------------------------------------------------------------------------------------
+RowValues = Tuple[float, float, float, float] # last close, % change, rsi, fair value
+#--------------------------------------------------------------------------------------------------------------------------------
+def ngrams(text: str, maxLength: int = 3) -> Set[str]:
+  return {text[i:i + n] for n in range(1, maxLength + 1) for i in range(len(text) - n + 1)}
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class SearchIndex:
+  """Sorted keys for prefix search (bisect) and an n-gram index (up to 3 characters) for substring search."""
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, items: Iterable[str] = ()):
+    self.sortedItems: List[str] = []
+    self.grams: Dict[str, Set[str]] = {}
+    self.setItems(items)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def setItems(self, items: Iterable[str]):
+    self.sortedItems = sorted(set(items))
+    self.grams = {}
+    for item in self.sortedItems:
+      for gram in ngrams(item):
+        self.grams.setdefault(gram, set()).add(item)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def add(self, item: str):
+    i = bisect.bisect_left(self.sortedItems, item)
+    if i < len(self.sortedItems) and self.sortedItems[i] == item:
+      return
+    self.sortedItems.insert(i, item)
+    for gram in ngrams(item):
+      self.grams.setdefault(gram, set()).add(item)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def remove(self, item: str):
+    i = bisect.bisect_left(self.sortedItems, item)
+    if i == len(self.sortedItems) or self.sortedItems[i] != item:
+      return
+    del self.sortedItems[i]
+    for gram in ngrams(item):
+      self.grams[gram].discard(item)
+      if not self.grams[gram]:
+        del self.grams[gram]
+  #------------------------------------------------------------------------------------------------------------------------------
+  def search(self, text: str) -> List[str]:
+    """Prefix matches first, then the other items containing text, both sorted."""
+    text = text.strip().upper()
+    if not text:
+      return list(self.sortedItems)
+    lo = bisect.bisect_left(self.sortedItems, text)
+    hi = bisect.bisect_left(self.sortedItems, text + '\uffff')
+    prefixMatches = self.sortedItems[lo:hi]
+    # candidates contain every n-gram of text, short queries are answered by the index alone
+    n = min(3, len(text))
+    candidates: Optional[Set[str]] = None
+    for gram in {text[i:i + n] for i in range(len(text) - n + 1)}:
+      found = self.grams.get(gram, set())
+      candidates = found if candidates is None else candidates & found
+      if not candidates:
+        return prefixMatches
+    substringMatches = sorted(c for c in candidates if text in c and not c.startswith(text))
+    return prefixMatches + substringMatches
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class WatchlistView:
+  COLUMNS = (('Ticker', 0.0, 'w'), ('Last', 0.42, 'e'), ('Fair', 0.62, 'e'), ('%Chg', 0.81, 'e'), ('RSI', 0.98, 'e')) # name, relative x, anchor
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, parent: tk.Widget, onSelect: Callable[[str], None],
+               fetchValues: Optional[Callable[[List[str]], Dict[str, RowValues]]] = None):
+    self.onSelect = onSelect
+    self.fetchValues = fetchValues
+    self.index = SearchIndex()
+    self.items: List[str] = [] # filtered, in display order
+    self.selected: Optional[str] = None
+    self.top = 0 # index of the first visible row
+    self.values: Dict[str, Optional[RowValues]] = {} # None: not in the cache
+    self.pendingValues: Set[str] = set()
+    self.valuesJob: Optional[str] = None
+    self.fetchRunning = False
+    self.rowItems: List[Tuple[int, ...]] = [] # pool of canvas items, one tuple (background, texts...) per visible row
+    self.searchVar = tk.StringVar()
+    self.setupUserInterface(parent)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def setupUserInterface(self, parent: tk.Widget):
+    self.frame = ttk.Frame(parent)
+    self.frame.rowconfigure(2, weight=1)
+    self.frame.columnconfigure(0, weight=1)
+    searchEntry = ttk.Entry(self.frame, textvariable=self.searchVar)
+    searchEntry.grid(row=0, column=0, columnspan=2, sticky="ew", pady=(0, 2))
+    self.searchVar.trace_add('write', lambda *args: self.applyFilter())
+    searchEntry.bind("<Down>", lambda event: self.moveSelection(1))
+    searchEntry.bind("<Return>", lambda event: self.moveSelection(0))
+    self.font = tkfont.nametofont('TkDefaultFont')
+    self.rowHeight = self.font.metrics('linespace') + 4
+    self.header = tk.Canvas(self.frame, height=self.rowHeight, highlightthickness=0)
+    self.header.grid(row=1, column=0, sticky="ew")
+    self.canvas = tk.Canvas(self.frame, background='white', highlightthickness=0, takefocus=1)
+    self.canvas.grid(row=2, column=0, sticky="nsew")
+    self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self.yview)
+    self.scrollbar.grid(row=2, column=1, sticky="ns")
+    self.canvas.bind("<Configure>", lambda event: self.redraw())
+    self.canvas.bind("<Button-1>", self.handleClick)
+    self.canvas.bind("<MouseWheel>", lambda event: self.yview('scroll', -1 if event.delta > 0 else 1, 'units'))
+    self.canvas.bind("<Button-4>", lambda event: self.yview('scroll', -1, 'units'))
+    self.canvas.bind("<Button-5>", lambda event: self.yview('scroll', 1, 'units'))
+    for key, step in (("<Up>", -1), ("<Down>", 1), ("<Prior>", -10), ("<Next>", 10)):
+      self.canvas.bind(key, lambda event, s=step: self.moveSelection(s))
+    self.canvas.bind("<Home>", lambda event: self.selectIndex(0))
+    self.canvas.bind("<End>", lambda event: self.selectIndex(len(self.items) - 1))
+  #------------------------------------------------------------------------------------------------------------------------------
+  def grid(self, **kwargs):
+    self.frame.grid(**kwargs)
+  #------------------------------------------------------------------------------------------------------------------------------
+  # content
+  #------------------------------------------------------------------------------------------------------------------------------
+  def setItems(self, tickers: Iterable[str]):
+    self.index.setItems(tickers)
+    self.applyFilter()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def insert(self, ticker: str):
+    self.index.add(ticker)
+    self.applyFilter()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def remove(self, ticker: str):
+    self.index.remove(ticker)
+    self.values.pop(ticker, None)
+    if self.selected == ticker:
+      self.selected = None
+    self.applyFilter()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def applyFilter(self):
+    self.items = self.index.search(self.searchVar.get())
+    self.top = max(0, min(self.top, len(self.items) - self.visibleRowCount()))
+    self.redraw()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def invalidateValues(self, tickers: Iterable[str]):
+    """Values are requested again the next time the rows are visible, e.g. after new data was downloaded."""
+    for ticker in tickers:
+      self.values.pop(ticker, None)
+    self.redraw()
+  #------------------------------------------------------------------------------------------------------------------------------
+  # selection
+  #------------------------------------------------------------------------------------------------------------------------------
+  def selection(self) -> Optional[str]:
+    return self.selected
+  #------------------------------------------------------------------------------------------------------------------------------
+  def select(self, ticker: str, notify: bool = True):
+    self.selected = ticker
+    if ticker in self.items:
+      self.see(self.items.index(ticker))
+    self.redraw()
+    if notify:
+      self.onSelect(ticker)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def selectIndex(self, i: int):
+    if self.items:
+      self.select(self.items[max(0, min(i, len(self.items) - 1))])
+  #------------------------------------------------------------------------------------------------------------------------------
+  def moveSelection(self, step: int):
+    i = self.items.index(self.selected) if self.selected in self.items else -1
+    self.selectIndex(0 if i < 0 else i + step)
+    self.canvas.focus_set()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def handleClick(self, event):
+    self.canvas.focus_set()
+    i = self.top + int(event.y // self.rowHeight)
+    if i < len(self.items):
+      self.select(self.items[i])
+  #------------------------------------------------------------------------------------------------------------------------------
+  # scrolling
+  #------------------------------------------------------------------------------------------------------------------------------
+  def visibleRowCount(self) -> int:
+    return max(1, self.canvas.winfo_height() // self.rowHeight)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def see(self, i: int):
+    rows = self.visibleRowCount()
+    if i < self.top:
+      self.top = i
+    elif i >= self.top + rows:
+      self.top = i - rows + 1
+  #------------------------------------------------------------------------------------------------------------------------------
+  def yview(self, *args):
+    """Scrollbar protocol: ('moveto', fraction) or ('scroll', n, 'units'|'pages')."""
+    rows = self.visibleRowCount()
+    if args[0] == 'moveto':
+      self.top = int(float(args[1]) * len(self.items))
+    elif args[0] == 'scroll':
+      self.top += int(args[1]) * (rows if args[2] == 'pages' else 1)
+    self.top = max(0, min(self.top, len(self.items) - rows))
+    self.redraw()
+  #------------------------------------------------------------------------------------------------------------------------------
+  # drawing
+  #------------------------------------------------------------------------------------------------------------------------------
+  def columnX(self, relative: float) -> float:
+    return 4 + relative * (self.canvas.winfo_width() - 8)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def redrawHeader(self):
+    self.header.delete('all')
+    for name, relative, anchor in self.COLUMNS:
+      self.header.create_text(self.columnX(relative), self.rowHeight / 2, text=name, anchor=anchor, font=self.font)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def ensureRowItems(self, rows: int):
+    while len(self.rowItems) < rows:
+      background = self.canvas.create_rectangle(0, 0, 0, 0, width=0)
+      texts = tuple(self.canvas.create_text(0, 0, anchor=anchor, font=self.font) for _, _, anchor in self.COLUMNS)
+      self.rowItems.append((background,) + texts)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def redraw(self):
+    rows = self.visibleRowCount() + 1
+    self.ensureRowItems(rows)
+    width = self.canvas.winfo_width()
+    missing = []
+    for r, itemIds in enumerate(self.rowItems):
+      i = self.top + r
+      if r >= rows or i >= len(self.items):
+        for itemId in itemIds:
+          self.canvas.itemconfigure(itemId, state='hidden')
+        continue
+      if self.items[i] not in self.values:
+        missing.append(self.items[i])
+      self.drawRow(r, i, itemIds, width)
+    self.redrawHeader()
+    if self.items:
+      self.scrollbar.set(self.top / len(self.items), min(1.0, (self.top + rows - 1) / len(self.items)))
+    else:
+      self.scrollbar.set(0.0, 1.0)
+    self.requestValues(missing)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def drawRow(self, r: int, i: int, itemIds: Tuple[int, ...], width: int):
+    ticker = self.items[i]
+    y0 = r * self.rowHeight
+    background, tickerText, closeText, fairText, changeText, rsiText = itemIds
+    self.canvas.coords(background, 0, y0, width, y0 + self.rowHeight)
+    self.canvas.itemconfigure(background, state='normal', fill='#cce0ff' if ticker == self.selected else ('white' if i % 2 == 0 else '#f4f4f4'))
+    values = self.values.get(ticker)
+    if values is None:
+      texts = (ticker, '', '', '', '')
+    else:
+      texts = (ticker, f"{values[0]:.2f}", '' if values[3] != values[3] else f"{values[3]:.2f}", f"{values[1]:+.2f}%",
+               '' if values[2] != values[2] else f"{values[2]:.0f}")
+    for itemId, text, (_, relative, _) in zip((tickerText, closeText, fairText, changeText, rsiText), texts, self.COLUMNS):
+      self.canvas.coords(itemId, self.columnX(relative), y0 + self.rowHeight / 2)
+      self.canvas.itemconfigure(itemId, text=text, state='normal')
+    self.canvas.itemconfigure(changeText, fill='black' if values is None else ('#008000' if values[1] >= 0 else '#c00000'))
+    self.canvas.itemconfigure(fairText, fill='black' if values is None or values[3] != values[3] else ('#008000' if values[3] >= values[0] else '#c00000'))
+  #------------------------------------------------------------------------------------------------------------------------------
+  def updateLiveValues(self, values: Dict[str, Tuple[float, float, float]]) -> int:
+    """Last close, % change and rsi from a live feed (liveFeed.py), the fair value is kept (empty for a ticker without
+    values yet). Only the visible rows among them are repainted, returns their number."""
+    for ticker, (close, change, rsi) in values.items():
+      previous = self.values.get(ticker)
+      self.values[ticker] = (close, change, rsi, previous[3] if previous is not None else float('nan'))
+    width = self.canvas.winfo_width()
+    repainted = 0
+    for r, itemIds in enumerate(self.rowItems[:self.visibleRowCount() + 1]):
+      i = self.top + r
+      if i < len(self.items) and self.items[i] in values:
+        self.drawRow(r, i, itemIds, width)
+        repainted += 1
+    return repainted
+  #------------------------------------------------------------------------------------------------------------------------------
+  # values of the visible rows
+  #------------------------------------------------------------------------------------------------------------------------------
+  def requestValues(self, tickers: List[str]):
+    if self.fetchValues is None:
+      return
+    self.pendingValues.update(tickers)
+    if self.valuesJob is not None:
+      self.canvas.after_cancel(self.valuesJob)
+    self.valuesJob = self.canvas.after(150, self.startValueFetch) # wait until scrolling stops
+  #------------------------------------------------------------------------------------------------------------------------------
+  def startValueFetch(self):
+    self.valuesJob = None
+    visible = set(self.items[self.top:self.top + self.visibleRowCount() + 1])
+    tickers = [t for t in self.pendingValues if t in visible and t not in self.values]
+    self.pendingValues.clear()
+    if not tickers or self.fetchRunning:
+      if tickers:
+        self.pendingValues.update(tickers) # retried when the running fetch is done
+      return
+    self.fetchRunning = True
+    def fetch():
+      try:
+        result = self.fetchValues(tickers)
+      except Exception as e:
+        print(f"Error loading watchlist values: {e}")
+        result = {}
+      self.canvas.after(0, self.applyValues, tickers, result)
+    threading.Thread(target=fetch, name='watchlistValues', daemon=True).start()
+  #------------------------------------------------------------------------------------------------------------------------------
+  def applyValues(self, tickers: List[str], result: Dict[str, RowValues]):
+    self.fetchRunning = False
+    self.values.update(result)
+    for ticker in tickers: # not in the cache, show empty columns instead of asking again
+      self.values.setdefault(ticker, None)
+    self.redraw()
+    if self.pendingValues:
+      self.requestValues([])
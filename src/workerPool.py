@@ -0,0 +1,222 @@
+"""Persistent process pool for the indicator calculation and the chart rasterization.
+
+pandas rolling/ewm and mplfinance hold the GIL for long stretches. In a worker process they do not block the Tk thread.
+The frames travel as Arrow IPC streams in shared memory, not pickled: the caller writes the frame once,
+the worker maps it, and the result comes back the same way. A chart comes back as a PPM image, which Tk shows
+without matplotlib in the GUI process. Only the shared memory names and sizes go through the pool's pipes.
+
+The workers are started and warmed up (imports, font cache, first figure) by prewarm() at startup.
+globalsSa.WORKER_POOL switches the pool off, and globalsSa.RASTER_CHARTS chooses between the images and the
+interactive figures. Interactive figures are created in the GUI process, only their indicators are
+calculated in the pool.
+"""
+import concurrent.futures
+import gc
+import multiprocessing
+import os
+import threading
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+
+import globalsSa
+#--------------------------------------------------------------------------------------------------------------------------------
+WORKERS = max(1, min(2, (os.cpu_count() or 1) - 1)) # daily and weekly chart in parallel
+DPI = 100
+SharedRef = Tuple[str, int] # name and used size of a shared memory block
+#--------------------------------------------------------------------------------------------------------------------------------
+# shared memory transport
+#--------------------------------------------------------------------------------------------------------------------------------
+def writeShared(data: Any) -> Tuple[shared_memory.SharedMemory, int]:
+  """Writes a frame (as Arrow IPC stream) or bytes to a new shared memory block, the caller unlinks it."""
+  if isinstance(data, pd.DataFrame):
+    table = pa.Table.from_pandas(data, preserve_index=True)
+    sink = pa.MockOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+      writer.write_table(table)
+    size = sink.size()
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    with pa.ipc.new_stream(pa.FixedSizeBufferWriter(pa.py_buffer(block.buf)), table.schema) as writer:
+      writer.write_table(table)
+    return block, size
+  block = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+  block.buf[:len(data)] = data
+  return block, len(data)
+#--------------------------------------------------------------------------------------------------------------------------------
+def frameFromBuffer(buffer, size: int) -> pd.DataFrame:
+  """Frame of an Arrow IPC stream, the columns may still point into the buffer."""
+  with pa.ipc.open_stream(pa.py_buffer(buffer)[:size]) as reader:
+    return reader.read_all().to_pandas()
+#--------------------------------------------------------------------------------------------------------------------------------
+def closeBlock(block: shared_memory.SharedMemory):
+  try:
+    block.close()
+  except BufferError: # a frame of the block is in a reference cycle
+    gc.collect()
+    block.close()
+#--------------------------------------------------------------------------------------------------------------------------------
+def withSharedFrame(ref: SharedRef, function, *args):
+  """Calls function(frame, *args) with the frame mapped from the block, closes the block when the frame is gone."""
+  block = shared_memory.SharedMemory(name=ref[0])
+  try:
+    return function(frameFromBuffer(block.buf, ref[1]), *args)
+  finally:
+    closeBlock(block)
+#--------------------------------------------------------------------------------------------------------------------------------
+def readBytes(ref: SharedRef, unlink: bool = True) -> bytes:
+  block = shared_memory.SharedMemory(name=ref[0])
+  try:
+    return bytes(block.buf[:ref[1]])
+  finally:
+    block.close()
+    if unlink:
+      block.unlink()
+#--------------------------------------------------------------------------------------------------------------------------------
+def takeFrame(ref: SharedRef) -> pd.DataFrame:
+  """Copies a result frame of a worker out of its block and frees the block."""
+  def ownedCopy(df: pd.DataFrame) -> pd.DataFrame:
+    result = df.copy(deep=True)
+    result.index = df.index.copy(deep=True) # copy(deep=True) only gives a view of the index
+    return result
+  try:
+    return withSharedFrame(ref, ownedCopy)
+  finally:
+    shared_memory.SharedMemory(name=ref[0]).unlink()
+#--------------------------------------------------------------------------------------------------------------------------------
+# worker side
+#--------------------------------------------------------------------------------------------------------------------------------
+def workerInit():
+  import matplotlib
+  matplotlib.use('Agg') # no display in the workers, must be set before pyplot gets imported
+  import stockAnalyzer
+  stockAnalyzer.importHeavyModules()
+#--------------------------------------------------------------------------------------------------------------------------------
+def warmTask() -> int:
+  """First indicator calculation and figure of a worker: loads the remaining modules and the font cache."""
+  from syntheticData import generateOhlcv
+  ref = writeShared(generateOhlcv(200, seed=1)) # below indicatorCache.MIN_BARS, nothing is written to data/indicators
+  try:
+    image = renderTask((ref[0].name, ref[1]), pd.Timestamp('1900-01-01'), 'WARM', '1d', 'Daily', 400, 300)
+    readBytes(image)
+  finally:
+    ref[0].close()
+    ref[0].unlink()
+  return os.getpid()
+#--------------------------------------------------------------------------------------------------------------------------------
+def calculateTask(ref: SharedRef, displayStart: pd.Timestamp, ticker: str, interval: str) -> SharedRef:
+  return withSharedFrame(ref, calculateFrame, displayStart, ticker, interval)
+#--------------------------------------------------------------------------------------------------------------------------------
+def calculateFrame(df: pd.DataFrame, displayStart: pd.Timestamp, ticker: str, interval: str) -> SharedRef:
+  import stockAnalyzer
+  block, size = writeShared(stockAnalyzer.calculateIndicators(df, displayStart, ticker, interval))
+  block.close()
+  return block.name, size
+#--------------------------------------------------------------------------------------------------------------------------------
+def renderTask(ref: SharedRef, displayStart: pd.Timestamp, ticker: str, interval: str, timeframe: str,
+               width: int, height: int, panels: Optional[List[str]] = None) -> SharedRef:
+  """Indicators and chart of a raw frame, returns the chart as binary PPM."""
+  return withSharedFrame(ref, renderFrame, displayStart, ticker, interval, timeframe, width, height, panels)
+#--------------------------------------------------------------------------------------------------------------------------------
+def renderFrame(df: pd.DataFrame, displayStart: pd.Timestamp, ticker: str, interval: str, timeframe: str,
+                width: int, height: int, panels: Optional[List[str]] = None) -> SharedRef:
+  import numpy as np
+  import stockAnalyzer
+  df = stockAnalyzer.calculateIndicators(df, displayStart, ticker, interval)
+  chartUtils = stockAnalyzer.ChartingUtils()
+  if df is not None and not df.empty:
+    fig = chartUtils.createStockChartFigure(df, ticker, timeframe, panels=panels)
+  else:
+    fig = chartUtils.createErrorFigure(f"No/Bad {timeframe} Data: {ticker}")
+  try:
+    fig.set_dpi(DPI)
+    fig.set_size_inches(width / DPI, height / DPI)
+    fig.canvas.draw()
+    rgba = np.asarray(fig.canvas.buffer_rgba())
+    header = f"P6\n{rgba.shape[1]} {rgba.shape[0]}\n255\n".encode('ascii')
+    block, size = writeShared(header + np.ascontiguousarray(rgba[:, :, :3]).tobytes())
+  finally:
+    stockAnalyzer.plt.close(fig)
+  block.close()
+  return block.name, size
+#--------------------------------------------------------------------------------------------------------------------------------
+#--------------------------------------------------------------------------------------------------------------------------------
+class WorkerPool:
+  #------------------------------------------------------------------------------------------------------------------------------
+  def __init__(self, workers: int = WORKERS):
+    self.workers = workers
+    self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                                           initializer=workerInit)
+  #------------------------------------------------------------------------------------------------------------------------------
+  def prewarm(self) -> List[concurrent.futures.Future]:
+    """Starts all workers and lets each do a first chart, returns without waiting."""
+    return [self.executor.submit(warmTask) for _ in range(self.workers)]
+  #------------------------------------------------------------------------------------------------------------------------------
+  def run(self, function, df: pd.DataFrame, *args) -> concurrent.futures.Future:
+    block, size = writeShared(df)
+    future = self.executor.submit(function, (block.name, size), *args)
+    def release(_):
+      block.close()
+      block.unlink()
+    future.add_done_callback(release)
+    return future
+  #------------------------------------------------------------------------------------------------------------------------------
+  def calculate(self, df: pd.DataFrame, displayStart: pd.Timestamp, ticker: str, interval: str) -> pd.DataFrame:
+    """calculateIndicators in a worker, blocks the calling (background) thread."""
+    return takeFrame(self.run(calculateTask, df, displayStart, ticker, interval).result())
+  #------------------------------------------------------------------------------------------------------------------------------
+  def renderCharts(self, jobs: List[Dict[str, Any]]) -> List[bytes]:
+    """Renders the charts in parallel. Each job has df, displayStart, ticker, interval, timeframe, width, height and optional panels."""
+    futures = [self.run(renderTask, job['df'], job['displayStart'], job['ticker'], job['interval'], job['timeframe'],
+                        job['width'], job['height'], job.get('panels')) for job in jobs]
+    images: List[bytes] = []
+    error: Optional[Exception] = None
+    for future in futures: # every result block is read and unlinked, also after a failed job
+      try:
+        image = readBytes(future.result())
+      except Exception as e:
+        error = error or e
+        continue
+      images.append(image)
+    if error is not None:
+      raise error
+    return images
+  #------------------------------------------------------------------------------------------------------------------------------
+  def shutdown(self):
+    self.executor.shutdown(wait=False, cancel_futures=True)
+#--------------------------------------------------------------------------------------------------------------------------------
+pool: Optional[WorkerPool] = None
+poolLock = threading.Lock()
+#--------------------------------------------------------------------------------------------------------------------------------
+def getPool() -> Optional[WorkerPool]:
+  """The shared pool, None if it is switched off or could not be started."""
+  global pool
+  if not globalsSa.WORKER_POOL:
+    return None
+  with poolLock:
+    if pool is None:
+      try:
+        pool = WorkerPool()
+      except Exception as e:
+        print(f"Worker pool not available, calculating in the GUI process: {e}")
+        globalsSa.WORKER_POOL = False
+        return None
+    return pool
+#--------------------------------------------------------------------------------------------------------------------------------
+def disablePool(reason: Exception):
+  """After a crashed worker (BrokenProcessPool) everything is done in the GUI process again."""
+  global pool
+  print(f"Worker pool failed, calculating in the GUI process from now on: {reason}")
+  globalsSa.WORKER_POOL = False
+  with poolLock:
+    if pool is not None:
+      pool.shutdown()
+      pool = None
+#--------------------------------------------------------------------------------------------------------------------------------
+def shutdownPool():
+  global pool
+  with poolLock:
+    if pool is not None:
+      pool.shutdown()
+      pool = None
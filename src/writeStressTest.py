@@ -0,0 +1,102 @@
+"""Stress test of the cache writes: many processes write and read the same few tickers at once.
+
+  python writeStressTest.py --processes 8 --tickers 2 --seconds 10
+  python writeStressTest.py --unsafe          # plain to_parquet as before atomicIo, shows the torn reads
+
+Every written frame is generateOhlcv(n, seed=n) for one of LENGTHS, so a reader can check that it got a whole frame.
+Each process also increments a shared counter under atomicIo.fileLock(), lost increments mean the lock does not work.
+"""
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import atomicIo
+#--------------------------------------------------------------------------------------------------------------------------------
+LENGTHS = [500, 1000, 2000, 4000]
+#--------------------------------------------------------------------------------------------------------------------------------
+def hammer(worker: int, dataDir: str, tickers: List[str], seconds: float, writeRatio: float, increments: int, unsafe: bool) -> Dict[str, Any]:
+  """One process: random writes and reads of the tickers, then the counter increments."""
+  import pandas as pd
+  import loader
+  from syntheticData import generateOhlcv
+  frames = {n: generateOhlcv(n, seed=n) for n in LENGTHS}
+  lastClose = {n: df['Close'].iloc[-1] for n, df in frames.items()}
+  stats = {'writes': 0, 'reads': 0, 'missing': 0, 'torn': 0, 'mismatch': 0, 'loaderNoData': 0}
+  rng = random.Random(worker)
+  end = time.monotonic() + seconds
+  with contextlib.redirect_stdout(io.StringIO()): # loader reports every file access
+    while time.monotonic() < end:
+      path = loader.constructParquetFilePath(rng.choice(tickers), '1d', dataDir)
+      if rng.random() < writeRatio:
+        df = frames[rng.choice(LENGTHS)]
+        if unsafe:
+          df.to_parquet(path, engine='pyarrow', index=True)
+        else:
+          loader.saveData(df, path)
+        stats['writes'] += 1
+        continue
+      stats['reads'] += 1
+      try:
+        df = pd.read_parquet(path)
+      except FileNotFoundError:
+        stats['missing'] += 1
+        continue
+      except Exception:
+        stats['torn'] += 1
+        continue
+      if len(df) not in lastClose or df['Close'].iloc[-1] != lastClose[len(df)]:
+        stats['mismatch'] += 1
+      if not unsafe and loader.loadLocalData(path, 'STRESS', '1d') is None: # what the app would treat as "no data"
+        stats['loaderNoData'] += 1
+  counterPath = os.path.join(dataDir, 'counter')
+  for _ in range(increments):
+    with atomicIo.fileLock(counterPath):
+      value = int(open(counterPath).read()) if os.path.exists(counterPath) else 0
+      atomicIo.writeText(counterPath, str(value + 1), durable=False)
+  return stats
+#--------------------------------------------------------------------------------------------------------------------------------
+def runStressTest(processes: int, tickers: int, seconds: float, writeRatio: float, increments: int, unsafe: bool) -> Dict[str, Any]:
+  workDir = tempfile.mkdtemp(prefix='stockAnalyzerStress')
+  dataDir = os.path.join(workDir, 'data')
+  names = [f"STRESS{i}" for i in range(tickers)]
+  try:
+    with multiprocessing.get_context('spawn').Pool(processes) as pool:
+      results = pool.starmap(hammer, [(i, dataDir, names, seconds, writeRatio, increments, unsafe) for i in range(processes)])
+    counterPath = os.path.join(dataDir, 'counter')
+    counter = int(open(counterPath).read()) if os.path.exists(counterPath) else 0
+    leftovers = [name for name in os.listdir(os.path.dirname(counterPath)) if name.endswith('.tmp')]
+  finally:
+    shutil.rmtree(workDir, ignore_errors=True)
+  total = {key: sum(r[key] for r in results) for key in results[0]}
+  return dict(total, counter=counter, expectedCounter=processes * increments, tmpFiles=len(leftovers))
+#--------------------------------------------------------------------------------------------------------------------------------
+def main(argv: Optional[List[str]] = None) -> int:
+  parser = argparse.ArgumentParser(description="Many processes writing and reading the same cache files.")
+  parser.add_argument("--processes", type=int, default=8)
+  parser.add_argument("--tickers", type=int, default=2, help="Number of tickers all processes share.")
+  parser.add_argument("--seconds", type=float, default=5.0)
+  parser.add_argument("--write-ratio", type=float, default=0.5, help="Share of the operations which write.")
+  parser.add_argument("--increments", type=int, default=200, help="Locked counter increments per process.")
+  parser.add_argument("--unsafe", action='store_true', help="Write with plain to_parquet instead of atomicIo.")
+  opt = parser.parse_args(argv)
+
+  result = runStressTest(opt.processes, opt.tickers, opt.seconds, opt.write_ratio, opt.increments, opt.unsafe)
+  print(f"writes     {result['writes']}")
+  print(f"reads      {result['reads']} (file not there yet: {result['missing']})")
+  print(f"torn       {result['torn']} unreadable, {result['mismatch']} not a whole frame, {result['loaderNoData']} 'no data' in loader")
+  print(f"counter    {result['counter']} of {result['expectedCounter']} locked increments")
+  print(f"tmp files  {result['tmpFiles']} left behind")
+  failed = result['torn'] + result['mismatch'] + result['loaderNoData'] + result['tmpFiles'] > 0 or result['counter'] != result['expectedCounter']
+  print("FAILED" if failed else "OK")
+  return 1 if failed else 0
+#----------------------------------------------------------------------------------------------------------------------
+if __name__ == "__main__":
+  sys.exit(main())